@@ -0,0 +1,179 @@
+import pandas as pd
+import numpy as np
+import logging
+
+from dashboard.components.activity_frame import ActivityFrame, EPOCH, to_day_numbers
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Above this many user x day cells the engine dedupes activity by sorting instead of
+# marking a dense boolean matrix (about 1 byte per cell)
+MAX_MATRIX_CELLS = 400_000_000
+
+
+def period_start(day_numbers, granularity):
+    """Day number of the period each day falls in, as PostgreSQL DATE_TRUNC: Monday weeks, calendar months"""
+    day_numbers = np.asarray(day_numbers, dtype=np.int64)
+    if granularity == 'day':
+        return day_numbers
+    if granularity == 'week':
+        # Day 0 (1970-01-01) is a Thursday, so Mondays are days with (day + 3) % 7 == 0
+        return (day_numbers + 3) // 7 * 7 - 3
+    if granularity == 'month':
+        months = (EPOCH + day_numbers.astype('timedelta64[D]')).astype('datetime64[M]')
+        return (months.astype('datetime64[D]') - EPOCH).astype(np.int64)
+    raise ValueError(f"Unknown granularity {granularity!r}; expected one of {GRANULARITIES}")
+
+
+def _bucket_of_day(first_day, num_days, granularity):
+    """Bucket index (0-based, ascending) of each day in first_day..first_day + num_days - 1, and bucket start days"""
+    starts_of_day = period_start(first_day + np.arange(num_days), granularity)
+    new_bucket = np.r_[True, starts_of_day[1:] != starts_of_day[:-1]]
+    bucket = np.cumsum(new_bucket) - 1
+    starts = np.flatnonzero(new_bucket)
+    return bucket, starts, starts_of_day[starts]
+
+
+class CohortEngine:
+    """Cohort retention on integer-coded users and day numbers.
+
+    Activity is reduced to distinct (user, day) pairs, users are assigned to
+    the cohort of their first active day, and every granularity's cohort x
+    period matrix is filled with a single ``np.bincount``. No Python-level
+    grouping or string hashing happens after the inputs are coded, so an
+    ActivityFrame goes through without conversion.
+    """
+
+    @staticmethod
+    def _codes(events, user_col, date_col, segment_col):
+        """(user codes, day numbers, segment codes or None, segment values or None)"""
+        if isinstance(events, ActivityFrame):
+            users, _ = events.factorize(user_col)
+            days = events.days(date_col)
+            segments, segment_values = events.factorize(segment_col) if segment_col else (None, None)
+        else:
+            users, _ = pd.factorize(events[user_col], sort=False)
+            days = to_day_numbers(events[date_col])
+            segments, segment_values = (pd.factorize(events[segment_col], sort=True)
+                                        if segment_col else (None, None))
+        return np.asarray(users), np.asarray(days), segments, segment_values
+
+    @staticmethod
+    def _active_pairs(users, offsets, num_users, num_days):
+        """Distinct active (user, day offset) pairs, sorted by user then day, and each user's first day offset"""
+        if num_users * num_days <= MAX_MATRIX_CELLS:
+            active = np.zeros((num_users, num_days), dtype=bool)
+            active[users, offsets] = True
+            first = active.argmax(axis=1)
+            pair_users, pair_days = np.nonzero(active)
+            return active, pair_users, pair_days, first
+
+        keys = np.unique(users.astype(np.int64) * num_days + offsets)
+        pair_users, pair_days = keys // num_days, keys % num_days
+        first = np.empty(num_users, dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, pair_users[1:] != pair_users[:-1]])
+        first[pair_users[starts]] = pair_days[starts]
+        return None, pair_users, pair_days, first
+
+    @staticmethod
+    def _first_segments(users, offsets, segments, first, num_users, num_segments):
+        """Segment of each user's first-day events (the lowest code when there are several)"""
+        on_first_day = (offsets == first[users]) & (segments >= 0)
+        seen = np.zeros((num_users, num_segments), dtype=bool)
+        seen[users[on_first_day], segments[on_first_day]] = True
+        return np.where(seen.any(axis=1), seen.argmax(axis=1), -1)
+
+    @staticmethod
+    def retention(events, granularity='week', segment_col=None, user_col='user_id', date_col='date',
+                  max_periods=None):
+        """Long-format retention table, in the shape of the dashboard's cohort data.
+
+        ``events`` is a DataFrame or an ActivityFrame of activity rows.
+        ``granularity`` is 'day', 'week', 'month' or a sequence of them
+        (computed together from one pass over the events). With
+        ``segment_col`` (e.g. device_type, subscription_type, course_id)
+        users are split by the segment of their first-day activity.
+        Returns columns [granularity, segment_col,] cohort_start,
+        period_number, users, cohort_size, retention_rate.
+        """
+        granularities = [granularity] if isinstance(granularity, str) else list(granularity)
+        columns = ['granularity'] + ([segment_col] if segment_col else []) + \
+                  ['cohort_start', 'period_number', 'users', 'cohort_size', 'retention_rate']
+        try:
+            users, days, segments, segment_values = CohortEngine._codes(events, user_col, date_col, segment_col)
+            if (users < 0).any():
+                # Events without a user can't be assigned to a cohort
+                known = users >= 0
+                users, days = users[known], days[known]
+                segments = segments[known] if segments is not None else None
+            if len(users) == 0:
+                return pd.DataFrame(columns=columns)
+
+            first_day = int(days.min())
+            num_days = int(days.max()) - first_day + 1
+            num_users = int(users.max()) + 1
+            offsets = (days - first_day).astype(np.int64)
+            active, pair_users, pair_days, first = CohortEngine._active_pairs(users, offsets, num_users, num_days)
+
+            if segment_col:
+                num_segments = len(segment_values)
+                user_segments = CohortEngine._first_segments(users, offsets, np.asarray(segments), first,
+                                                             num_users, num_segments)
+            else:
+                num_segments, user_segments = 1, np.zeros(num_users, dtype=np.int64)
+
+            frames = []
+            for name in granularities:
+                bucket, starts, start_days = _bucket_of_day(first_day, num_days, name)
+                num_buckets = len(starts)
+                cohort = bucket[first]
+
+                # Distinct (user, bucket) pairs: OR the day columns of each bucket together
+                if name == 'day':
+                    bucket_users, bucket_ids = pair_users, pair_days
+                elif active is not None:
+                    bucket_users, bucket_ids = np.nonzero(np.logical_or.reduceat(active, starts, axis=1))
+                else:
+                    keys = np.unique(pair_users * num_buckets + bucket[pair_days])
+                    bucket_users, bucket_ids = keys // num_buckets, keys % num_buckets
+
+                period = bucket_ids - cohort[bucket_users]
+                segment = user_segments[bucket_users]
+                keep = segment >= 0
+                if max_periods is not None:
+                    keep &= period <= max_periods
+                cell = (segment[keep] * num_buckets + cohort[bucket_users[keep]]) * num_buckets + period[keep]
+                counts = np.bincount(cell, minlength=num_segments * num_buckets * num_buckets)
+                counts = counts.reshape(num_segments, num_buckets, num_buckets)
+
+                seg_index, cohort_index, period_index = np.nonzero(counts)
+                sizes = counts[seg_index, cohort_index, 0]
+                users_retained = counts[seg_index, cohort_index, period_index]
+                frame = pd.DataFrame({
+                    'granularity': name,
+                    'cohort_start': (EPOCH + start_days[cohort_index].astype('timedelta64[D]')).astype('datetime64[ns]'),
+                    'period_number': period_index,
+                    'users': users_retained,
+                    'cohort_size': sizes,
+                    'retention_rate': np.round(users_retained * 100.0 / sizes, 1),
+                })
+                if segment_col:
+                    frame.insert(1, segment_col, np.asarray(segment_values, dtype=object)[seg_index])
+                frames.append(frame)
+
+            return pd.concat(frames, ignore_index=True)[columns]
+
+        except Exception as e:
+            logger.error(f"Error calculating cohort retention: {e}")
+            return pd.DataFrame(columns=columns)
+
+    @staticmethod
+    def retention_matrix(events, granularity='week', segment_col=None, value='retention_rate', **kwargs):
+        """Cohort x period matrix of ``value`` (retention_rate or users), one row per cohort (and segment)"""
+        table = CohortEngine.retention(events, granularity, segment_col, **kwargs)
+        if table.empty:
+            return pd.DataFrame()
+        index = [segment_col, 'cohort_start'] if segment_col else ['cohort_start']
+        return table.pivot_table(index=index, columns='period_number', values=value, aggfunc='first')
@@ -0,0 +1,280 @@
+import pandas as pd
+import numpy as np
+import logging
+
+from dashboard.components.activity_frame import EPOCH, to_day_numbers
+from dashboard.components.funnel_engine import FunnelStep
+from dashboard.utils.analytics_backend import get_backend, read_sql
+from dashboard.utils.query_cache import get_query_cache, query_cache_enabled
+from analysis.cohort_analysis import period_start
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (25, 50, 75, 90)
+
+PREMIUM = FunnelStep("Premium", {'subscription_type': 'premium'})
+
+
+def lesson_milestone(n):
+    """Milestone reached on the day a user completes their n-th lesson"""
+    return FunnelStep(f"Lesson {n}", {'lesson_completed': True}, min_count=n)
+
+
+def resolve_milestone(milestone):
+    """'premium', an int N (N-th completed lesson) or a FunnelStep"""
+    if isinstance(milestone, FunnelStep):
+        return milestone
+    if milestone == 'premium':
+        return PREMIUM
+    if isinstance(milestone, int) and milestone > 0:
+        return lesson_milestone(milestone)
+    raise ValueError(f"Unknown milestone {milestone!r}; expected 'premium', a lesson count or a FunnelStep")
+
+
+class ConversionLatency:
+    """Time from signup (a user's first active day) to a milestone, per signup cohort and segment.
+
+    Events are sorted by (user, day) once; the day each user reaches a
+    milestone comes from a running per-user count over the sorted arrays, and
+    percentiles and Kaplan-Meier curves for every group are computed from
+    bincounts over (group, day) cells. Users who haven't converted yet are
+    right-censored at ``as_of`` (default: the last day in the data), so recent
+    cohorts don't drag the curves down.
+    """
+
+    @staticmethod
+    def _prepare(events, user_col, date_col, weight_col, segment_col):
+        """Events sorted by (user, day) plus per-user signup day and first-event segment"""
+        users, _ = pd.factorize(events[user_col], sort=False)
+        days = to_day_numbers(events[date_col]).astype(np.int64)
+        tie_break = (pd.factorize(events[segment_col], sort=True)[0].astype(np.int64) + 1 if segment_col
+                     else np.zeros(len(events), dtype=np.int64))
+        # One argsort of a packed (user, day, segment) key is about twice as fast as np.lexsort
+        offsets = days - days.min()
+        span, width = int(offsets.max()) + 1, int(tie_break.max()) + 1
+        order = np.argsort((users.astype(np.int64) * span + offsets) * width + tie_break, kind='stable')
+        users, days = users[order], days[order]
+        weights = (events[weight_col].to_numpy(dtype=np.int64)[order] if weight_col
+                   else np.ones(len(order), dtype=np.int64))
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+        prepared = {
+            'order': order,
+            'days': days,
+            'weights': weights,
+            'starts': starts,
+            'ends': np.r_[starts[1:], len(order)],
+            'signup': days[starts],
+            'segments': None,
+            'segment_values': None,
+        }
+        if segment_col:
+            segments, segment_values = pd.factorize(events[segment_col].to_numpy()[order][starts], sort=True)
+            prepared['segments'], prepared['segment_values'] = segments, segment_values
+        return prepared
+
+    @staticmethod
+    def _reach_days(events, prepared, step):
+        """Day each user reaches ``step`` (counting ``min_count`` qualifying events), -1 if never"""
+        starts, ends = prepared['starts'], prepared['ends']
+        qualifying = step.mask(events)[prepared['order']]
+        counted = np.where(qualifying, prepared['weights'], 0)
+        running = np.cumsum(counted)
+        running -= np.repeat(running[starts] - counted[starts], ends - starts)
+        # Running counts only grow, so each converting user crosses min_count at exactly one event
+        crossing = np.flatnonzero(qualifying & (running >= step.min_count) & (running - counted < step.min_count))
+        reached = np.full(len(starts), -1, dtype=np.int64)
+        reached[np.searchsorted(starts, crossing, side='right') - 1] = prepared['days'][crossing]
+        return reached
+
+    @staticmethod
+    def _groups(prepared, granularity, segment_col):
+        """Per-user group codes (duplicated so 'All' and each segment are groups) and group labels"""
+        n_users = len(prepared['starts'])
+        if granularity:
+            cohort_days, cohorts = np.unique(period_start(prepared['signup'], granularity), return_inverse=True)
+        else:
+            cohort_days, cohorts = np.array([], dtype=np.int64), np.zeros(n_users, dtype=np.int64)
+        labels = ['All'] + (list(prepared['segment_values']) if segment_col else [])
+        n_labels = len(labels)
+
+        user_index = np.arange(n_users)
+        group = cohorts * n_labels
+        if segment_col:
+            user_index = np.r_[user_index, user_index]
+            group = np.r_[group, cohorts * n_labels + 1 + prepared['segments']]
+        n_cohorts = max(len(cohort_days), 1)
+        cohort_labels = (pd.DatetimeIndex((EPOCH + cohort_days.astype('timedelta64[D]')).astype('datetime64[ns]'))
+                         if granularity else pd.DatetimeIndex([pd.NaT]))
+        group_cohort = cohort_labels[np.arange(n_cohorts * n_labels) // n_labels]
+        group_segment = np.asarray(labels, dtype=object)[np.arange(n_cohorts * n_labels) % n_labels]
+        return user_index, group, n_cohorts * n_labels, group_cohort, group_segment
+
+    @staticmethod
+    def _latencies(events, milestone, granularity, segment_col, as_of, user_col, date_col, weight_col):
+        prepared = ConversionLatency._prepare(events, user_col, date_col, weight_col, segment_col)
+        reached = ConversionLatency._reach_days(events, prepared, resolve_milestone(milestone))
+        as_of_day = (int(prepared['days'].max()) if as_of is None
+                     else int(to_day_numbers(pd.Series([as_of]))[0]))
+        # Nothing after as_of has been observed yet
+        converted = (reached >= 0) & (reached <= as_of_day)
+        # Conversion latency for converters, time observed so far (censored) for everyone else
+        duration = np.where(converted, reached, as_of_day) - prepared['signup']
+        user_index, group, n_groups, group_cohort, group_segment = \
+            ConversionLatency._groups(prepared, granularity, segment_col)
+        keep = duration[user_index] >= 0  # users signing up after as_of aren't observed yet
+        user_index, group = user_index[keep], group[keep]
+        return duration[user_index], converted[user_index], group, n_groups, group_cohort, group_segment
+
+    @staticmethod
+    def distribution(events, milestone='premium', granularity='week', segment_col=None, percentiles=PERCENTILES,
+                     as_of=None, user_col='user_id', date_col='date', weight_col=None):
+        """Days-to-milestone percentiles per signup cohort and segment.
+
+        ``milestone`` is 'premium', an int N (the N-th completed lesson) or a
+        FunnelStep. ``granularity`` ('day', 'week', 'month' or None for no
+        cohort split) buckets users by signup day; with ``segment_col`` each
+        cohort also gets one row per first-event segment next to 'All'.
+        Percentiles (pNN_days) are over users who converted;
+        km_median_days is the Kaplan-Meier median, which also accounts for
+        users still unconverted, and is missing until half a group converts.
+        """
+        try:
+            if events.empty:
+                return pd.DataFrame()
+            duration, converted, group, n_groups, group_cohort, group_segment = ConversionLatency._latencies(
+                events, milestone, granularity, segment_col, as_of, user_col, date_col, weight_col)
+
+            users = np.bincount(group, minlength=n_groups)
+            converters = np.bincount(group[converted], minlength=n_groups)
+            result = pd.DataFrame({
+                'cohort_start': group_cohort,
+                'segment': group_segment,
+                'users': users,
+                'converted': converters,
+                'conversion_rate': np.round(converters * 100.0 / np.maximum(users, 1), 1),
+            })
+
+            # Percentiles with linear interpolation (as np.percentile) over each group's sorted latencies
+            order = np.lexsort((duration[converted], group[converted]))
+            latency = duration[converted][order].astype(float)
+            offsets = np.r_[0, np.cumsum(converters)[:-1]]
+            has = converters > 0
+            for q in percentiles:
+                position = (converters - 1).clip(min=0) * (q / 100.0)
+                low = np.floor(position).astype(np.int64)
+                high = np.ceil(position).astype(np.int64)
+                values = np.full(n_groups, np.nan)
+                if has.any():
+                    lo = latency[(offsets + low)[has]]
+                    hi = latency[(offsets + high)[has]]
+                    values[has] = lo + (hi - lo) * (position - low)[has]
+                result[f'p{q}_days'] = values
+
+            curves = ConversionLatency._kaplan_meier(duration, converted, group, n_groups)
+            below_half = curves['survival'] <= 0.5
+            result['km_median_days'] = np.where(below_half.any(axis=1), below_half.argmax(axis=1), np.nan)
+            return result[users > 0].reset_index(drop=True)
+
+        except Exception as e:
+            logger.error(f"Error computing conversion latency distribution: {e}")
+            return pd.DataFrame()
+
+    @staticmethod
+    def _kaplan_meier(duration, converted, group, n_groups):
+        """Group x day matrices of users at risk, conversions, censorings and the survival estimate"""
+        horizon = int(duration.max()) + 1 if len(duration) else 1
+        cell = group * horizon + duration
+        size = n_groups * horizon
+        events = np.bincount(cell[converted], minlength=size).reshape(n_groups, horizon)
+        exits = np.bincount(cell, minlength=size).reshape(n_groups, horizon)
+        totals = exits.sum(axis=1, keepdims=True)
+        at_risk = totals - np.cumsum(exits, axis=1) + exits
+        hazard = np.divide(events, at_risk, out=np.zeros(events.shape), where=at_risk > 0)
+        return {
+            'at_risk': at_risk,
+            'converted': events,
+            'censored': exits - events,
+            'survival': np.cumprod(1.0 - hazard, axis=1),
+        }
+
+    @staticmethod
+    def survival(events, milestone='premium', granularity='week', segment_col=None, max_days=None,
+                 as_of=None, user_col='user_id', date_col='date', weight_col=None):
+        """Kaplan-Meier curves of days since signup until the milestone, per signup cohort and segment.
+
+        One row per group and day while users are still at risk: at_risk,
+        converted, censored, survival (share not yet converted) and
+        converted_share (1 - survival). Arguments as in ``distribution``.
+        """
+        try:
+            if events.empty:
+                return pd.DataFrame()
+            duration, converted, group, n_groups, group_cohort, group_segment = ConversionLatency._latencies(
+                events, milestone, granularity, segment_col, as_of, user_col, date_col, weight_col)
+            curves = ConversionLatency._kaplan_meier(duration, converted, group, n_groups)
+
+            at_risk = curves['at_risk']
+            if max_days is not None:
+                at_risk = at_risk[:, :max_days + 1]
+            group_index, day = np.nonzero(at_risk > 0)
+            survival = curves['survival'][group_index, day]
+            return pd.DataFrame({
+                'cohort_start': group_cohort[group_index],
+                'segment': group_segment[group_index],
+                'day': day,
+                'at_risk': at_risk[group_index, day],
+                'converted': curves['converted'][group_index, day],
+                'censored': curves['censored'][group_index, day],
+                'survival': np.round(survival, 4),
+                'converted_share': np.round(1.0 - survival, 4),
+            })
+
+        except Exception as e:
+            logger.error(f"Error computing conversion survival curves: {e}")
+            return pd.DataFrame()
+
+
+def get_conversion_latency(milestone='premium', granularity='week', segment_col='device_type', kind='distribution',
+                           max_days=None):
+    """Conversion latency for the dashboard: ``kind`` is 'distribution' or 'survival'.
+
+    Events are read with one grouped scan of `activity`, and the computed
+    result is kept in the shared query cache, so it is dropped together with
+    the query results whenever the cache is invalidated.
+    """
+    if kind not in ('distribution', 'survival'):
+        raise ValueError(f"Unknown kind {kind!r}; expected 'distribution' or 'survival'")
+    if isinstance(milestone, FunnelStep):
+        raise ValueError("Cached conversion latency takes 'premium' or a lesson count, not a FunnelStep")
+
+    def load():
+        events = read_sql("""
+            SELECT
+                user_id,
+                date,
+                lesson_completed,
+                subscription_type,
+                device_type,
+                course_id,
+                COUNT(*) as events
+            FROM activity
+            GROUP BY user_id, date, lesson_completed, subscription_type, device_type, course_id;
+        """, name='conversion_events')
+        if kind == 'survival':
+            return ConversionLatency.survival(events, milestone, granularity, segment_col, max_days,
+                                              weight_col='events')
+        return ConversionLatency.distribution(events, milestone, granularity, segment_col, weight_col='events')
+
+    try:
+        if not query_cache_enabled():
+            return load()
+        # Keyed like the backend's own query results (per backend and DuckDB snapshot), so a
+        # new snapshot or a switch of backend never serves a stale result
+        backend = get_backend()
+        backend.sync()
+        params = (milestone, granularity, segment_col, kind, max_days)
+        key = backend.cache_key(f"-- {backend.name} conversion_latency", params)
+        return get_query_cache().get_or_load(key, load)
+    except Exception as e:
+        logger.error(f"Error getting conversion latency: {e}")
+        return pd.DataFrame()
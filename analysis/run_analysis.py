@@ -0,0 +1,469 @@
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import logging
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+import numpy as np
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from analysis.cohort_analysis import CohortEngine
+from analysis.conversion_analysis import ConversionLatency
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACT_DIR = os.path.join(ROOT, 'artifacts', 'analysis')
+MANIFEST = 'latest.json'
+
+EVENT_COLUMNS = ['user_id', 'date', 'course_id', 'lesson_completed', 'device_type', 'subscription_type']
+
+# Cheap change detector for the database source: appends and deletes move the counts, and the
+# summed row hash moves when any column of a row is updated (device, subscription, course...)
+EVENTS_FINGERPRINT_QUERY = """
+SELECT
+    COUNT(*) as events,
+    MIN(date) as first_day,
+    MAX(date) as last_day,
+    SUM(time_spent) as total_time_spent,
+    SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END) as lessons_completed,
+    CAST(SUM({row_hash}) AS VARCHAR) as row_hash{watermark}
+FROM activity;
+"""
+
+# Per-row hash of every event column, in each backend's dialect
+ROW_HASH = {
+    'postgres': "hashtext(concat_ws('|', user_id, date, course_id, lesson_completed, time_spent, "
+                "device_type, subscription_type))::bigint",
+    'duckdb': "hash(user_id, date, course_id, lesson_completed, time_spent, device_type, subscription_type)",
+}
+
+# PostgreSQL also reports when the rollups last caught up; a DuckDB snapshot has no watermarks
+ROLLUP_WATERMARK = {
+    'postgres': ",\n    (SELECT MAX(updated_at) FROM rollup_watermarks) as rollups_updated_at",
+}
+
+EVENTS_QUERY = """
+SELECT
+    user_id,
+    date,
+    course_id,
+    lesson_completed,
+    device_type,
+    subscription_type,
+    COUNT(*) as events,
+    SUM(time_spent) as time_spent
+FROM activity
+GROUP BY user_id, date, course_id, lesson_completed, device_type, subscription_type;
+"""
+
+
+class Analysis:
+    """One node of the analysis DAG.
+
+    ``func(inputs, **params)`` gets a dict of its dependencies' results by
+    name. Source nodes (no ``deps``) are called as ``func(**params)`` and
+    need a ``fingerprint(**params)`` that changes whenever their data does,
+    so an unchanged source is not even loaded. Bump ``version`` when the
+    code of a node changes to invalidate its stored results.
+    """
+
+    def __init__(self, name, func, deps=(), params=None, version=1, fingerprint=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.params = dict(params or {})
+        self.version = version
+        self.fingerprint = fingerprint
+        if not self.deps and fingerprint is None:
+            raise ValueError(f"Source analysis '{name}' needs a fingerprint")
+
+    def __repr__(self):
+        return f"Analysis({self.name!r})"
+
+
+# Sources
+def load_events(path=None):
+    """Activity events, collapsed to one row per user/day/attribute combination with an `events` count"""
+    if path:
+        df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+        df['date'] = pd.to_datetime(df['date'])
+        df['events'] = 1
+        return df[EVENT_COLUMNS + ['events', 'time_spent']]
+    from dashboard.utils.analytics_backend import read_sql
+    df = read_sql(EVENTS_QUERY, use_cache=False, name='analysis_events')
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def events_fingerprint(path=None):
+    if path:
+        stat = os.stat(path)
+        return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    from dashboard.utils.analytics_backend import get_backend
+    backend = get_backend()
+    query = EVENTS_FINGERPRINT_QUERY.format(row_hash=ROW_HASH[backend.name],
+                                            watermark=ROLLUP_WATERMARK.get(backend.name, ''))
+    row = backend.read_sql(query, use_cache=False, name='analysis_fingerprint').iloc[0]
+    return {'backend': type(backend).__name__, **{k: str(v) for k, v in row.items()}}
+
+
+# Analyses
+def user_summary(inputs):
+    """One row per user: signup and last active day, activity totals and first-day attributes"""
+    events = inputs['events']
+    events = events.assign(lessons=np.where(events['lesson_completed'], events['events'], 0),
+                           premium=events['subscription_type'] == 'premium')
+    grouped = events.groupby('user_id')
+    users = grouped.agg(
+        signup_date=('date', 'min'),
+        last_active=('date', 'max'),
+        active_days=('date', 'nunique'),
+        events=('events', 'sum'),
+        lessons=('lessons', 'sum'),
+        time_spent=('time_spent', 'sum'),
+        premium=('premium', 'any'),
+    )
+    # Attributes of the first day (lowest values when it has several), as in the funnel and cohort segments
+    first_day = events[events['date'] == grouped['date'].transform('min')]
+    first_day = first_day.sort_values(['device_type', 'subscription_type'])
+    users = users.join(first_day.groupby('user_id')[['device_type', 'subscription_type']].first())
+    return users.reset_index()
+
+
+def cohort_retention(inputs, granularity=('day', 'week', 'month'), segment_col=None):
+    return CohortEngine.retention(inputs['events'], granularity, segment_col)
+
+
+def conversion_latency(inputs, milestone='premium', granularity='week', segment_col=None):
+    return ConversionLatency.distribution(inputs['events'], milestone, granularity, segment_col, weight_col='events')
+
+
+def conversion_survival(inputs, milestone='premium', granularity='month', segment_col=None, max_days=None):
+    return ConversionLatency.survival(inputs['events'], milestone, granularity, segment_col, max_days,
+                                      weight_col='events')
+
+
+def lifecycle_stages(inputs, new_days=7, active_days=7, at_risk_days=30):
+    """Users per lifecycle stage (new, active, at_risk, dormant) as of the last active day, by device"""
+    users = inputs['users']
+    as_of = users['last_active'].max()
+    since_signup = (as_of - users['signup_date']).dt.days
+    since_active = (as_of - users['last_active']).dt.days
+    stage = np.select(
+        [since_signup < new_days, since_active < active_days, since_active < at_risk_days],
+        ['new', 'active', 'at_risk'],
+        default='dormant',
+    )
+    counts = pd.crosstab(users['device_type'], stage, margins=True, margins_name='All')
+    result = counts.stack().rename('users').reset_index()
+    result.columns = ['device_type', 'stage', 'users']
+    result = result[result['stage'] != 'All']
+    totals = result.groupby('device_type')['users'].transform('sum')
+    result['share'] = (result['users'] * 100.0 / totals).round(1)
+    result['as_of'] = as_of
+    return result.reset_index(drop=True)
+
+
+def course_performance(inputs):
+    """Per-course learners, activity, completion rate, time spent and premium share"""
+    events = inputs['events']
+    events = events.assign(lessons=np.where(events['lesson_completed'], events['events'], 0),
+                           premium_user=np.where(events['subscription_type'] == 'premium', events['user_id'], None))
+    courses = events.groupby('course_id').agg(
+        learners=('user_id', 'nunique'),
+        premium_learners=('premium_user', 'nunique'),
+        events=('events', 'sum'),
+        lessons_completed=('lessons', 'sum'),
+        time_spent=('time_spent', 'sum'),
+        first_day=('date', 'min'),
+        last_day=('date', 'max'),
+    )
+    courses['completion_rate'] = (courses['lessons_completed'] * 100.0 / courses['events']).round(1)
+    courses['avg_time_per_event'] = (courses['time_spent'] / courses['events']).round(1)
+    courses['lessons_per_learner'] = (courses['lessons_completed'] / courses['learners']).round(2)
+    courses['premium_share'] = (courses['premium_learners'] * 100.0 / courses['learners']).round(1)
+    return courses.reset_index().sort_values('learners', ascending=False, ignore_index=True)
+
+
+ANALYSES = [
+    Analysis('events', load_events, fingerprint=events_fingerprint),
+    Analysis('users', user_summary, deps=['events']),
+    Analysis('cohorts', cohort_retention, deps=['events']),
+    Analysis('cohorts_by_device', cohort_retention, deps=['events'],
+             params={'granularity': 'week', 'segment_col': 'device_type'}),
+    Analysis('cohorts_by_subscription', cohort_retention, deps=['events'],
+             params={'granularity': 'week', 'segment_col': 'subscription_type'}),
+    Analysis('conversion_premium', conversion_latency, deps=['events'], params={'segment_col': 'device_type'}),
+    Analysis('conversion_lesson_5', conversion_latency, deps=['events'], params={'milestone': 5}),
+    Analysis('premium_survival', conversion_survival, deps=['events'],
+             params={'segment_col': 'device_type', 'max_days': 90}),
+    Analysis('lifecycle', lifecycle_stages, deps=['users']),
+    Analysis('course_performance', course_performance, deps=['events']),
+]
+
+
+def analyses_by_name(analyses=None):
+    analyses = {a.name: a for a in (analyses or ANALYSES)}
+    for analysis in analyses.values():
+        missing = [d for d in analysis.deps if d not in analyses]
+        if missing:
+            raise ValueError(f"Analysis '{analysis.name}' depends on unknown {missing}")
+    return analyses
+
+
+def topological_order(analyses, only=None):
+    """Analyses in dependency order; with ``only``, just those names and everything they depend on"""
+    order, state = [], {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = 'visiting'
+        for dep in analyses[name].deps:
+            visit(dep, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in (only or analyses):
+        if name not in analyses:
+            raise ValueError(f"Unknown analysis '{name}'")
+        visit(name, [])
+    return order
+
+
+# Content-addressed store
+def digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def content_hash(value):
+    """Hash of a result's content, so equal results hash equally however they were produced"""
+    if isinstance(value, pd.DataFrame):
+        h = hashlib.sha256()
+        h.update(json.dumps([[str(c) for c in value.columns], [str(t) for t in value.dtypes]]).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        return h.hexdigest()
+    return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+class ArtifactStore:
+    """Results on disk as objects/<key>.pkl with a <key>.json metadata file.
+
+    The key hashes the analysis name, version, parameters and the content
+    hashes of its inputs, so a stored result is valid for as long as it
+    exists. ``latest.json`` maps each analysis to the key of its most
+    recent successful run; that is what the dashboard reads.
+    """
+
+    def __init__(self, root=None):
+        # Relative locations are taken from the repository root, wherever the runner is started
+        self.root = os.path.join(ROOT, root or os.getenv('ANALYSIS_ARTIFACT_DIR') or DEFAULT_ARTIFACT_DIR)
+        self.objects = os.path.join(self.root, 'objects')
+        os.makedirs(self.objects, exist_ok=True)
+
+    def path(self, key, suffix='.pkl'):
+        return os.path.join(self.objects, key + suffix)
+
+    def metadata(self, key):
+        try:
+            with open(self.path(key, '.json')) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return meta if os.path.exists(self.path(key)) else None
+
+    def load(self, key):
+        with open(self.path(key), 'rb') as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _write(path, data, mode='wb'):
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, mode) as f:
+            f.write(data)
+        os.replace(temp, path)
+
+    def save(self, key, value, meta):
+        """Write a result and its metadata (result first, so metadata always points at a complete file)"""
+        self._write(self.path(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        self._write(self.path(key, '.json'), json.dumps(meta, indent=2, default=str), 'w')
+
+    def manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def publish(self, entries):
+        manifest = self.manifest()
+        manifest.update(entries)
+        self._write(os.path.join(self.root, MANIFEST), json.dumps(manifest, indent=2, default=str), 'w')
+
+    def collect_garbage(self):
+        """Delete stored results not referenced by the manifest; returns the number removed"""
+        live = {entry['key'] for entry in self.manifest().values()}
+        removed = 0
+        for filename in os.listdir(self.objects):
+            key = filename.split('.', 1)[0]
+            if key not in live:
+                os.remove(os.path.join(self.objects, filename))
+                removed += filename.endswith('.pkl')
+        return removed
+
+
+def load_artifact(name, artifact_dir=None):
+    """Latest stored result of an analysis (e.g. for the dashboard), or None if it has never run"""
+    try:
+        store = ArtifactStore(artifact_dir)
+        entry = store.manifest().get(name)
+        return store.load(entry['key']) if entry else None
+    except Exception as e:
+        logger.error(f"Error loading analysis artifact '{name}': {e}")
+        return None
+
+
+def _execute(analysis, key, input_keys, artifact_dir, meta):
+    """Run one analysis (in a worker process) and store its result; returns its metadata"""
+    store = ArtifactStore(artifact_dir)
+    started = time.time()
+    if analysis.deps:
+        inputs = {dep: store.load(input_key) for dep, input_key in input_keys.items()}
+        result = analysis.func(inputs, **analysis.params)
+    else:
+        result = analysis.func(**analysis.params)
+    output_hash = content_hash(result)
+    meta.update({
+        'output_hash': output_hash,
+        'seconds': round(time.time() - started, 3),
+        'rows': len(result) if hasattr(result, '__len__') else None,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    store.save(key, result, meta)
+    return meta
+
+
+def run(only=None, force=False, workers=None, artifact_dir=None, analyses=None):
+    """Run the analysis DAG, reusing every stored result whose inputs haven't changed.
+
+    Sources are fingerprinted first and only reloaded when the fingerprint
+    moves. A node's key is derived from its inputs' content hashes, so a
+    node whose inputs came out identical is not rerun even when something
+    upstream was. Independent nodes run in parallel on a process pool.
+    Returns {name: status} with status 'cached', 'computed', 'failed' or
+    'skipped' (a dependency failed).
+    """
+    registry = analyses_by_name(analyses)
+    order = topological_order(registry, only)
+    store = ArtifactStore(artifact_dir)
+    workers = workers or int(os.getenv('ANALYSIS_WORKERS', 0)) or os.cpu_count() or 1
+
+    keys, hashes, status, published = {}, {}, {}, {}
+    pending = list(order)
+    running = {}
+    # spawn: workers don't inherit database connections or backend threads from this process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        while pending or running:
+            for name in list(pending):
+                analysis = registry[name]
+                if any(status.get(dep) in ('failed', 'skipped') for dep in analysis.deps):
+                    status[name] = 'skipped'
+                    pending.remove(name)
+                    logger.warning(f"Skipping '{name}': a dependency failed")
+                    continue
+                if not all(dep in hashes for dep in analysis.deps):
+                    continue
+                pending.remove(name)
+
+                inputs = {dep: hashes[dep] for dep in analysis.deps}
+                if not analysis.deps:
+                    try:
+                        inputs = {'fingerprint': analysis.fingerprint(**analysis.params)}
+                    except Exception as e:
+                        status[name] = 'failed'
+                        logger.error(f"{name}: fingerprint failed: {e}")
+                        continue
+                meta = {'analysis': name, 'version': analysis.version, 'params': analysis.params, 'inputs': inputs}
+                keys[name] = key = digest([name, analysis.version, analysis.params, inputs])
+                cached = None if force else store.metadata(key)
+                if cached is not None:
+                    hashes[name], status[name] = cached['output_hash'], 'cached'
+                    published[name] = {'key': key, **{k: cached.get(k) for k in ('output_hash', 'created_at', 'rows')}}
+                    logger.info(f"{name}: up to date ({key[:12]})")
+                    continue
+                input_keys = {dep: keys[dep] for dep in analysis.deps}
+                running[pool.submit(_execute, analysis, key, input_keys, store.root, meta)] = name
+                logger.info(f"{name}: running ({key[:12]})")
+
+            if not running:
+                if pending:
+                    raise RuntimeError(f"Analyses {pending} can never become ready")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result_meta = future.result()
+                except Exception as e:
+                    status[name] = 'failed'
+                    logger.error(f"{name}: failed: {e}")
+                    continue
+                hashes[name], status[name] = result_meta['output_hash'], 'computed'
+                published[name] = {'key': keys[name],
+                                   **{k: result_meta[k] for k in ('output_hash', 'created_at', 'rows')}}
+                logger.info(f"{name}: computed in {result_meta['seconds']:.2f}s ({result_meta['rows']} rows)")
+
+    store.publish(published)
+    return status
+
+
+def main():
+    """Run the batch analyses and store their results for the dashboard"""
+    parser = argparse.ArgumentParser(description="Run the analysis DAG with a content-addressed result cache")
+    parser.add_argument('analyses', nargs='*', help="analyses to run, with their dependencies (default all)")
+    parser.add_argument('--input', help="read events from a CSV or Parquet file instead of the analytics backend")
+    parser.add_argument('--workers', type=int, help="worker processes (default ANALYSIS_WORKERS or the CPU count)")
+    parser.add_argument('--artifact-dir', help=f"result store (default ANALYSIS_ARTIFACT_DIR or {DEFAULT_ARTIFACT_DIR})")
+    parser.add_argument('--force', action='store_true', help="recompute even when stored results are current")
+    parser.add_argument('--gc', action='store_true', help="delete stored results no longer in the manifest")
+    parser.add_argument('--list', action='store_true', help="list the analyses and their dependencies")
+    args = parser.parse_args()
+
+    if args.list:
+        for name in topological_order(analyses_by_name()):
+            analysis = analyses_by_name()[name]
+            print(f"{name:<26} <- {', '.join(analysis.deps) or '(source)'}")
+        return
+
+    analyses = ANALYSES
+    if args.input:
+        analyses = [Analysis(a.name, a.func, a.deps, {**a.params, 'path': args.input}, a.version, a.fingerprint)
+                    if a.name == 'events' else a for a in ANALYSES]
+
+    started = time.time()
+    status = run(args.analyses or None, args.force, args.workers, args.artifact_dir, analyses)
+    counts = pd.Series(status).value_counts().to_dict()
+    logger.info(f"Analysis run finished in {time.time() - started:.1f}s: {counts}")
+    if args.gc:
+        removed = ArtifactStore(args.artifact_dir).collect_garbage()
+        logger.info(f"Removed {removed} stale results")
+    if any(s in ('failed', 'skipped') for s in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    main()
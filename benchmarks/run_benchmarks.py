@@ -0,0 +1,302 @@
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import warnings
+import statistics
+import tracemalloc
+import subprocess
+from datetime import datetime
+from dotenv import load_dotenv
+import logging
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'scripts'))
+
+load_dotenv()
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger('benchmarks')
+logger.setLevel(logging.INFO)
+# read_sql on a psycopg2 connection warns on every query, which would drown the results
+warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
+
+# Users per dataset size; the generator yields roughly 12 activity rows per user over 90 days
+SIZES = {'small': 2000, 'medium': 20000, 'large': 100000}
+SEED = 42
+NUM_DAYS = 90
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+
+# Data
+def generate_dataset(users, jobs=1):
+    """Activity rows for `users` users from the seeded generator (ending today, like the dashboard windows)"""
+    from generate_sample_data import generate_realistic_edtech_data
+    df = generate_realistic_edtech_data(users, NUM_DAYS, seed=SEED, jobs=jobs)
+    df['date'] = df['date'].astype('datetime64[ns]')
+    for column in ('course_id', 'device_type', 'subscription_type'):
+        df[column] = df[column].astype(str)
+    return df
+
+
+def load_backend(df, backend, workdir, db_url=None):
+    """Put the dataset behind the analytics backend the fetchers will query"""
+    if backend == 'duckdb':
+        from convert_to_parquet import convert_csv_to_parquet
+        csv_path = os.path.join(workdir, 'activity.csv')
+        df.to_csv(csv_path, index=False)
+        convert_csv_to_parquet([csv_path], os.path.join(workdir, 'parquet'), overwrite=True)
+        os.remove(csv_path)
+    else:
+        import psycopg2
+        from dashboard.utils.bulk_load import load_activity
+        from dashboard.utils.rollups import refresh_rollups
+        with open(os.path.join(ROOT, 'data', 'schema.sql')) as file:
+            schema = file.read()
+        conn = psycopg2.connect(db_url)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(schema)
+            conn.commit()
+            load_activity(conn, df, replace=True)
+            refresh_rollups(conn, full=True)
+        finally:
+            conn.close()
+
+
+def configure_environment(backend, workdir, db_url=None):
+    """Point the dashboard at the benchmark data, with the query cache off so every run hits the engine"""
+    os.environ['ANALYTICS_BACKEND'] = backend
+    os.environ['QUERY_CACHE_ENABLED'] = 'False'
+    os.environ['ACTIVITY_PARQUET_DIR'] = os.path.join(workdir, 'parquet')
+    if db_url:
+        os.environ['DB_URL'] = db_url
+
+
+# Cases
+def build_cases(df):
+    """Benchmark name -> zero-argument callable, for one dataset"""
+    import pandas as pd
+    from dashboard import app as dashboard
+    from dashboard.components.data_processor import DataProcessor
+    from dashboard.components.chart_factory import ChartFactory
+    from dashboard.components.activity_frame import ActivityFrame
+
+    # Inputs are derived outside the timed calls
+    activity = df.assign(signup_date=df.groupby('user_id')['date'].transform('min'))
+    frame = ActivityFrame.from_dataframe(activity, date_columns=('date', 'signup_date'))
+    daily = (df.groupby('date')
+               .agg(daily_active_users=('user_id', 'nunique'), total_sessions=('user_id', 'size'))
+               .reset_index())
+    users = (df.groupby('user_id')
+               .agg(total_sessions=('date', 'size'), subscription_type=('subscription_type', 'last'))
+               .reset_index())
+    users_frame = ActivityFrame.from_dataframe(users, date_columns=())
+    segment_daily = (df.groupby(['date', 'device_type', 'subscription_type', 'course_id'])
+                       .agg(active_users=('user_id', 'nunique'), sessions=('user_id', 'size'))
+                       .reset_index())
+    trends = dashboard.get_trends_data()
+    cohort = dashboard.get_cohort_data()
+    funnel = dashboard.get_funnel_data()
+    segmentation = dashboard.get_segmentation_data()
+    weekly = cohort[cohort['granularity'] == 'week'] if not cohort.empty else cohort
+    overall = (funnel[funnel['segment'] == 'All'].sort_values('step_index') if not funnel.empty
+               else pd.DataFrame({'step': [], 'users': []}))
+    data, errors = dashboard.fetch_dashboard_data()
+    store = dashboard.serialize_dashboard_data(data, errors)
+
+    cases = {
+        'fetch.get_key_metrics': dashboard.get_key_metrics,
+        'fetch.get_trends_data': dashboard.get_trends_data,
+        'fetch.get_cohort_data': dashboard.get_cohort_data,
+        'fetch.get_funnel_data': dashboard.get_funnel_data,
+        'fetch.get_segmentation_data': dashboard.get_segmentation_data,
+        'fetch.get_growth_data': dashboard.get_growth_data,
+
+        'processor.calculate_retention_rates': lambda: DataProcessor.calculate_retention_rates(activity),
+        'processor.calculate_retention_rates[frame]': lambda: DataProcessor.calculate_retention_rates(frame),
+        'processor.calculate_retention_horizons': lambda: DataProcessor.calculate_retention_horizons(df),
+        'processor.calculate_retention_horizons[frame]': lambda: DataProcessor.calculate_retention_horizons(frame),
+        'processor.detect_anomalies': lambda: DataProcessor.detect_anomalies(daily, 'daily_active_users'),
+        'processor.detect_anomalies_streaming': lambda: DataProcessor.detect_anomalies_streaming(
+            segment_daily, ['active_users', 'sessions'], ['device_type', 'subscription_type', 'course_id'],
+            fill_value=0),
+        'processor.calculate_growth_rates': lambda: DataProcessor.calculate_growth_rates(daily.copy(), 'total_sessions'),
+        'processor.segment_users': lambda: DataProcessor.segment_users(users),
+        'processor.segment_users[frame]': lambda: DataProcessor.segment_users(users_frame),
+
+        'charts.create_trend_chart': lambda: ChartFactory.create_trend_chart(
+            trends, 'date', 'daily_active_users', 'Daily Active Users'),
+        'charts.create_cohort_heatmap': lambda: ChartFactory.create_cohort_heatmap(
+            weekly, 'cohort_start', 'period_number', 'retention_rate', 'Weekly Retention'),
+        'charts.create_funnel_chart': lambda: ChartFactory.create_funnel_chart(
+            overall['step'].tolist(), overall['users'].tolist(), 'Conversion Funnel'),
+        'charts.create_segmentation_chart': lambda: ChartFactory.create_segmentation_chart(
+            segmentation, 'device_type', 'users', 'Users by Device'),
+
+        'dashboard.update_dashboard': lambda: dashboard.update_dashboard(1, None),
+        'dashboard.render_panels': lambda: (
+            dashboard.update_metric_cards(store),
+            dashboard.update_trends_chart(store, 'daily_active_users'),
+            dashboard.update_cohort_heatmap(store, 'week'),
+            dashboard.update_funnel_chart(store),
+            dashboard.update_segmentation_table(store),
+            dashboard.update_insights(store),
+        ),
+    }
+    return cases
+
+
+# Measurement
+def measure(func, repeat=5):
+    """Median/min wall time over `repeat` runs after a warm-up, and peak traced memory of one more run"""
+    func()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    # Tracing slows allocation-heavy code, so memory gets its own run
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'median_s': round(statistics.median(times), 6),
+        'min_s': round(min(times), 6),
+        'peak_mb': round(peak / 1e6, 3),
+    }
+
+
+def _growth(previous, current):
+    # Tiny measurements are recorded as zero
+    return f"+{current / previous - 1:.0%}" if previous else "was zero"
+
+
+def compare(results, baseline, time_threshold=0.25, memory_threshold=0.25, min_time=0.005, min_memory=1.0):
+    """Regressions of `results` against `baseline`, as a list of messages.
+
+    A benchmark regresses when its median time or peak memory grows by more
+    than the relative threshold and by more than the absolute floor (which
+    keeps tiny, noisy measurements from failing the run).
+    """
+    regressions = []
+    for key, current in sorted(results.items()):
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        slower = current['median_s'] - previous['median_s']
+        if slower > min_time and current['median_s'] > previous['median_s'] * (1 + time_threshold):
+            regressions.append(f"{key}: time {previous['median_s'] * 1000:.1f}ms -> {current['median_s'] * 1000:.1f}ms "
+                               f"({_growth(previous['median_s'], current['median_s'])})")
+        grown = current['peak_mb'] - previous['peak_mb']
+        if grown > min_memory and current['peak_mb'] > previous['peak_mb'] * (1 + memory_threshold):
+            regressions.append(f"{key}: peak memory {previous['peak_mb']:.1f}MB -> {current['peak_mb']:.1f}MB "
+                               f"({_growth(previous['peak_mb'], current['peak_mb'])})")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Run the dashboard benchmarks and compare them with the stored baseline"""
+    parser = argparse.ArgumentParser(description="Benchmark dashboard fetchers, DataProcessor, charts and callbacks")
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['small', 'medium'],
+                        help="dataset sizes to run (default small medium)")
+    parser.add_argument('--backend', choices=['duckdb', 'postgres'], default='duckdb',
+                        help="engine behind the fetchers (postgres needs --db-url)")
+    parser.add_argument('--db-url', default=os.getenv('BENCHMARK_DB_URL'),
+                        help="scratch database for the postgres backend (default BENCHMARK_DB_URL); its activity is replaced")
+    parser.add_argument('--filter', help="only run benchmarks whose name contains this text")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark (median is compared)")
+    parser.add_argument('--jobs', type=int, default=1, help="data generator processes")
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results.json'),
+                        help="where to write this run's results")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline to compare with")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--time-threshold', type=float, default=0.25,
+                        help="allowed relative slowdown before failing (default 0.25)")
+    parser.add_argument('--memory-threshold', type=float, default=0.25,
+                        help="allowed relative peak-memory growth before failing (default 0.25)")
+    args = parser.parse_args()
+
+    if args.backend == 'postgres':
+        if not args.db_url:
+            parser.error("the postgres backend needs --db-url or BENCHMARK_DB_URL (a scratch database)")
+        if args.db_url == os.getenv('DB_URL'):
+            parser.error("--db-url is the dashboard database; use a scratch database for benchmarks")
+
+    workdir = tempfile.mkdtemp(prefix='edtech_bench_')
+    configure_environment(args.backend, workdir, args.db_url if args.backend == 'postgres' else None)
+    results = {}
+    try:
+        for size in args.sizes:
+            started = time.time()
+            df = generate_dataset(SIZES[size], args.jobs)
+            load_backend(df, args.backend, workdir, args.db_url)
+            from dashboard.utils.analytics_backend import get_backend
+            get_backend().sync(force=True)
+            logger.info(f"{size}: {len(df)} activity rows ready in {time.time() - started:.1f}s")
+
+            for name, func in build_cases(df).items():
+                if args.filter and args.filter not in name:
+                    continue
+                results[f"{size}/{name}"] = result = measure(func, args.repeat)
+                logger.info(f"{size}/{name}: {result['median_s'] * 1000:.1f}ms median, {result['peak_mb']:.1f}MB peak")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': _git_revision(),
+            'backend': args.backend,
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': SEED,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    logger.info(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        logger.info(f"Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        logger.info(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get('meta', {}).get('backend') != args.backend:
+        logger.warning(f"Baseline was recorded on the {baseline.get('meta', {}).get('backend')} backend")
+    regressions = compare(results, baseline.get('results', {}), args.time_threshold, args.memory_threshold)
+    if regressions:
+        for message in regressions:
+            logger.error(f"Regression: {message}")
+        sys.exit(1)
+    logger.info(f"No regressions against {args.baseline} ({len(results)} benchmarks)")
+
+if __name__ == "__main__":
+    main()
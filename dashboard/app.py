@@ -8,14 +8,27 @@ import pandas as pd
 import numpy as np
 import os
 import sys
-import psycopg2
+import hmac
 from datetime import datetime, timedelta
 import logging
 from dotenv import load_dotenv
+from flask import Response, jsonify, request
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from dashboard.utils.db_pool import pool_stats
+from dashboard.utils.analytics_backend import get_backend, read_sql
+from dashboard.utils.db_queries import (COHORT_RETENTION_SQL, KEY_METRICS_SQL, RETENTION_HORIZONS_SQL, SEGMENTATION_SQL,
+                                        TRENDS_SQL, growth_queries)
+from dashboard.utils.funnel_progress import FUNNEL_PROGRESS_SQL, FUNNEL_SEGMENT, funnel_columns, funnel_events_query
+from dashboard.components.funnel_engine import FunnelEngine, DEFAULT_FUNNEL, funnel_signature
+from dashboard.components.metric_store import RETENTION_HORIZONS, get_metric_store
+from dashboard.utils.parallel import run_concurrently
+from dashboard.utils.query_cache import get_query_cache
+from dashboard.utils.ingest import BufferFull, get_ingest_buffer, get_watermarks, ingest_stats
+from dashboard.utils.instrumentation import Gauge, register, render_metrics, slow_query_plans, timed_callback
+
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,219 +37,140 @@ logger = logging.getLogger(__name__)
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 app.title = "EdTech Analytics Dashboard"
 
-# Database connection function
-def get_db_connection():
+# Prometheus-style metrics for scraping; counters are per server process
+register(Gauge('dashboard_db_pool', 'Database pool state and counters', ['stat'],
+               lambda: {(k,): v for k, v in pool_stats().items() if isinstance(v, (int, float))}))
+register(Gauge('dashboard_query_cache', 'Shared query cache counters', ['stat'],
+               lambda: {(k,): v for k, v in get_query_cache().stats().items()}))
+register(Gauge('dashboard_ingest_buffer', 'Ingest buffer state and counters', ['stat'],
+               lambda: {(k,): v for k, v in ingest_stats().items()}))
+
+
+@app.server.route('/metrics')
+def metrics_endpoint():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.server.route('/metrics/slow-queries')
+def slow_queries_endpoint():
+    """Most recently sampled EXPLAIN (ANALYZE, BUFFERS) plans of slow queries"""
+    return jsonify(list(slow_query_plans))
+
+
+@app.server.route('/ingest', methods=['POST'])
+def ingest_endpoint():
+    """Accept activity events as newline-delimited JSON, one event object per line.
+
+    Valid events are buffered and written in batches; the response (202)
+    reports how many lines were accepted and why any were rejected.
+    Returns 429 with Retry-After while the buffer is full.
+    """
+    token = os.getenv('INGEST_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return jsonify({'error': 'unauthorized'}), 401
+    if get_backend().name != 'postgres':
+        return jsonify({'error': 'ingestion requires ANALYTICS_BACKEND=postgres'}), 503
+
     try:
-        conn = psycopg2.connect(os.getenv('DB_URL'))
-        return conn
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return None
+        result = get_ingest_buffer().ingest(request.get_data(as_text=True))
+    except BufferFull as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return jsonify(result), 202 if result['accepted'] or not result['rejected'] else 400
+
+
+@app.server.route('/ingest/status')
+def ingest_status_endpoint():
+    """Ingest buffer counters and the most recent per-day ingestion watermarks"""
+    return jsonify({'buffer': ingest_stats(), 'watermarks': get_watermarks()})
 
-# Data fetching functions
+# Data fetching functions; errors propagate so fetch_dashboard_data marks only that panel unavailable
 def get_key_metrics():
     """Get key business metrics"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return {}
-        
-        # Current period metrics
-        query = """
-        WITH current_metrics AS (
-            SELECT 
-                COUNT(DISTINCT user_id) as total_users,
-                COUNT(DISTINCT CASE WHEN date >= CURRENT_DATE - INTERVAL '1 day' THEN user_id END) as dau,
-                COUNT(DISTINCT CASE WHEN date >= CURRENT_DATE - INTERVAL '7 days' THEN user_id END) as wau,
-                COUNT(DISTINCT CASE WHEN date >= CURRENT_DATE - INTERVAL '30 days' THEN user_id END) as mau,
-                ROUND(AVG(time_spent), 1) as avg_session_time,
-                ROUND(AVG(CASE WHEN lesson_completed THEN 1.0 ELSE 0.0 END) * 100, 1) as completion_rate,
-                COUNT(DISTINCT CASE WHEN subscription_type = 'premium' THEN user_id END) * 100.0 / 
-                    NULLIF(COUNT(DISTINCT user_id), 0) as premium_rate
-            FROM activity
-        ),
-        retention_metrics AS (
-            SELECT 
-                COUNT(DISTINCT CASE WHEN first_date = return_date - INTERVAL '1 day' THEN user_id END) * 100.0 /
-                    NULLIF(COUNT(DISTINCT user_id), 0) as day1_retention
-            FROM (
-                SELECT 
-                    user_id,
-                    MIN(date) as first_date,
-                    date as return_date
-                FROM activity
-                GROUP BY user_id, date
-            ) t
-        )
-        SELECT * FROM current_metrics, retention_metrics;
-        """
-        
-        df = pd.read_sql(query, conn)
-        conn.close()
-        
-        if not df.empty:
-            return df.iloc[0].to_dict()
-        return {}
-        
-    except Exception as e:
-        logger.error(f"Error getting key metrics: {e}")
+    # Session metrics from the rollups
+    df = read_sql(KEY_METRICS_SQL, name='key_metrics')
+    if df.empty:
         return {}
+    metrics = df.iloc[0].to_dict()
+    
+    # Day-N retention for every configured horizon (see the retention_horizons view)
+    retention_df = read_sql(RETENTION_HORIZONS_SQL, name='retention_horizons')
+    for row in retention_df.itertuples():
+        metrics[f"day{row.horizon}_retention"] = row.classic_retention
+        metrics[f"day{row.horizon}_rolling_retention"] = row.rolling_retention
+    
+    # Exact distinct-user counts (activity bitmaps on Postgres, a windowed scan on DuckDB)
+    today = pd.Timestamp(metrics.pop('today')).date()
+    counts = get_backend().active_user_counts(today)
+    premium_users = counts.pop('premium_users')
+    previous_mau = counts.pop('previous_mau')
+    metrics.update(counts)
+    # Distinct users don't add up over days, so the MAU change compares the exact counts
+    metrics['mau_change'] = round((counts['mau'] / previous_mau - 1) * 100, 2) if previous_mau else None
+    metrics['premium_rate'] = premium_users * 100.0 / counts['total_users'] if counts['total_users'] else 0.0
+    return metrics
 
 def get_cohort_data():
-    """Get cohort retention data"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return pd.DataFrame()
-        
-        query = """
-        WITH user_cohorts AS (
-            SELECT 
-                user_id,
-                DATE_TRUNC('week', MIN(date)) as cohort_week,
-                MIN(date) as signup_date
-            FROM activity
-            GROUP BY user_id
-        ),
-        cohort_data AS (
-            SELECT 
-                uc.cohort_week,
-                EXTRACT(WEEK FROM a.date) - EXTRACT(WEEK FROM uc.signup_date) as period_number,
-                COUNT(DISTINCT uc.user_id) as users
-            FROM user_cohorts uc
-            JOIN activity a ON uc.user_id = a.user_id
-            WHERE uc.cohort_week >= CURRENT_DATE - INTERVAL '12 weeks'
-            GROUP BY uc.cohort_week, period_number
-        ),
-        cohort_sizes AS (
-            SELECT cohort_week, COUNT(DISTINCT user_id) as cohort_size
-            FROM user_cohorts
-            WHERE cohort_week >= CURRENT_DATE - INTERVAL '12 weeks'
-            GROUP BY cohort_week
-        )
-        SELECT 
-            cd.cohort_week,
-            cd.period_number,
-            cd.users,
-            cs.cohort_size,
-            ROUND(cd.users * 100.0 / cs.cohort_size, 1) as retention_rate
-        FROM cohort_data cd
-        JOIN cohort_sizes cs ON cd.cohort_week = cs.cohort_week
-        ORDER BY cd.cohort_week, cd.period_number;
-        """
-        
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
-        
-    except Exception as e:
-        logger.error(f"Error getting cohort data: {e}")
-        return pd.DataFrame()
+    """Get cohort retention data for every granularity from the stored retention matrix"""
+    df = read_sql(COHORT_RETENTION_SQL, name='cohort_retention')
+    return df
 
-def get_funnel_data():
-    """Get conversion funnel data"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return pd.DataFrame()
-        
-        query = """
-        WITH funnel_steps AS (
-            SELECT 
-                COUNT(DISTINCT user_id) as total_users,
-                COUNT(DISTINCT CASE WHEN lesson_completed THEN user_id END) as completed_lesson,
-                COUNT(DISTINCT CASE WHEN total_lessons >= 3 THEN user_id END) as completed_3_lessons,
-                COUNT(DISTINCT CASE WHEN subscription_type = 'premium' THEN user_id END) as premium_users
-            FROM (
-                SELECT 
-                    user_id,
-                    MAX(CASE WHEN lesson_completed THEN 1 ELSE 0 END) as lesson_completed,
-                    SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END) as total_lessons,
-                    MAX(CASE WHEN subscription_type = 'premium' THEN 1 ELSE 0 END) as is_premium,
-                    subscription_type
-                FROM activity
-                GROUP BY user_id, subscription_type
-            ) t
-        )
-        SELECT * FROM funnel_steps;
-        """
-        
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
-        
-    except Exception as e:
-        logger.error(f"Error getting funnel data: {e}")
-        return pd.DataFrame()
+def get_funnel_data(steps=None, segment_col='device_type'):
+    """Get ordered conversion funnel data, overall and per segment"""
+    steps = steps or DEFAULT_FUNNEL
+    # The dashboard funnel comes from the per-user reach days kept up to date by refresh_rollups
+    signature = funnel_signature(steps)
+    if segment_col == FUNNEL_SEGMENT and signature is not None and signature == funnel_signature(DEFAULT_FUNNEL):
+        counts = read_sql(FUNNEL_PROGRESS_SQL, {'funnel': signature}, name='funnel_progress')
+        if not counts.empty:
+            return FunnelEngine.summarize(counts, steps)
+
+    # Any other funnel: one scan, collapsed to the columns its steps and segment read;
+    # `events` keeps per-row counts so "N lessons" steps stay exact
+    query = funnel_events_query(funnel_columns(steps, segment_col))
+    events = read_sql(query, name='funnel_events')
+    return FunnelEngine.compute(events, steps, weight_col='events', segment_col=segment_col)
 
 def get_trends_data():
     """Get daily/weekly trends"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return pd.DataFrame()
-        
-        query = """
-        WITH daily_metrics AS (
-            SELECT 
-                date,
-                COUNT(DISTINCT user_id) as daily_active_users,
-                COUNT(*) as total_sessions,
-                AVG(time_spent) as avg_session_time,
-                SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END) * 100.0 / COUNT(*) as completion_rate,
-                COUNT(DISTINCT CASE WHEN subscription_type = 'premium' THEN user_id END) * 100.0 / 
-                    COUNT(DISTINCT user_id) as premium_rate
-            FROM activity
-            WHERE date >= CURRENT_DATE - INTERVAL '30 days'
-            GROUP BY date
-            ORDER BY date
-        )
-        SELECT 
-            date,
-            daily_active_users,
-            total_sessions,
-            ROUND(avg_session_time, 1) as avg_session_time,
-            ROUND(completion_rate, 1) as completion_rate,
-            ROUND(premium_rate, 1) as premium_rate
-        FROM daily_metrics;
-        """
-        
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
-        
-    except Exception as e:
-        logger.error(f"Error getting trends data: {e}")
+    df = read_sql(TRENDS_SQL, name='trends')
+    return df
+
+# Days re-read before the metric store's last day on every refresh, for late rows and rollup rebuilds
+GROWTH_REFRESH_DAYS = 7
+
+def get_growth_data():
+    """Get day/week/28-day growth of every metric and segment as of the last complete day"""
+    store = get_metric_store()
+    last = store.last_day()
+    since = (last - timedelta(days=GROWTH_REFRESH_DAYS)).date() if last is not None else None
+    params = {'since': since} if since else None
+    queries = growth_queries(since)
+    totals = read_sql(queries['growth_totals'], params, use_cache=False, name='growth_totals')
+    segments = read_sql(queries['growth_segments'], params, use_cache=False, name='growth_segments')
+    retention = read_sql(queries['growth_retention'], params, use_cache=False, name='growth_retention')
+    
+    overall = [totals] + [
+        retention[retention['horizon'] == n]
+        .drop(columns='horizon')
+        .rename(columns={'cohort': f"day{n}_cohort", 'retained': f"day{n}_retained"})
+        for n in RETENTION_HORIZONS
+    ]
+    overall = pd.concat(overall, ignore_index=True).assign(device_type='All', subscription_type='All', course_id='All')
+    frame = pd.concat([overall, segments], ignore_index=True)
+    store.upsert(frame.groupby(['date'] + store.segment_cols, as_index=False).sum())
+    
+    last = store.last_day()
+    if last is None:
         return pd.DataFrame()
+    return store.growth(as_of=min(last, pd.Timestamp(datetime.now().date() - timedelta(days=1))))
 
 def get_segmentation_data():
     """Get user segmentation data"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return pd.DataFrame()
-        
-        query = """
-        SELECT 
-            device_type,
-            subscription_type,
-            COUNT(DISTINCT user_id) as users,
-            AVG(time_spent) as avg_session_time,
-            AVG(CASE WHEN lesson_completed THEN 1.0 ELSE 0.0 END) * 100 as completion_rate,
-            COUNT(*) as total_sessions
-        FROM activity
-        WHERE date >= CURRENT_DATE - INTERVAL '7 days'
-        GROUP BY device_type, subscription_type
-        ORDER BY users DESC;
-        """
-        
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
-        
-    except Exception as e:
-        logger.error(f"Error getting segmentation data: {e}")
-        return pd.DataFrame()
+    df = read_sql(SEGMENTATION_SQL, name='segmentation')
+    return df
 
 # Layout components
 def create_metric_card(title, value, delta=None, format_type="number"):
@@ -307,6 +241,17 @@ app.layout = html.Div([
         # Right Column - Cohort Heatmap
         html.Div([
             html.H3("🔥 Cohort Retention Analysis", className="section-title"),
+            dcc.Dropdown(
+                id="cohort-granularity-dropdown",
+                options=[
+                    {"label": "Daily Cohorts", "value": "day"},
+                    {"label": "Weekly Cohorts", "value": "week"},
+                    {"label": "Monthly Cohorts", "value": "month"}
+                ],
+                value="week",
+                clearable=False,
+                className="dropdown"
+            ),
             dcc.Graph(id="cohort-heatmap")
         ], className="chart-container-half")
     ], className="charts-row"),
@@ -357,8 +302,8 @@ app.layout = html.Div([
         n_intervals=0
     ),
     
-    # Hidden div to store data
-    html.Div(id="data-store", style={"display": "none"}),
+    # Fetched datasets shared by the per-panel callbacks
+    dcc.Store(id="data-store"),
     
     # Custom CSS
     html.Div([
@@ -555,138 +500,301 @@ app.layout = html.Div([
     ])
 ])
 
+# Concurrent data loading
+DASHBOARD_FETCHERS = {
+    'metrics': get_key_metrics,
+    'trends': get_trends_data,
+    'cohort': get_cohort_data,
+    'funnel': get_funnel_data,
+    'segmentation': get_segmentation_data,
+    'growth': get_growth_data,
+}
+
+def fetch_dashboard_data():
+    """Run all dashboard queries in parallel; failed or slow queries come back empty and are listed in errors"""
+    results, errors = run_concurrently(DASHBOARD_FETCHERS)
+    data = {
+        'metrics': results.get('metrics') or {},
+        'trends': results.get('trends', pd.DataFrame()),
+        'cohort': results.get('cohort', pd.DataFrame()),
+        'funnel': results.get('funnel', pd.DataFrame()),
+        'segmentation': results.get('segmentation', pd.DataFrame()),
+        'growth': results.get('growth', pd.DataFrame()),
+    }
+    return data, errors
+
+# Panel builders
+def create_unavailable_figure(title, reason="Data temporarily unavailable"):
+    """Placeholder figure for a panel whose data could not be loaded"""
+    fig = go.Figure()
+    fig.add_annotation(text=reason, showarrow=False, font=dict(size=16, color="#636e72"),
+                       xref="paper", yref="paper", x=0.5, y=0.5)
+    fig.update_layout(title=title, height=400, xaxis_visible=False, yaxis_visible=False)
+    return fig
+
+# Card delta: (metric store metric, growth column); the MAU card's change comes with the key metrics
+KPI_DELTAS = {
+    'dau': ('active_users', 'dod'),
+    'day1_retention': ('day1_retention', 'wow'),
+    'day7_retention': ('day7_retention', 'wow'),
+    'premium_rate': ('premium_rate', 'wow'),
+    'avg_session_time': ('avg_session_time', 'wow'),
+    'completion_rate': ('completion_rate', 'wow'),
+}
+
+# Cards whose value also comes from the metric store, so the number and its delta cover the same day
+KPI_VALUES = {'dau': 'active_users'}
+
+def overall_growth(growth_df):
+    """Metric store rows of the overall ('All') segment, indexed by metric"""
+    if growth_df.empty:
+        return growth_df
+    return growth_df[(growth_df['device_type'] == 'All') & (growth_df['subscription_type'] == 'All')
+                     & (growth_df['course_id'] == 'All')].set_index('metric')
+
+def kpi_deltas(growth_df):
+    """Overall growth (%) behind each KPI card, None where there is no previous period"""
+    deltas = dict.fromkeys(KPI_DELTAS)
+    overall = overall_growth(growth_df)
+    for kpi, (metric, horizon) in KPI_DELTAS.items():
+        if metric in overall.index and pd.notna(overall.at[metric, horizon]):
+            deltas[kpi] = float(overall.at[metric, horizon])
+    return deltas
+
+def kpi_values(growth_df):
+    """Overall value on the metric store's last complete day behind each KPI_VALUES card, None if missing"""
+    values = dict.fromkeys(KPI_VALUES)
+    overall = overall_growth(growth_df)
+    for kpi, metric in KPI_VALUES.items():
+        if metric in overall.index and pd.notna(overall.at[metric, 'value']):
+            values[kpi] = float(overall.at[metric, 'value'])
+    return values
+
+def create_metric_cards(metrics, growth_df=None):
+    """Create the KPI cards row"""
+    if not metrics:
+        return []
+    growth_df = growth_df if growth_df is not None else pd.DataFrame()
+    deltas, values = kpi_deltas(growth_df), kpi_values(growth_df)
+    # The day-over-day delta compares the last complete day with the one before, so the card shows that day
+    dau = values['dau'] if values['dau'] is not None else metrics.get('dau', 0)
+    return [
+        create_metric_card("Daily Active Users", dau, delta=deltas['dau']),
+        create_metric_card("Day 1 Retention", metrics.get('day1_retention') or 0, delta=deltas['day1_retention'],
+                           format_type="percentage"),
+        create_metric_card("Day 7 Retention", metrics.get('day7_retention') or 0, delta=deltas['day7_retention'],
+                           format_type="percentage"),
+        create_metric_card("Premium Conversion", metrics.get('premium_rate', 0), delta=deltas['premium_rate'],
+                           format_type="percentage"),
+        create_metric_card("Avg Session Time", metrics.get('avg_session_time', 0), delta=deltas['avg_session_time'],
+                           format_type="time"),
+        create_metric_card("Lesson Completion", metrics.get('completion_rate', 0), delta=deltas['completion_rate'],
+                           format_type="percentage"),
+        create_metric_card("Monthly Active Users", metrics.get('mau', 0), delta=metrics.get('mau_change')),
+    ]
+
+def create_trends_figure(trends_df, selected_metric):
+    """Create the activity trends chart for the selected metric"""
+    trends_fig = go.Figure()
+    if not trends_df.empty:
+        trends_fig.add_trace(go.Scatter(
+            x=trends_df['date'],
+            y=trends_df[selected_metric],
+            mode='lines+markers',
+            name=selected_metric.replace('_', ' ').title(),
+            line=dict(color='#6c5ce7', width=3),
+            marker=dict(size=8, color='#6c5ce7')
+        ))
+        
+        # Add trend line
+        z = np.polyfit(range(len(trends_df)), trends_df[selected_metric], 1)
+        p = np.poly1d(z)
+        trends_fig.add_trace(go.Scatter(
+            x=trends_df['date'],
+            y=p(range(len(trends_df))),
+            mode='lines',
+            name='Trend',
+            line=dict(color='#fd79a8', width=2, dash='dash'),
+            opacity=0.7
+        ))
+    
+    trends_fig.update_layout(
+        title=f"{selected_metric.replace('_', ' ').title()} - Last 30 Days",
+        xaxis_title="Date",
+        yaxis_title=selected_metric.replace('_', ' ').title(),
+        hovermode='x unified',
+        showlegend=True,
+        height=400
+    )
+    return trends_fig
+
+COHORT_LABELS = {
+    'day': ("Daily", "Day", "Days After Signup", "Signup Day"),
+    'week': ("Weekly", "Week", "Weeks After Signup", "Signup Week"),
+    'month': ("Monthly", "Month", "Months After Signup", "Signup Month"),
+}
+
+def create_cohort_figure(cohort_df, granularity='week'):
+    """Create the cohort retention heatmap for one cohort granularity"""
+    title_prefix, period_label, xaxis_title, yaxis_title = COHORT_LABELS[granularity]
+    cohort_fig = go.Figure()
+    if not cohort_df.empty:
+        cohort_df = cohort_df[cohort_df['granularity'] == granularity]
+    if not cohort_df.empty:
+        pivot_cohort = cohort_df.pivot(index='cohort_start', columns='period_number', values='retention_rate')
+        
+        cohort_fig.add_trace(go.Heatmap(
+            z=pivot_cohort.values,
+            x=[f"{period_label} {col}" for col in pivot_cohort.columns],
+            y=[str(idx)[:10] for idx in pivot_cohort.index],
+            colorscale='RdYlBu_r',
+            text=pivot_cohort.values,
+            texttemplate="%{text:.1f}%",
+            textfont={"size": 10},
+            hoverongaps=False
+        ))
+    
+    cohort_fig.update_layout(
+        title=f"{title_prefix} Cohort Retention Rates",
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title,
+        height=400
+    )
+    return cohort_fig
+
+def create_funnel_figure(funnel_df):
+    """Create the conversion funnel chart"""
+    funnel_fig = go.Figure()
+    if not funnel_df.empty:
+        overall = funnel_df[funnel_df['segment'] == 'All'].sort_values('step_index')
+        median_days = [f"median {days:.0f}d" if index > 0 and pd.notna(days) else ""
+                       for index, days in zip(overall['step_index'], overall['median_days_from_previous'])]
+        colors = ['#74b9ff', '#0984e3', '#6c5ce7', '#a29bfe', '#fd79a8', '#00b894']
+        
+        funnel_fig = go.Figure(go.Funnel(
+            y=overall['step'],
+            x=overall['users'],
+            customdata=median_days,
+            texttemplate='%{label}: %{value:,}<br>(%{percentInitial}) %{customdata}',
+            textfont_size=12,
+            marker_color=[colors[i % len(colors)] for i in range(len(overall))]
+        ))
+    
+    funnel_fig.update_layout(
+        title="User Conversion Funnel",
+        height=400
+    )
+    return funnel_fig
+
+def render_panel(name, builder, fallback, errors, *args):
+    """Build one panel, degrading to `fallback` if its query or rendering failed"""
+    if name in errors:
+        return fallback
+    try:
+        return builder(*args)
+    except Exception as e:
+        logger.error(f"Error rendering {name} panel: {e}")
+        return fallback
+
+# Data store helpers
+def serialize_dashboard_data(data, errors):
+    """Convert fetched datasets into a JSON-friendly payload for the data store"""
+    payload = {
+        name: value.to_dict('records') if isinstance(value, pd.DataFrame) else value
+        for name, value in data.items()
+    }
+    payload['errors'] = errors
+    return payload
+
+def store_frame(store, name):
+    """Rebuild one dataset from the data store as a DataFrame"""
+    return pd.DataFrame((store or {}).get(name) or [])
+
+def store_errors(store):
+    return (store or {}).get('errors', {})
+
+def triggered_by(prop_id):
+    """True if the running callback was fired by `prop_id` (False outside a callback)"""
+    try:
+        return any(t['prop_id'] == prop_id for t in callback_context.triggered)
+    except Exception:
+        return False
+
 # Callbacks
 @app.callback(
-    [Output("metrics-cards", "children"),
-     Output("trends-chart", "figure"),
-     Output("cohort-heatmap", "figure"),
-     Output("funnel-chart", "figure"),
-     Output("segmentation-table", "data"),
-     Output("insights-panel", "children"),
+    [Output("data-store", "data"),
      Output("last-update", "children")],
     [Input("interval-component", "n_intervals"),
-     Input("refresh-btn", "n_clicks"),
+     Input("refresh-btn", "n_clicks")]
+)
+@timed_callback()
+def update_dashboard(n_intervals, refresh_clicks):
+    """Fetch every dataset once per refresh; panels re-render from the store"""
+    # An explicit refresh bypasses cached results for every dashboard instance
+    if refresh_clicks and triggered_by("refresh-btn.n_clicks"):
+        get_query_cache().invalidate()
+        get_backend().sync(force=True)
+        get_metric_store().clear()
+    
+    data, errors = fetch_dashboard_data()
+    
+    # Last update timestamp
+    last_update = f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    if errors:
+        last_update += f" (unavailable: {', '.join(sorted(errors))})"
+    
+    return serialize_dashboard_data(data, errors), last_update
+
+@app.callback(Output("metrics-cards", "children"), Input("data-store", "data"))
+@timed_callback()
+def update_metric_cards(store):
+    return render_panel(
+        'metrics', create_metric_cards, [html.Div("Key metrics unavailable", className="metric-card")],
+        store_errors(store), (store or {}).get('metrics') or {}, store_frame(store, 'growth'))
+
+@app.callback(
+    Output("trends-chart", "figure"),
+    [Input("data-store", "data"),
      Input("trends-metric-dropdown", "value")]
 )
-def update_dashboard(n_intervals, refresh_clicks, selected_metric):
-    try:
-        # Get data
-        metrics = get_key_metrics()
-        trends_df = get_trends_data()
-        cohort_df = get_cohort_data()
-        funnel_df = get_funnel_data()
-        segmentation_df = get_segmentation_data()
-        
-        # Create metric cards
-        metric_cards = []
-        if metrics:
-            metric_cards = [
-                create_metric_card("Daily Active Users", metrics.get('dau', 0), delta=5.2),
-                create_metric_card("Day 1 Retention", metrics.get('day1_retention', 0), delta=-2.1, format_type="percentage"),
-                create_metric_card("Premium Conversion", metrics.get('premium_rate', 0), delta=1.8, format_type="percentage"),
-                create_metric_card("Avg Session Time", metrics.get('avg_session_time', 0), delta=3.4, format_type="time"),
-                create_metric_card("Lesson Completion", metrics.get('completion_rate', 0), delta=2.7, format_type="percentage"),
-                create_metric_card("Monthly Active Users", metrics.get('mau', 0), delta=8.5),
-            ]
-        
-        # Create trends chart
-        trends_fig = go.Figure()
-        if not trends_df.empty:
-            trends_fig.add_trace(go.Scatter(
-                x=trends_df['date'],
-                y=trends_df[selected_metric],
-                mode='lines+markers',
-                name=selected_metric.replace('_', ' ').title(),
-                line=dict(color='#6c5ce7', width=3),
-                marker=dict(size=8, color='#6c5ce7')
-            ))
-            
-            # Add trend line
-            z = np.polyfit(range(len(trends_df)), trends_df[selected_metric], 1)
-            p = np.poly1d(z)
-            trends_fig.add_trace(go.Scatter(
-                x=trends_df['date'],
-                y=p(range(len(trends_df))),
-                mode='lines',
-                name='Trend',
-                line=dict(color='#fd79a8', width=2, dash='dash'),
-                opacity=0.7
-            ))
-        
-        trends_fig.update_layout(
-            title=f"{selected_metric.replace('_', ' ').title()} - Last 30 Days",
-            xaxis_title="Date",
-            yaxis_title=selected_metric.replace('_', ' ').title(),
-            hovermode='x unified',
-            showlegend=True,
-            height=400
-        )
-        
-        # Create cohort heatmap
-        cohort_fig = go.Figure()
-        if not cohort_df.empty:
-            pivot_cohort = cohort_df.pivot(index='cohort_week', columns='period_number', values='retention_rate')
-            
-            cohort_fig.add_trace(go.Heatmap(
-                z=pivot_cohort.values,
-                x=[f"Week {col}" for col in pivot_cohort.columns],
-                y=[str(idx)[:10] for idx in pivot_cohort.index],
-                colorscale='RdYlBu_r',
-                text=pivot_cohort.values,
-                texttemplate="%{text:.1f}%",
-                textfont={"size": 10},
-                hoverongaps=False
-            ))
-        
-        cohort_fig.update_layout(
-            title="Weekly Cohort Retention Rates",
-            xaxis_title="Weeks After Signup",
-            yaxis_title="Signup Week",
-            height=400
-        )
-        
-        # Create funnel chart
-        funnel_fig = go.Figure()
-        if not funnel_df.empty:
-            funnel_data = funnel_df.iloc[0]
-            stages = ["Total Users", "Completed Lesson", "Completed 3+ Lessons", "Premium Users"]
-            values = [
-                funnel_data.get('total_users', 0),
-                funnel_data.get('completed_lesson', 0),
-                funnel_data.get('completed_3_lessons', 0),
-                funnel_data.get('premium_users', 0)
-            ]
-            
-            funnel_fig = go.Figure(go.Funnel(
-                y=stages,
-                x=values,
-                texttemplate='%{label}: %{value:,}<br>(%{percentInitial})',
-                textfont_size=12,
-                marker_color=['#74b9ff', '#0984e3', '#6c5ce7', '#a29bfe']
-            ))
-        
-        funnel_fig.update_layout(
-            title="User Conversion Funnel",
-            height=400
-        )
-        
-        # Prepare segmentation data
-        segmentation_data = segmentation_df.to_dict('records') if not segmentation_df.empty else []
-        
-        # Generate insights
-        insights = generate_insights(metrics, trends_df, funnel_df)
-        
-        # Last update timestamp
-        last_update = f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        
-        return (metric_cards, trends_fig, cohort_fig, funnel_fig, 
-                segmentation_data, insights, last_update)
-                
-    except Exception as e:
-        logger.error(f"Dashboard update error: {e}")
-        empty_fig = go.Figure()
-        return ([], empty_fig, empty_fig, empty_fig, [], 
-                [html.Div("Error loading data")], "Error updating")
+@timed_callback()
+def update_trends_chart(store, selected_metric):
+    return render_panel(
+        'trends', create_trends_figure, create_unavailable_figure("User Activity Trends"),
+        store_errors(store), store_frame(store, 'trends'), selected_metric)
+
+@app.callback(
+    Output("cohort-heatmap", "figure"),
+    [Input("data-store", "data"),
+     Input("cohort-granularity-dropdown", "value")]
+)
+@timed_callback()
+def update_cohort_heatmap(store, granularity):
+    return render_panel(
+        'cohort', create_cohort_figure, create_unavailable_figure("Cohort Retention Rates"),
+        store_errors(store), store_frame(store, 'cohort'), granularity)
+
+@app.callback(Output("funnel-chart", "figure"), Input("data-store", "data"))
+@timed_callback()
+def update_funnel_chart(store):
+    return render_panel(
+        'funnel', create_funnel_figure, create_unavailable_figure("User Conversion Funnel"),
+        store_errors(store), store_frame(store, 'funnel'))
+
+@app.callback(Output("segmentation-table", "data"), Input("data-store", "data"))
+@timed_callback()
+def update_segmentation_table(store):
+    if 'segmentation' in store_errors(store):
+        return []
+    return (store or {}).get('segmentation') or []
+
+@app.callback(Output("insights-panel", "children"), Input("data-store", "data"))
+@timed_callback()
+def update_insights(store):
+    # Insights degrade gracefully on their own when inputs are empty
+    return render_panel(
+        'insights', generate_insights, [html.Div("Error loading insights", className="insight-item insight-info")],
+        {}, (store or {}).get('metrics') or {}, store_frame(store, 'trends'), store_frame(store, 'funnel'))
 
 def generate_insights(metrics, trends_df, funnel_df):
     """Generate business insights based on current data"""
@@ -696,7 +804,7 @@ def generate_insights(metrics, trends_df, funnel_df):
         return [html.Div("No data available for insights", className="insight-item insight-info")]
     
     # Day 1 retention insight
-    day1_retention = metrics.get('day1_retention', 0)
+    day1_retention = metrics.get('day1_retention') or 0
     if day1_retention < 35:
         insights.append(html.Div([
             html.H4("🔴 Critical: Low Day 1 Retention", style={"margin": "0 0 10px 0", "color": "#e74c3c"}),
@@ -705,6 +813,16 @@ def generate_insights(metrics, trends_df, funnel_df):
             html.P("💡 Potential Impact: +35% retention improvement could increase MRR by $75K-120K")
         ], className="insight-item insight-critical"))
     
+    # Week-one drop-off insight: users who came back on day 1 but were gone by day 7
+    day7_retention = metrics.get('day7_retention')
+    if day7_retention is not None and day1_retention >= 35 and day7_retention < day1_retention / 2:
+        insights.append(html.Div([
+            html.H4("🟡 Warning: Week-One Drop-off", style={"margin": "0 0 10px 0", "color": "#f39c12"}),
+            html.P(f"Day 7 retention ({day7_retention:.1f}%) is less than half of Day 1 retention ({day1_retention:.1f}%). "),
+            html.P("Recommendation: Add a first-week learning plan with reminders for days 2-7."),
+            html.P(f"📊 Rolling Day 30 retention: {metrics.get('day30_rolling_retention') or 0:.1f}% of users are still active after a month")
+        ], className="insight-item insight-warning"))
+    
     # Premium conversion insight
     premium_rate = metrics.get('premium_rate', 0)
     if premium_rate < 25:
@@ -748,16 +866,8 @@ def generate_insights(metrics, trends_df, funnel_df):
     return insights
 
 if __name__ == '__main__':
-<<<<<<< HEAD
-    app.run_server(
-        debug=True,
+    app.run(
+        debug=os.getenv('DASH_DEBUG', 'True') == 'True',
         host=os.getenv('DASH_HOST', '0.0.0.0'),
         port=int(os.getenv('DASH_PORT', 8050))
     )
-=======
-    app.run(
-    debug=True,
-    host='0.0.0.0',
-    port=8050
-)
->>>>>>> a64bd1b (🚀 Major Update: Professional Analytics Dashboard v2.0)
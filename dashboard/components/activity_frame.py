@@ -0,0 +1,207 @@
+import pandas as pd
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+ACTIVITY_DATE_COLUMNS = ('date',)
+
+
+def _smallest_code_dtype(cardinality):
+    for dtype in (np.int8, np.int16, np.int32):
+        if cardinality < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def to_day_numbers(values):
+    """Dates/timestamps (any pandas-parsable form) as int32 days since 1970-01-01"""
+    days = pd.to_datetime(values).values.astype('datetime64[D]')
+    return (days - EPOCH).astype(np.int32)
+
+
+class ActivityFrame:
+    """Compact columnar activity data.
+
+    String columns are dictionary-encoded: ``codes(name)`` holds small
+    integer codes (-1 for missing) and ``categories(name)`` the values they
+    stand for. Date columns are int32 day numbers since 1970-01-01. Other
+    columns (numbers, booleans) are kept as plain NumPy arrays. Grouping on
+    codes and day numbers avoids hashing Python strings and timestamps.
+    """
+
+    def __init__(self, columns, dictionaries=None, date_columns=()):
+        self._columns = dict(columns)
+        self._dictionaries = dict(dictionaries or {})
+        self._date_columns = set(date_columns)
+        lengths = {len(values) for values in self._columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"ActivityFrame columns have different lengths: {sorted(lengths)}")
+
+    # Construction
+    @classmethod
+    def from_dataframe(cls, df, date_columns=ACTIVITY_DATE_COLUMNS):
+        """Encode a DataFrame: object/categorical columns get dictionaries, date columns become day numbers"""
+        columns, dictionaries = {}, {}
+        date_columns = [c for c in date_columns if c in df.columns]
+        for name in df.columns:
+            series = df[name]
+            if name in date_columns:
+                columns[name] = to_day_numbers(series)
+            elif isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+                codes, categories = pd.factorize(series, sort=True)
+                columns[name] = codes.astype(_smallest_code_dtype(len(categories)))
+                dictionaries[name] = np.asarray(categories, dtype=object)
+            else:
+                columns[name] = series.to_numpy()
+        return cls(columns, dictionaries, date_columns)
+
+    @classmethod
+    def from_csv(cls, path, chunksize=500000, date_columns=ACTIVITY_DATE_COLUMNS, **read_csv_kwargs):
+        """Load a CSV chunk by chunk, so the string columns are never materialised in full"""
+        parts, lookups = [], {}
+        for chunk in pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs):
+            encoded = {}
+            for name in chunk.columns:
+                series = chunk[name]
+                if name in date_columns:
+                    encoded[name] = to_day_numbers(series)
+                elif series.dtype == object:
+                    # Extend the running dictionary with this chunk's new values
+                    lookup = lookups.setdefault(name, {})
+                    codes, uniques = pd.factorize(series)
+                    mapping = np.array([lookup.setdefault(value, len(lookup)) for value in uniques], dtype=np.int64)
+                    encoded[name] = np.where(codes >= 0, mapping[codes] if len(mapping) else -1, -1)
+                else:
+                    encoded[name] = series.to_numpy()
+            parts.append(encoded)
+
+        if not parts:
+            return cls({})
+        columns, dictionaries = {}, {}
+        for name in parts[0]:
+            values = np.concatenate([part[name] for part in parts])
+            if name in lookups:
+                # Re-number so categories are sorted, as from_dataframe does
+                categories = np.array(list(lookups[name]), dtype=object)
+                order = np.argsort(categories)
+                remap = np.empty(len(order), dtype=np.int64)
+                remap[order] = np.arange(len(order))
+                values = np.where(values >= 0, remap[np.maximum(values, 0)], -1)
+                columns[name] = values.astype(_smallest_code_dtype(len(categories)))
+                dictionaries[name] = categories[order]
+            else:
+                columns[name] = values
+        frame = cls(columns, dictionaries, [c for c in date_columns if c in columns])
+        logger.info(f"Loaded {len(frame)} activity rows from {path} ({frame.memory_usage() / 1e6:.1f} MB)")
+        return frame
+
+    # Access
+    def __len__(self):
+        return len(next(iter(self._columns.values()))) if self._columns else 0
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def is_encoded(self, name):
+        return name in self._dictionaries
+
+    def is_date(self, name):
+        return name in self._date_columns
+
+    def codes(self, name):
+        """Dictionary codes of an encoded column"""
+        return self._columns[name]
+
+    def categories(self, name):
+        return self._dictionaries[name]
+
+    def days(self, name='date'):
+        """Day numbers (days since 1970-01-01) of a date column"""
+        return self._columns[name]
+
+    def values(self, name):
+        """Raw stored array: codes, day numbers or plain values"""
+        return self._columns[name]
+
+    def factorize(self, name):
+        """(codes, uniques) for grouping on any column; uniques are decoded values"""
+        values = self._columns[name]
+        if name in self._dictionaries:
+            return values, self._dictionaries[name]
+        if name in self._date_columns:
+            low = int(values.min()) if len(values) else 0
+            codes = (values - low).astype(np.int64)
+            span = np.arange(int(codes.max()) + 1 if len(codes) else 0) + low
+            return codes, pd.DatetimeIndex((EPOCH + span).astype('datetime64[ns]'))
+        uniques, codes = np.unique(values, return_inverse=True)
+        return codes, uniques
+
+    def decode(self, name):
+        """Column as a pandas Series (Categorical for encoded columns, datetime64 for dates)"""
+        values = self._columns[name]
+        if name in self._dictionaries:
+            return pd.Series(pd.Categorical.from_codes(values, self._dictionaries[name]), name=name)
+        if name in self._date_columns:
+            return pd.Series(EPOCH + values.astype('timedelta64[D]'), name=name).astype('datetime64[ns]')
+        return pd.Series(values, name=name)
+
+    def to_dataframe(self):
+        return pd.DataFrame({name: self.decode(name) for name in self._columns})
+
+    def memory_usage(self):
+        """Bytes used by the columns and dictionaries"""
+        total = sum(values.nbytes for values in self._columns.values())
+        for categories in self._dictionaries.values():
+            total += pd.Series(categories).memory_usage(deep=True, index=False)
+        return int(total)
+
+    # Derivation (frames are treated as immutable; these return new frames)
+    def take(self, indexer):
+        return ActivityFrame({name: values[indexer] for name, values in self._columns.items()},
+                             self._dictionaries, self._date_columns)
+
+    def assign(self, **columns):
+        """New frame with plain (numeric/boolean) columns added or replaced"""
+        new = dict(self._columns)
+        new.update({name: np.asarray(values) for name, values in columns.items()})
+        dictionaries = {k: v for k, v in self._dictionaries.items() if k not in columns}
+        return ActivityFrame(new, dictionaries, self._date_columns - set(columns))
+
+    def assign_encoded(self, name, codes, categories):
+        """New frame with a dictionary-encoded column added or replaced"""
+        categories = np.asarray(categories, dtype=object)
+        new = dict(self._columns)
+        new[name] = np.asarray(codes).astype(_smallest_code_dtype(len(categories)))
+        dictionaries = dict(self._dictionaries)
+        dictionaries[name] = categories
+        return ActivityFrame(new, dictionaries, self._date_columns - {name})
+
+    def assign_dates(self, name, day_numbers):
+        """New frame with a day-number date column added or replaced"""
+        new = dict(self._columns)
+        new[name] = np.asarray(day_numbers, dtype=np.int32)
+        dictionaries = {k: v for k, v in self._dictionaries.items() if k != name}
+        return ActivityFrame(new, dictionaries, self._date_columns | {name})
+
+    def with_first_date(self, name='signup_date', user_col='user_id', date_col='date'):
+        """Add each user's first activity day as a date column (e.g. as the cohort for retention)"""
+        users, _ = self.factorize(user_col)
+        days = self.days(date_col)
+        order = np.lexsort((days, users))
+        present, first_row = np.unique(users[order], return_index=True)
+        first = np.zeros(int(users.max()) + 1 if len(users) else 0, dtype=np.int32)
+        first[present] = days[order][first_row]
+        return self.assign_dates(name, first[users])
+
+    def __repr__(self):
+        return f"ActivityFrame({len(self)} rows, columns={self.columns})"
@@ -0,0 +1,237 @@
+import os
+import json
+import logging
+import warnings
+
+import pandas as pd
+import numpy as np
+
+from .activity_frame import to_day_numbers
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('ewma', 'mad')
+MAD_SCALE = 1.4826  # MAD -> standard deviation for normally distributed data
+NO_DAY = np.iinfo(np.int64).min
+
+# Arrays saved with the state, per method; everything else in __init__ is configuration
+STATE_ARRAYS = {
+    'ewma': ('last_day', 'count', 'level', 'offset', 'var'),
+    'mad': ('last_day', 'count', 'buffer', 'position', 'errors', 'error_position'),
+}
+
+
+class StreamingAnomalyDetector:
+    """Online anomaly detection for many daily series at once.
+
+    Each series (any hashable key, e.g. (metric, device, subscription,
+    course)) keeps a small fixed-size state, and every new point is scored
+    against the baseline *before* it is folded in, so a batch update costs
+    O(1) per point and is vectorised across series.
+
+    ``method='ewma'``: exponentially weighted level and variance, plus
+    additive weekday offsets when ``seasonal`` (a Monday is compared with
+    the level plus the usual Monday effect). Points beyond ``threshold`` are
+    clipped before updating so one spike doesn't inflate the baseline.
+    ``method='mad'``: the median of the last ``window`` values (of the same
+    weekday when ``seasonal``) as baseline, scaled by the MAD of the last
+    7 x ``window`` prediction errors; both are robust to outliers in the
+    history.
+
+    Points at or before a series' last processed day are ignored, so
+    re-feeding overlapping windows on every refresh is safe.
+    """
+
+    def __init__(self, method='ewma', alpha=0.1, seasonal_alpha=0.3, seasonal=True, window=8,
+                 threshold=3.0, min_periods=14, min_std=1.0):
+        if method not in METHODS:
+            raise ValueError(f"Unknown method {method!r}; expected one of {METHODS}")
+        self.method = method
+        self.alpha = alpha
+        self.seasonal_alpha = seasonal_alpha
+        self.seasonal = seasonal
+        self.window = window
+        self.threshold = threshold
+        self.min_periods = min_periods
+        self.min_std = min_std
+
+        self.keys = []
+        self._index = {}
+        self.last_day = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.level = np.zeros(0)
+        self.offset = np.zeros((0, 7))
+        self.var = np.zeros(0)
+        self.buffer = np.zeros((0, self._slots, window))
+        self.position = np.zeros((0, self._slots), dtype=np.int64)
+        self.errors = np.zeros((0, 7 * window))
+        self.error_position = np.zeros(0, dtype=np.int64)
+
+    @property
+    def _slots(self):
+        return 7 if self.seasonal else 1
+
+    def config(self):
+        return {'method': self.method, 'alpha': self.alpha, 'seasonal_alpha': self.seasonal_alpha,
+                'seasonal': self.seasonal, 'window': self.window, 'threshold': self.threshold,
+                'min_periods': self.min_periods, 'min_std': self.min_std}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return f"StreamingAnomalyDetector({self.method!r}, {len(self)} series)"
+
+    # Series bookkeeping
+    def _series_indices(self, keys):
+        """State row of every key, adding rows for keys not seen before"""
+        codes, uniques = pd.factorize(pd.Series(list(keys), dtype=object), sort=False)
+        new = [key for key in uniques if key not in self._index]
+        if new:
+            for key in new:
+                self._index[key] = len(self.keys)
+                self.keys.append(key)
+            n = len(new)
+            self.last_day = np.r_[self.last_day, np.full(n, NO_DAY)]
+            self.count = np.r_[self.count, np.zeros(n, dtype=np.int64)]
+            self.level = np.r_[self.level, np.zeros(n)]
+            self.offset = np.vstack([self.offset, np.zeros((n, 7))])
+            self.var = np.r_[self.var, np.zeros(n)]
+            self.buffer = np.concatenate([self.buffer, np.full((n, self._slots, self.window), np.nan)])
+            self.position = np.vstack([self.position, np.zeros((n, self._slots), dtype=np.int64)])
+            self.errors = np.vstack([self.errors, np.full((n, 7 * self.window), np.nan)])
+            self.error_position = np.r_[self.error_position, np.zeros(n, dtype=np.int64)]
+        lookup = np.array([self._index[key] for key in uniques], dtype=np.int64)
+        return lookup[codes]
+
+    # Scoring
+    def _step_ewma(self, rows, weekday, values):
+        warm = self.count[rows] >= self.min_periods
+        offset = self.offset[rows, weekday] if self.seasonal else np.zeros(len(rows))
+        expected = self.level[rows] + offset
+        # The recursion below settles at (1 - alpha) times the mean squared prediction error
+        std = np.maximum(np.sqrt(self.var[rows] / (1 - self.alpha)), self.min_std)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_score = (values - expected) / std
+
+        first = self.count[rows] == 0
+        # Once warmed up, fold in outliers only up to the threshold
+        bound = self.threshold * std
+        folded = np.where(warm, np.clip(values, expected - bound, expected + bound), values)
+        residual = folded - expected
+        level = self.level[rows] + self.alpha * (folded - offset - self.level[rows])
+        self.level[rows] = np.where(first, values, level)
+        self.var[rows] = np.where(first, 0.0, (1 - self.alpha) * (self.var[rows] + self.alpha * residual ** 2))
+        if self.seasonal:
+            seasonal = offset + self.seasonal_alpha * (folded - self.level[rows] - offset)
+            self.offset[rows, weekday] = np.where(first, 0.0, seasonal)
+        return expected, z_score, warm
+
+    def _step_mad(self, rows, weekday, values):
+        slot = weekday if self.seasonal else np.zeros(len(rows), dtype=np.int64)
+        history = self.buffer[rows, slot]
+        errors = self.errors[rows]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN history of new series
+            median = np.nanmedian(history, axis=1)
+            mad = np.nanmedian(np.abs(errors), axis=1)
+        std = np.maximum(MAD_SCALE * np.nan_to_num(mad), self.min_std)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_score = (values - median) / std
+        warm = ((self.count[rows] >= self.min_periods) & ((~np.isnan(history)).sum(axis=1) >= min(3, self.window))
+                & ((~np.isnan(errors)).sum(axis=1) >= 7))
+
+        # The scale comes from how far values fell from the baseline at the time, i.e. prediction errors
+        has_baseline = ~np.isnan(median)
+        error_position = self.error_position[rows]
+        self.errors[rows[has_baseline], error_position[has_baseline]] = (values - median)[has_baseline]
+        self.error_position[rows] = np.where(has_baseline, (error_position + 1) % self.errors.shape[1], error_position)
+        position = self.position[rows, slot]
+        self.buffer[rows, slot, position] = values
+        self.position[rows, slot] = (position + 1) % self.window
+        return median, z_score, warm
+
+    def update(self, keys, days, values):
+        """Score new points and fold them into the state.
+
+        ``keys`` identifies the series of each point, ``days`` are dates (or
+        day numbers) and ``values`` the observations. Returns a DataFrame
+        aligned with the input: expected, z_score, is_anomaly and processed
+        (False for points at or before the series' last processed day, or
+        with a missing value).
+        """
+        n = len(values)
+        values = np.asarray(values, dtype=np.float64)
+        days = (np.asarray(days, dtype=np.int64) if np.issubdtype(np.asarray(days).dtype, np.integer)
+                else to_day_numbers(days).astype(np.int64))
+        rows = self._series_indices(keys) if n else np.zeros(0, dtype=np.int64)
+
+        expected = np.full(n, np.nan)
+        z_score = np.full(n, np.nan)
+        is_anomaly = np.zeros(n, dtype=bool)
+        fresh = (days > self.last_day[rows]) & ~np.isnan(values)
+
+        # Several new days of one series are applied in order: round r holds each series' r-th point
+        points = np.flatnonzero(fresh)
+        points = points[np.lexsort((days[points], rows[points]))]
+        # A series gets one point per day; repeats of a day keep the first in input order
+        repeat = np.zeros(len(points), dtype=bool)
+        repeat[1:] = (rows[points][1:] == rows[points][:-1]) & (days[points][1:] == days[points][:-1])
+        fresh[points[repeat]] = False
+        points = points[~repeat]
+        series = rows[points]
+        starts = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+        rank = np.arange(len(points)) - np.repeat(starts, np.diff(np.r_[starts, len(points)]))
+
+        step = self._step_ewma if self.method == 'ewma' else self._step_mad
+        for r in range(int(rank.max()) + 1 if len(rank) else 0):
+            batch = points[rank == r]
+            batch_rows = rows[batch]
+            # 1970-01-01 (day 0) was a Thursday; weekday 0 = Monday as in pandas
+            weekday = (days[batch] + 3) % 7
+            expected[batch], z_score[batch], warm = step(batch_rows, weekday, values[batch])
+            is_anomaly[batch] = warm & (np.abs(z_score[batch]) > self.threshold)
+            self.count[batch_rows] += 1
+            self.last_day[batch_rows] = days[batch]
+
+        return pd.DataFrame({'expected': expected, 'z_score': z_score,
+                             'is_anomaly': is_anomaly, 'processed': fresh})
+
+    def last_processed(self):
+        """Latest day folded into any series (as a Timestamp), or None for an empty detector"""
+        seen = self.last_day[self.last_day != NO_DAY]
+        return pd.Timestamp(int(seen.max()), unit='D') if len(seen) else None
+
+    # Persistence
+    def save(self, path):
+        """Write configuration, series keys and state arrays to an .npz file (atomically)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        arrays = {name: getattr(self, name) for name in STATE_ARRAYS[self.method]}
+        with open(temp, 'wb') as f:
+            np.savez_compressed(f, config=np.array(json.dumps(self.config())),
+                                keys=np.array(json.dumps([list(k) if isinstance(k, tuple) else k for k in self.keys],
+                                                         default=str)),
+                                **arrays)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            detector = cls(**json.loads(str(data['config'])))
+            keys = [tuple(k) if isinstance(k, list) else k for k in json.loads(str(data['keys']))]
+            detector._series_indices(keys)
+            for name in STATE_ARRAYS[detector.method]:
+                setattr(detector, name, data[name].copy())
+        return detector
+
+    @classmethod
+    def open(cls, path, **config):
+        """Load the detector saved at ``path``, or create one with ``config`` if there is none yet"""
+        if path and os.path.exists(path):
+            detector = cls.load(path)
+            if config and any(detector.config().get(k) != v for k, v in config.items()):
+                logger.warning(f"Anomaly state {path} was saved with {detector.config()}; keeping those settings")
+            return detector
+        return cls(**config)
@@ -1,10 +1,97 @@
+import os
+import glob
+import pickle
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
 
+from .activity_frame import ActivityFrame
+from .anomaly_detector import StreamingAnomalyDetector
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
 logger = logging.getLogger(__name__)
 
+
+def _source_files(paths):
+    """CSV/Parquet files under the given files or directories (directories are searched recursively)"""
+    files = []
+    for path in ([paths] if isinstance(paths, (str, os.PathLike)) else paths):
+        path = os.fspath(path)
+        if os.path.isdir(path):
+            files += sorted(f for pattern in ('*.csv', '*.parquet')
+                            for f in glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        else:
+            files.append(path)
+    return files
+
+
+def _read_chunks(path, columns, chunksize):
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise ImportError("Reading Parquet in chunks requires pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def _spill_retention_partials(task, path, cohort_col, return_col, user_col, chunksize, buckets, spill_dir):
+    """Reduce one file to distinct (cohort, user) and (cohort, return, user) rows, sharded by user hash.
+
+    Every user lands in the same shard from every chunk of every file, so
+    shards can later be aggregated independently and their counts added.
+    """
+    columns = [c for c in dict.fromkeys([cohort_col, return_col, user_col]) if c]
+    rows = 0
+    for chunk in _read_chunks(path, columns, chunksize):
+        rows += len(chunk)
+        chunk = chunk.reset_index(drop=True)
+        shard = pd.util.hash_pandas_object(chunk[user_col], index=False).to_numpy() % buckets
+        keys = [cohort_col, return_col, user_col] if cohort_col else [return_col, user_col]
+        triples = chunk[keys].dropna().drop_duplicates()
+        triple_parts = dict(tuple(triples.groupby(shard[triples.index])))
+        pair_parts = {}
+        if cohort_col:
+            pairs = chunk[[cohort_col, user_col]].dropna().drop_duplicates()
+            pair_parts = dict(tuple(pairs.groupby(shard[pairs.index])))
+        for bucket in set(triple_parts) | set(pair_parts):
+            part = (triple_parts.get(bucket, triples.iloc[:0]), pair_parts.get(bucket))
+            with open(os.path.join(spill_dir, f"{task:05d}-{bucket:04d}.pkl"), 'ab') as f:
+                pickle.dump(part, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return rows
+
+
+def _aggregate_retention_bucket(files, cohort_col, return_col, user_col):
+    """Exact per-shard counts: users per (cohort, return) and per cohort"""
+    triples, pairs = [], []
+    for name in files:
+        with open(name, 'rb') as f:
+            while True:
+                try:
+                    part_triples, part_pairs = pickle.load(f)
+                except EOFError:
+                    break
+                triples.append(part_triples)
+                pairs.append(part_pairs)
+    triples = pd.concat(triples, ignore_index=True).drop_duplicates()
+    if cohort_col is None:
+        # Cohort = the user's first return value; exact here because the shard holds all of a user's rows
+        cohort_col = 'cohort'
+        triples[cohort_col] = triples.groupby(user_col)[return_col].transform('min')
+        pairs = triples[[cohort_col, user_col]].drop_duplicates()
+    else:
+        pairs = pd.concat(pairs, ignore_index=True).drop_duplicates()
+    return triples.groupby([cohort_col, return_col]).size(), pairs.groupby(cohort_col).size()
+
 class DataProcessor:
     """Advanced data processing for dashboard analytics"""
     
@@ -12,24 +99,168 @@ class DataProcessor:
     def calculate_retention_rates(df, cohort_col='signup_date', return_col='date', user_col='user_id'):
         """Calculate cohort retention rates"""
         try:
+            if isinstance(df, ActivityFrame):
+                return DataProcessor._frame_retention_rates(df, cohort_col, return_col, user_col)
+            
             # Create cohort table
             cohort_data = df.groupby([cohort_col, return_col])[user_col].nunique().reset_index()
             cohort_sizes = df.groupby(cohort_col)[user_col].nunique().reset_index()
-            cohort_sizes.columns = [cohort_col, 'cohort_size']
+            return DataProcessor._merge_cohort_sizes(cohort_data, cohort_sizes, cohort_col, user_col)
+        except Exception as e:
+            logger.error(f"Error calculating retention rates: {e}")
+            return pd.DataFrame()
+    
+    @staticmethod
+    def _merge_cohort_sizes(cohort_data, cohort_sizes, cohort_col, user_col):
+        cohort_sizes.columns = [cohort_col, 'cohort_size']
+        
+        # Merge and calculate retention rates
+        cohort_data = cohort_data.merge(cohort_sizes, on=cohort_col)
+        cohort_data['retention_rate'] = (cohort_data[user_col] / cohort_data['cohort_size']) * 100
+        
+        return cohort_data
+    
+    @staticmethod
+    def _run_now(func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+    
+    @staticmethod
+    def calculate_retention_rates_chunked(paths, cohort_col='signup_date', return_col='date', user_col='user_id',
+                                          chunksize=500000, buckets=16, workers=1, spill_dir=None):
+        """calculate_retention_rates over CSV/Parquet files too large to load at once.
+
+        ``paths`` is a file, a directory (searched for *.csv and *.parquet)
+        or a list of them. Each chunk is reduced to its distinct
+        (cohort, return, user) and (cohort, user) rows, which are spilled to
+        ``buckets`` shards on disk by a hash of the user; every shard then
+        holds all rows of its users, so per-shard distinct counts simply
+        add up. With ``workers`` > 1 files and shards are processed on a
+        process pool. Memory is bounded by one chunk plus one shard's
+        distinct rows. With ``cohort_col=None`` the cohort is each user's
+        first ``return_col`` value. The result equals the in-memory method
+        on the concatenated files.
+        """
+        files = _source_files(paths)
+        spill_root = tempfile.mkdtemp(prefix='retention-', dir=spill_dir)
+        pool = (ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                if workers > 1 else None)
+        try:
+            submit = pool.submit if pool else DataProcessor._run_now
+            spills = [submit(_spill_retention_partials, task, path, cohort_col, return_col, user_col,
+                             chunksize, buckets, spill_root) for task, path in enumerate(files)]
+            rows = sum(spill.result() for spill in spills)
             
-            # Merge and calculate retention rates
-            cohort_data = cohort_data.merge(cohort_sizes, on=cohort_col)
-            cohort_data['retention_rate'] = (cohort_data[user_col] / cohort_data['cohort_size']) * 100
+            shards = {}
+            for name in sorted(os.listdir(spill_root)):
+                shards.setdefault(name.rsplit('-', 1)[1], []).append(os.path.join(spill_root, name))
+            partials = [submit(_aggregate_retention_bucket, names, cohort_col, return_col, user_col)
+                        for names in shards.values()]
+            partials = [partial.result() for partial in partials]
             
-            return cohort_data
+            cohort_name = cohort_col or 'cohort'
+            if not partials:
+                return pd.DataFrame(columns=[cohort_name, return_col, user_col, 'cohort_size', 'retention_rate'])
+            counts = pd.concat([counts for counts, _ in partials]).groupby(level=[0, 1]).sum()
+            sizes = pd.concat([sizes for _, sizes in partials]).groupby(level=0).sum()
+            cohort_data = counts.rename(user_col).rename_axis([cohort_name, return_col]).reset_index()
+            cohort_sizes = sizes.rename_axis(cohort_name).reset_index()
+            logger.info(f"Computed retention from {rows} rows in {len(files)} files ({len(shards)} shards)")
+            return DataProcessor._merge_cohort_sizes(cohort_data, cohort_sizes, cohort_name, user_col)
         except Exception as e:
-            logger.error(f"Error calculating retention rates: {e}")
+            logger.error(f"Error calculating chunked retention rates: {e}")
             return pd.DataFrame()
+        finally:
+            if pool:
+                pool.shutdown()
+            shutil.rmtree(spill_root, ignore_errors=True)
     
+    @staticmethod
+    def _frame_retention_rates(frame, cohort_col, return_col, user_col):
+        """calculate_retention_rates on integer codes: distinct (cohort, return, user) triples via np.unique"""
+        cohort, cohort_values = frame.factorize(cohort_col)
+        returned, return_values = frame.factorize(return_col)
+        users, user_values = frame.factorize(user_col)
+        n_users, n_return = len(user_values), len(return_values)
+        
+        cell = cohort.astype(np.int64) * n_return + returned
+        cells, cell_users = np.unique(np.unique(cell * n_users + users) // n_users, return_counts=True)
+        sizes = np.bincount(np.unique(cohort.astype(np.int64) * n_users + users) // n_users,
+                            minlength=len(cohort_values))
+        
+        cohort_data = pd.DataFrame({
+            cohort_col: np.asarray(cohort_values)[cells // n_return],
+            return_col: np.asarray(return_values)[cells % n_return],
+            user_col: cell_users,
+            'cohort_size': sizes[cells // n_return],
+        })
+        cohort_data['retention_rate'] = (cohort_data[user_col] / cohort_data['cohort_size']) * 100
+        return cohort_data
+    
+    @staticmethod
+    def calculate_retention_horizons(df, horizons=(1, 7, 14, 30), user_col='user_id', date_col='date', as_of=None):
+        """Classic and rolling day-N retention for several horizons in one pass.
+
+        Classic: share of users active exactly N days after their first day.
+        Rolling: share of users active N or more days after their first day.
+        Only users whose day N is observable (first day <= as_of - N) count.
+        """
+        try:
+            horizons = np.array(sorted(set(horizons)), dtype=np.int64)
+            if isinstance(df, ActivityFrame):
+                # Already integer codes and day numbers; no hashing or date parsing needed
+                user_codes, _ = df.factorize(user_col)
+                days = df.days(date_col).astype(np.int64)
+            else:
+                user_codes, _ = pd.factorize(df[user_col], sort=False)
+                days = pd.to_datetime(df[date_col]).values.astype('datetime64[D]').astype(np.int64)
+            as_of_day = days.max() if as_of is None else np.datetime64(pd.Timestamp(as_of).date(), 'D').astype(np.int64)
+
+            # Sort once by (user, day); everything below is a linear sweep over the sorted arrays
+            order = np.lexsort((days, user_codes))
+            user_codes, days = user_codes[order], days[order]
+            starts = np.flatnonzero(np.r_[True, user_codes[1:] != user_codes[:-1]])
+            group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(days)]))
+            first_day = days[starts]
+            day_n = days - first_day[group]
+            last_day_n = np.maximum.reduceat(day_n, starts)
+
+            # Classic hits for all horizons at once: map each day_n to its horizon slot, if any
+            slot = np.minimum(np.searchsorted(horizons, day_n), len(horizons) - 1)
+            hit = horizons[slot] == day_n
+            classic = np.zeros((len(starts), len(horizons)), dtype=bool)
+            classic[group[hit], slot[hit]] = True
+
+            eligible = first_day[:, None] <= as_of_day - horizons[None, :]
+            rolling = last_day_n[:, None] >= horizons[None, :]
+
+            eligible_users = eligible.sum(axis=0)
+            classic_retained = (classic & eligible).sum(axis=0)
+            rolling_retained = (rolling & eligible).sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result = pd.DataFrame({
+                    'horizon': horizons,
+                    'eligible_users': eligible_users,
+                    'classic_retained': classic_retained,
+                    'rolling_retained': rolling_retained,
+                    'classic_retention': np.round(classic_retained * 100.0 / eligible_users, 1),
+                    'rolling_retention': np.round(rolling_retained * 100.0 / eligible_users, 1),
+                })
+            return result
+        except Exception as e:
+            logger.error(f"Error calculating retention horizons: {e}")
+            return pd.DataFrame()
+
     @staticmethod
     def detect_anomalies(df, metric_col, threshold=2):
         """Detect anomalies in time series data using z-score"""
         try:
+            if isinstance(df, ActivityFrame):
+                values = df.values(metric_col).astype(np.float64)
+                z_score = np.abs((values - values.mean()) / values.std(ddof=1))
+                return df.assign(z_score=z_score, is_anomaly=z_score > threshold)
+            
             df = df.copy()
             df['z_score'] = np.abs((df[metric_col] - df[metric_col].mean()) / df[metric_col].std())
             df['is_anomaly'] = df['z_score'] > threshold
@@ -39,10 +270,66 @@ class DataProcessor:
             logger.error(f"Error detecting anomalies: {e}")
             return df
     
+    @staticmethod
+    def detect_anomalies_streaming(df, metric_cols, series_cols=(), date_col='date', detector=None,
+                                   state_path=None, fill_value=None, **config):
+        """Score new daily points of many series with a persistent StreamingAnomalyDetector.
+
+        ``df`` has one row per day and combination of ``series_cols``; each
+        metric column of each combination is a series keyed
+        (metric, *series values). The detector is ``detector``, or the one
+        saved at ``state_path`` (created with ``config`` if missing and
+        saved back after the update). With ``fill_value``, days a series
+        has no row for count as that value (e.g. 0 for sparse rollups) from
+        its first day on. Returns the newly processed points: series
+        columns, metric, date, value, expected, z_score, is_anomaly.
+        """
+        series_cols = list(series_cols)
+        columns = series_cols + ['metric', date_col, 'value', 'expected', 'z_score', 'is_anomaly']
+        try:
+            if detector is None:
+                detector = StreamingAnomalyDetector.open(state_path, **config)
+            if df.empty:
+                return pd.DataFrame(columns=columns)
+            
+            long = df.melt(id_vars=series_cols + [date_col], value_vars=list(metric_cols),
+                           var_name='metric', value_name='value')
+            long[date_col] = pd.to_datetime(long[date_col])
+            keys = ['metric'] + series_cols
+            if fill_value is not None:
+                # Full series x day grid, minus days before a series first appeared
+                first_seen = long.groupby(keys)[date_col].min()
+                known = [key for key in detector.keys if isinstance(key, tuple) and len(key) == len(keys)
+                         and key[0] in set(metric_cols)]
+                if known:
+                    known = pd.MultiIndex.from_tuples(known, names=keys).difference(first_seen.index)
+                    first_seen = pd.concat([first_seen, pd.Series(long[date_col].min(), index=known)])
+                dates = pd.date_range(long[date_col].min(), long[date_col].max(), freq='D')
+                grid = pd.MultiIndex.from_tuples([(*key, day) for key, start in first_seen.items()
+                                                  for day in dates[dates >= start]],
+                                                 names=keys + [date_col])
+                long = (long.set_index(keys + [date_col])['value'].groupby(level=list(range(len(keys) + 1))).sum()
+                            .reindex(grid, fill_value=fill_value).reset_index())
+            
+            key_tuples = list(long[keys].itertuples(index=False, name=None))
+            result = detector.update(key_tuples, long[date_col], long['value'].to_numpy(dtype=np.float64))
+            long = pd.concat([long.reset_index(drop=True), result], axis=1)
+            if state_path:
+                detector.save(state_path)
+            return long[long['processed']][columns].sort_values([date_col] + keys, ignore_index=True)
+        except Exception as e:
+            logger.error(f"Error detecting streaming anomalies: {e}")
+            return pd.DataFrame(columns=columns)
+    
     @staticmethod
     def calculate_growth_rates(df, metric_col, date_col='date', periods=7):
         """Calculate growth rates over specified periods"""
         try:
+            if isinstance(df, ActivityFrame):
+                df = df.take(np.argsort(df.values(date_col), kind='stable'))
+                growth = pd.Series(df.values(metric_col)).pct_change(periods=periods) * 100
+                return df.assign(**{f'{metric_col}_growth': growth.to_numpy()})
+            
             df = df.sort_values(date_col)
             df[f'{metric_col}_growth'] = df[metric_col].pct_change(periods=periods) * 100
             
@@ -55,6 +342,9 @@ class DataProcessor:
     def segment_users(df, engagement_col='total_sessions', subscription_col='subscription_type'):
         """Segment users based on engagement and subscription"""
         try:
+            if isinstance(df, ActivityFrame):
+                return DataProcessor._frame_segment_users(df, engagement_col, subscription_col)
+            
             df = df.copy()
             
             # Define engagement segments
@@ -70,4 +360,18 @@ class DataProcessor:
             return df
         except Exception as e:
             logger.error(f"Error segmenting users: {e}")
-            return df
\ No newline at end of file
+            return df
+    
+    @staticmethod
+    def _frame_segment_users(frame, engagement_col, subscription_col):
+        """segment_users on codes: combined segment code = engagement code x subscription code"""
+        labels = ['Inactive', 'Low', 'Medium', 'High']
+        engagement = pd.cut(frame.values(engagement_col), bins=[0, 1, 5, 20, np.inf], labels=labels).codes
+        subscription, subscriptions = frame.factorize(subscription_col)
+        
+        # Engagement code -1 (outside the bins) reads 'nan', matching astype(str) on the DataFrame path;
+        # subscription code -1 (missing) leaves the segment missing, as str + NaN does there
+        segment_names = [f"{e}_{s}" for e in ['nan'] + labels for s in subscriptions]
+        segment = np.where(subscription < 0, -1, (engagement.astype(np.int64) + 1) * len(subscriptions) + subscription)
+        return (frame.assign_encoded('engagement_segment', engagement, labels)
+                     .assign_encoded('user_segment', segment, segment_names))
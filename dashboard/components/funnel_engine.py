@@ -0,0 +1,221 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FunnelStep:
+    """One ordered funnel step.
+
+    ``predicate`` selects qualifying events: ``None`` (any event), a dict of
+    ``{column: value}`` equality conditions, or a callable taking the events
+    frame and returning a boolean mask. The step is reached at the first
+    qualifying event, at or after the previous step, by which the user has
+    accumulated ``min_count`` qualifying events, optionally no more than
+    ``within_days`` after the previous step.
+    """
+
+    def __init__(self, name, predicate=None, min_count=1, within_days=None):
+        self.name = name
+        self.predicate = predicate
+        self.min_count = min_count
+        self.within_days = within_days
+
+    def mask(self, events):
+        if self.predicate is None:
+            return np.ones(len(events), dtype=bool)
+        if isinstance(self.predicate, dict):
+            mask = np.ones(len(events), dtype=bool)
+            for column, value in self.predicate.items():
+                mask &= (events[column] == value).to_numpy()
+            return mask
+        return np.asarray(self.predicate(events), dtype=bool)
+
+    def columns(self):
+        """Event columns the predicate reads, or None when it is a callable"""
+        if self.predicate is None:
+            return []
+        if isinstance(self.predicate, dict):
+            return list(self.predicate)
+        return None
+
+    def __repr__(self):
+        return f"FunnelStep({self.name!r})"
+
+
+def funnel_signature(steps):
+    """Stable hash of a funnel definition, or None if a step uses a callable predicate"""
+    definition = []
+    for step in steps:
+        if step.columns() is None:
+            return None
+        predicate = sorted((column, repr(value)) for column, value in (step.predicate or {}).items())
+        definition.append((step.name, predicate, step.min_count, step.within_days))
+    return hashlib.sha1(repr(definition).encode('utf-8')).hexdigest()[:16]
+
+
+DEFAULT_FUNNEL = [
+    FunnelStep("Total Users"),
+    FunnelStep("Completed Lesson", {'lesson_completed': True}),
+    FunnelStep("Completed 3+ Lessons", {'lesson_completed': True}, min_count=3),
+    FunnelStep("Premium Users", {'subscription_type': 'premium'}),
+]
+
+
+class FunnelEngine:
+    """Ordered funnel computed from one sort of the user event stream"""
+
+    STEP_COUNT_COLUMNS = ['segment', 'step_index', 'users', 'median_days_from_start', 'median_days_from_previous']
+
+    @staticmethod
+    def compute(events, steps=None, user_col='user_id', date_col='date', weight_col=None, segment_col=None):
+        """Per-step user counts, conversion rates and median days to reach each step.
+
+        ``events`` may be raw activity or pre-aggregated rows; with
+        ``weight_col`` each row counts as that many events towards
+        ``min_count``. With ``segment_col`` the result is also broken down by
+        the segment value of each user's first event (the lowest value when
+        the first day has several).
+        """
+        steps = steps or DEFAULT_FUNNEL
+        try:
+            if events.empty:
+                return pd.DataFrame()
+
+            _, segment_values, reached, _ = FunnelEngine._reach(events, steps, user_col, date_col,
+                                                                weight_col, segment_col)
+            rows = FunnelEngine._summarize(reached, steps, 'All')
+            if segment_col is not None:
+                segments, labels = pd.factorize(segment_values, sort=True)
+                for code, label in enumerate(labels):
+                    rows += FunnelEngine._summarize(reached[segments == code], steps, label)
+            return FunnelEngine.summarize(pd.DataFrame(rows, columns=FunnelEngine.STEP_COUNT_COLUMNS), steps)
+
+        except Exception as e:
+            logger.error(f"Error computing funnel: {e}")
+            return pd.DataFrame()
+
+    @staticmethod
+    def reach_days(events, steps=None, user_col='user_id', date_col='date', weight_col=None, segment_col=None):
+        """Day each user reached every step, for storing in user_funnel_progress.
+
+        One row per user: ``user_col``, ``segment`` (None without
+        ``segment_col``) and ``reached``, a list with the date of each step,
+        None for steps not reached. Same arguments as ``compute``.
+        """
+        steps = steps or DEFAULT_FUNNEL
+        if events.empty:
+            return pd.DataFrame(columns=[user_col, 'segment', 'reached'])
+
+        users, segment_values, reached, base_day = FunnelEngine._reach(events, steps, user_col, date_col,
+                                                                       weight_col, segment_col)
+        dates = (reached + base_day).astype('datetime64[D]').astype(object)
+        dates[reached < 0] = None
+        return pd.DataFrame({
+            user_col: users,
+            'segment': segment_values,
+            'reached': [list(row) for row in dates],
+        })
+
+    @staticmethod
+    def summarize(step_counts, steps=None):
+        """Funnel result from per-segment step counts and medians.
+
+        ``step_counts`` has one row per segment and step with the
+        STEP_COUNT_COLUMNS, e.g. aggregated from user_funnel_progress in SQL;
+        segments keep their order of appearance.
+        """
+        steps = steps or DEFAULT_FUNNEL
+        rows = []
+        for segment, group in step_counts.groupby('segment', sort=False):
+            group = group.sort_values('step_index')
+            counts = group['users'].astype(int).tolist()
+            medians = group[['median_days_from_start', 'median_days_from_previous']].to_numpy(dtype=float)
+            for k, step in enumerate(steps):
+                rows.append({
+                    'segment': segment,
+                    'step_index': k,
+                    'step': step.name,
+                    'users': counts[k],
+                    'conversion_from_start': round(counts[k] * 100.0 / counts[0], 1) if counts[0] else 0.0,
+                    'conversion_from_previous': (round(counts[k] * 100.0 / counts[k - 1], 1)
+                                                 if k > 0 and counts[k - 1] else (100.0 if k == 0 else 0.0)),
+                    'median_days_from_start': None if np.isnan(medians[k, 0]) else float(medians[k, 0]),
+                    'median_days_from_previous': None if np.isnan(medians[k, 1]) else float(medians[k, 1]),
+                })
+        return pd.DataFrame(rows)
+
+    @staticmethod
+    def _reach(events, steps, user_col, date_col, weight_col, segment_col):
+        """(user ids, first-event segments or None, reached days per user and step (-1 if not reached), base day)"""
+        user_codes, _ = pd.factorize(events[user_col], sort=False)
+        days = pd.to_datetime(events[date_col]).values.astype('datetime64[D]').astype(np.int64)
+        base_day = days.min()
+        days = days - base_day
+        weights = (events[weight_col].to_numpy(dtype=np.int64) if weight_col
+                   else np.ones(len(events), dtype=np.int64))
+
+        # Single sort by (user, day); all steps are evaluated on these arrays. The segment
+        # value breaks ties so a user's first-event segment doesn't depend on row order.
+        tie_break = (pd.factorize(events[segment_col], sort=True)[0] if segment_col is not None
+                     else np.zeros(len(events), dtype=np.int64))
+        order = np.lexsort((tie_break, days, user_codes))
+        user_codes, days, weights = user_codes[order], days[order], weights[order]
+        sorted_events = events.iloc[order]
+        n_events = len(days)
+
+        starts = np.flatnonzero(np.r_[True, user_codes[1:] != user_codes[:-1]])
+        ends = np.r_[starts[1:], n_events]
+        n_users = len(starts)
+        span = int(days.max()) + 2
+        keys = np.arange(n_users).repeat(ends - starts) * span + days
+
+        reached = np.full((n_users, len(steps)), -1, dtype=np.int64)  # day each step was reached
+        prev_day = np.zeros(n_users, dtype=np.int64)  # step 1 may start on any day
+        active = np.ones(n_users, dtype=bool)
+
+        for k, step in enumerate(steps):
+            qualifying = step.mask(sorted_events)
+            # Running per-user count of qualifying events (weighted)
+            counted = np.where(qualifying, weights, 0)
+            running = np.cumsum(counted)
+            running -= np.repeat(running[starts] - counted[starts], ends - starts)
+            candidate = qualifying & (running >= step.min_count)
+
+            # next_candidate[i] = first candidate index >= i (n_events if none)
+            positions = np.where(candidate, np.arange(n_events), n_events)
+            next_candidate = np.minimum.accumulate(positions[::-1])[::-1]
+            next_candidate = np.r_[next_candidate, n_events]
+
+            users = np.flatnonzero(active)
+            first_pos = np.searchsorted(keys, users * span + prev_day[users])
+            hit = next_candidate[first_pos]
+            ok = hit < ends[users]
+            hit_day = np.where(ok, days[np.minimum(hit, n_events - 1)], -1)
+            if step.within_days is not None and k > 0:
+                ok &= hit_day - prev_day[users] <= step.within_days
+
+            reached[users[ok], k] = hit_day[ok]
+            prev_day[users[ok]] = hit_day[ok]
+            active[:] = False
+            active[users[ok]] = True
+
+        user_ids = sorted_events[user_col].to_numpy()[starts]
+        segment_values = sorted_events[segment_col].to_numpy()[starts] if segment_col is not None else None
+        return user_ids, segment_values, reached, base_day
+
+    @staticmethod
+    def _summarize(reached, steps, segment):
+        """STEP_COUNT_COLUMNS rows for one group of users"""
+        start_day = reached[:, 0]
+        rows = []
+        for k in range(len(steps)):
+            got = reached[:, k] >= 0
+            from_start = reached[got, k] - start_day[got]
+            from_previous = reached[got, k] - reached[got, k - 1] if k > 0 else np.zeros(got.sum())
+            rows.append((segment, k, int(got.sum()),
+                         float(np.median(from_start)) if got.any() else None,
+                         float(np.median(from_previous)) if got.any() else None))
+        return rows
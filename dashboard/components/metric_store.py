@@ -0,0 +1,195 @@
+import logging
+import threading
+
+import pandas as pd
+import numpy as np
+
+from .activity_frame import EPOCH, to_day_numbers
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = {'dod': 1, 'wow': 7, 'growth_28d': 28}
+RETENTION_HORIZONS = (1, 7)
+
+# Additive per-day, per-segment components; every metric is a ratio of their sums over a window.
+# dayN_retained / dayN_cohort are keyed by the day the horizon is observed (cohort start + N).
+COMPONENTS = ('active_users', 'premium_users', 'sessions', 'total_time_spent', 'lessons_completed') + \
+    tuple(f"day{n}_{part}" for n in RETENTION_HORIZONS for part in ('retained', 'cohort'))
+
+# metric -> (numerator, denominator or None for a daily average, scale)
+METRICS = {
+    'active_users': ('active_users', None, 1.0),
+    'sessions': ('sessions', None, 1.0),
+    'avg_session_time': ('total_time_spent', 'sessions', 1.0),
+    'completion_rate': ('lessons_completed', 'sessions', 100.0),
+    'premium_rate': ('premium_users', 'active_users', 100.0),
+}
+METRICS.update({f"day{n}_retention": (f"day{n}_retained", f"day{n}_cohort", 100.0) for n in RETENTION_HORIZONS})
+
+
+class MetricStore:
+    """Daily metric components per segment, kept as running sums for growth queries.
+
+    Each component (sessions, active users, retained users, ...) is stored
+    per segment and day together with its cumulative sum, so the total over
+    any window is one subtraction. Growth over h days compares the metric
+    on the h days ending at ``as_of`` with the h days before them, for every
+    metric, segment and horizon in one vectorised step. Appending a day only
+    extends the running sums; replacing recent days recomputes them from the
+    earliest changed day.
+    """
+
+    def __init__(self, segment_cols=('segment',), horizons=None):
+        self.segment_cols = list(segment_cols)
+        self.horizons = dict(horizons or HORIZONS)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.segments = []
+        self._index = {}
+        self.first_day = None
+        self.num_days = 0
+        self.values = np.zeros((len(COMPONENTS), 0, 0))
+        self.cumulative = np.zeros((len(COMPONENTS), 0, 1))
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __repr__(self):
+        return f"MetricStore({len(self)} segments, {self.num_days} days)"
+
+    def last_day(self):
+        """Latest stored day as a Timestamp, or None for an empty store"""
+        if not self.num_days:
+            return None
+        return pd.Timestamp(EPOCH + np.timedelta64(self.first_day + self.num_days - 1, 'D'))
+
+    def clear(self):
+        """Drop every stored day and segment (the store stays usable by threads holding it)"""
+        with self._lock:
+            self._reset()
+
+    # Storage
+    def _segment_indices(self, frame):
+        keys = list(frame[self.segment_cols].itertuples(index=False, name=None))
+        codes, uniques = pd.factorize(pd.Series(keys, dtype=object), sort=False)
+        for key in uniques:
+            if key not in self._index:
+                self._index[key] = len(self.segments)
+                self.segments.append(key)
+        lookup = np.array([self._index[key] for key in uniques], dtype=np.int64)
+        return lookup[codes]
+
+    def _reserve(self, first_day, last_day):
+        """Make room for every segment and first_day..last_day; returns the first day whose running sums are stale"""
+        if self.first_day is None:
+            self.first_day = first_day
+        start = min(self.first_day, first_day)
+        end = max(self.first_day + self.num_days, last_day + 1)
+        shift = self.first_day - start
+        stale = self.num_days
+        if shift or len(self.segments) > self.values.shape[1] or end - start > self.values.shape[2]:
+            # Reallocate with spare room so appending a day at a time doesn't copy every time
+            capacity = max(end - start, 2 * self.values.shape[2])
+            values = np.zeros((len(COMPONENTS), len(self.segments), capacity))
+            values[:, :self.values.shape[1], shift:shift + self.num_days] = self.values[:, :, :self.num_days]
+            self.values = values
+            self.cumulative = np.zeros((len(COMPONENTS), len(self.segments), capacity + 1))
+            stale = 0
+        self.first_day, self.num_days = start, end - start
+        return stale
+
+    def upsert(self, frame, date_col='date'):
+        """Load daily components, replacing what the store holds from the frame's earliest day on.
+
+        ``frame`` has the date, the segment columns and any of COMPONENTS
+        (missing ones count as 0). A (segment, day) absent from the frame
+        is 0 from its earliest day on, as when a rollup deletes and
+        re-inserts its recent days.
+        """
+        if frame.empty:
+            return self
+        with self._lock:
+            days = to_day_numbers(frame[date_col]).astype(np.int64)
+            rows = self._segment_indices(frame)
+            first = int(days.min())
+            stale = self._reserve(first, int(days.max()))
+            replaced = first - self.first_day
+            span = self.num_days - replaced
+
+            cell = rows * span + (days - first)
+            for k, name in enumerate(COMPONENTS):
+                sums = (np.bincount(cell, weights=frame[name].fillna(0).to_numpy(dtype=np.float64),
+                                    minlength=len(self.segments) * span) if name in frame
+                        else np.zeros(len(self.segments) * span))
+                self.values[k, :, replaced:self.num_days] = sums.reshape(len(self.segments), span)
+            # Running sums only change from the first replaced (or newly added) day on
+            start = min(replaced, stale)
+            self.cumulative[:, :, start + 1:self.num_days + 1] = \
+                self.cumulative[:, :, start:start + 1] + np.cumsum(self.values[:, :, start:self.num_days], axis=2)
+        return self
+
+    # Queries
+    def growth(self, as_of=None):
+        """Metric values and growth (%) for every segment and metric as of one day.
+
+        ``as_of`` defaults to the last stored day. Returns the segment
+        columns, metric, value (the metric on ``as_of``) and one column per
+        horizon: the change of the metric over the ``h`` days ending on
+        ``as_of`` against the ``h`` days before (NaN where either window
+        has no data).
+        """
+        columns = self.segment_cols + ['metric', 'value'] + list(self.horizons)
+        day = int(to_day_numbers(pd.Series([pd.Timestamp(as_of)]))[0]) if as_of is not None else None
+        with self._lock:
+            if not self.num_days:
+                return pd.DataFrame(columns=columns)
+            end = day - self.first_day + 1 if day is not None else self.num_days
+            if not 0 < end <= self.num_days:
+                return pd.DataFrame(columns=columns)
+            # Window sums at lengths 1 and every horizon: (window, component, segment)
+            segments = list(self.segments)
+            lengths = np.array([1] + list(self.horizons.values()))
+            cumulative = self.cumulative[:, :len(segments)]
+            ends = [end] * len(lengths), end - lengths, end - 2 * lengths
+            current_end, previous_end, previous_start = (cumulative[:, :, np.clip(day, 0, None)].transpose(2, 0, 1)
+                                                         for day in ends)
+            current, previous = current_end - previous_end, previous_end - previous_start
+
+        num = np.array([COMPONENTS.index(m[0]) for m in METRICS.values()])
+        den = np.array([COMPONENTS.index(m[1]) if m[1] else -1 for m in METRICS.values()])
+        scale = np.array([m[2] for m in METRICS.values()])[None, :, None]
+
+        def rate(sums):
+            denominator = np.where((den >= 0)[None, :, None], sums[:, den], lengths[:, None, None])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(denominator > 0, sums[:, num] * scale / denominator, np.nan)
+
+        value, before = rate(current), rate(previous)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = np.where(before > 0, (value / before - 1) * 100, np.nan)
+        # Windows reaching back past the first stored day have no comparison
+        change[end - 2 * lengths < 0] = np.nan
+
+        metric_index, segment_index = np.meshgrid(np.arange(len(METRICS)), np.arange(len(segments)), indexing='ij')
+        result = pd.DataFrame([segments[i] for i in segment_index.ravel()], columns=self.segment_cols)
+        result['metric'] = np.array(list(METRICS), dtype=object)[metric_index.ravel()]
+        result['value'] = value[0].ravel()
+        for h, name in enumerate(self.horizons, start=1):
+            result[name] = np.round(change[h].ravel(), 2)
+        return result[columns]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metric_store():
+    """Return the process-wide metric store used by the dashboard"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MetricStore(segment_cols=('device_type', 'subscription_type', 'course_id'))
+    return _store
@@ -0,0 +1,203 @@
+import zlib
+import logging
+import threading
+from datetime import timedelta
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Number of set bits in every possible byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+SEGMENT_COLUMNS = ['device_type', 'subscription_type', 'course_id']
+ALL_USERS = 'all'
+FIRST_SEEN = 'first_seen'
+
+
+def segment_name(column, value):
+    """Bitmap segment key, e.g. ``device_type=mobile``"""
+    return f"{column}={value}"
+
+
+# Bitmap primitives: a bitmap is a uint8 array, bit i of byte j is user index 8*j + i
+def encode_bitmap(user_idx):
+    """Compress a set of user indexes into a zlib'd bitmap; returns (blob, cardinality)"""
+    user_idx = np.asarray(user_idx, dtype=np.int64)
+    if user_idx.size == 0:
+        return zlib.compress(b''), 0
+    flags = np.zeros(int(user_idx.max()) + 1, dtype=bool)
+    flags[user_idx] = True
+    bits = np.packbits(flags, bitorder='little')
+    return zlib.compress(bits.tobytes()), int(flags.sum())
+
+
+def decode_bitmap(blob):
+    return np.frombuffer(zlib.decompress(bytes(blob)), dtype=np.uint8)
+
+
+def bitmap_union(bitmaps):
+    bitmaps = list(bitmaps)
+    if not bitmaps:
+        return np.zeros(0, dtype=np.uint8)
+    result = np.zeros(max(len(b) for b in bitmaps), dtype=np.uint8)
+    for bits in bitmaps:
+        result[:len(bits)] |= bits
+    return result
+
+
+def bitmap_intersection(a, b):
+    size = min(len(a), len(b))
+    return a[:size] & b[:size]
+
+
+def bitmap_cardinality(bits):
+    return int(POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def bitmap_members(bits):
+    """User indexes set in a bitmap"""
+    return np.flatnonzero(np.unpackbits(bits, bitorder='little'))
+
+
+# Maintenance (called from refresh_rollups inside its transaction)
+ASSIGN_USER_INDEX_SQL = """
+    INSERT INTO user_index (user_id)
+    SELECT new_users.user_id
+    FROM (
+        SELECT DISTINCT a.user_id
+        FROM activity a
+        WHERE a.date >= %(from_date)s
+          AND NOT EXISTS (SELECT 1 FROM user_index u WHERE u.user_id = a.user_id)
+    ) new_users
+    ORDER BY new_users.user_id;
+"""
+
+DAY_ACTIVITY_SQL = """
+    SELECT DISTINCT u.user_idx, a.device_type, a.subscription_type, a.course_id
+    FROM activity a
+    JOIN user_index u ON u.user_id = a.user_id
+    WHERE a.date = %(date)s;
+"""
+
+DAY_FIRST_SEEN_SQL = """
+    SELECT u.user_idx
+    FROM user_first_seen f
+    JOIN user_index u ON u.user_id = f.user_id
+    WHERE f.first_date = %(date)s;
+"""
+
+
+def refresh_activity_bitmaps(cursor, from_date):
+    """Rebuild the per-day bitmaps for every day from `from_date` onwards"""
+    cursor.execute(ASSIGN_USER_INDEX_SQL, {'from_date': from_date})
+    cursor.execute("DELETE FROM daily_active_bitmaps WHERE date >= %s", (from_date,))
+    # daily_activity_totals is refreshed first, so it already lists the days to rebuild
+    cursor.execute("SELECT date FROM daily_activity_totals WHERE date >= %s ORDER BY date", (from_date,))
+    days = [row[0] for row in cursor.fetchall()]
+
+    for day in days:
+        cursor.execute(DAY_ACTIVITY_SQL, {'date': day})
+        rows = cursor.fetchall()
+        user_idx = np.array([row[0] for row in rows], dtype=np.int64)
+
+        segments = {ALL_USERS: user_idx}
+        for position, column in enumerate(SEGMENT_COLUMNS, start=1):
+            values = np.array([row[position] for row in rows], dtype=object)
+            for value in np.unique(values):
+                segments[segment_name(column, value)] = user_idx[values == value]
+
+        cursor.execute(DAY_FIRST_SEEN_SQL, {'date': day})
+        segments[FIRST_SEEN] = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+
+        records = []
+        for segment, members in segments.items():
+            blob, count = encode_bitmap(members)
+            records.append((day, segment, count, blob))
+        execute_values(cursor, """
+            INSERT INTO daily_active_bitmaps (date, segment, user_count, bitmap) VALUES %s
+        """, records)
+
+    logger.debug(f"Rebuilt activity bitmaps for {len(days)} days from {from_date}")
+
+
+# What ActiveUserBitmaps.sync reads: every stored day's version, then the new or changed days
+BITMAP_VERSIONS_SQL = "SELECT segment, date, version FROM daily_active_bitmaps WHERE segment = ANY(%s)"
+BITMAP_DAYS_SQL = "SELECT date, version, bitmap FROM daily_active_bitmaps WHERE segment = %s AND date = ANY(%s)"
+
+
+class ActiveUserBitmaps:
+    """In-memory view of the per-day active-user bitmaps.
+
+    Segments are loaded on first use and then synced incrementally: each
+    ``sync`` lists the version of every stored day and only fetches days
+    that are new or were rewritten since (late events, a backfill, a full
+    rebuild), dropping days that no longer exist.
+    Distinct users over any window is an OR of the daily bitmaps; day-N
+    retention is the AND of a day's first-seen bitmap with the bitmap N days later.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {}  # segment -> {date: uint8 array}
+        self._versions = {}  # segment -> {date: version of the loaded bitmap}
+
+    def sync(self, conn, segments=(ALL_USERS,)):
+        """Load new or changed days for the given segments from the database"""
+        with self._lock:
+            with conn.cursor() as cursor:
+                cursor.execute(BITMAP_VERSIONS_SQL, (list(segments),))
+                stored = {segment: {} for segment in segments}
+                for segment, day, version in cursor.fetchall():
+                    stored[segment][day] = version
+
+                for segment in segments:
+                    loaded = self._days.setdefault(segment, {})
+                    versions = self._versions.setdefault(segment, {})
+                    changed = [day for day, version in stored[segment].items() if versions.get(day) != version]
+                    for day in [d for d in loaded if d not in stored[segment] or d in changed]:
+                        del loaded[day]
+                        versions.pop(day, None)
+                    if not changed:
+                        continue
+                    cursor.execute(BITMAP_DAYS_SQL, (segment, changed))
+                    for day, version, blob in cursor.fetchall():
+                        loaded[day] = decode_bitmap(blob)
+                        versions[day] = version
+        return self
+
+    def active_set(self, start=None, end=None, segments=(ALL_USERS,)):
+        """Users active in [start, end] in every given segment (combined per day)"""
+        with self._lock:
+            per_segment = [self._days.get(segment, {}) for segment in segments]
+            daily = []
+            for day, bits in per_segment[0].items():
+                if (start is not None and day < start) or (end is not None and day > end):
+                    continue
+                for other in per_segment[1:]:
+                    bits = bitmap_intersection(bits, other.get(day, np.zeros(0, dtype=np.uint8)))
+                daily.append(bits)
+            return bitmap_union(daily)
+
+    def active_users(self, start=None, end=None, segments=(ALL_USERS,)):
+        """Exact number of distinct users active in [start, end]"""
+        return bitmap_cardinality(self.active_set(start, end, segments))
+
+    def retention(self, cohort_date, day_n, segments=(ALL_USERS,)):
+        """Share (%) of users first seen on `cohort_date` who were active `day_n` days later"""
+        with self._lock:
+            cohort = self._days.get(FIRST_SEEN, {}).get(cohort_date)
+        if cohort is None or not bitmap_cardinality(cohort):
+            return None
+        target_day = cohort_date + timedelta(days=day_n)
+        returned = bitmap_intersection(cohort, self.active_set(target_day, target_day, segments))
+        return bitmap_cardinality(returned) * 100.0 / bitmap_cardinality(cohort)
+
+
+_bitmaps = ActiveUserBitmaps()
+
+
+def get_activity_bitmaps(conn, segments=(ALL_USERS,)):
+    """Process-wide bitmap view, synced with the database before returning"""
+    return _bitmaps.sync(conn, segments)
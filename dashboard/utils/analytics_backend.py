@@ -0,0 +1,376 @@
+import os
+import re
+import hashlib
+import time
+import logging
+import threading
+from datetime import timedelta
+
+from .db_pool import read_sql as postgres_read_sql, pooled_connection
+from .activity_bitmaps import ALL_USERS, get_activity_bitmaps, segment_name
+from .funnel_progress import FUNNEL_SEGMENT, funnel_columns, funnel_events_query
+from ..components.funnel_engine import DEFAULT_FUNNEL, FunnelEngine, funnel_signature
+from .instrumentation import QUERY_ERRORS, query_label, record_query
+from .query_cache import cache_key, get_query_cache, query_cache_enabled
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+PREMIUM_SEGMENT = segment_name('subscription_type', 'premium')
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'data', 'schema.sql')
+
+
+class PostgresBackend:
+    """Dashboard queries against PostgreSQL (DB_URL), with rollups kept up to date by refresh_rollups"""
+
+    name = 'postgres'
+
+    def read_sql(self, query, params=None, use_cache=True, name=None):
+        return postgres_read_sql(query, params, use_cache=use_cache, name=name)
+
+    def cache_key(self, query, params=None):
+        """Query cache key of a query's result, as read_sql keys it"""
+        return cache_key(query, params)
+
+    def active_user_counts(self, today):
+        """Exact distinct users overall, since yesterday / last 7 / last 30 days, and premium users.
+
+        previous_mau counts the 31 days before the MAU window, for its period-over-period change.
+        """
+        with pooled_connection() as conn:
+            bitmaps = get_activity_bitmaps(conn, segments=(ALL_USERS, PREMIUM_SEGMENT))
+        return {
+            'total_users': bitmaps.active_users(),
+            'dau': bitmaps.active_users(today - timedelta(days=1)),
+            'wau': bitmaps.active_users(today - timedelta(days=7)),
+            'mau': bitmaps.active_users(today - timedelta(days=30)),
+            'previous_mau': bitmaps.active_users(today - timedelta(days=61), today - timedelta(days=31)),
+            'premium_users': bitmaps.active_users(segments=(PREMIUM_SEGMENT,)),
+        }
+
+    def sync(self, force=False):
+        """Rollups are maintained in the database; nothing to reload"""
+
+
+# DuckDB equivalents of the rollup tables and views in data/schema.sql, rebuilt from the
+# Parquet snapshot whenever it changes, so the dashboard SQL runs unchanged on both engines.
+# The snapshot is immutable, so even the retention_horizons view is materialised here.
+DUCKDB_ROLLUP_STATEMENTS = [
+    """
+    CREATE OR REPLACE TABLE daily_activity_rollup AS
+    SELECT
+        date,
+        device_type,
+        subscription_type,
+        course_id,
+        COUNT(DISTINCT user_id) as active_users,
+        COUNT(*) as sessions,
+        SUM(time_spent) as total_time_spent,
+        SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END) as lessons_completed
+    FROM activity
+    GROUP BY date, device_type, subscription_type, course_id;
+    """,
+    """
+    CREATE OR REPLACE TABLE daily_activity_totals AS
+    SELECT
+        date,
+        COUNT(DISTINCT user_id) as active_users,
+        COUNT(DISTINCT CASE WHEN subscription_type = 'premium' THEN user_id END) as premium_users,
+        COUNT(*) as sessions,
+        SUM(time_spent) as total_time_spent,
+        SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END) as lessons_completed
+    FROM activity
+    GROUP BY date;
+    """,
+    """
+    CREATE OR REPLACE TABLE user_segment_activity AS
+    SELECT user_id, device_type, subscription_type, MIN(date) as first_date, MAX(date) as last_date
+    FROM activity
+    GROUP BY user_id, device_type, subscription_type;
+    """,
+    """
+    CREATE OR REPLACE TABLE user_first_seen AS
+    SELECT user_id, MIN(date) as first_date
+    FROM activity
+    GROUP BY user_id;
+    """,
+    """
+    CREATE OR REPLACE TABLE cohort_retention AS
+    WITH granularities (granularity) AS (
+        VALUES ('day'), ('week'), ('month')
+    ),
+    user_periods AS (
+        SELECT DISTINCT
+            g.granularity,
+            a.user_id,
+            CAST(DATE_TRUNC(g.granularity, f.first_date) AS DATE) as cohort_start,
+            CAST(DATE_TRUNC(g.granularity, a.date) AS DATE) as activity_start
+        FROM activity a
+        JOIN user_first_seen f ON f.user_id = a.user_id
+        CROSS JOIN granularities g
+    )
+    SELECT
+        granularity,
+        cohort_start,
+        CAST(CASE granularity
+            WHEN 'day' THEN activity_start - cohort_start
+            WHEN 'week' THEN (activity_start - cohort_start) // 7
+            ELSE (EXTRACT(YEAR FROM activity_start) - EXTRACT(YEAR FROM cohort_start)) * 12
+                 + EXTRACT(MONTH FROM activity_start) - EXTRACT(MONTH FROM cohort_start)
+        END AS BIGINT) as period_number,
+        COUNT(*) as users
+    FROM user_periods
+    GROUP BY 1, 2, 3;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS retention_horizon_days AS
+    SELECT * FROM (VALUES (1), (7), (14), (30)) t(horizon);
+    """,
+    """
+    CREATE OR REPLACE TABLE retention_horizons AS
+    WITH user_days AS (
+        SELECT
+            user_id,
+            date,
+            date - MIN(date) OVER (PARTITION BY user_id) as day_n
+        FROM (SELECT DISTINCT user_id, date FROM activity) d
+    ),
+    per_user AS (
+        SELECT
+            user_id,
+            MIN(date) as first_date,
+            LIST(day_n) as active_days,
+            MAX(day_n) as last_day_n
+        FROM user_days
+        GROUP BY user_id
+    ),
+    as_of AS (
+        SELECT MAX(date) as max_date FROM activity
+    )
+    SELECT
+        h.horizon,
+        COUNT(pu.user_id) as eligible_users,
+        COUNT(pu.user_id) FILTER (WHERE list_contains(pu.active_days, h.horizon)) as classic_retained,
+        COUNT(pu.user_id) FILTER (WHERE pu.last_day_n >= h.horizon) as rolling_retained,
+        ROUND(COUNT(pu.user_id) FILTER (WHERE list_contains(pu.active_days, h.horizon)) * 100.0
+              / NULLIF(COUNT(pu.user_id), 0), 1) as classic_retention,
+        ROUND(COUNT(pu.user_id) FILTER (WHERE pu.last_day_n >= h.horizon) * 100.0
+              / NULLIF(COUNT(pu.user_id), 0), 1) as rolling_retention
+    FROM retention_horizon_days h
+    CROSS JOIN as_of
+    LEFT JOIN per_user pu ON pu.first_date <= as_of.max_date - h.horizon
+    GROUP BY h.horizon
+    ORDER BY h.horizon;
+    """,
+]
+
+# Totals come from the materialised rollups; only the last 30 days of activity are scanned
+ACTIVE_USER_COUNTS_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM user_first_seen) as total_users,
+        COUNT(DISTINCT user_id) FILTER (WHERE date >= $today - 1) as dau,
+        COUNT(DISTINCT user_id) FILTER (WHERE date >= $today - 7) as wau,
+        COUNT(DISTINCT user_id) FILTER (WHERE date >= $today - 30) as mau,
+        COUNT(DISTINCT user_id) FILTER (WHERE date < $today - 30) as previous_mau,
+        (SELECT COUNT(DISTINCT user_id) FROM user_segment_activity
+         WHERE subscription_type = 'premium') as premium_users
+    FROM activity
+    WHERE date >= $today - 61
+"""
+
+
+def to_duckdb_params(query):
+    """Rewrite psycopg2 placeholders (%(name)s, %s, %%) into DuckDB's ($name, ?, %)"""
+    query = re.sub(r'%\((\w+)\)s', r'$\1', query)
+    return query.replace('%s', '?').replace('%%', '%')
+
+
+class DuckDBBackend:
+    """Dashboard queries run in-process with DuckDB over a Parquet snapshot of activity.
+
+    The snapshot is a directory of Parquet files, typically hive-partitioned
+    by month (see scripts/convert_to_parquet.py). Rollup tables are
+    materialised in memory when the snapshot is opened, and rebuilt when
+    its files change.
+    """
+
+    name = 'duckdb'
+
+    def __init__(self, parquet_dir, check_interval=10.0, threads=None):
+        if duckdb is None:
+            raise ImportError("ANALYTICS_BACKEND=duckdb requires the duckdb package (pip install duckdb)")
+        self.parquet_dir = parquet_dir
+        self.check_interval = check_interval
+        self.threads = threads
+        self._lock = threading.Lock()
+        self._conn = None
+        self._signature = None
+        self._snapshot_id = None
+        self._checked_at = 0.0
+
+    def _snapshot_signature(self):
+        files = []
+        for root, _, names in os.walk(self.parquet_dir):
+            for file_name in names:
+                if file_name.endswith('.parquet'):
+                    stat = os.stat(os.path.join(root, file_name))
+                    files.append((root, file_name, stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(files))
+
+    def _open(self, signature):
+        started = time.time()
+        conn = duckdb.connect(':memory:')
+        if self.threads:
+            conn.execute(f"SET threads = {int(self.threads)}")
+        pattern = os.path.join(self.parquet_dir, '**', '*.parquet').replace("'", "''")
+        conn.execute(f"""
+            CREATE VIEW activity AS
+            SELECT
+                CAST(date AS DATE) as date,
+                user_id, course_id, lesson_completed, time_spent, device_type, subscription_type
+            FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)
+        """)
+        for statement in DUCKDB_ROLLUP_STATEMENTS:
+            conn.execute(statement)
+        self._load_funnel_progress(conn)
+        self._load_courses(conn)
+        logger.info(f"Opened Parquet snapshot {self.parquet_dir} ({len(signature)} files) "
+                    f"in {time.time() - started:.2f}s")
+        return conn
+
+    @staticmethod
+    def _load_funnel_progress(conn):
+        """user_funnel_progress for the snapshot, computed by the same engine refresh_rollups uses"""
+        events = conn.execute(funnel_events_query(funnel_columns(DEFAULT_FUNNEL, FUNNEL_SEGMENT))).df()
+        progress = FunnelEngine.reach_days(events, DEFAULT_FUNNEL, weight_col='events', segment_col=FUNNEL_SEGMENT)
+        progress['funnel'] = funnel_signature(DEFAULT_FUNNEL)
+        conn.register('funnel_progress_frame', progress)
+        try:
+            conn.execute("""
+                CREATE TABLE user_funnel_progress AS
+                SELECT user_id, funnel, segment, CAST(reached AS DATE[]) as reached
+                FROM funnel_progress_frame
+            """)
+        finally:
+            conn.unregister('funnel_progress_frame')
+
+    @staticmethod
+    def _load_courses(conn):
+        """Course dimension, seeded from the same INSERT that data/schema.sql runs on Postgres"""
+        conn.execute("""
+            CREATE TABLE courses (
+                course_id VARCHAR PRIMARY KEY,
+                course_name VARCHAR NOT NULL,
+                total_lessons INTEGER NOT NULL DEFAULT 0,
+                difficulty_level VARCHAR DEFAULT 'beginner',
+                category VARCHAR,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        try:
+            with open(SCHEMA_PATH) as schema:
+                seed = re.search(r'INSERT INTO courses\b[^;]*;', schema.read())
+            if seed:
+                conn.execute(seed.group(0))
+        except OSError as e:
+            logger.warning(f"Could not seed courses from {SCHEMA_PATH}: {e}")
+
+    def sync(self, force=False):
+        """Reopen the snapshot if its files changed (checked at most every check_interval seconds)"""
+        now = time.time()
+        if not force and self._conn is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            signature = self._snapshot_signature()
+            if not signature:
+                raise FileNotFoundError(f"No Parquet files found under {self.parquet_dir}")
+            if self._conn is None or signature != self._signature:
+                # The previous database is left to the garbage collector: in-flight cursors may still use it
+                self._conn = self._open(signature)
+                self._signature = signature
+                self._snapshot_id = hashlib.sha1(repr(signature).encode('utf-8')).hexdigest()
+
+    def cache_key(self, query, params=None):
+        """Query cache key of a query's result on the current snapshot, as read_sql keys it"""
+        # Keyed by snapshot as well, so a new snapshot never serves stale results
+        return cache_key(f"-- duckdb snapshot {self._snapshot_id}\n{query}", params)
+
+    def read_sql(self, query, params=None, use_cache=True, name=None):
+        """Run dashboard SQL on the snapshot, through the shared query cache when enabled"""
+        label = query_label(query, name)
+        fetched = {}
+
+        def load():
+            # A cursor is an independent connection to the same in-memory database
+            cursor = self._conn.cursor()
+            try:
+                result = cursor.execute(to_duckdb_params(query), params)
+                date_columns = [column[0] for column in result.description if str(column[1]) == 'DATE']
+                df = result.df()
+            finally:
+                cursor.close()
+            # psycopg2 returns DATE columns as datetime.date objects; keep the frames interchangeable
+            for column in date_columns:
+                df[column] = df[column].dt.date
+            fetched['rows'] = len(df)
+            fetched['bytes'] = int(df.memory_usage(deep=True).sum())
+            return df
+
+        started = time.perf_counter()
+        try:
+            self.sync()
+            if use_cache and query_cache_enabled():
+                df = get_query_cache().get_or_load(self.cache_key(query, params), load)
+                cache_result = 'miss' if fetched else 'hit'
+            else:
+                df = load()
+                cache_result = 'bypass'
+        except Exception:
+            QUERY_ERRORS.inc(query=label)
+            raise
+        record_query(label, time.perf_counter() - started, cache_result,
+                     rows=fetched.get('rows'), result_bytes=fetched.get('bytes'))
+        return df
+
+    def active_user_counts(self, today):
+        """Exact distinct users overall, since yesterday / last 7 / last 30 days, and premium users"""
+        row = self.read_sql(ACTIVE_USER_COUNTS_SQL, {'today': today}, name='active_user_counts').iloc[0]
+        return {column: int(row[column])
+                for column in ['total_users', 'dau', 'wau', 'mau', 'previous_mau', 'premium_users']}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Process-wide analytics backend chosen by ANALYTICS_BACKEND (postgres or duckdb)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                kind = os.getenv('ANALYTICS_BACKEND', 'postgres').lower()
+                if kind == 'duckdb':
+                    threads = os.getenv('DUCKDB_THREADS')
+                    _backend = DuckDBBackend(
+                        os.getenv('ACTIVITY_PARQUET_DIR', 'data/activity_parquet'),
+                        check_interval=float(os.getenv('PARQUET_SNAPSHOT_CHECK_INTERVAL', 10)),
+                        threads=int(threads) if threads else None,
+                    )
+                elif kind == 'postgres':
+                    _backend = PostgresBackend()
+                else:
+                    raise ValueError(f"Unknown ANALYTICS_BACKEND: {kind}")
+                logger.info(f"Using {_backend.name} analytics backend")
+    return _backend
+
+
+def read_sql(query, params=None, use_cache=True, name=None):
+    """Run a dashboard query on the configured backend and return a DataFrame"""
+    return get_backend().read_sql(query, params, use_cache=use_cache, name=name)
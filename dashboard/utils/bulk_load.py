@@ -0,0 +1,116 @@
+import io
+import os
+import time
+import logging
+
+import pandas as pd
+
+from .partitions import is_partitioned, list_partitions, ensure_partitions
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_COLUMNS = ['date', 'user_id', 'course_id', 'lesson_completed',
+                    'time_spent', 'device_type', 'subscription_type']
+STAGING_TABLE = 'activity_staging'
+
+
+def default_batch_size():
+    return int(os.getenv('BULK_LOAD_BATCH_SIZE', 50000))
+
+
+def iter_batches(source, batch_size=None):
+    """Yield DataFrames of at most `batch_size` rows from a DataFrame, CSV path or iterable of DataFrames"""
+    batch_size = batch_size or default_batch_size()
+    if isinstance(source, pd.DataFrame):
+        chunks = [source]
+    elif isinstance(source, (str, os.PathLike)):
+        chunks = pd.read_csv(source, chunksize=batch_size)
+    else:
+        chunks = source
+    for chunk in chunks:
+        for start in range(0, len(chunk), batch_size):
+            yield chunk.iloc[start:start + batch_size]
+
+
+def _prepare(batch):
+    """Activity columns in table order, with timestamps truncated to dates"""
+    batch = batch[ACTIVITY_COLUMNS].copy()
+    batch['date'] = pd.to_datetime(batch['date']).values.astype('datetime64[D]')
+    return batch
+
+
+def copy_frame(cursor, table, batch):
+    """Stream one prepared batch into `table` with COPY FROM STDIN"""
+    buffer = io.StringIO()
+    batch.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(ACTIVITY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def load_activity(conn, source, batch_size=None, replace=False, staging=True, commit=True):
+    """Bulk load activity rows with COPY, in a single transaction.
+
+    ``source`` is a DataFrame, a CSV path or an iterable of DataFrames
+    (e.g. a generator of chunks). With ``replace=True`` existing rows are
+    swapped out; when ``staging`` is on, rows are first copied into a temp
+    table and moved over with TRUNCATE + INSERT ... SELECT at the end, so
+    readers keep seeing the old data (never an empty table) while the
+    client streams, and only wait for the final server-side swap.
+
+    Monthly partitions missing for the loaded dates are created on the way.
+    With ``commit=False`` the caller commits, e.g. to record bookkeeping
+    in the same transaction.
+
+    Returns a dict with rows, batches, seconds, rows_per_sec and the
+    min/max activity date loaded (handy for an incremental rollup refresh).
+    """
+    started = time.time()
+    stats = {'rows': 0, 'batches': 0, 'min_date': None, 'max_date': None}
+    use_staging = replace and staging
+    target = STAGING_TABLE if use_staging else 'activity'
+    cursor = conn.cursor()
+    try:
+        partitions = list_partitions(cursor) if is_partitioned(cursor) else None
+        if use_staging:
+            cursor.execute(f"""
+                CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS
+                SELECT {', '.join(ACTIVITY_COLUMNS)} FROM activity WITH NO DATA
+            """)
+        elif replace:
+            cursor.execute("TRUNCATE activity")
+
+        for batch in iter_batches(source, batch_size):
+            if batch.empty:
+                continue
+            batch = _prepare(batch)
+            low, high = batch['date'].min().date(), batch['date'].max().date()
+            if partitions is not None:
+                ensure_partitions(cursor, low, high, partitions)
+            copy_frame(cursor, target, batch)
+            stats['rows'] += len(batch)
+            stats['batches'] += 1
+            stats['min_date'] = low if stats['min_date'] is None else min(stats['min_date'], low)
+            stats['max_date'] = high if stats['max_date'] is None else max(stats['max_date'], high)
+            logger.debug(f"Copied batch {stats['batches']} ({len(batch)} rows) into {target}")
+
+        if use_staging:
+            cursor.execute(f"""
+                TRUNCATE activity;
+                INSERT INTO activity ({', '.join(ACTIVITY_COLUMNS)})
+                SELECT {', '.join(ACTIVITY_COLUMNS)} FROM {STAGING_TABLE};
+            """)
+        if commit:
+            conn.commit()
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    stats['seconds'] = time.time() - started
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    logger.info(f"Loaded {stats['rows']} activity rows in {stats['batches']} batches "
+                f"({stats['seconds']:.2f}s, {stats['rows_per_sec']:,.0f} rows/sec)")
+    return stats
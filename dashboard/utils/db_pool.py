@@ -0,0 +1,274 @@
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+import pandas as pd
+import psycopg2
+
+from .query_cache import cache_key, get_query_cache, query_cache_enabled
+from .instrumentation import QUERY_ERRORS, maybe_capture_plan, query_label, record_query
+from .parallel import time_remaining
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe PostgreSQL connection pool with health checks"""
+
+    def __init__(self, dsn, min_size=1, max_size=10, checkout_timeout=10.0,
+                 health_check_interval=30.0, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, last_used) pairs, most recent last
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {'created': 0, 'closed': 0, 'checkouts': 0, 'timeouts': 0, 'health_check_failures': 0}
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _count(self, key):
+        # The condition wraps an RLock, so this is safe while already holding it
+        with self._cond:
+            self._stats[key] += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, **self.connect_kwargs)
+        self._count('created')
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count('closed')
+
+    def _is_healthy(self, conn, last_used):
+        """Cheap liveness check; only pings connections idle longer than the interval"""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds for a free slot"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._in_use < self.max_size:
+                        conn, last_used = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No database connection available within {timeout:.1f}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+                # Reserve the slot before doing any I/O outside the lock
+                self._in_use += 1
+            finally:
+                self._waiting -= 1
+
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                self._count('health_check_failures')
+                logger.warning("Discarding unhealthy pooled connection")
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        self._count('checkouts')
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, resetting any open transaction"""
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed or self._closed or len(self._idle) >= self.max_size:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks out a connection and always returns it"""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                **self._stats,
+            }
+
+    def close(self):
+        """Close all idle connections and reject further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it from environment settings on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                connect_kwargs = {}
+                statement_timeout = os.getenv('DB_STATEMENT_TIMEOUT_MS')
+                if statement_timeout:
+                    # Server-side cap so queries abandoned by a caller timeout don't keep running
+                    connect_kwargs['options'] = f"-c statement_timeout={int(statement_timeout)}"
+                _pool = ConnectionPool(
+                    os.getenv('DB_URL'),
+                    min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    checkout_timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+                    **connect_kwargs
+                )
+                logger.info(f"Database pool initialised (min={_pool.min_size}, max={_pool.max_size})")
+    return _pool
+
+
+def close_pool():
+    """Close the process-wide pool (e.g. on shutdown or after fork)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    """Statistics of the process-wide pool, or an empty dict if it was never used"""
+    return _pool.stats() if _pool is not None else {}
+
+
+@contextmanager
+def pooled_connection(timeout=None):
+    """Borrow a connection from the process-wide pool"""
+    with get_pool().connection(timeout) as conn:
+        yield conn
+
+
+def read_sql(query, params=None, use_cache=True, name=None):
+    """Run a query on a pooled connection and return the result as a DataFrame.
+
+    Results are served from the shared query cache when enabled, so identical
+    queries from concurrent dashboards hit the database once per TTL.
+    Timing, row counts and cache outcome are recorded under ``name`` (or a
+    hash of the SQL) for the /metrics endpoint; slow queries are sampled for
+    an EXPLAIN (ANALYZE, BUFFERS) plan.
+    """
+    label = query_label(query, name)
+    fetch = {}
+
+    def load():
+        started = time.perf_counter()
+        with pooled_connection() as conn:
+            remaining = time_remaining()
+            if remaining is not None:
+                # Inside run_concurrently: the server cancels the query once the caller stops waiting
+                with conn.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = %s", (max(1, int(remaining * 1000)),))
+            df = pd.read_sql(query, conn, params=params)
+        fetch['seconds'] = time.perf_counter() - started
+        fetch['rows'] = len(df)
+        fetch['bytes'] = int(df.memory_usage(deep=True).sum())
+        return df
+
+    started = time.perf_counter()
+    try:
+        if use_cache and query_cache_enabled():
+            df = get_query_cache().get_or_load(cache_key(query, params), load)
+            cache_result = 'miss' if fetch else 'hit'
+        else:
+            df = load()
+            cache_result = 'bypass'
+    except Exception:
+        QUERY_ERRORS.inc(query=label)
+        raise
+
+    record_query(label, time.perf_counter() - started, cache_result,
+                 rows=fetch.get('rows'), result_bytes=fetch.get('bytes'))
+    if fetch:
+        maybe_capture_plan(label, query, params, fetch['seconds'], _run_explain)
+    return df
+
+
+def _run_explain(statement, params):
+    with pooled_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(statement, params)
+            rows = cursor.fetchall()
+        conn.rollback()  # EXPLAIN ANALYZE executes the statement; keep it read-only
+        return rows
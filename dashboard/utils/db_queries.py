@@ -1,6 +1,97 @@
+from datetime import date, timedelta
+
+from .analytics_backend import PREMIUM_SEGMENT, read_sql
+from .activity_bitmaps import ALL_USERS, BITMAP_DAYS_SQL, BITMAP_VERSIONS_SQL
+from .funnel_progress import FUNNEL_PROGRESS_SQL, FUNNEL_SEGMENT, funnel_columns, funnel_events_query
+from ..components.funnel_engine import DEFAULT_FUNNEL, funnel_signature
+from ..components.metric_store import RETENTION_HORIZONS
+
+# Queries behind the dashboard panels (dashboard/app.py); they run unchanged on PostgreSQL and DuckDB
+KEY_METRICS_SQL = """
+    SELECT 
+        CURRENT_DATE as today,
+        ROUND(SUM(total_time_spent)::numeric / NULLIF(SUM(sessions), 0), 1) as avg_session_time,
+        ROUND(SUM(lessons_completed) * 100.0 / NULLIF(SUM(sessions), 0), 1) as completion_rate
+    FROM daily_activity_totals;
+    """
+
+RETENTION_HORIZONS_SQL = "SELECT * FROM retention_horizons;"
+
+COHORT_RETENTION_SQL = """
+    WITH lookback (granularity, since) AS (
+        VALUES ('day', CURRENT_DATE - 30),
+               ('week', (CURRENT_DATE - INTERVAL '12 weeks')::date),
+               ('month', (CURRENT_DATE - INTERVAL '12 months')::date)
+    )
+    SELECT 
+        cr.granularity,
+        cr.cohort_start,
+        cr.period_number,
+        cr.users,
+        cs.users as cohort_size,
+        ROUND(cr.users * 100.0 / cs.users, 1) as retention_rate
+    FROM cohort_retention cr
+    JOIN lookback lb ON lb.granularity = cr.granularity
+    JOIN cohort_retention cs
+        ON cs.granularity = cr.granularity
+        AND cs.cohort_start = cr.cohort_start
+        AND cs.period_number = 0
+    WHERE cr.cohort_start >= lb.since
+    ORDER BY cr.granularity, cr.cohort_start, cr.period_number;
+    """
+
+TRENDS_SQL = """
+    SELECT 
+        date,
+        active_users as daily_active_users,
+        sessions as total_sessions,
+        ROUND(total_time_spent::numeric / NULLIF(sessions, 0), 1) as avg_session_time,
+        ROUND(lessons_completed * 100.0 / NULLIF(sessions, 0), 1) as completion_rate,
+        ROUND(premium_users * 100.0 / NULLIF(active_users, 0), 1) as premium_rate
+    FROM daily_activity_totals
+    WHERE date >= CURRENT_DATE - 30
+    ORDER BY date;
+    """
+
+SEGMENTATION_SQL = """
+    WITH segment_users AS (
+        SELECT device_type, subscription_type, COUNT(*) as users
+        FROM user_segment_activity
+        WHERE last_date >= CURRENT_DATE - 7
+        GROUP BY device_type, subscription_type
+    ),
+    segment_sessions AS (
+        SELECT 
+            device_type,
+            subscription_type,
+            SUM(total_time_spent)::numeric / NULLIF(SUM(sessions), 0) as avg_session_time,
+            SUM(lessons_completed) * 100.0 / NULLIF(SUM(sessions), 0) as completion_rate,
+            SUM(sessions) as total_sessions
+        FROM daily_activity_rollup
+        WHERE date >= CURRENT_DATE - 7
+        GROUP BY device_type, subscription_type
+    )
+    SELECT 
+        ss.device_type,
+        ss.subscription_type,
+        su.users,
+        ss.avg_session_time,
+        ss.completion_rate,
+        ss.total_sessions
+    FROM segment_sessions ss
+    JOIN segment_users su ON su.device_type = ss.device_type AND su.subscription_type = ss.subscription_type
+    ORDER BY users DESC;
+    """
+
+
 class AdvancedQueries:
     """Advanced SQL queries for dashboard analytics"""
     
+    @staticmethod
+    def run(query, params=None, name=None):
+        """Execute one of the queries below on a pooled connection"""
+        return read_sql(query, params, name=name)
+    
     @staticmethod
     def get_user_lifecycle_metrics():
         """Get comprehensive user lifecycle metrics"""
@@ -15,7 +106,7 @@ class AdvancedQueries:
                 AVG(time_spent) as avg_session_duration,
                 SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END) as lessons_completed,
                 MAX(CASE WHEN subscription_type = 'premium' THEN 1 ELSE 0 END) as became_premium,
-                EXTRACT(DAYS FROM (MAX(date) - MIN(date))) + 1 as lifecycle_days
+                (MAX(date) - MIN(date)) + 1 as lifecycle_days
             FROM activity
             GROUP BY user_id
         ),
@@ -25,8 +116,8 @@ class AdvancedQueries:
                 CASE 
                     WHEN active_days = 1 THEN 'One-time'
                     WHEN active_days <= 7 AND lifecycle_days <= 14 THEN 'New'
-                    WHEN last_session >= CURRENT_DATE - INTERVAL '7 days' THEN 'Active'
-                    WHEN last_session >= CURRENT_DATE - INTERVAL '30 days' THEN 'At Risk'
+                    WHEN last_session >= CURRENT_DATE - 7 THEN 'Active'
+                    WHEN last_session >= CURRENT_DATE - 30 THEN 'At Risk'
                     ELSE 'Churned'
                 END as lifecycle_stage
             FROM user_lifecycle
@@ -64,7 +155,7 @@ class AdvancedQueries:
                 COUNT(DISTINCT CASE WHEN subscription_type = 'premium' THEN user_id END) * 100.0 / 
                     COUNT(DISTINCT user_id) as premium_conversion_rate
             FROM activity
-            WHERE date >= CURRENT_DATE - INTERVAL '30 days'
+            WHERE date >= CURRENT_DATE - 30
             GROUP BY course_id
         )
         SELECT 
@@ -75,4 +166,83 @@ class AdvancedQueries:
         FROM course_metrics cm
         LEFT JOIN courses c ON cm.course_id = c.course_id
         ORDER BY total_users DESC;
-        """
\ No newline at end of file
+        """
+
+
+def growth_queries(since=None):
+    """Daily totals, segment rollups and day-N retention for the metric store, from after `since` (None: all)"""
+    after = 'date > %(since)s' if since else 'TRUE'
+    observed_after = 'c.cohort_start + h.horizon > %(since)s' if since else 'TRUE'
+    return {
+        'growth_totals': f"""
+    SELECT date, active_users, premium_users, sessions, total_time_spent, lessons_completed
+    FROM daily_activity_totals
+    WHERE {after};
+    """,
+        'growth_segments': f"""
+    SELECT 
+        date,
+        device_type,
+        subscription_type,
+        course_id,
+        active_users,
+        CASE WHEN subscription_type = 'premium' THEN active_users ELSE 0 END as premium_users,
+        sessions,
+        total_time_spent,
+        lessons_completed
+    FROM daily_activity_rollup
+    WHERE {after};
+    """,
+        # Day-N retention keyed by the day it is observed: cohort size and users back on day N
+        'growth_retention': f"""
+    WITH horizons (horizon) AS (
+        VALUES {', '.join(f'({n})' for n in RETENTION_HORIZONS)}
+    )
+    SELECT 
+        c.cohort_start + h.horizon as date,
+        h.horizon,
+        c.users as cohort,
+        COALESCE(r.users, 0) as retained
+    FROM cohort_retention c
+    CROSS JOIN horizons h
+    LEFT JOIN cohort_retention r
+        ON r.granularity = 'day'
+        AND r.cohort_start = c.cohort_start
+        AND r.period_number = h.horizon
+    WHERE c.granularity = 'day'
+        AND c.period_number = 0
+        AND c.cohort_start + h.horizon <= CURRENT_DATE
+        AND {observed_after};
+    """,
+    }
+
+
+def dashboard_queries(today=None):
+    """Every query the dashboard runs on PostgreSQL, as [(name, sql, sample params)].
+
+    Names are the ``name=`` the dashboard passes to read_sql; on PostgreSQL
+    the active user counts come from the activity bitmaps, listed under
+    active_user_counts and active_user_bitmaps. Sample params are realistic
+    for data up to ``today``. The index advisor explains every query here,
+    so a new dashboard query belongs in this list too.
+    """
+    today = today or date.today()
+    since = {'since': today - timedelta(days=8)}
+    segments = [ALL_USERS, PREMIUM_SEGMENT]
+    queries = [
+        ('key_metrics', KEY_METRICS_SQL, None),
+        ('retention_horizons', RETENTION_HORIZONS_SQL, None),
+        ('active_user_counts', BITMAP_VERSIONS_SQL, (segments,)),
+        ('active_user_bitmaps', BITMAP_DAYS_SQL, (ALL_USERS, [today - timedelta(days=n) for n in range(1, 31)])),
+        ('cohort_retention', COHORT_RETENTION_SQL, None),
+        ('funnel_progress', FUNNEL_PROGRESS_SQL, {'funnel': funnel_signature(DEFAULT_FUNNEL)}),
+        ('funnel_events', funnel_events_query(funnel_columns(DEFAULT_FUNNEL, FUNNEL_SEGMENT)), None),
+        ('trends', TRENDS_SQL, None),
+        ('segmentation', SEGMENTATION_SQL, None),
+    ]
+    queries += [(name, sql, since) for name, sql in growth_queries(since['since']).items()]
+    queries += [
+        ('user_lifecycle_metrics', AdvancedQueries.get_user_lifecycle_metrics(), None),
+        ('course_performance_metrics', AdvancedQueries.get_course_performance_metrics(), None),
+    ]
+    return [(name, sql.strip().rstrip(';'), params) for name, sql, params in queries]
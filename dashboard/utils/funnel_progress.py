@@ -0,0 +1,89 @@
+import logging
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from ..components.funnel_engine import DEFAULT_FUNNEL, FunnelEngine, funnel_signature
+
+logger = logging.getLogger(__name__)
+
+# The dashboard funnel: DEFAULT_FUNNEL broken down by each user's first device.
+# It is kept per user in user_funnel_progress; other funnels are computed from activity.
+FUNNEL_SEGMENT = 'device_type'
+EVENT_COLUMNS = ['course_id', 'lesson_completed', 'time_spent', 'device_type', 'subscription_type']
+
+# Users and medians per step, overall ('All') and per segment, straight from the stored reach days
+FUNNEL_PROGRESS_SQL = """
+    SELECT
+        CASE WHEN GROUPING(p.segment) = 1 THEN 'All' ELSE p.segment END as segment,
+        s.step_index - 1 as step_index,
+        COUNT(s.day) as users,
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY s.day - p.reached[1]) as median_days_from_start,
+        percentile_cont(0.5) WITHIN GROUP (
+            ORDER BY s.day - COALESCE(p.reached[s.step_index - 1], s.day)) as median_days_from_previous
+    FROM user_funnel_progress p
+    CROSS JOIN LATERAL unnest(p.reached) WITH ORDINALITY s(day, step_index)
+    WHERE p.funnel = %(funnel)s
+    GROUP BY GROUPING SETS ((s.step_index), (p.segment, s.step_index))
+    ORDER BY GROUPING(p.segment) DESC, p.segment, s.step_index;
+"""
+
+
+def funnel_columns(steps, segment_col=None):
+    """Activity columns a funnel reads besides user_id and date (all of them if a step is a callable)"""
+    columns = set() if segment_col is None else {segment_col}
+    for step in steps:
+        step_columns = step.columns()
+        if step_columns is None:
+            return list(EVENT_COLUMNS)
+        columns.update(step_columns)
+    return sorted(columns)
+
+
+def funnel_events_query(columns, users_active_since=False):
+    """Activity collapsed to one row per user, day and distinct `columns` values; `events` keeps row counts.
+
+    With ``users_active_since`` only users with activity on or after
+    %(from_date)s are read, but their whole history.
+    """
+    group = ', '.join(['user_id', 'date'] + list(columns))
+    where = ("WHERE user_id IN (SELECT user_id FROM activity WHERE date >= %(from_date)s)"
+             if users_active_since else "")
+    return f"SELECT {group}, COUNT(*) as events FROM activity {where} GROUP BY {group}"
+
+
+def refresh_funnel_progress(cursor, from_date, steps=None):
+    """Recompute the funnel reach days of every user active on or after `from_date`.
+
+    A user's reach days depend on their whole history, so those users are
+    recomputed from all of their activity; everybody else is untouched. When
+    the stored rows were computed for a different funnel definition (or none
+    are stored yet) every user is recomputed.
+    """
+    steps = steps or DEFAULT_FUNNEL
+    signature = funnel_signature(steps)
+    cursor.execute("""
+        SELECT NOT EXISTS (SELECT 1 FROM user_funnel_progress WHERE funnel = %(funnel)s)
+            OR EXISTS (SELECT 1 FROM user_funnel_progress WHERE funnel <> %(funnel)s)
+    """, {'funnel': signature})
+    rebuild = cursor.fetchone()[0]
+
+    columns = funnel_columns(steps, FUNNEL_SEGMENT)
+    if rebuild:
+        cursor.execute("DELETE FROM user_funnel_progress")
+        cursor.execute(funnel_events_query(columns))
+    else:
+        cursor.execute("""
+            DELETE FROM user_funnel_progress
+            WHERE user_id IN (SELECT user_id FROM activity WHERE date >= %(from_date)s)
+        """, {'from_date': from_date})
+        cursor.execute(funnel_events_query(columns, users_active_since=True), {'from_date': from_date})
+    events = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+    progress = FunnelEngine.reach_days(events, steps, weight_col='events', segment_col=FUNNEL_SEGMENT)
+    records = [(row.user_id, signature, row.segment, row.reached) for row in progress.itertuples(index=False)]
+    execute_values(cursor, """
+        INSERT INTO user_funnel_progress (user_id, funnel, segment, reached) VALUES %s
+    """, records, template="(%s, %s, %s, %s::date[])", page_size=1000)
+    logger.debug(f"Recomputed funnel progress for {len(records)} users"
+                 f"{' (full rebuild)' if rebuild else f' active since {from_date}'}")
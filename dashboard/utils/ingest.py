@@ -0,0 +1,315 @@
+import os
+import json
+import math
+import time
+import atexit
+import logging
+import threading
+from collections import Counter as DayCounter
+from datetime import date
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from .bulk_load import ACTIVITY_COLUMNS, load_activity
+from .db_pool import pooled_connection
+from .rollups import refresh_rollups
+from .query_cache import get_query_cache
+from .instrumentation import Counter, Histogram, register
+
+logger = logging.getLogger(__name__)
+
+# Flushes hold this lock shared and the rollup refresh holds it exclusively, so
+# a refresh never misses rows from a flush that commits while it is running
+INGEST_LOCK_KEY = 0x65647465
+
+# Column limits from data/schema.sql; checked up front so one bad event can't fail a whole COPY batch
+MAX_ID_LENGTH = 50
+MAX_LABEL_LENGTH = 20
+MAX_TIME_SPENT = 2 ** 31 - 1
+
+INGEST_EVENTS = Counter('dashboard_ingest_events_total', 'Events received on /ingest by outcome', ['result'])
+INGEST_FLUSH_DURATION = Histogram('dashboard_ingest_flush_duration_seconds', 'Time to write one ingest batch')
+INGEST_FLUSH_ERRORS = Counter('dashboard_ingest_flush_errors_total', 'Ingest batches that failed to write')
+register(INGEST_EVENTS)
+register(INGEST_FLUSH_DURATION)
+register(INGEST_FLUSH_ERRORS)
+
+
+class BufferFull(Exception):
+    """Raised when the ingest buffer cannot take a request; retry after ``retry_after`` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Ingest buffer is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _text(event, field, max_length, default=None):
+    value = event.get(field, default)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{field} must be a non-empty string")
+    if len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def parse_event(event):
+    """Validate one event dict and return it as a row tuple in ACTIVITY_COLUMNS order"""
+    if not isinstance(event, dict):
+        raise ValueError("event must be a JSON object")
+    if 'date' not in event:
+        raise ValueError("date is required")
+    # Timestamps are accepted and truncated to the day, as in the bulk loader
+    day = date.fromisoformat(str(event['date'])[:10])
+    time_spent = event.get('time_spent', 0)
+    if isinstance(time_spent, bool) or not isinstance(time_spent, (int, float)) \
+            or not 0 <= time_spent <= MAX_TIME_SPENT:
+        raise ValueError("time_spent must be a non-negative number")
+    lesson_completed = event.get('lesson_completed', False)
+    if not isinstance(lesson_completed, bool):
+        raise ValueError("lesson_completed must be true or false")
+    return (
+        day,
+        _text(event, 'user_id', MAX_ID_LENGTH),
+        _text(event, 'course_id', MAX_ID_LENGTH),
+        lesson_completed,
+        int(time_spent),
+        _text(event, 'device_type', MAX_LABEL_LENGTH, 'unknown'),
+        _text(event, 'subscription_type', MAX_LABEL_LENGTH, 'free'),
+    )
+
+
+def parse_ndjson(body):
+    """Parse newline-delimited JSON events into (rows, errors); errors carry 1-based line numbers"""
+    rows, errors = [], []
+    for line_number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            rows.append(parse_event(json.loads(line)))
+        except ValueError as e:
+            errors.append({'line': line_number, 'error': str(e)})
+    return rows, errors
+
+
+class IngestBuffer:
+    """In-memory event buffer drained into `activity` by a background thread.
+
+    A batch is written once ``flush_size`` events are waiting or
+    ``flush_interval`` seconds have passed, with COPY in the same transaction
+    as the per-day watermark update (``ingest_day_watermarks``). Every
+    ``rollup_interval`` seconds the rollups are refreshed from the earliest
+    day with pending rows, so late events only reprocess the days after them.
+    Once ``max_buffered`` events are waiting, ``offer`` raises BufferFull;
+    failed batches go back to the front of the buffer, so a database outage
+    turns into backpressure instead of data loss.
+    """
+
+    def __init__(self, flush_size=5000, flush_interval=1.0, max_buffered=200000, rollup_interval=60.0):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.rollup_interval = rollup_interval
+        self._rows = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._flushing = 0
+        self._last_rollup = time.time()
+        self._stats = {'accepted': 0, 'rejected': 0, 'throttled': 0, 'flushed': 0,
+                       'flushes': 0, 'flush_errors': 0, 'rollup_refreshes': 0}
+
+    def retry_after(self):
+        """Seconds a throttled client should wait: about one flush cycle"""
+        return max(1, math.ceil(self.flush_interval))
+
+    def offer(self, rows):
+        """Queue validated rows, all or nothing; raises BufferFull when they don't fit"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Ingest buffer is closed")
+            if len(self._rows) + len(rows) > self.max_buffered:
+                self._stats['throttled'] += len(rows)
+                INGEST_EVENTS.inc(len(rows), result='throttled')
+                raise BufferFull(self.retry_after())
+            self._rows.extend(rows)
+            self._stats['accepted'] += len(rows)
+            if len(self._rows) >= self.flush_size:
+                self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ingest-flusher', daemon=True)
+                self._thread.start()
+        INGEST_EVENTS.inc(len(rows), result='accepted')
+        return len(rows)
+
+    def ingest(self, body):
+        """Parse an NDJSON body and queue its valid events; returns a summary dict"""
+        rows, errors = parse_ndjson(body)
+        if rows:
+            self.offer(rows)
+        if errors:
+            with self._cond:
+                self._stats['rejected'] += len(errors)
+            INGEST_EVENTS.inc(len(errors), result='rejected')
+        return {'accepted': len(rows), 'rejected': len(errors), 'errors': errors[:20]}
+
+    def _run(self):
+        last_flush = time.time()
+        while True:
+            with self._cond:
+                while not self._closed and len(self._rows) < self.flush_size:
+                    remaining = self.flush_interval - (time.time() - last_flush)
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._rows[:self.flush_size * 4]
+                del self._rows[:len(batch)]
+                self._flushing = len(batch)
+                closed = self._closed
+            last_flush = time.time()
+            written = self._flush(batch) if batch else True
+            if time.time() - self._last_rollup >= self.rollup_interval:
+                self._refresh_rollups()
+            if closed and (not batch or not written):
+                if not written:
+                    logger.error(f"Dropping {self.stats()['buffered']} ingested events at shutdown")
+                return
+
+    def _flush(self, batch):
+        started = time.time()
+        try:
+            frame = pd.DataFrame.from_records(batch, columns=ACTIVITY_COLUMNS)
+            per_day = DayCounter(row[0] for row in batch)
+            with pooled_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_xact_lock_shared(%s)", (INGEST_LOCK_KEY,))
+                load_activity(conn, frame, batch_size=len(batch), commit=False)
+                try:
+                    with conn.cursor() as cursor:
+                        execute_values(cursor, """
+                            INSERT INTO ingest_day_watermarks (date, events_ingested, last_ingested_at)
+                            VALUES %s
+                            ON CONFLICT (date) DO UPDATE SET
+                                events_ingested = ingest_day_watermarks.events_ingested + EXCLUDED.events_ingested,
+                                last_ingested_at = EXCLUDED.last_ingested_at,
+                                pending_rollup = TRUE
+                        """, sorted(per_day.items()), template="(%s, %s, CURRENT_TIMESTAMP)")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            INGEST_FLUSH_DURATION.observe(time.time() - started)
+            with self._cond:
+                self._stats['flushed'] += len(batch)
+                self._stats['flushes'] += 1
+                self._flushing = 0
+            logger.debug(f"Flushed {len(batch)} ingested events in {time.time() - started:.3f}s")
+            return True
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} ingested events, will retry: {e}")
+            INGEST_FLUSH_ERRORS.inc()
+            with self._cond:
+                self._rows[:0] = batch
+                self._flushing = 0
+                self._stats['flush_errors'] += 1
+                closed = self._closed
+            if not closed:
+                time.sleep(self.retry_after())
+            return False
+
+    def _refresh_rollups(self):
+        """Refresh rollups from the earliest day with pending ingested rows"""
+        self._last_rollup = time.time()
+        try:
+            with pooled_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Waits for in-flight flushes (from any worker) and holds new ones back
+                    cursor.execute("SELECT pg_advisory_lock(%s)", (INGEST_LOCK_KEY,))
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT MIN(date) FROM ingest_day_watermarks WHERE pending_rollup")
+                        from_date = cursor.fetchone()[0]
+                    conn.commit()
+                    if from_date is None:
+                        return None
+                    refresh_rollups(conn, from_date=from_date)
+                    with conn.cursor() as cursor:
+                        cursor.execute("""
+                            UPDATE ingest_day_watermarks
+                            SET pending_rollup = FALSE, rolled_up_at = CURRENT_TIMESTAMP
+                            WHERE pending_rollup
+                        """)
+                    conn.commit()
+                finally:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", (INGEST_LOCK_KEY,))
+                    conn.commit()
+            get_query_cache().invalidate()
+            with self._cond:
+                self._stats['rollup_refreshes'] += 1
+            return from_date
+        except Exception as e:
+            logger.error(f"Error refreshing rollups after ingest: {e}")
+            return None
+
+    def close(self, timeout=30):
+        """Stop accepting events and wait for the buffered ones to be written"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['buffered'] = len(self._rows) + self._flushing
+        stats['max_buffered'] = self.max_buffered
+        return stats
+
+
+def get_watermarks(days=30):
+    """Most recent per-day ingestion watermarks, newest first"""
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT date, events_ingested, last_ingested_at, rolled_up_at, pending_rollup
+                    FROM ingest_day_watermarks
+                    ORDER BY date DESC
+                    LIMIT %s
+                """, (days,))
+                columns = [c[0] for c in cursor.description]
+                rows = cursor.fetchall()
+            conn.rollback()
+        return [{k: (v.isoformat() if hasattr(v, 'isoformat') else v) for k, v in zip(columns, row)}
+                for row in rows]
+    except Exception as e:
+        logger.error(f"Error reading ingest watermarks: {e}")
+        return []
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_ingest_buffer():
+    """Return the process-wide ingest buffer, creating it from environment settings on first use"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = IngestBuffer(
+                    flush_size=int(os.getenv('INGEST_FLUSH_SIZE', 5000)),
+                    flush_interval=float(os.getenv('INGEST_FLUSH_INTERVAL', 1.0)),
+                    max_buffered=int(os.getenv('INGEST_MAX_BUFFERED', 200000)),
+                    rollup_interval=float(os.getenv('INGEST_ROLLUP_INTERVAL', 60)),
+                )
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def ingest_stats():
+    """Statistics of the process-wide ingest buffer, or an empty dict if it was never used"""
+    return _buffer.stats() if _buffer is not None else {}
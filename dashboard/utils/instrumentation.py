@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+import functools
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames, key, [('le', repr(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose samples are read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, labelnames, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect  # returns {label values tuple: value}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            samples = self.collect()
+        except Exception as e:
+            logger.warning(f"Could not collect {self.name}: {e}")
+            samples = {}
+        for key, value in sorted(samples.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+QUERY_DURATION = Histogram(
+    'dashboard_query_duration_seconds', 'Wall time of dashboard SQL queries', ['query', 'cache'])
+QUERY_ROWS = Counter('dashboard_query_rows_total', 'Rows returned by dashboard SQL queries', ['query'])
+QUERY_BYTES = Counter(
+    'dashboard_query_result_bytes_total', 'In-memory size of query results fetched from the database', ['query'])
+QUERY_ERRORS = Counter('dashboard_query_errors_total', 'Failed dashboard SQL queries', ['query'])
+QUERY_CACHE = Counter('dashboard_query_cache_total', 'Query cache lookups by outcome', ['query', 'result'])
+CALLBACK_DURATION = Histogram(
+    'dashboard_callback_duration_seconds', 'Latency of Dash callbacks', ['callback'])
+SLOW_QUERY_PLANS = Counter(
+    'dashboard_slow_query_plans_total', 'EXPLAIN ANALYZE plans captured for slow queries', ['query'])
+
+_registry = [QUERY_DURATION, QUERY_ROWS, QUERY_BYTES, QUERY_ERRORS, QUERY_CACHE, CALLBACK_DURATION, SLOW_QUERY_PLANS]
+_registry_lock = threading.Lock()
+
+# Most recent captured plans, newest last
+slow_query_plans = deque(maxlen=int(os.getenv('SLOW_QUERY_PLAN_HISTORY', 20)))
+
+
+def register(metric):
+    """Add a metric (e.g. a Gauge over pool or cache stats) to the /metrics output"""
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def render_metrics():
+    """All registered metrics in Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def query_label(query, name=None):
+    """Metric label for a query: its explicit name or a short hash of the SQL"""
+    if name:
+        return name
+    return 'sql_' + hashlib.sha1(' '.join(query.split()).encode('utf-8')).hexdigest()[:10]
+
+
+def record_query(label, seconds, cache_result, rows=None, result_bytes=None):
+    QUERY_DURATION.observe(seconds, query=label, cache=cache_result)
+    QUERY_CACHE.inc(query=label, result=cache_result)
+    if rows is not None:
+        QUERY_ROWS.inc(rows, query=label)
+    if result_bytes is not None:
+        QUERY_BYTES.inc(result_bytes, query=label)
+
+
+def maybe_capture_plan(label, query, params, seconds, run_explain):
+    """Sample an EXPLAIN (ANALYZE, BUFFERS) of a slow query in the background.
+
+    ``run_explain(sql, params)`` executes the statement and returns the
+    plan rows. The query is re-executed, so sampling is rate limited by
+    SLOW_QUERY_EXPLAIN_RATE.
+    """
+    threshold = float(os.getenv('SLOW_QUERY_MS', 1000)) / 1000.0
+    sample_rate = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+    if seconds < threshold or random.random() >= sample_rate:
+        return
+
+    def capture():
+        try:
+            rows = run_explain(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params)
+            plan = rows[0][0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plan = plan[0] if isinstance(plan, list) else plan
+            top = plan.get('Plan', {})
+            slow_query_plans.append({
+                'query': label,
+                'captured_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'wall_seconds': round(seconds, 4),
+                'execution_ms': plan.get('Execution Time'),
+                'shared_hit_blocks': top.get('Shared Hit Blocks'),
+                'shared_read_blocks': top.get('Shared Read Blocks'),
+                'plan': plan,
+            })
+            SLOW_QUERY_PLANS.inc(query=label)
+            logger.warning(f"Slow query '{label}' took {seconds:.2f}s; "
+                           f"plan execution {plan.get('Execution Time')} ms, "
+                           f"buffers hit={top.get('Shared Hit Blocks')} read={top.get('Shared Read Blocks')}")
+        except Exception as e:
+            logger.warning(f"Could not capture plan for slow query '{label}': {e}")
+
+    threading.Thread(target=capture, name=f"explain-{label}", daemon=True).start()
+
+
+def timed_callback(name=None):
+    """Decorator recording a Dash callback's latency in CALLBACK_DURATION"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                CALLBACK_DURATION.observe(time.perf_counter() - started, callback=label)
+        return wrapper
+    return decorator
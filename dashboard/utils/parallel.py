@@ -0,0 +1,81 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def time_remaining():
+    """Seconds left before the running task's timeout, or None outside run_concurrently"""
+    deadline = getattr(_local, 'deadline', None)
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def run_concurrently(tasks, timeouts=None, default_timeout=None, max_workers=None):
+    """Run named zero-argument callables in parallel and collect partial results.
+
+    Every call gets its own worker threads (``DASH_QUERY_WORKERS``, by
+    default one per task), so refreshes from other tabs never queue in
+    front of it, and each task's timeout is measured from when it starts
+    running. Queries a task runs on Postgres are capped at its remaining
+    time (see ``time_remaining``), so the server stops a query nobody
+    waits for any more. Returns
+    ``(results, errors)``: ``results`` holds the value of every task that
+    finished in time, ``errors`` maps the name of each failed or timed-out
+    task to a short reason.
+    """
+    if not tasks:
+        return {}, {}
+    timeouts = timeouts or {}
+    if default_timeout is None:
+        default_timeout = float(os.getenv('DASH_QUERY_TIMEOUT', 30))
+    if max_workers is None:
+        max_workers = int(os.getenv('DASH_QUERY_WORKERS') or len(tasks))
+
+    def limit(name):
+        return timeouts.get(name, default_timeout)
+
+    started = {}
+
+    def timed(name, func):
+        def run():
+            started[name] = time.monotonic()
+            _local.deadline = started[name] + limit(name)
+            try:
+                return func()
+            finally:
+                _local.deadline = None
+        return run
+
+    # Not a context manager: leaving it would wait for the timed-out tasks
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks))),
+                                  thread_name_prefix='dashboard-query')
+    results, errors = {}, {}
+    try:
+        pending = {executor.submit(timed(name, func)): name for name, func in tasks.items()}
+        while pending:
+            # A task still queued has its whole timeout ahead of it
+            now = time.monotonic()
+            next_deadline = min(started.get(name, now) + limit(name) for name in pending.values())
+            done, _ = wait(pending, timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future, name in list(pending.items()):
+                if future in done:
+                    del pending[future]
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        errors[name] = str(e)
+                        logger.error(f"Query '{name}' failed: {e}")
+                elif name in started and started[name] + limit(name) <= now:
+                    del pending[future]
+                    errors[name] = 'timeout'
+                    logger.warning(f"Query '{name}' timed out after {limit(name):.1f}s")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, errors
@@ -0,0 +1,199 @@
+import re
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITION = 'activity_default'
+LEGACY_TABLE = 'activity_unpartitioned'
+ARCHIVE_SCHEMA = 'activity_archive'
+PARTITION_NAME = re.compile(r'^activity_y(\d{4})m(\d{2})$')
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"activity_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(cursor):
+    """True when `activity` is a partitioned table (False for a legacy heap or a missing table)"""
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('public.activity')")
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions(cursor):
+    """Monthly partitions currently attached to `activity`, as {month start: table name}"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('public.activity')
+    """)
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(cursor, month):
+    """Create and attach the partition for `month`, moving any of its rows out of the default partition.
+
+    The table is filled before it is attached (with a CHECK constraint
+    matching its bounds), so ATTACH doesn't have to rescan it, and creating
+    a month that already has rows in the default partition doesn't fail.
+    """
+    low, high = month_start(month), add_months(month, 1)
+    name = partition_name(low)
+    cursor.execute(f"""
+        CREATE TABLE {name} (LIKE activity INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+        ALTER TABLE {name} ADD CONSTRAINT {name}_date_range CHECK (date >= %(low)s AND date < %(high)s);
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE date >= %(low)s AND date < %(high)s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+        ALTER TABLE activity ATTACH PARTITION {name} FOR VALUES FROM (%(low)s) TO (%(high)s);
+    """, {'low': low, 'high': high})
+    logger.info(f"Created partition {name}")
+    return name
+
+
+def ensure_partitions(cursor, first_day, last_day, existing=None):
+    """Make sure monthly partitions cover first_day..last_day; returns the names created.
+
+    Pass the dict from ``list_partitions`` as ``existing`` to avoid a catalog
+    lookup per call (it is updated in place).
+    """
+    if existing is None:
+        existing = list_partitions(cursor)
+    created = []
+    month, last = month_start(first_day), month_start(last_day)
+    while month <= last:
+        if month not in existing:
+            existing[month] = create_partition(cursor, month)
+            created.append(existing[month])
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partition(cursor, name, drop=False):
+    """Detach a partition and move it to the archive schema (or drop it)"""
+    cursor.execute(f"ALTER TABLE activity DETACH PARTITION {name}")
+    if drop:
+        cursor.execute(f"DROP TABLE {name}")
+        logger.info(f"Dropped partition {name}")
+    else:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        cursor.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+        logger.info(f"Archived partition {name} to {ARCHIVE_SCHEMA}.{name}")
+
+
+def maintain_partitions(conn, months_ahead=3, retain_months=None, drop=False, today=None):
+    """Create upcoming partitions, rehome stray rows and archive expired months.
+
+    Partitions are created up to ``months_ahead`` months past the current
+    one, plus any month that has rows sitting in the default partition.
+    With ``retain_months`` set, partitions older than that many months
+    before the current one are detached and archived (or dropped). Rollups
+    already computed for archived months are kept, but a full rollup
+    rebuild will no longer see their rows.
+    Returns a dict with the partitions created and archived.
+    """
+    current = month_start(today or date.today())
+    cursor = conn.cursor()
+    try:
+        if not is_partitioned(cursor):
+            logger.warning("activity is not partitioned; run scripts/setup_database.py to migrate it")
+            conn.rollback()
+            return {'created': [], 'archived': []}
+
+        existing = list_partitions(cursor)
+        cursor.execute(f"SELECT MIN(date), MAX(date) FROM {DEFAULT_PARTITION}")
+        stray_low, stray_high = cursor.fetchone()
+        created = ensure_partitions(cursor, current, add_months(current, months_ahead), existing)
+        if stray_low is not None:
+            created += ensure_partitions(cursor, stray_low, stray_high, existing)
+
+        archived = []
+        if retain_months is not None:
+            cutoff = add_months(current, -retain_months)
+            for month, name in sorted(existing.items()):
+                if month < cutoff:
+                    archive_partition(cursor, name, drop)
+                    archived.append(name)
+        conn.commit()
+        return {'created': created, 'archived': archived}
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def set_aside_legacy_table(cursor):
+    """Rename a non-partitioned `activity` out of the way before the schema creates the partitioned one.
+
+    Its primary key and sequence are renamed and its secondary indexes
+    dropped, since their names would otherwise clash with the new table's.
+    Returns True if there was a legacy table to migrate.
+    """
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('public.activity')")
+    row = cursor.fetchone()
+    if not row or row[0] != 'r':
+        return False
+
+    cursor.execute("SELECT pg_get_serial_sequence('activity', 'id')")
+    sequence = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT i.relname, c.conname
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid
+        WHERE x.indrelid = 'activity'::regclass
+    """)
+    for index_name, constraint_name in cursor.fetchall():
+        if constraint_name:
+            cursor.execute(f"ALTER TABLE activity RENAME CONSTRAINT {constraint_name} TO {LEGACY_TABLE}_{constraint_name}")
+        else:
+            cursor.execute(f"DROP INDEX {index_name}")
+    cursor.execute(f"ALTER TABLE activity RENAME TO {LEGACY_TABLE}")
+    if sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {LEGACY_TABLE}_id_seq")
+    logger.info(f"Renamed non-partitioned activity table to {LEGACY_TABLE} for migration")
+    return True
+
+
+def migrate_legacy_table(cursor):
+    """Copy rows from the renamed legacy table into partitioned `activity` and drop it.
+
+    Partitions are created up front so rows are routed straight to them,
+    and ids are kept (the new sequence continues after the largest one).
+    """
+    cursor.execute(f"SELECT MIN(date), MAX(date), COUNT(*) FROM {LEGACY_TABLE}")
+    low, high, rows = cursor.fetchone()
+    if low is not None:
+        ensure_partitions(cursor, low, high)
+    cursor.execute(f"""
+        INSERT INTO activity (id, date, user_id, course_id, lesson_completed, time_spent,
+                              device_type, subscription_type, created_at)
+        SELECT id, date, user_id, course_id, lesson_completed, time_spent,
+               device_type, subscription_type, created_at
+        FROM {LEGACY_TABLE}
+        ORDER BY date;
+        SELECT setval(pg_get_serial_sequence('activity', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+        FROM activity;
+        DROP TABLE {LEGACY_TABLE};
+    """)
+    logger.info(f"Migrated {rows} activity rows into the partitioned table")
+    return rows
@@ -0,0 +1,350 @@
+import os
+import time
+import glob
+import stat
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _current_uid():
+    return os.getuid() if hasattr(os, 'getuid') else None
+
+
+def default_cache_dir():
+    """Per-user cache directory under the system temp dir"""
+    user = _current_uid() if _current_uid() is not None else os.getenv('USERNAME', 'default')
+    return os.path.join(tempfile.gettempdir(), f"edtech_query_cache-{user}")
+
+
+def is_private_dir(path):
+    """True if `path` is a real directory owned by this user and closed to everyone else.
+
+    Cache entries are pickles, so a directory other users can write to (or
+    one they created first) would let them run code in the dashboard.
+    """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(info.st_mode):
+        return False
+    if _current_uid() is not None and (info.st_uid != _current_uid() or info.st_mode & 0o077):
+        return False
+    return True
+
+
+def cache_key(query, params=None):
+    """Stable cache key for a SQL text and its bind parameters"""
+    normalized = ' '.join(query.split())
+    return hashlib.sha256(f"{normalized}|{params!r}".encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """A load in progress that other threads can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QueryCache:
+    """TTL + LRU result cache with single-flight loading.
+
+    Results live in a per-process LRU and, when ``cache_dir`` is set, in a
+    directory of pickles shared by every worker process on the host. That
+    directory must be private to the dashboard user (mode 0700), otherwise
+    only the memory tier is used. Misses for the same key are collapsed to
+    one load per process (thread single-flight) and, with a cache directory,
+    to one load per host via an advisory file lock (lock files go with their
+    entries on eviction and invalidation). ``invalidate()`` bumps a
+    generation stamp in the cache directory so every process drops its
+    entries, not only the caller.
+    """
+
+    def __init__(self, ttl=300, max_entries=256, cache_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (expires_at, generation, value)
+        self._inflight = {}
+        self._local_generation = 0
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+        if cache_dir:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            info = os.lstat(cache_dir)
+            if stat.S_ISDIR(info.st_mode) and info.st_uid == _current_uid() and info.st_mode & 0o077:
+                os.chmod(cache_dir, 0o700)  # our own directory, created before this check: tighten it
+            if not is_private_dir(cache_dir):
+                logger.error(f"Query cache directory {cache_dir} is not a private directory of this user "
+                             f"(mode 0700); the disk cache is disabled")
+                self.cache_dir = None
+
+    # Generation handling
+    def _generation_path(self):
+        return os.path.join(self.cache_dir, 'GENERATION')
+
+    def _generation(self):
+        if not self.cache_dir:
+            return self._local_generation
+        try:
+            return os.stat(self._generation_path()).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    # Memory tier
+    def _memory_get(self, key, generation):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, entry_generation, value = entry
+        if expires_at < time.time() or entry_generation != generation:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def _memory_put(self, key, expires_at, generation, value):
+        with self._lock:
+            self._memory[key] = (expires_at, generation, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    # Disk tier
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def _disk_get(self, key, generation):
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                if _current_uid() is not None and os.fstat(f.fileno()).st_uid != _current_uid():
+                    raise PermissionError("entry is owned by another user")
+                expires_at, entry_generation, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key[:12]}: {e}")
+            self._remove(path)
+            return None
+        if expires_at < time.time() or entry_generation != generation:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)  # mtime doubles as the LRU timestamp
+        except OSError:
+            pass
+        return expires_at, entry_generation, value
+
+    def _disk_put(self, key, expires_at, generation, value):
+        path = self._entry_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires_at, generation, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = glob.glob(os.path.join(self.cache_dir, '*.pkl'))
+        excess = len(entries) - self.max_entries
+        if excess > 0:
+            def mtime(path):
+                try:
+                    return os.stat(path).st_mtime
+                except FileNotFoundError:
+                    return 0
+            for path in sorted(entries, key=mtime)[:excess]:
+                self._remove(path)
+                self._stats['evictions'] += 1
+        # Expired, evicted and never-stored entries leave their lock files behind
+        self._remove_stale_locks()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _lock_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.lock")
+
+    @contextmanager
+    def _file_lock(self, key):
+        if fcntl is None:
+            yield
+            return
+        path = self._lock_path(key)
+        while True:
+            lock_file = open(path, 'w')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            # Unlinked by _remove_stale_locks while we waited: lock the file that replaced it
+            lock_file.close()
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _remove_stale_locks(self):
+        """Unlink the lock files of keys without an entry that no process is loading"""
+        if fcntl is None:
+            return
+        for path in glob.glob(os.path.join(self.cache_dir, '*.lock')):
+            if os.path.exists(path[:-len('.lock')] + '.pkl'):
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                # Only unlink while holding the lock; waiters notice and relock the new file
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._remove(path)
+            except BlockingIOError:
+                pass
+            finally:
+                os.close(fd)
+
+    # Public API
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key`, running `loader` once on a miss"""
+        generation = self._generation()
+        with self._lock:
+            entry = self._memory_get(key, generation)
+            if entry is not None:
+                self._stats['hits'] += 1
+                return self._share(entry[2])
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            with self._lock:
+                self._stats['hits'] += 1
+            return self._share(flight.value)
+
+        try:
+            flight.value = self._load(key, loader, generation)
+            return self._share(flight.value)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def _load(self, key, loader, generation):
+        if not self.cache_dir:
+            value = loader()
+            with self._lock:
+                self._stats['misses'] += 1
+            if generation == self._generation():
+                self._memory_put(key, time.time() + self.ttl, generation, value)
+            return value
+
+        with self._file_lock(key):
+            # Another process may have filled the entry while we waited for the lock
+            entry = self._disk_get(key, generation)
+            if entry is not None:
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                self._memory_put(key, *entry)
+                return entry[2]
+
+            value = loader()
+            with self._lock:
+                self._stats['misses'] += 1
+            expires_at = time.time() + self.ttl
+            # Don't publish results that raced with an invalidation
+            if generation == self._generation():
+                try:
+                    self._disk_put(key, expires_at, generation, value)
+                except Exception as e:
+                    logger.warning(f"Could not persist cache entry {key[:12]}: {e}")
+                self._memory_put(key, expires_at, generation, value)
+            return value
+
+    @staticmethod
+    def _share(value):
+        # Callers may add columns to frames; don't let that leak into the cache
+        if isinstance(value, pd.DataFrame):
+            return value.copy(deep=False)
+        return value
+
+    def invalidate(self):
+        """Drop every cached result in this and all other processes sharing the cache"""
+        with self._lock:
+            self._memory.clear()
+            self._local_generation += 1
+            self._stats['invalidations'] += 1
+        if self.cache_dir:
+            path = self._generation_path()
+            with open(path, 'a'):
+                pass
+            os.utime(path, ns=(time.time_ns(), time.time_ns()))
+            for entry in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+                self._remove(entry)
+            self._remove_stale_locks()
+        logger.info("Query cache invalidated")
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        with self._lock:
+            return {'entries': len(self._memory), **self._stats}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """Return the process-wide query cache configured from the environment"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache_dir = os.getenv('QUERY_CACHE_DIR', default_cache_dir())
+                _cache = QueryCache(
+                    ttl=float(os.getenv('QUERY_CACHE_TTL', 300)),
+                    max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', 256)),
+                    cache_dir=cache_dir or None,
+                )
+    return _cache
+
+
+def query_cache_enabled():
+    return os.getenv('QUERY_CACHE_ENABLED', 'True') == 'True'
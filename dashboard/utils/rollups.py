@@ -0,0 +1,161 @@
+import logging
+import time
+
+from .activity_bitmaps import refresh_activity_bitmaps
+from .funnel_progress import refresh_funnel_progress
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_NAME = 'daily_activity'
+
+# Each statement rebuilds one rollup from %(from_date)s onwards; earlier days are left untouched.
+REFRESH_STATEMENTS = [
+    ("daily_activity_rollup", """
+        DELETE FROM daily_activity_rollup WHERE date >= %(from_date)s;
+        INSERT INTO daily_activity_rollup (date, device_type, subscription_type, course_id,
+                                           active_users, sessions, total_time_spent, lessons_completed)
+        SELECT
+            date,
+            device_type,
+            subscription_type,
+            course_id,
+            COUNT(DISTINCT user_id),
+            COUNT(*),
+            SUM(time_spent),
+            SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END)
+        FROM activity
+        WHERE date >= %(from_date)s
+        GROUP BY date, device_type, subscription_type, course_id;
+    """),
+    ("daily_activity_totals", """
+        DELETE FROM daily_activity_totals WHERE date >= %(from_date)s;
+        INSERT INTO daily_activity_totals (date, active_users, premium_users, sessions,
+                                           total_time_spent, lessons_completed)
+        SELECT
+            date,
+            COUNT(DISTINCT user_id),
+            COUNT(DISTINCT CASE WHEN subscription_type = 'premium' THEN user_id END),
+            COUNT(*),
+            SUM(time_spent),
+            SUM(CASE WHEN lesson_completed THEN 1 ELSE 0 END)
+        FROM activity
+        WHERE date >= %(from_date)s
+        GROUP BY date;
+    """),
+    ("user_segment_activity", """
+        INSERT INTO user_segment_activity (user_id, device_type, subscription_type, first_date, last_date)
+        SELECT user_id, device_type, subscription_type, MIN(date), MAX(date)
+        FROM activity
+        WHERE date >= %(from_date)s
+        GROUP BY user_id, device_type, subscription_type
+        ON CONFLICT (user_id, device_type, subscription_type) DO UPDATE SET
+            first_date = LEAST(user_segment_activity.first_date, EXCLUDED.first_date),
+            last_date = GREATEST(user_segment_activity.last_date, EXCLUDED.last_date);
+    """),
+    # Assumes days arrive in order: a user's first_date only moves earlier on a full rebuild
+    ("user_first_seen", """
+        INSERT INTO user_first_seen (user_id, first_date)
+        SELECT user_id, MIN(date)
+        FROM activity
+        WHERE date >= %(from_date)s
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            first_date = LEAST(user_first_seen.first_date, EXCLUDED.first_date);
+    """),
+    # Periods are calendar buckets, so new days can only change cells whose bucket starts
+    # at or after the bucket containing from_date; only that slice of activity is rescanned.
+    ("cohort_retention", """
+        DELETE FROM cohort_retention
+        WHERE (cohort_start + period_number * CAST('1 ' || granularity AS INTERVAL))::date
+              >= DATE_TRUNC(granularity, %(from_date)s::timestamp)::date;
+        WITH granularities (granularity) AS (
+            VALUES ('day'), ('week'), ('month')
+        ),
+        user_periods AS (
+            SELECT DISTINCT
+                g.granularity,
+                a.user_id,
+                DATE_TRUNC(g.granularity, f.first_date::timestamp)::date as cohort_start,
+                DATE_TRUNC(g.granularity, a.date::timestamp)::date as activity_start
+            FROM activity a
+            JOIN user_first_seen f ON f.user_id = a.user_id
+            CROSS JOIN granularities g
+            WHERE a.date >= DATE_TRUNC(g.granularity, %(from_date)s::timestamp)::date
+        )
+        INSERT INTO cohort_retention (granularity, cohort_start, period_number, users)
+        SELECT
+            granularity,
+            cohort_start,
+            CASE granularity
+                WHEN 'day' THEN activity_start - cohort_start
+                WHEN 'week' THEN (activity_start - cohort_start) / 7
+                ELSE (EXTRACT(YEAR FROM activity_start) - EXTRACT(YEAR FROM cohort_start)) * 12
+                     + EXTRACT(MONTH FROM activity_start) - EXTRACT(MONTH FROM cohort_start)
+            END as period_number,
+            COUNT(*)
+        FROM user_periods
+        GROUP BY 1, 2, 3;
+    """),
+]
+
+RESET_STATEMENTS = """
+    TRUNCATE daily_activity_rollup, daily_activity_totals, user_segment_activity,
+             user_first_seen, cohort_retention, daily_active_bitmaps, user_funnel_progress;
+    DELETE FROM rollup_watermarks WHERE rollup_name = %(name)s;
+"""
+
+
+def get_watermark(cursor):
+    """Last activity date already folded into the rollups, or None"""
+    cursor.execute("SELECT last_date FROM rollup_watermarks WHERE rollup_name = %s", (WATERMARK_NAME,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def refresh_rollups(conn, from_date=None, full=False):
+    """Bring the daily rollups up to date with `activity`.
+
+    By default only days from the stored watermark onwards are recomputed
+    (the watermark day itself is redone because it may have been partial).
+    Pass ``from_date`` to reprocess from an earlier day, e.g. after late
+    events arrive, or ``full=True`` to rebuild everything.
+    Returns the first date that was reprocessed, or None if there was nothing to do.
+    """
+    started = time.time()
+    cursor = conn.cursor()
+    try:
+        if full:
+            cursor.execute(RESET_STATEMENTS, {'name': WATERMARK_NAME})
+        elif from_date is None:
+            from_date = get_watermark(cursor)
+
+        if from_date is None:
+            cursor.execute("SELECT MIN(date) FROM activity")
+            from_date = cursor.fetchone()[0]
+            if from_date is None:
+                logger.info("No activity rows yet; rollups left empty")
+                conn.commit()
+                return None
+
+        for name, statement in REFRESH_STATEMENTS:
+            cursor.execute(statement, {'from_date': from_date})
+            logger.debug(f"Refreshed {name} from {from_date}")
+        refresh_activity_bitmaps(cursor, from_date)
+        refresh_funnel_progress(cursor, from_date)
+
+        cursor.execute("""
+            INSERT INTO rollup_watermarks (rollup_name, last_date, updated_at)
+            SELECT %s, MAX(date), CURRENT_TIMESTAMP FROM activity
+            ON CONFLICT (rollup_name) DO UPDATE SET
+                last_date = EXCLUDED.last_date,
+                updated_at = EXCLUDED.updated_at
+        """, (WATERMARK_NAME,))
+        conn.commit()
+        logger.info(f"Rollups refreshed from {from_date} in {time.time() - started:.2f}s")
+        return from_date
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -1,6 +1,8 @@
--- Main activity table
+-- Main activity table, range-partitioned by month so date-windowed queries
+-- only scan the partitions they need. Monthly partitions (activity_yYYYYmMM)
+-- are created and archived by dashboard/utils/partitions.py.
 CREATE TABLE IF NOT EXISTS activity (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     date DATE NOT NULL,
     user_id VARCHAR(50) NOT NULL,
     course_id VARCHAR(50) NOT NULL,
@@ -8,8 +10,12 @@ CREATE TABLE IF NOT EXISTS activity (
     time_spent INTEGER NOT NULL DEFAULT 0,
     device_type VARCHAR(20) NOT NULL DEFAULT 'unknown',
     subscription_type VARCHAR(20) NOT NULL DEFAULT 'free',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+-- Catches rows for months without a partition yet; maintenance moves them out
+CREATE TABLE IF NOT EXISTS activity_default PARTITION OF activity DEFAULT;
 
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
@@ -51,7 +57,9 @@ CREATE TABLE IF NOT EXISTS payments (
 );
 
 -- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_activity_date_user ON activity(date, user_id);
+-- Rows arrive roughly in date order, so a BRIN index on date stays tiny and
+-- still skips most blocks of a partition for day-range filters
+CREATE INDEX IF NOT EXISTS idx_activity_date_brin ON activity USING brin(date);
 CREATE INDEX IF NOT EXISTS idx_activity_user_date ON activity(user_id, date);
 CREATE INDEX IF NOT EXISTS idx_activity_course ON activity(course_id);
 CREATE INDEX IF NOT EXISTS idx_users_signup_date ON users(signup_date);
@@ -64,4 +72,164 @@ INSERT INTO courses (course_id, course_name, total_lessons, difficulty_level, ca
 ('C103', 'Advanced Machine Learning', 25, 'advanced', 'Machine Learning'),
 ('C104', 'Web Development Fundamentals', 18, 'beginner', 'Web Development'),
 ('C105', 'SQL for Analytics', 12, 'intermediate', 'Data Analytics')
-ON CONFLICT (course_id) DO NOTHING;
\ No newline at end of file
+ON CONFLICT (course_id) DO NOTHING;
+
+-- Daily rollups (refreshed incrementally by dashboard/utils/rollups.py)
+CREATE TABLE IF NOT EXISTS daily_activity_rollup (
+    date DATE NOT NULL,
+    device_type VARCHAR(20) NOT NULL,
+    subscription_type VARCHAR(20) NOT NULL,
+    course_id VARCHAR(50) NOT NULL,
+    active_users INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    total_time_spent BIGINT NOT NULL,
+    lessons_completed INTEGER NOT NULL,
+    PRIMARY KEY (date, device_type, subscription_type, course_id)
+);
+
+-- Per-day totals; distinct users are not additive across segments, so they are kept separately
+CREATE TABLE IF NOT EXISTS daily_activity_totals (
+    date DATE PRIMARY KEY,
+    active_users INTEGER NOT NULL,
+    premium_users INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    total_time_spent BIGINT NOT NULL,
+    lessons_completed INTEGER NOT NULL
+);
+
+-- First/last activity per user and segment; answers "distinct users since X" without scanning activity
+CREATE TABLE IF NOT EXISTS user_segment_activity (
+    user_id VARCHAR(50) NOT NULL,
+    device_type VARCHAR(20) NOT NULL,
+    subscription_type VARCHAR(20) NOT NULL,
+    first_date DATE NOT NULL,
+    last_date DATE NOT NULL,
+    PRIMARY KEY (user_id, device_type, subscription_type)
+);
+
+-- First activity date per user (cohort assignment)
+CREATE TABLE IF NOT EXISTS user_first_seen (
+    user_id VARCHAR(50) PRIMARY KEY,
+    first_date DATE NOT NULL
+);
+
+-- Distinct active users per cohort and period; period 0 holds the cohort size
+CREATE TABLE IF NOT EXISTS cohort_retention (
+    granularity VARCHAR(10) NOT NULL,
+    cohort_start DATE NOT NULL,
+    period_number INTEGER NOT NULL,
+    users INTEGER NOT NULL,
+    PRIMARY KEY (granularity, cohort_start, period_number),
+    CHECK (granularity IN ('day', 'week', 'month'))
+);
+
+-- Day each user reached every step of the dashboard funnel (NULL where not reached), computed by
+-- FunnelEngine in refresh_rollups; `funnel` is the signature of the funnel definition used
+CREATE TABLE IF NOT EXISTS user_funnel_progress (
+    user_id VARCHAR(50) PRIMARY KEY,
+    funnel VARCHAR(16) NOT NULL,
+    segment VARCHAR(20),
+    reached DATE[] NOT NULL
+);
+
+-- Dense integer index per user; bit positions in the activity bitmaps
+CREATE TABLE IF NOT EXISTS user_index (
+    user_idx SERIAL PRIMARY KEY,
+    user_id VARCHAR(50) NOT NULL UNIQUE
+);
+
+-- zlib-compressed bitmap of active users per day and segment ('all', 'first_seen', 'device_type=mobile', ...).
+-- Every rewrite of a day gets a new version, so in-memory copies can tell which days changed.
+CREATE SEQUENCE IF NOT EXISTS daily_active_bitmaps_version_seq;
+
+CREATE TABLE IF NOT EXISTS daily_active_bitmaps (
+    date DATE NOT NULL,
+    segment VARCHAR(100) NOT NULL,
+    user_count INTEGER NOT NULL,
+    bitmap BYTEA NOT NULL,
+    version BIGINT NOT NULL DEFAULT nextval('daily_active_bitmaps_version_seq'),
+    PRIMARY KEY (segment, date)
+);
+
+ALTER TABLE daily_active_bitmaps
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('daily_active_bitmaps_version_seq');
+
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    rollup_name VARCHAR(50) PRIMARY KEY,
+    last_date DATE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-day ingestion watermark for events arriving through /ingest: days with
+-- pending_rollup set have rows the rollups have not seen yet
+CREATE TABLE IF NOT EXISTS ingest_day_watermarks (
+    date DATE PRIMARY KEY,
+    events_ingested BIGINT NOT NULL DEFAULT 0,
+    last_ingested_at TIMESTAMP NOT NULL,
+    rolled_up_at TIMESTAMP,
+    pending_rollup BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+-- Retention horizons reported by the retention_horizons view; add a row to track another day N
+CREATE TABLE IF NOT EXISTS retention_horizon_days (
+    horizon INTEGER PRIMARY KEY CHECK (horizon > 0)
+);
+
+INSERT INTO retention_horizon_days (horizon) VALUES (1), (7), (14), (30)
+ON CONFLICT (horizon) DO NOTHING;
+
+-- Classic (active exactly on day N) and rolling (active on day N or later) retention for every
+-- horizon. Users count only once day N is observable. Read from the rollups, never from activity:
+-- classic from the day cohorts in cohort_retention, rolling from each user's first and last day.
+CREATE OR REPLACE VIEW retention_horizons AS
+WITH as_of AS (
+    SELECT MAX(date) as max_date FROM daily_activity_totals
+),
+classic AS (
+    SELECT
+        h.horizon,
+        SUM(c.users) as eligible_users,
+        SUM(COALESCE(r.users, 0)) as classic_retained
+    FROM retention_horizon_days h
+    CROSS JOIN as_of
+    JOIN cohort_retention c
+        ON c.granularity = 'day'
+        AND c.period_number = 0
+        AND c.cohort_start <= as_of.max_date - h.horizon
+    LEFT JOIN cohort_retention r
+        ON r.granularity = 'day'
+        AND r.cohort_start = c.cohort_start
+        AND r.period_number = h.horizon
+    GROUP BY h.horizon
+),
+spans AS (
+    -- Users by first day and by how many days after it they were last active
+    SELECT f.first_date, l.last_date - f.first_date as last_day_n, COUNT(*) as users
+    FROM user_first_seen f
+    JOIN (
+        SELECT user_id, MAX(last_date) as last_date FROM user_segment_activity GROUP BY user_id
+    ) l ON l.user_id = f.user_id
+    GROUP BY 1, 2
+),
+rolling AS (
+    SELECT h.horizon, SUM(s.users) as rolling_retained
+    FROM retention_horizon_days h
+    CROSS JOIN as_of
+    JOIN spans s
+        ON s.first_date <= as_of.max_date - h.horizon
+        AND s.last_day_n >= h.horizon
+    GROUP BY h.horizon
+)
+SELECT
+    h.horizon,
+    COALESCE(c.eligible_users, 0)::bigint as eligible_users,
+    COALESCE(c.classic_retained, 0)::bigint as classic_retained,
+    COALESCE(r.rolling_retained, 0)::bigint as rolling_retained,
+    ROUND(COALESCE(c.classic_retained, 0) * 100.0 / NULLIF(c.eligible_users, 0), 1) as classic_retention,
+    ROUND(COALESCE(r.rolling_retained, 0) * 100.0 / NULLIF(c.eligible_users, 0), 1) as rolling_retention
+FROM retention_horizon_days h
+LEFT JOIN classic c ON c.horizon = h.horizon
+LEFT JOIN rolling r ON r.horizon = h.horizon
+ORDER BY h.horizon;
+
+CREATE INDEX IF NOT EXISTS idx_user_segment_activity_last_date ON user_segment_activity(last_date);
@@ -0,0 +1,45 @@
+import os
+import sys
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.utils.bulk_load import load_activity
+from dashboard.utils.rollups import refresh_rollups
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    """Bulk load activity CSV files with COPY and refresh the rollups"""
+    parser = argparse.ArgumentParser(description="Bulk load activity data into the database")
+    parser.add_argument('csv_files', nargs='+', help="CSV files with activity columns")
+    parser.add_argument('--batch-size', type=int, help="rows per COPY batch (default BULK_LOAD_BATCH_SIZE)")
+    parser.add_argument('--replace', action='store_true', help="replace all existing activity rows")
+    parser.add_argument('--no-staging', action='store_true',
+                        help="with --replace, truncate and load in place instead of via a staging table")
+    parser.add_argument('--skip-rollups', action='store_true', help="do not refresh rollups after loading")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.getenv('DB_URL'))
+    try:
+        for position, path in enumerate(args.csv_files):
+            # Only the first file replaces; the rest append to it
+            stats = load_activity(conn, path, batch_size=args.batch_size,
+                                  replace=args.replace and position == 0, staging=not args.no_staging)
+            logger.info(f"{path}: {stats['rows']} rows at {stats['rows_per_sec']:,.0f} rows/sec")
+            if args.skip_rollups or not stats['rows']:
+                continue
+            if args.replace and position == 0:
+                refresh_rollups(conn, full=True)
+            else:
+                refresh_rollups(conn, from_date=stats['min_date'])
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
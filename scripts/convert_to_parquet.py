@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+from dotenv import load_dotenv
+import logging
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def convert_csv_to_parquet(csv_files, output_dir, row_group_size=122880, overwrite=False):
+    """Convert activity CSV files into a month-partitioned Parquet snapshot.
+
+    Rows are sorted by date within each partition so Parquet row-group
+    statistics let date filters skip most of the data. The conversion runs
+    inside DuckDB and streams, so inputs larger than memory are fine.
+    """
+    if duckdb is None:
+        raise ImportError("Parquet conversion requires the duckdb package (pip install duckdb)")
+    if os.path.exists(output_dir) and not overwrite:
+        raise FileExistsError(f"{output_dir} already exists (use --overwrite to replace it)")
+
+    # Written next to the target and swapped in at the end, so a running dashboard never sees a partial snapshot
+    staging_dir = output_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    started = time.time()
+    sources = ', '.join("'" + path.replace("'", "''") + "'" for path in csv_files)
+    conn = duckdb.connect(':memory:')
+    try:
+        # Dates may carry a time of day (older exports); the snapshot stores plain dates
+        conn.execute(f"""
+            COPY (
+                SELECT
+                    CAST(CAST(date AS TIMESTAMP) AS DATE) as date,
+                    user_id, course_id,
+                    CAST(lesson_completed AS BOOLEAN) as lesson_completed,
+                    CAST(time_spent AS INTEGER) as time_spent,
+                    device_type, subscription_type,
+                    strftime(CAST(date AS TIMESTAMP), '%Y-%m') as month
+                FROM read_csv([{sources}], header = true, all_varchar = true)
+                ORDER BY date, user_id
+            ) TO '{staging_dir.replace("'", "''")}'
+            (FORMAT parquet, PARTITION_BY (month), ROW_GROUP_SIZE {int(row_group_size)}, COMPRESSION zstd)
+        """)
+        rows = conn.execute(f"""
+            SELECT COUNT(*) FROM read_parquet('{os.path.join(staging_dir, "**", "*.parquet").replace("'", "''")}')
+        """).fetchone()[0]
+    finally:
+        conn.close()
+
+    if os.path.exists(output_dir):
+        retired_dir = output_dir.rstrip(os.sep) + '.old'
+        shutil.rmtree(retired_dir, ignore_errors=True)
+        os.rename(output_dir, retired_dir)
+        os.rename(staging_dir, output_dir)
+        shutil.rmtree(retired_dir)
+    else:
+        os.rename(staging_dir, output_dir)
+
+    logger.info(f"Wrote {rows} activity rows to {output_dir} in {time.time() - started:.2f}s")
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert activity CSV exports to a Parquet snapshot")
+    parser.add_argument('csv_files', nargs='*', default=['data/advanced_sample_data.csv'],
+                        help="activity CSV files (default data/advanced_sample_data.csv)")
+    parser.add_argument('--output', default=os.getenv('ACTIVITY_PARQUET_DIR', 'data/activity_parquet'),
+                        help="snapshot directory (default ACTIVITY_PARQUET_DIR)")
+    parser.add_argument('--row-group-size', type=int, default=122880, help="rows per Parquet row group")
+    parser.add_argument('--overwrite', action='store_true', help="replace an existing snapshot")
+    args = parser.parse_args()
+
+    try:
+        convert_csv_to_parquet(args.csv_files, args.output, args.row_group_size, args.overwrite)
+    except (ImportError, FileExistsError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+    logger.info("Run the dashboard on the snapshot with ANALYTICS_BACKEND=duckdb")
+
+if __name__ == "__main__":
+    main()
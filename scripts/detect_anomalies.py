@@ -0,0 +1,59 @@
+import os
+import sys
+import argparse
+from datetime import timedelta
+from dotenv import load_dotenv
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.utils.analytics_backend import read_sql
+from dashboard.components.anomaly_detector import StreamingAnomalyDetector
+from dashboard.components.data_processor import DataProcessor
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METRICS = ['active_users', 'sessions', 'total_time_spent', 'lessons_completed']
+SERIES = ['device_type', 'subscription_type', 'course_id']
+
+
+def main():
+    """Feed new days of the segment rollup to the persistent anomaly detector (run after each rollup refresh)"""
+    parser = argparse.ArgumentParser(description="Streaming anomaly detection over the daily segment rollup")
+    parser.add_argument('--state', default=os.getenv('ANOMALY_STATE_PATH', 'artifacts/anomaly_state.npz'),
+                        help="detector state file (default ANOMALY_STATE_PATH)")
+    parser.add_argument('--method', default=os.getenv('ANOMALY_METHOD', 'ewma'), choices=['ewma', 'mad'],
+                        help="baseline for a new state: EWMA with weekday offsets, or rolling median/MAD")
+    parser.add_argument('--threshold', type=float, default=float(os.getenv('ANOMALY_THRESHOLD', 3.0)),
+                        help="|z| above which a point is an anomaly, for a new state (default 3)")
+    parser.add_argument('--lookback-days', type=int, default=7,
+                        help="re-read this many days before the last processed one, for late rows (default 7)")
+    parser.add_argument('--reset', action='store_true', help="discard the saved state and start over")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.state):
+        os.remove(args.state)
+    detector = StreamingAnomalyDetector.open(args.state, method=args.method, threshold=args.threshold)
+    last = detector.last_processed()
+    since = (last - timedelta(days=args.lookback_days)).date() if last is not None else None
+
+    rollup = read_sql(f"""
+        SELECT date, {', '.join(SERIES)}, {', '.join(METRICS)}
+        FROM daily_activity_rollup
+        {'WHERE date > %(since)s' if since else ''}
+        ORDER BY date;
+    """, {'since': since} if since else None, use_cache=False, name='anomaly_rollup')
+
+    points = DataProcessor.detect_anomalies_streaming(rollup, METRICS, SERIES, detector=detector,
+                                                      state_path=args.state, fill_value=0)
+    anomalies = points[points['is_anomaly']]
+    logger.info(f"Scored {len(points)} new points across {len(detector)} series; {len(anomalies)} anomalies")
+    for row in anomalies.itertuples(index=False):
+        logger.info(f"{row.date:%Y-%m-%d} {row.metric} {row.device_type}/{row.subscription_type}/{row.course_id}: "
+                    f"{row.value:g} vs expected {row.expected:.1f} (z={row.z_score:+.1f})")
+
+
+if __name__ == "__main__":
+    main()
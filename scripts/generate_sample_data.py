@@ -1,184 +1,295 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import psycopg2
 from dotenv import load_dotenv
 import logging
 from faker import Faker
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.utils.bulk_load import load_activity
+from dashboard.utils.rollups import refresh_rollups
+
 load_dotenv()
 fake = Faker()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_realistic_edtech_data(num_users=2000, num_days=90):
-    """Генерирует реалистичные данные EdTech платформы"""
-    
-    data = []
-    start_date = datetime.now() - timedelta(days=num_days)
-    
-    # Курсы с разной популярностью
-    courses = [
-        {'id': 'C101', 'name': 'Python Basics', 'popularity': 0.4},
-        {'id': 'C102', 'name': 'Data Science', 'popularity': 0.3}, 
-        {'id': 'C103', 'name': 'Machine Learning', 'popularity': 0.15},
-        {'id': 'C104', 'name': 'Web Development', 'popularity': 0.1},
-        {'id': 'C105', 'name': 'SQL Analytics', 'popularity': 0.05}
-    ]
-    
-    # Устройства с разными характеристиками  
-    devices = [
+# Курсы с разной популярностью
+COURSES = [
+    {'id': 'C101', 'name': 'Python Basics', 'popularity': 0.4},
+    {'id': 'C102', 'name': 'Data Science', 'popularity': 0.3}, 
+    {'id': 'C103', 'name': 'Machine Learning', 'popularity': 0.15},
+    {'id': 'C104', 'name': 'Web Development', 'popularity': 0.1},
+    {'id': 'C105', 'name': 'SQL Analytics', 'popularity': 0.05}
+]
+
+# Устройства с разными характеристиками  
+DEVICES = [
     {'type': 'mobile', 'probability': 0.6, 'avg_session_time': 25, 'completion_rate': 0.65},
     {'type': 'desktop', 'probability': 0.3, 'avg_session_time': 45, 'completion_rate': 0.85},
     {'type': 'tablet', 'probability': 0.1, 'avg_session_time': 35, 'completion_rate': 0.75}
 ]
-    
-    logger.info(f"Generating data for {num_users} users over {num_days} days...")
-    
-    for user_idx in range(1, num_users + 1):
-        user_id = f"U{user_idx:04d}"
-        
-        # Дата регистрации пользователя
-        signup_date = start_date + timedelta(days=np.random.randint(0, num_days-30))
-        
-        # Тип пользователя (влияет на поведение)
-        user_type = np.random.choice(['engaged', 'casual', 'trial'], p=[0.2, 0.6, 0.2])
-        
-        # Выбор основного устройства
-        device_probs = [d['probability'] for d in devices]
-        primary_device = np.random.choice(devices, p=device_probs)
-        
-        # Конверсия в premium (зависит от активности)
-        converts_to_premium = np.random.random() < (0.4 if user_type == 'engaged' else 0.1)
-        conversion_day = np.random.randint(3, 30) if converts_to_premium else None
-        
-        # Генерация активности пользователя
-        current_date = signup_date
-        subscription_type = 'free'
-        consecutive_inactive = 0
-        
-        # Параметры активности по типу пользователя
-        activity_params = {
-            'engaged': {'session_prob': 0.7, 'sessions_per_day': 2.5, 'retention_decay': 0.95},
-            'casual': {'session_prob': 0.3, 'sessions_per_day': 1.2, 'retention_decay': 0.85}, 
-            'trial': {'session_prob': 0.8, 'sessions_per_day': 3.0, 'retention_decay': 0.7}
-        }
-        
-        params = activity_params[user_type]
-        
-        while current_date.date() <= datetime.now().date():
-            # Проверка конверсии в premium
-            if (conversion_day and 
-                (current_date - signup_date).days >= conversion_day and 
-                subscription_type == 'free'):
-                subscription_type = 'premium'
-            
-            # Вероятность активности (уменьшается со временем)
-            days_since_signup = (current_date - signup_date).days
-            base_prob = params['session_prob'] * (params['retention_decay'] ** (days_since_signup / 7))
-            
-            # Снижение активности после периодов неактивности
-            if consecutive_inactive > 0:
-                base_prob *= (0.7 ** consecutive_inactive)
-            
-            # Решение об активности в этот день
-            if np.random.random() < base_prob:
-                consecutive_inactive = 0
-                
-                # Количество сессий в день
-                num_sessions = max(1, int(np.random.poisson(params['sessions_per_day'])))
-                
-                for session in range(num_sessions):
-                    # Выбор курса (с учетом популярности)
-                    course_probs = [c['popularity'] for c in courses]
-                    course = np.random.choice([c['id'] for c in courses], p=course_probs)
-                    
-                    # Выбор устройства (80% - основное, 20% - другое)
-                    if np.random.random() < 0.8:
-                        device = primary_device
-                    else:
-                        device = np.random.choice(devices)
-                    
-                    # Продолжительность сессии
-                    base_time = device['avg_session_time']
-                    if subscription_type == 'premium':
-                        base_time *= 1.4  # Premium пользователи дольше занимаются
-                    
-                    time_spent = max(5, int(np.random.normal(base_time, base_time * 0.3)))
-                    
-                    # Завершение урока
-                    completion_rate = device['completion_rate']
-                    if subscription_type == 'premium':
-                        completion_rate *= 1.2
-                    if user_type == 'engaged':
-                        completion_rate *= 1.1
-                        
-                    lesson_completed = np.random.random() < min(completion_rate, 0.95)
-                    
-                    # Добавление записи
-                    data.append({
-                        'date': current_date,
-                        'user_id': user_id,
-                        'course_id': course,
-                        'lesson_completed': lesson_completed,
-                        'time_spent': time_spent,
-                        'device_type': device['type'],
-                        'subscription_type': subscription_type
-                    })
-            else:
-                consecutive_inactive += 1
-                
-                # Если неактивен больше 14 дней, прекращаем генерацию
-                if consecutive_inactive > 14:
-                    break
-            
-            current_date += timedelta(days=1)
-        
-        if user_idx % 500 == 0:
-            logger.info(f"Generated data for {user_idx} users...")
-    
-    df = pd.DataFrame(data)
+
+# Параметры активности по типу пользователя
+USER_TYPES = [
+    {'type': 'engaged', 'probability': 0.2, 'session_prob': 0.7, 'sessions_per_day': 2.5,
+     'retention_decay': 0.95, 'conversion_prob': 0.4},
+    {'type': 'casual', 'probability': 0.6, 'session_prob': 0.3, 'sessions_per_day': 1.2,
+     'retention_decay': 0.85, 'conversion_prob': 0.1},
+    {'type': 'trial', 'probability': 0.2, 'session_prob': 0.8, 'sessions_per_day': 3.0,
+     'retention_decay': 0.7, 'conversion_prob': 0.1}
+]
+
+USERS_PER_SHARD = 50000
+MAX_INACTIVE_DAYS = 14
+
+
+def _column(items, key, dtype=np.float64):
+    return np.array([item[key] for item in items], dtype=dtype)
+
+
+def generate_activity_shard(first_user, num_users, num_days, seed, end_date):
+    """Генерирует активность пользователей first_user .. first_user + num_users - 1.
+
+    Day-by-day simulation, vectorised across all users of the shard; the
+    per-user model is the same as in the original per-user loop.
+    """
+    rng = np.random.default_rng(seed)
+    start_day = np.datetime64(end_date, 'D') - num_days
+
+    course_probs = _column(COURSES, 'popularity')
+    device_probs = _column(DEVICES, 'probability')
+    avg_session_time = _column(DEVICES, 'avg_session_time')
+    device_completion = _column(DEVICES, 'completion_rate')
+    session_prob = _column(USER_TYPES, 'session_prob')
+    sessions_per_day = _column(USER_TYPES, 'sessions_per_day')
+    retention_decay = _column(USER_TYPES, 'retention_decay')
+    conversion_prob = _column(USER_TYPES, 'conversion_prob')
+    engaged = np.array([t['type'] == 'engaged' for t in USER_TYPES])
+
+    # Атрибуты пользователей: дата регистрации, тип, основное устройство, день конверсии
+    signup = rng.integers(0, num_days - 30, size=num_users)
+    user_type = rng.choice(len(USER_TYPES), size=num_users, p=_column(USER_TYPES, 'probability'))
+    primary_device = rng.choice(len(DEVICES), size=num_users, p=device_probs)
+    converts = rng.random(num_users) < conversion_prob[user_type]
+    conversion_day = np.where(converts, rng.integers(3, 30, size=num_users), -1)
+
+    consecutive_inactive = np.zeros(num_users, dtype=np.int64)
+    churned = np.zeros(num_users, dtype=bool)
+    parts = []
+
+    for day in range(num_days + 1):
+        users = np.flatnonzero((signup <= day) & ~churned)
+        if users.size == 0:
+            continue
+        types = user_type[users]
+        days_since = day - signup[users]
+
+        # Вероятность активности (уменьшается со временем и после пропусков)
+        base_prob = session_prob[types] * retention_decay[types] ** (days_since / 7)
+        base_prob *= 0.7 ** consecutive_inactive[users]
+        active = rng.random(users.size) < base_prob
+
+        inactive_users = users[~active]
+        consecutive_inactive[users[active]] = 0
+        consecutive_inactive[inactive_users] += 1
+        # Если неактивен больше 14 дней, прекращаем генерацию
+        churned[inactive_users[consecutive_inactive[inactive_users] > MAX_INACTIVE_DAYS]] = True
+
+        users, types, days_since = users[active], types[active], days_since[active]
+        if users.size == 0:
+            continue
+
+        # Сессии за день, затем атрибуты каждой сессии
+        num_sessions = np.maximum(1, rng.poisson(sessions_per_day[types]))
+        session_user = np.repeat(users, num_sessions)
+        session_type = np.repeat(types, num_sessions)
+        premium = np.repeat((conversion_day[users] >= 0) & (days_since >= conversion_day[users]), num_sessions)
+        n = session_user.size
+
+        course = rng.choice(len(COURSES), size=n, p=course_probs)
+        device = np.where(rng.random(n) < 0.8, primary_device[session_user], rng.integers(0, len(DEVICES), size=n))
+
+        base_time = avg_session_time[device] * np.where(premium, 1.4, 1.0)
+        time_spent = np.maximum(5, np.trunc(rng.normal(base_time, base_time * 0.3))).astype(np.int32)
+
+        completion_rate = device_completion[device] * np.where(premium, 1.2, 1.0) * np.where(engaged[session_type], 1.1, 1.0)
+        lesson_completed = rng.random(n) < np.minimum(completion_rate, 0.95)
+
+        parts.append((session_user, np.full(n, day, dtype=np.int32), course, device,
+                      time_spent, lesson_completed, premium))
+
+    if not parts:
+        return pd.DataFrame(columns=['date', 'user_id', 'course_id', 'lesson_completed',
+                                     'time_spent', 'device_type', 'subscription_type'])
+
+    session_user, day, course, device, time_spent, lesson_completed, premium = (
+        np.concatenate(column) for column in zip(*parts))
+    # Порядок как у исходного генератора: по пользователю, затем по дате
+    order = np.lexsort((day, session_user))
+    user_ids = np.array([f"U{idx:04d}" for idx in range(first_user, first_user + num_users)], dtype=object)
+
+    return pd.DataFrame({
+        'date': pd.to_datetime(start_day + day[order]),
+        'user_id': user_ids[session_user[order]],
+        'course_id': pd.Categorical.from_codes(course[order], [c['id'] for c in COURSES]),
+        'lesson_completed': lesson_completed[order],
+        'time_spent': time_spent[order],
+        'device_type': pd.Categorical.from_codes(device[order], [d['type'] for d in DEVICES]),
+        'subscription_type': pd.Categorical.from_codes(premium[order].astype(np.int8), ['free', 'premium']),
+    })
+
+
+def plan_shards(num_users, seed=None, shard_size=USERS_PER_SHARD):
+    """Split users into fixed-size shards, each with its own child seed.
+
+    Shard boundaries and seeds depend only on (num_users, seed, shard_size),
+    so output is identical whatever the number of worker processes.
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    if seed is None:
+        logger.info(f"Random seed entropy: {seed_sequence.entropy} (pass --seed to reproduce)")
+    starts = list(range(1, num_users + 1, shard_size))
+    children = seed_sequence.spawn(len(starts))
+    return [(start, min(shard_size, num_users + 1 - start), child) for start, child in zip(starts, children)]
+
+
+def iter_activity_chunks(num_users=2000, num_days=90, seed=None, jobs=1,
+                         shard_size=USERS_PER_SHARD, end_date=None):
+    """Генерирует данные блоками: один DataFrame на каждый шард пользователей.
+
+    Chunks come out in user order. At most ``2 * jobs`` shards are in
+    flight, so peak memory depends on the shard size, not on the total
+    number of users or days.
+    """
+    end_date = end_date or datetime.now().date()
+    shards = plan_shards(num_users, seed, shard_size)
+    logger.info(f"Generating data for {num_users} users over {num_days} days "
+                f"({len(shards)} shards, {jobs} processes)...")
+
+    args = [(start, count, child, num_days, end_date) for start, count, child in shards]
+    if jobs <= 1 or len(shards) <= 1:
+        for arg in args:
+            yield _generate_shard(arg)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for arg in args:
+            pending.append(executor.submit(_generate_shard, arg))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def generate_realistic_edtech_data(num_users=2000, num_days=90, seed=None, jobs=1,
+                                   shard_size=USERS_PER_SHARD, end_date=None):
+    """Генерирует реалистичные данные EdTech платформы"""
+    df = pd.concat(list(iter_activity_chunks(num_users, num_days, seed, jobs, shard_size, end_date)),
+                   ignore_index=True)
     logger.info(f"Generated {len(df)} activity records")
     return df
 
-def save_to_database(df):
-    """Сохранение данных в базу"""
+
+def _generate_shard(args):
+    start, count, seed, num_days, end_date = args
+    return generate_activity_shard(start, count, num_days, seed, end_date)
+
+
+def stream_to_file(chunks, path):
+    """Пишет блоки в CSV или Parquet (по расширению) и передаёт их дальше.
+
+    Parquet output needs pyarrow; each chunk becomes one row group.
+    """
+    parquet = path.endswith('.parquet')
+    if parquet and pq is None:
+        raise ImportError("Writing Parquet requires pyarrow (pip install pyarrow)")
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if parquet:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(path, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+            rows += len(chunk)
+            yield chunk
+    finally:
+        if writer is not None:
+            writer.close()
+    logger.info(f"Wrote {rows} activity records to {path}")
+
+
+def save_to_database(data):
+    """Сохранение данных в базу (DataFrame или поток блоков)"""
     try:
         conn = psycopg2.connect(os.getenv('DB_URL'))
-        cursor = conn.cursor()
         
-        # Очистка старых данных
-        cursor.execute("DELETE FROM activity")
+        # Замена данных через COPY и staging-таблицу (читатели не видят пустую таблицу)
+        stats = load_activity(conn, data, replace=True)
         
-        # Вставка новых данных
-        for _, row in df.iterrows():
-            cursor.execute("""
-                INSERT INTO activity (date, user_id, course_id, lesson_completed, 
-                                    time_spent, device_type, subscription_type)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, tuple(row))
-        
-        conn.commit()
-        cursor.close()
+        # The table was replaced wholesale, so rebuild rollups rather than appending
+        refresh_rollups(conn, full=True)
         conn.close()
-        logger.info(f"Successfully saved {len(df)} records to database")
+        logger.info(f"Successfully saved {stats['rows']} records to database")
         
     except Exception as e:
         logger.error(f"Error saving to database: {str(e)}")
         raise
 
 def main():
-    logger.info("Generating advanced sample data for dashboard...")
+    parser = argparse.ArgumentParser(description="Generate synthetic EdTech activity data")
+    parser.add_argument('--users', type=int, default=2000, help="number of users (default 2000)")
+    parser.add_argument('--days', type=int, default=90, help="days of history (default 90)")
+    parser.add_argument('--seed', type=int, help="random seed for reproducible output")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--shard-size', type=int, default=USERS_PER_SHARD, help="users per shard")
+    parser.add_argument('--output', default='data/advanced_sample_data.csv',
+                        help="backup file path; .parquet writes Parquet (needs pyarrow)")
+    parser.add_argument('--no-db', action='store_true', help="only write the backup file, skip the database")
+    parser.add_argument('--stream', action='store_true',
+                        help="stream shard-sized chunks to the file and database instead of building one DataFrame")
+    args = parser.parse_args()
     
-    # Генерация данных (2000 пользователей, 90 дней)
-    df = generate_realistic_edtech_data(num_users=2000, num_days=90)
-    
-    # Сохранение в базу данных
-    save_to_database(df)
+    logger.info("Generating advanced sample data for dashboard...")
     
-    # Сохранение в CSV для резервной копии
-    df.to_csv('data/advanced_sample_data.csv', index=False)
+    # Генерация данных (по умолчанию 2000 пользователей, 90 дней)
+    options = dict(num_users=args.users, num_days=args.days, seed=args.seed,
+                   jobs=args.jobs, shard_size=args.shard_size)
+    if args.stream:
+        # Каждый блок пишется в файл и сразу копируется в базу; весь набор в памяти не держится
+        chunks = stream_to_file(iter_activity_chunks(**options), args.output)
+        if args.no_db:
+            deque(chunks, maxlen=0)
+        else:
+            save_to_database(chunks)
+    else:
+        df = generate_realistic_edtech_data(**options)
+        
+        # Сохранение в базу данных
+        if not args.no_db:
+            save_to_database(df)
+        
+        # Сохранение в CSV для резервной копии
+        deque(stream_to_file([df], args.output), maxlen=0)
     
     logger.info("Advanced sample data generation completed!")
     logger.info("You can now launch the dashboard with: python dashboard/app.py")
@@ -0,0 +1,350 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import statistics
+import psycopg2
+from dotenv import load_dotenv
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.utils.bulk_load import load_activity
+from dashboard.utils.db_queries import dashboard_queries
+from dashboard.utils.rollups import refresh_rollups
+from scripts.generate_sample_data import iter_activity_chunks
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(ROOT, 'data', 'schema.sql')
+SCAN_NODES = ('Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan', 'Bitmap Index Scan')
+IDENTIFIER = re.compile(r'\b([a-z_][a-z0-9_]*)\b')
+# e.g. "((subscription_type)::text = 'premium'::text)"
+EQUALS_LITERAL = re.compile(r"\(*(?:\w+\.)?(\w+)\)*(?:::[\w ]+?)?\)* = '((?:[^']|'')*)'")
+
+
+# Data loading
+def load_scale(conn, rows, days=90, seed=42, jobs=1):
+    """Replace activity with roughly `rows` generated rows and rebuild the rollups"""
+    pilot = sum(len(chunk) for chunk in iter_activity_chunks(2000, days, seed))
+    users = max(1, round(rows * 2000 / pilot))
+    with open(SCHEMA_PATH) as file, conn.cursor() as cursor:
+        cursor.execute(file.read())
+    conn.commit()
+    stats = load_activity(conn, iter_activity_chunks(users, days, seed, jobs), replace=True)
+    refresh_rollups(conn, full=True)
+    # Fresh visibility map and statistics, so index-only scans and estimates are realistic
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("VACUUM ANALYZE")
+    finally:
+        conn.autocommit = False
+    logger.info(f"Loaded {stats['rows']} rows for {users} users")
+    return stats['rows']
+
+
+# Plans
+def _walk(plan, ancestors=()):
+    yield plan, ancestors
+    for child in plan.get('Plans', []):
+        yield from _walk(child, ancestors + (plan,))
+
+
+def _columns(expressions, table_columns):
+    """Columns of a table referenced in plan expressions, in order of first appearance"""
+    found = []
+    for expression in expressions:
+        for name in IDENTIFIER.findall(re.sub(r"'(?:[^']|'')*'", '', expression)):
+            if name in table_columns and name not in found:
+                found.append(name)
+    return found
+
+
+def explain(cursor, sql, repeat=3, params=None):
+    """Median-time EXPLAIN (ANALYZE, BUFFERS) of a query after one warm-up run"""
+    plans = []
+    for _ in range(repeat + 1):
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, VERBOSE, FORMAT JSON) {sql}", params)
+        plans.append(cursor.fetchone()[0][0])
+    plans = sorted(plans[1:], key=lambda p: p['Execution Time'])
+    median = plans[len(plans) // 2]
+    root = median['Plan']
+    scans = [{'node': node['Node Type'], 'relation': node.get('Relation Name'), 'index': node.get('Index Name')}
+             for node, _ in _walk(root) if node['Node Type'] in SCAN_NODES]
+    return {
+        'execution_ms': round(statistics.median(p['Execution Time'] for p in plans), 2),
+        'planning_ms': round(median['Planning Time'], 2),
+        'shared_hit': root.get('Shared Hit Blocks', 0),
+        'shared_read': root.get('Shared Read Blocks', 0),
+        'temp_written': root.get('Temp Written Blocks', 0),
+        'scans': scans,
+        'plan': median,
+    }
+
+
+def catalog(cursor):
+    """(columns per table, parent table per partition, existing secondary indexes)"""
+    cursor.execute("SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = 'public'")
+    columns = {}
+    for table, column in cursor.fetchall():
+        columns.setdefault(table, set()).add(column)
+    cursor.execute("""
+        SELECT c.relname, p.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+    """)
+    parents = dict(cursor.fetchall())
+    cursor.execute("""
+        SELECT i.relname, t.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_class t ON t.oid = x.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = 'public' AND NOT x.indisprimary AND NOT x.indisunique
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.oid)
+    """)
+    indexes = {name: {'table': table, 'definition': definition} for name, table, definition in cursor.fetchall()}
+    for name, info in indexes.items():
+        # Scans on partitions name the per-partition child index
+        cursor.execute("SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass)", (name,))
+        info['tree'] = {name} | {row[0] for row in cursor.fetchall()}
+    return columns, parents, indexes
+
+
+def propose_indexes(plan, columns, parents):
+    """Candidate indexes for the scans in a plan: {definition without name: table}.
+
+    For each scan, keys are the filtered columns (equality first) followed
+    by sort/group keys of the operators above it; the remaining output
+    columns are INCLUDEd so the scan can become index-only. Equality
+    filters on a literal also yield a partial index with that predicate.
+    """
+    candidates = {}
+    for node, ancestors in _walk(plan['Plan']):
+        relation = node.get('Relation Name')
+        if node['Node Type'] not in SCAN_NODES or not relation:
+            continue
+        table = parents.get(relation, relation)
+        table_columns = columns.get(table, set())
+        conditions = [node[key] for key in ('Filter', 'Index Cond', 'Recheck Cond') if key in node]
+        equalities = [(c, v) for c, v in EQUALS_LITERAL.findall(' AND '.join(conditions)) if c in table_columns]
+        filtered = _columns(conditions, table_columns)
+        ordering = _columns([k for a in ancestors for k in a.get('Sort Key', []) + a.get('Group Key', [])],
+                            table_columns)
+        output = _columns(node.get('Output', []), table_columns)
+        equal_columns = [c for c, _ in equalities]
+
+        def add(keys, predicate=''):
+            keys = list(dict.fromkeys(keys))
+            if not keys:
+                return
+            include = [c for c in output if c not in keys]
+            definition = f"ON {table} ({', '.join(keys)})"
+            if include:
+                definition += f" INCLUDE ({', '.join(include)})"
+            if predicate:
+                definition += f" WHERE {predicate}"
+            candidates[definition] = table
+
+        add(equal_columns + [c for c in filtered if c not in equal_columns] + ordering)
+        if equalities:
+            predicate = ' AND '.join(f"{c} = '{v}'" for c, v in equalities)
+            rest = [c for c in filtered + ordering if c not in equal_columns]
+            add(rest or [c for c in output if c not in equal_columns][:1], predicate)
+        elif not filtered and ordering:
+            add(ordering)
+    return candidates
+
+
+def _index_size(cursor, name):
+    # pg_partition_tree is empty for an index on a plain table
+    cursor.execute("""
+        SELECT COALESCE(SUM(pg_relation_size(relid)), pg_relation_size(%(name)s::regclass))
+        FROM pg_partition_tree(%(name)s::regclass)
+    """, {'name': name})
+    return int(cursor.fetchone()[0])
+
+
+def _tables(result, parents):
+    return {parents.get(s['relation'], s['relation']) for s in result['scans'] if s['relation']}
+
+
+def measure_change(conn, statement, queries, repeat, index_name=None):
+    """Apply DDL in a transaction, re-run the (name, sql, params) queries, then roll back"""
+    cursor = conn.cursor()
+    try:
+        started = time.time()
+        cursor.execute(statement)
+        seconds = time.time() - started
+        size, tree = None, set()
+        if index_name:
+            size = _index_size(cursor, index_name)
+            cursor.execute("SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass)", (index_name,))
+            tree = {index_name} | {row[0] for row in cursor.fetchall()}
+        results = {name: explain(cursor, sql, repeat, params) for name, sql, params in queries}
+        return seconds, size, tree, results
+    finally:
+        conn.rollback()
+        cursor.close()
+
+
+def _effect(before, after, index_tree=()):
+    return {
+        'uses_index': any(s['index'] in index_tree for s in after['scans']),
+        'before_ms': before['execution_ms'], 'after_ms': after['execution_ms'],
+        'before_blocks': before['shared_hit'] + before['shared_read'],
+        'after_blocks': after['shared_hit'] + after['shared_read'],
+        'indexes_used': sorted({s['index'] for s in after['scans'] if s['index']}),
+    }
+
+
+def advise(conn, queries, repeat=3, min_gain=0.2):
+    """Baseline plans of (name, sql, params) queries, the effect of each existing index and of each proposed index"""
+    cursor = conn.cursor()
+    try:
+        columns, parents, indexes = catalog(cursor)
+        baseline = {name: explain(cursor, sql, repeat, params) for name, sql, params in queries}
+    finally:
+        conn.rollback()
+        cursor.close()
+
+    existing = []
+    for name, info in sorted(indexes.items()):
+        used_by = [q for q, r in baseline.items() if any(s['index'] in info['tree'] for s in r['scans'])]
+        affected = [query for query in queries if query[0] in used_by]
+        effects = {}
+        if affected:
+            _, _, _, results = measure_change(conn, f"DROP INDEX {name}", affected, repeat)
+            # "before" is with the index, "after" without it
+            effects = {q: _effect(baseline[q], results[q]) for q in results}
+        existing.append({'index': name, 'definition': info['definition'], 'used_by': used_by, 'without_it': effects})
+
+    candidates = {}
+    for name, result in baseline.items():
+        for definition, table in propose_indexes(result['plan'], columns, parents).items():
+            candidates.setdefault(definition, {'table': table, 'proposed_for': []})['proposed_for'].append(name)
+    existing_definitions = {re.sub(r'^CREATE INDEX \w+ ON (ONLY )?(public\.)?', 'ON ', d['definition'])
+                            .replace(' USING btree', '') for d in indexes.values()}
+
+    proposals = []
+    for definition, info in candidates.items():
+        if definition in existing_definitions:
+            continue
+        index_name = 'advisor_' + hashlib.sha1(definition.encode()).hexdigest()[:10]
+        affected = [query for query in queries if info['table'] in _tables(baseline[query[0]], parents)]
+        try:
+            seconds, size, tree, results = measure_change(
+                conn, f"CREATE INDEX {index_name} {definition}", affected, repeat, index_name)
+        except psycopg2.Error as e:
+            logger.warning(f"Skipping candidate {definition}: {e}")
+            continue
+        effects = {q: _effect(baseline[q], results[q], tree) for q in results}
+        # Only plans that actually use the index count; other differences are timing noise
+        best = max((1 - e['after_ms'] / e['before_ms'] for e in effects.values()
+                    if e['uses_index'] and e['before_ms']), default=0)
+        proposals.append({
+            'definition': f"CREATE INDEX {definition}",
+            'proposed_for': info['proposed_for'],
+            'build_seconds': round(seconds, 2),
+            'size_bytes': size,
+            'best_gain': round(best, 3),
+            'recommended': best >= min_gain,
+            'effects': effects,
+        })
+    proposals.sort(key=lambda p: -p['best_gain'])
+
+    for result in baseline.values():
+        result.pop('plan', None)
+    return {'baseline': baseline, 'existing_indexes': existing, 'proposals': proposals}
+
+
+# Reporting
+def print_report(rows, report):
+    print(f"\n=== {rows:,} activity rows ===")
+    print(f"{'query':<28}{'exec ms':>10}{'plan ms':>9}{'hit':>10}{'read':>9}{'temp':>7}  scans")
+    for name, r in report['baseline'].items():
+        scans = ', '.join(sorted({f"{s['node']}:{s['index'] or s['relation']}" for s in r['scans']}))
+        print(f"{name:<28}{r['execution_ms']:>10.2f}{r['planning_ms']:>9.2f}{r['shared_hit']:>10}"
+              f"{r['shared_read']:>9}{r['temp_written']:>7}  {scans}")
+
+    print("\nExisting indexes:")
+    for info in report['existing_indexes']:
+        if not info['used_by']:
+            print(f"  {info['index']}: not used by any dashboard query")
+            continue
+        changes = ', '.join(f"{q} {e['before_ms']:.1f}ms -> {e['after_ms']:.1f}ms without it"
+                            for q, e in info['without_it'].items())
+        print(f"  {info['index']}: {changes}")
+
+    print("\nProposed indexes (measured):")
+    for p in report['proposals']:
+        flag = 'RECOMMENDED' if p['recommended'] else 'no gain'
+        print(f"  [{flag}] {p['definition']}  ({p['size_bytes'] / 1e6:.1f} MB, built in {p['build_seconds']}s)")
+        for q, e in p['effects'].items():
+            used = ' (uses it)' if e['uses_index'] else ''
+            print(f"      {q:<28}{e['before_ms']:>10.2f}ms -> {e['after_ms']:>9.2f}ms"
+                  f"  blocks {e['before_blocks']} -> {e['after_blocks']}{used}")
+
+
+def main():
+    """Load generated data at several scales and measure how indexes affect the dashboard queries"""
+    parser = argparse.ArgumentParser(description="EXPLAIN-based index advisor for the dashboard queries")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1e5, 1e6, 1e7],
+                        help="activity row counts to test (default 1e5 1e6 1e7)")
+    parser.add_argument('--db-url', default=os.getenv('INDEX_ADVISOR_DB_URL'),
+                        help="scratch database whose activity table is replaced (default INDEX_ADVISOR_DB_URL)")
+    parser.add_argument('--allow-dashboard-db', action='store_true',
+                        help="permit --db-url to be the dashboard database (DB_URL)")
+    parser.add_argument('--skip-load', action='store_true', help="analyse the data already loaded (one pass)")
+    parser.add_argument('--queries', nargs='+', help="only these query names")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per query (median is reported)")
+    parser.add_argument('--min-gain', type=float, default=0.2,
+                        help="speed-up needed for a proposal to be recommended (default 0.2 = 20%%)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="data generator processes")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write the full report (all scales) as JSON")
+    args = parser.parse_args()
+
+    if not args.db_url:
+        parser.error("set --db-url or INDEX_ADVISOR_DB_URL to a scratch database")
+    if args.db_url == os.getenv('DB_URL') and not args.allow_dashboard_db:
+        parser.error("--db-url is the dashboard database; its activity table would be replaced "
+                     "(pass --allow-dashboard-db to do it anyway)")
+
+    queries = dashboard_queries()
+    if args.queries:
+        queries = [query for query in queries if query[0] in args.queries]
+    logger.info(f"Analysing {len(queries)} queries: {', '.join(name for name, _, _ in queries)}")
+
+    conn = psycopg2.connect(args.db_url)
+    reports = []
+    try:
+        for scale in ([None] if args.skip_load else args.scales):
+            if scale is None:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*) FROM activity")
+                    rows = cursor.fetchone()[0]
+                conn.rollback()
+            else:
+                rows = load_scale(conn, int(scale), seed=args.seed, jobs=args.jobs)
+            report = advise(conn, queries, args.repeat, args.min_gain)
+            print_report(rows, report)
+            reports.append({'rows': rows, **report})
+    finally:
+        conn.close()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(reports, file, indent=2, default=str)
+        logger.info(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os
+import sys
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.utils.partitions import maintain_partitions, ARCHIVE_SCHEMA
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    """Create upcoming activity partitions and archive expired ones (run daily, e.g. from cron)"""
+    retain_default = os.getenv('ACTIVITY_RETENTION_MONTHS')
+    parser = argparse.ArgumentParser(description="Maintain monthly activity partitions")
+    parser.add_argument('--months-ahead', type=int, default=int(os.getenv('PARTITION_MONTHS_AHEAD', 3)),
+                        help="create partitions this many months past the current one (default 3)")
+    parser.add_argument('--retain-months', type=int, default=int(retain_default) if retain_default else None,
+                        help="detach partitions older than this many months (default ACTIVITY_RETENTION_MONTHS; unset keeps all)")
+    parser.add_argument('--drop', action='store_true',
+                        help=f"drop expired partitions instead of moving them to the {ARCHIVE_SCHEMA} schema")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.getenv('DB_URL'))
+    try:
+        result = maintain_partitions(conn, args.months_ahead, args.retain_months, args.drop)
+    finally:
+        conn.close()
+    logger.info(f"Created {len(result['created'])} partitions, "
+                f"{'dropped' if args.drop else 'archived'} {len(result['archived'])}")
+
+if __name__ == "__main__":
+    main()
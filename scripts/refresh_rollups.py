@@ -0,0 +1,32 @@
+import os
+import sys
+import argparse
+import psycopg2
+from datetime import date
+from dotenv import load_dotenv
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.utils.rollups import refresh_rollups
+
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    """Incrementally refresh the daily rollup tables"""
+    parser = argparse.ArgumentParser(description="Refresh dashboard rollup tables")
+    parser.add_argument('--full', action='store_true', help="rebuild all rollups from scratch")
+    parser.add_argument('--from-date', type=date.fromisoformat,
+                        help="reprocess activity from this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    
+    conn = psycopg2.connect(os.getenv('DB_URL'))
+    try:
+        refresh_rollups(conn, from_date=args.from_date, full=args.full)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 import os
+import sys
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from dotenv import load_dotenv
 import logging
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dashboard.utils.rollups import refresh_rollups
+from dashboard.utils.partitions import set_aside_legacy_table, migrate_legacy_table, maintain_partitions
+
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -47,7 +53,11 @@ def setup_tables():
     try:
         conn = psycopg2.connect(os.getenv('DB_URL'))
         cursor = conn.cursor()
+        # A pre-partitioning activity table is migrated in the same transaction
+        legacy = set_aside_legacy_table(cursor)
         cursor.execute(schema_sql)
+        if legacy:
+            migrate_legacy_table(cursor)
         conn.commit()
         logger.info("Tables and indexes created successfully")
         cursor.close()
@@ -57,11 +67,35 @@ def setup_tables():
         logger.error(f"Error setting up tables: {str(e)}")
         raise
 
+def setup_partitions():
+    """Create upcoming monthly activity partitions"""
+    try:
+        conn = psycopg2.connect(os.getenv('DB_URL'))
+        maintain_partitions(conn, months_ahead=int(os.getenv('PARTITION_MONTHS_AHEAD', 3)))
+        conn.close()
+        
+    except Exception as e:
+        logger.error(f"Error creating partitions: {str(e)}")
+        raise
+
+def setup_rollups():
+    """Populate rollup tables from any activity already present"""
+    try:
+        conn = psycopg2.connect(os.getenv('DB_URL'))
+        refresh_rollups(conn)
+        conn.close()
+        
+    except Exception as e:
+        logger.error(f"Error refreshing rollups: {str(e)}")
+        raise
+
 def main():
     """Main setup function"""
     logger.info("Starting database setup...")
     create_database()
     setup_tables()
+    setup_partitions()
+    setup_rollups()
     logger.info("Database setup completed successfully!")
 
 if __name__ == "__main__":
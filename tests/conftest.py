@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'schema.sql')
+
+
+@pytest.fixture(scope='session')
+def test_db_url():
+    """Scratch PostgreSQL database for integration tests (TEST_DB_URL); its public schema is recreated.
+
+    Tests using it are skipped when TEST_DB_URL is not set. Never point it at a real database.
+    """
+    url = os.getenv('TEST_DB_URL')
+    if not url:
+        pytest.skip("TEST_DB_URL not set")
+    psycopg2 = pytest.importorskip('psycopg2')
+    conn = psycopg2.connect(url)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+            with open(SCHEMA_PATH) as f:
+                cursor.execute(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+    return url
+
+
+@pytest.fixture
+def pg_conn(test_db_url):
+    """Connection to the scratch database with activity and every rollup emptied"""
+    import psycopg2
+
+    conn = psycopg2.connect(test_db_url)
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            TRUNCATE activity, daily_activity_rollup, daily_activity_totals, user_segment_activity,
+                     user_first_seen, cohort_retention, user_index, daily_active_bitmaps, user_funnel_progress,
+                     rollup_watermarks, ingest_day_watermarks RESTART IDENTITY;
+        """)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def activity_frame():
+    """Small deterministic activity sample: 60 users over 40 days"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(7)
+    rows = 3000
+    users = rng.integers(0, 60, rows)
+    first_day = users % 20  # users join over the first 20 days and stay active after it
+    days = first_day + rng.geometric(0.15, rows) - 1
+    keep = days < 40
+    frame = pd.DataFrame({
+        'date': pd.Timestamp('2026-03-01') + pd.to_timedelta(days[keep], unit='D'),
+        'user_id': [f"user_{u:03d}" for u in users[keep]],
+        'course_id': rng.choice(['C101', 'C102', 'C103'], rows)[keep],
+        'lesson_completed': rng.random(rows)[keep] < 0.4,
+        'time_spent': rng.integers(1, 60, rows)[keep],
+        'device_type': rng.choice(['mobile', 'desktop'], rows)[keep],
+        'subscription_type': np.where(users % 4 == 0, 'premium', 'free')[keep],
+    })
+    return frame.sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def _insert_activity(conn, frame):
+    from psycopg2.extras import execute_values
+
+    columns = ['date', 'user_id', 'course_id', 'lesson_completed', 'time_spent', 'device_type', 'subscription_type']
+    records = [tuple(row) for row in frame[columns].astype(object).itertuples(index=False)]
+    records = [(row[0].date(),) + row[1:] for row in records]
+    with conn.cursor() as cursor:
+        execute_values(cursor, f"INSERT INTO activity ({', '.join(columns)}) VALUES %s", records)
+    conn.commit()
+
+
+@pytest.fixture
+def insert_activity():
+    """insert_activity(conn, frame): append activity rows (a DataFrame with the activity columns) and commit"""
+    return _insert_activity
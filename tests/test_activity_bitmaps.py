@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.utils.activity_bitmaps import (ALL_USERS, ActiveUserBitmaps, bitmap_cardinality, bitmap_intersection,
+                                              bitmap_members, bitmap_union, decode_bitmap, encode_bitmap,
+                                              segment_name)
+from dashboard.utils.rollups import refresh_rollups
+
+PREMIUM = segment_name('subscription_type', 'premium')
+
+
+def test_encode_decode_round_trip():
+    users = np.array([0, 3, 8, 9, 1000])
+    blob, count = encode_bitmap(users)
+    bits = decode_bitmap(blob)
+    assert count == 5
+    assert bitmap_members(bits).tolist() == users.tolist()
+    assert bitmap_cardinality(decode_bitmap(encode_bitmap([])[0])) == 0
+
+
+def test_union_and_intersection_of_different_lengths():
+    a = decode_bitmap(encode_bitmap([1, 2, 3])[0])
+    b = decode_bitmap(encode_bitmap([3, 40])[0])
+    assert bitmap_members(bitmap_union([a, b])).tolist() == [1, 2, 3, 40]
+    assert bitmap_members(bitmap_intersection(a, b)).tolist() == [3]
+    assert bitmap_cardinality(bitmap_union([])) == 0
+
+
+def distinct_users(activity, start=None, end=None, premium=False):
+    mask = pd.Series(True, index=activity.index)
+    if start is not None:
+        mask &= activity['date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= activity['date'] <= pd.Timestamp(end)
+    if premium:
+        mask &= activity['subscription_type'] == 'premium'
+    return activity.loc[mask, 'user_id'].nunique()
+
+
+def assert_counts(bitmaps, activity):
+    last = activity['date'].max().date()
+    for days in (1, 7, 30):
+        start = last - timedelta(days=days)
+        assert bitmaps.active_users(start) == distinct_users(activity, start), days
+    assert bitmaps.active_users() == distinct_users(activity)
+    assert bitmaps.active_users(segments=(PREMIUM,)) == distinct_users(activity, premium=True)
+
+
+@pytest.fixture
+def synced(pg_conn, activity_frame, insert_activity):
+    insert_activity(pg_conn, activity_frame)
+    refresh_rollups(pg_conn)
+    return ActiveUserBitmaps().sync(pg_conn, segments=(ALL_USERS, PREMIUM))
+
+
+def test_counts_match_activity(synced, activity_frame):
+    assert_counts(synced, activity_frame)
+
+
+def test_unchanged_days_are_not_refetched(synced, pg_conn):
+    before = dict(synced._days[ALL_USERS])
+    synced.sync(pg_conn, segments=(ALL_USERS, PREMIUM))
+    assert all(synced._days[ALL_USERS][day] is bits for day, bits in before.items())
+
+
+def test_rewritten_older_day_is_picked_up(synced, pg_conn, activity_frame, insert_activity):
+    # Late events for a day well before the newest loaded one: new users and a premium user
+    late_day = activity_frame['date'].max() - pd.Timedelta(days=5)
+    late = pd.DataFrame({'date': late_day, 'user_id': ['late_1', 'late_2', 'late_3'], 'course_id': 'C101',
+                         'lesson_completed': False, 'time_spent': 5, 'device_type': 'mobile',
+                         'subscription_type': ['free', 'free', 'premium']})
+    insert_activity(pg_conn, late)
+    refresh_rollups(pg_conn, from_date=late_day.date())
+
+    synced.sync(pg_conn, segments=(ALL_USERS, PREMIUM))
+    assert_counts(synced, pd.concat([activity_frame, late], ignore_index=True))
+
+
+def test_full_rebuild_with_fewer_days_is_picked_up(synced, pg_conn, activity_frame, insert_activity):
+    # Reload only a later slice of the data, as generate_sample_data does with a new dataset
+    subset = activity_frame[activity_frame['date'] >= '2026-03-10']
+    subset = subset[subset['user_id'] != subset['user_id'].iloc[0]]
+    with pg_conn.cursor() as cursor:
+        cursor.execute("TRUNCATE activity")
+    pg_conn.commit()
+    insert_activity(pg_conn, subset)
+    refresh_rollups(pg_conn, full=True)
+
+    synced.sync(pg_conn, segments=(ALL_USERS, PREMIUM))
+    assert min(synced._days[ALL_USERS]) == subset['date'].min().date()
+    assert_counts(synced, subset)
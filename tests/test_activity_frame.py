@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.components.activity_frame import ActivityFrame, to_day_numbers
+from dashboard.components.data_processor import DataProcessor
+
+
+@pytest.fixture
+def frame(activity_frame):
+    return ActivityFrame.from_dataframe(activity_frame)
+
+
+def test_round_trip(activity_frame, frame):
+    assert len(frame) == len(activity_frame) and frame.columns == list(activity_frame.columns)
+    assert frame.is_encoded('user_id') and frame.is_date('date') and not frame.is_encoded('time_spent')
+    decoded = frame.to_dataframe()
+    for column in ['user_id', 'course_id', 'device_type', 'subscription_type']:
+        assert decoded[column].astype(str).tolist() == activity_frame[column].tolist(), column
+    pd.testing.assert_series_equal(decoded['date'], activity_frame['date'])
+    assert (decoded['time_spent'] == activity_frame['time_spent']).all()
+    assert frame.memory_usage() < activity_frame.memory_usage(deep=True).sum()
+
+
+def test_day_numbers():
+    assert to_day_numbers(['1970-01-02', '2026-03-01']).tolist() == [1, 20513]
+    assert to_day_numbers(pd.Series(['2026-03-01 13:00'])).tolist() == [20513]
+
+
+def test_columns_must_have_equal_length():
+    with pytest.raises(ValueError):
+        ActivityFrame({'a': np.zeros(2), 'b': np.zeros(3)})
+
+
+@pytest.mark.parametrize('chunksize', [7, 250, 10 ** 6])
+def test_from_csv_matches_from_dataframe(tmp_path, activity_frame, frame, chunksize):
+    path = tmp_path / 'activity.csv'
+    activity_frame.to_csv(path, index=False)
+    loaded = ActivityFrame.from_csv(str(path), chunksize=chunksize)
+    for column in frame.columns:
+        assert np.array_equal(loaded.values(column), frame.values(column)), column
+        if frame.is_encoded(column):
+            assert loaded.categories(column).tolist() == frame.categories(column).tolist()
+
+
+def test_missing_strings_are_code_minus_one(tmp_path):
+    source = pd.DataFrame({'date': ['2026-01-01'] * 4, 'device_type': ['b', None, 'a', 'b']})
+    path = tmp_path / 'activity.csv'
+    source.to_csv(path, index=False)
+    for encoded in (ActivityFrame.from_dataframe(source), ActivityFrame.from_csv(str(path), chunksize=2)):
+        assert encoded.codes('device_type').tolist() == [1, -1, 0, 1]
+        assert encoded.categories('device_type').tolist() == ['a', 'b']
+
+
+def test_factorize(frame, activity_frame):
+    codes, uniques = frame.factorize('date')
+    assert (uniques[codes] == activity_frame['date']).all()
+    codes, uniques = frame.factorize('time_spent')
+    assert (uniques[codes] == activity_frame['time_spent']).all()
+
+
+def test_with_first_date(frame, activity_frame):
+    first = frame.with_first_date().decode('signup_date')
+    assert (first == activity_frame.groupby('user_id')['date'].transform('min')).all()
+
+
+def test_take_and_assign_return_new_frames(frame):
+    head = frame.take(np.arange(5))
+    assert len(head) == 5 and len(frame) > 5
+    assigned = frame.assign(time_spent=np.zeros(len(frame)))
+    assert not assigned.values('time_spent').any() and frame.values('time_spent').any()
+    encoded = frame.assign_encoded('bucket', np.zeros(len(frame)), ['only'])
+    assert encoded.decode('bucket').astype(str).eq('only').all() and 'bucket' not in frame
+
+
+# DataProcessor gives the same answers for an ActivityFrame and the equivalent DataFrame
+def test_retention_rates_match_pandas(activity_frame):
+    activity = activity_frame.assign(signup_date=activity_frame.groupby('user_id')['date'].transform('min'))
+    expected = DataProcessor.calculate_retention_rates(activity).sort_values(['signup_date', 'date'])
+    frame = ActivityFrame.from_dataframe(activity, date_columns=('date', 'signup_date'))
+    result = DataProcessor.calculate_retention_rates(frame)
+    for column in ['user_id', 'cohort_size', 'retention_rate']:
+        assert result[column].tolist() == expected[column].tolist(), column
+    assert pd.to_datetime(result['date']).tolist() == expected['date'].tolist()
+
+
+def test_retention_horizons_match_pandas(activity_frame, frame):
+    pd.testing.assert_frame_equal(DataProcessor.calculate_retention_horizons(frame),
+                                  DataProcessor.calculate_retention_horizons(activity_frame))
+
+
+def test_anomalies_and_growth_match_pandas(activity_frame):
+    daily = activity_frame.groupby('date').agg(sessions=('user_id', 'size')).reset_index()
+    frame = ActivityFrame.from_dataframe(daily)
+
+    anomalies = DataProcessor.detect_anomalies(frame, 'sessions', threshold=1.5)
+    expected = DataProcessor.detect_anomalies(daily, 'sessions', threshold=1.5)
+    np.testing.assert_allclose(anomalies.values('z_score'), expected['z_score'])
+    assert anomalies.values('is_anomaly').tolist() == expected['is_anomaly'].tolist()
+
+    growth = DataProcessor.calculate_growth_rates(frame, 'sessions', periods=7)
+    expected = DataProcessor.calculate_growth_rates(daily.copy(), 'sessions', periods=7)
+    np.testing.assert_allclose(growth.values('sessions_growth'), expected['sessions_growth'])
+
+
+def test_segment_users_matches_pandas(activity_frame):
+    users = (activity_frame.groupby('user_id')
+             .agg(total_sessions=('date', 'size'), subscription_type=('subscription_type', 'first'))
+             .reset_index())
+    users.loc[0, 'total_sessions'] = 0  # outside the bins
+    expected = DataProcessor.segment_users(users)
+    result = DataProcessor.segment_users(ActivityFrame.from_dataframe(users, date_columns=()))
+    assert result.decode('user_segment').astype(str).tolist() == expected['user_segment'].tolist()
+    assert (result.decode('engagement_segment').astype(str).tolist()
+            == expected['engagement_segment'].astype(str).tolist())
+
+
+def test_segment_users_with_missing_subscriptions_matches_pandas():
+    users = pd.DataFrame({'user_id': [f"u{i}" for i in range(6)], 'total_sessions': [0, 3, 8, 30, 3, 30],
+                          'subscription_type': ['free', None, 'premium', np.nan, 'premium', 'free']})
+    expected = DataProcessor.segment_users(users)
+    assert expected['user_segment'].isna().tolist() == [False, True, False, True, False, False]
+    for subscriptions in (users['subscription_type'], users['subscription_type'].astype('category')):
+        frame = ActivityFrame.from_dataframe(users.assign(subscription_type=subscriptions), date_columns=())
+        result = DataProcessor.segment_users(frame).decode('user_segment').astype(object)
+        pd.testing.assert_series_equal(result.where(result.notna(), np.nan), expected['user_segment'],
+                                       check_names=False)
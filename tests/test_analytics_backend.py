@@ -0,0 +1,139 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from dashboard.components.data_processor import DataProcessor
+from dashboard.components.funnel_engine import DEFAULT_FUNNEL, FunnelEngine, funnel_signature
+from dashboard.utils import analytics_backend, db_pool
+from dashboard.utils.analytics_backend import DuckDBBackend, PostgresBackend, get_backend, to_duckdb_params
+from dashboard.utils.funnel_progress import FUNNEL_PROGRESS_SQL, FUNNEL_SEGMENT
+from dashboard.utils.query_cache import QueryCache
+from dashboard.utils.rollups import refresh_rollups
+from tests.test_cohort_retention_rollup import expected_cohorts
+from tests.test_rollups import expected_totals
+
+
+def test_to_duckdb_params():
+    assert to_duckdb_params("WHERE date >= %(since)s AND course_id = %s") == "WHERE date >= $since AND course_id = ?"
+    assert to_duckdb_params("WHERE name LIKE 'a%%'") == "WHERE name LIKE 'a%'"
+
+
+@pytest.mark.parametrize('kind, expected', [('postgres', PostgresBackend), ('DuckDB', DuckDBBackend)])
+def test_get_backend_from_env(monkeypatch, tmp_path, kind, expected):
+    if expected is DuckDBBackend:
+        pytest.importorskip('duckdb')
+    monkeypatch.setattr(analytics_backend, '_backend', None)
+    monkeypatch.setenv('ANALYTICS_BACKEND', kind)
+    monkeypatch.setenv('ACTIVITY_PARQUET_DIR', str(tmp_path))
+    assert isinstance(get_backend(), expected)
+    assert get_backend() is get_backend()
+
+
+def test_unknown_backend(monkeypatch):
+    monkeypatch.setattr(analytics_backend, '_backend', None)
+    monkeypatch.setenv('ANALYTICS_BACKEND', 'sqlite')
+    with pytest.raises(ValueError):
+        get_backend()
+
+
+def write_snapshot(frame, tmp_path, name='snapshot'):
+    from scripts.convert_to_parquet import convert_csv_to_parquet
+
+    csv_path = tmp_path / f"{name}.csv"
+    frame.to_csv(csv_path, index=False)
+    output = tmp_path / name
+    convert_csv_to_parquet([str(csv_path)], str(output), overwrite=True)
+    return str(output)
+
+
+@pytest.fixture
+def duckdb_backend(tmp_path, activity_frame, monkeypatch):
+    pytest.importorskip('duckdb')
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', 'False')
+    return DuckDBBackend(write_snapshot(activity_frame, tmp_path), check_interval=0)
+
+
+def test_missing_snapshot_raises(tmp_path):
+    pytest.importorskip('duckdb')
+    with pytest.raises(FileNotFoundError):
+        DuckDBBackend(str(tmp_path)).sync()
+
+
+def test_rollups_match_activity(duckdb_backend, activity_frame):
+    totals = duckdb_backend.read_sql("SELECT * FROM daily_activity_totals ORDER BY date")
+    assert isinstance(totals['date'].iloc[0], date)  # same as psycopg2
+    expected = expected_totals(activity_frame)
+    for column in ['active_users', 'premium_users', 'sessions', 'total_time_spent', 'lessons_completed']:
+        assert totals[column].tolist() == expected[column].tolist(), column
+
+    cohorts = duckdb_backend.read_sql("SELECT * FROM cohort_retention ORDER BY granularity, cohort_start, period_number")
+    expected = expected_cohorts(activity_frame)
+    assert pd.to_datetime(cohorts['cohort_start']).tolist() == expected['cohort_start'].tolist()
+    assert cohorts['users'].tolist() == expected['users'].tolist()
+
+
+def test_retention_horizons_match_data_processor(duckdb_backend, activity_frame):
+    view = duckdb_backend.read_sql("SELECT * FROM retention_horizons")
+    expected = DataProcessor.calculate_retention_horizons(activity_frame, horizons=(1, 7, 14, 30))
+    for column in ['eligible_users', 'classic_retained', 'rolling_retained']:
+        assert view[column].tolist() == expected[column].tolist(), column
+
+
+def test_funnel_progress_matches_engine(duckdb_backend, activity_frame):
+    counts = duckdb_backend.read_sql(FUNNEL_PROGRESS_SQL, {'funnel': funnel_signature(DEFAULT_FUNNEL)})
+    expected = FunnelEngine.compute(activity_frame, DEFAULT_FUNNEL, segment_col=FUNNEL_SEGMENT)
+    pd.testing.assert_frame_equal(FunnelEngine.summarize(counts), expected)
+
+
+def expected_user_counts(activity_frame, today):
+    def between(start, end=0):
+        dates = activity_frame['date']
+        since = (dates >= pd.Timestamp(today - timedelta(days=start))) & (dates <= pd.Timestamp(today - timedelta(days=end)))
+        return activity_frame.loc[since, 'user_id'].nunique()
+    return {
+        'total_users': activity_frame['user_id'].nunique(),
+        'dau': between(1),
+        'wau': between(7),
+        'mau': between(30),
+        'previous_mau': between(61, 31),
+        'premium_users': activity_frame.loc[activity_frame['subscription_type'] == 'premium', 'user_id'].nunique(),
+    }
+
+
+@pytest.mark.parametrize('days_after', [1, 20])
+def test_active_user_counts(duckdb_backend, activity_frame, days_after):
+    today = activity_frame['date'].max().date() + timedelta(days=days_after)
+    counts = duckdb_backend.active_user_counts(today)
+    assert counts == expected_user_counts(activity_frame, today)
+    assert counts['previous_mau'] > 0
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_postgres_active_user_counts(pg_conn, test_db_url, activity_frame, insert_activity, monkeypatch):
+    monkeypatch.setenv('DB_URL', test_db_url)
+    db_pool.close_pool()
+    insert_activity(pg_conn, activity_frame)
+    refresh_rollups(pg_conn)
+    try:
+        for days_after in (1, 20):
+            today = activity_frame['date'].max().date() + timedelta(days=days_after)
+            assert PostgresBackend().active_user_counts(today) == expected_user_counts(activity_frame, today)
+    finally:
+        db_pool.close_pool()
+
+
+def test_new_snapshot_is_picked_up_and_not_served_from_cache(tmp_path, activity_frame, monkeypatch):
+    pytest.importorskip('duckdb')
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', 'True')
+    cache = QueryCache(ttl=60)
+    monkeypatch.setattr(analytics_backend, 'get_query_cache', lambda: cache)
+    first = activity_frame[activity_frame['date'] < '2026-03-20']
+    path = write_snapshot(first, tmp_path)
+    backend = DuckDBBackend(path, check_interval=0)
+    query = "SELECT COUNT(*) as n FROM activity"
+    assert backend.read_sql(query)['n'].iloc[0] == len(first)
+
+    write_snapshot(activity_frame, tmp_path)
+    assert backend.read_sql(query)['n'].iloc[0] == len(activity_frame)
+    assert cache.stats()['misses'] == 2
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.components.anomaly_detector import StreamingAnomalyDetector
+from dashboard.components.data_processor import DataProcessor
+
+DAYS = pd.date_range('2026-01-05', periods=70)  # starts on a Monday
+
+
+def weekly_series(seed, level=100.0, weekend=0.3, noise=2.0):
+    rng = np.random.default_rng(seed)
+    values = level * np.where(DAYS.dayofweek >= 5, weekend, 1.0) + rng.normal(0, noise, len(DAYS))
+    return values.round(1)
+
+
+def feed(detector, series, days=DAYS):
+    """update() for {key: values} over the same days, as one batch"""
+    keys = [key for key, values in series.items() for _ in values]
+    return detector.update(keys, np.tile(days, len(series)), np.concatenate(list(series.values())))
+
+
+@pytest.mark.parametrize('method, threshold', [('ewma', 3.0), ('mad', 5.0)])
+def test_weekday_pattern_is_not_anomalous_but_a_spike_is(method, threshold):
+    values = weekly_series(1)
+    values[60] *= 1.5
+    result = feed(StreamingAnomalyDetector(method, threshold=threshold), {('sessions', 'mobile'): values})
+    assert result['processed'].all()
+    assert np.flatnonzero(result['is_anomaly']).tolist() == [60]
+    assert result['expected'].iloc[61] < 50  # a Sunday: baseline near the weekend level, not the weekday one
+
+
+def test_without_weekday_baselines_weekends_look_anomalous():
+    result = feed(StreamingAnomalyDetector('mad', threshold=5.0, seasonal=False), {'sessions': weekly_series(1)})
+    flagged = DAYS[result['is_anomaly'].to_numpy()]
+    assert len(flagged) > 5 and (flagged.dayofweek >= 5).all()
+
+
+@pytest.mark.parametrize('method', ['ewma', 'mad'])
+def test_series_are_independent_and_batches_compose(method):
+    series = {('sessions', f"course_{i}"): weekly_series(i, level=50 + 10 * i) for i in range(5)}
+    together = feed(StreamingAnomalyDetector(method), series)
+
+    for i, (key, values) in enumerate(series.items()):
+        alone = feed(StreamingAnomalyDetector(method), {key: values})
+        part = together.iloc[i * len(DAYS):(i + 1) * len(DAYS)].reset_index(drop=True)
+        pd.testing.assert_frame_equal(part, alone)
+
+    # The same points fed day by day, shuffled within each day, and re-fed with overlap
+    detector = StreamingAnomalyDetector(method)
+    rng = np.random.default_rng(0)
+    scored = {}
+    for start in range(0, len(DAYS), 10):
+        window = slice(max(start - 3, 0), start + 10)  # three days already processed
+        keys = [key for key in series for _ in DAYS[window]]
+        days = np.tile(DAYS[window], len(series))
+        values = np.concatenate([values[window] for values in series.values()])
+        order = rng.permutation(len(keys))
+        result = detector.update([keys[i] for i in order], days[order], values[order])
+        assert result['processed'].sum() == len(series) * len(DAYS[start:start + 10])
+        for i, row in zip(order, result.itertuples()):
+            if row.processed:
+                scored[(keys[i], pd.Timestamp(days[i]))] = row.z_score
+    actual = [scored[(key, day)] for key in series for day in DAYS]
+    np.testing.assert_allclose(actual, together['z_score'])
+
+
+def test_duplicates_and_missing_values_are_skipped():
+    detector = StreamingAnomalyDetector()
+    result = detector.update(['a', 'a', 'a', 'b'], pd.to_datetime(['2026-01-05', '2026-01-05', '2026-01-06',
+                                                                   '2026-01-05']), [1.0, 2.0, 3.0, np.nan])
+    assert result['processed'].tolist() == [True, False, True, False]
+    assert detector.level[detector._index['a']] != 2.0
+    assert detector.last_processed() == pd.Timestamp('2026-01-06')
+    assert StreamingAnomalyDetector().last_processed() is None
+    with pytest.raises(ValueError):
+        StreamingAnomalyDetector('zscore')
+
+
+@pytest.mark.parametrize('method', ['ewma', 'mad'])
+def test_saved_state_continues_where_it_left_off(tmp_path, method):
+    series = {('sessions', 'mobile', 'premium'): weekly_series(3), ('active_users', 'desktop', 'free'): weekly_series(4),
+              'plain': weekly_series(5)}
+    reference = StreamingAnomalyDetector(method, threshold=2.5, window=6)
+    feed(reference, {key: values[:40] for key, values in series.items()}, DAYS[:40])
+    path = tmp_path / 'state' / 'anomaly.npz'
+    reference.save(str(path))
+
+    loaded = StreamingAnomalyDetector.load(str(path))
+    assert loaded.config() == reference.config()
+    assert loaded.keys == list(series)
+    assert loaded.last_processed() == DAYS[39]
+    rest = {key: values[40:] for key, values in series.items()}
+    pd.testing.assert_frame_equal(feed(loaded, rest, DAYS[40:]), feed(reference, rest, DAYS[40:]))
+    assert list(tmp_path.joinpath('state').iterdir()) == [path]  # no temporary file left behind
+
+
+def test_open_prefers_the_saved_configuration(tmp_path, caplog):
+    path = str(tmp_path / 'anomaly.npz')
+    assert StreamingAnomalyDetector.open(path, method='mad').method == 'mad'
+    StreamingAnomalyDetector('mad', threshold=4.0).save(path)
+    assert StreamingAnomalyDetector.open(path).threshold == 4.0
+    detector = StreamingAnomalyDetector.open(path, method='ewma')
+    assert detector.method == 'mad' and 'keeping those settings' in caplog.text
+
+
+def test_detect_anomalies_streaming_persists_between_refreshes(tmp_path):
+    rng = np.random.default_rng(9)
+    rows = [(day, device, 'free', 100 + rng.normal(0, 2), 300 + rng.normal(0, 5))
+            for day in DAYS for device in ('mobile', 'desktop')
+            if not (device == 'desktop' and day == DAYS[50])]  # a day without desktop activity
+    rollup = pd.DataFrame(rows, columns=['date', 'device_type', 'subscription_type', 'active_users', 'sessions'])
+    rollup.loc[(rollup['date'] == DAYS[55]) & (rollup['device_type'] == 'mobile'), 'sessions'] = 600
+    path = str(tmp_path / 'anomaly.npz')
+    args = (['active_users', 'sessions'], ['device_type', 'subscription_type'])
+
+    first = DataProcessor.detect_anomalies_streaming(rollup[rollup['date'] < DAYS[45]], *args, state_path=path,
+                                                     fill_value=0, threshold=4.0)
+    assert len(first) == 45 * 2 * 2 and not first['is_anomaly'].any()
+    # The next refresh re-reads a few days; only new ones are scored
+    second = DataProcessor.detect_anomalies_streaming(rollup[rollup['date'] >= DAYS[40]], *args, state_path=path,
+                                                      fill_value=0)
+    assert len(second) == 25 * 2 * 2 and second['date'].min() == DAYS[45]
+    flagged = second[second['is_anomaly']]
+    assert set(zip(flagged['date'], flagged['device_type'], flagged['metric'])) == {
+        (DAYS[50], 'desktop', 'active_users'), (DAYS[50], 'desktop', 'sessions'), (DAYS[55], 'mobile', 'sessions')}
+    assert StreamingAnomalyDetector.load(path).last_processed() == DAYS[-1]
+    assert DataProcessor.detect_anomalies_streaming(rollup.iloc[:0], *args, state_path=path).empty
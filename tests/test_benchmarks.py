@@ -0,0 +1,90 @@
+import json
+from functools import partial
+
+import pytest
+
+import benchmarks.run_benchmarks as bench
+from benchmarks.run_benchmarks import compare, measure
+from dashboard.utils import analytics_backend
+
+BASELINE = {'small/a': {'median_s': 0.1, 'min_s': 0.09, 'peak_mb': 10.0}}
+
+
+def result(median_s=0.1, peak_mb=10.0):
+    return {'median_s': median_s, 'min_s': median_s, 'peak_mb': peak_mb}
+
+
+def test_compare_flags_slower_and_larger_runs():
+    regressions = compare({'small/a': result(0.2, 20.0)}, BASELINE)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('small/a: time 100.0ms -> 200.0ms (+100%)')
+    assert regressions[1].startswith('small/a: peak memory 10.0MB -> 20.0MB')
+
+
+@pytest.mark.parametrize('current', [
+    result(0.12, 12.0),  # within the thresholds
+    result(0.0001, 0.1),  # faster and smaller
+])
+def test_compare_within_thresholds(current):
+    assert compare({'small/a': current}, BASELINE) == []
+
+
+def test_compare_against_a_zero_baseline():
+    assert compare({'small/a': result(0.1, 12.0)}, {'small/a': result(0.1, 0.0)}) == [
+        'small/a: peak memory 0.0MB -> 12.0MB (was zero)']
+
+
+def test_compare_ignores_tiny_absolute_changes_and_new_benchmarks():
+    baseline = {'small/tiny': result(0.001, 0.1)}
+    assert compare({'small/tiny': result(0.004, 0.9), 'small/new': result(9.0, 900.0)}, baseline) == []
+    assert compare({'small/tiny': result(0.004, 0.9)}, baseline, min_time=0.001, min_memory=0.5) != []
+
+
+def test_measure_runs_warm_up_timed_and_traced_calls():
+    calls = []
+
+    def allocate():
+        calls.append(1)
+        return bytearray(5 * 10 ** 6)
+    measured = measure(allocate, repeat=3)
+    assert len(calls) == 5
+    assert set(measured) == {'median_s', 'min_s', 'peak_mb'}
+    assert measured['min_s'] <= measured['median_s']
+    assert 5 <= measured['peak_mb'] < 6
+
+
+@pytest.fixture
+def small_run(tmp_path, monkeypatch):
+    """main() on a tiny DuckDB dataset, with the environment it changes restored afterwards"""
+    pytest.importorskip('duckdb')
+    for name in ('ANALYTICS_BACKEND', 'QUERY_CACHE_ENABLED', 'ACTIVITY_PARQUET_DIR'):
+        monkeypatch.setenv(name, '')
+    monkeypatch.setattr(analytics_backend, '_backend', None)
+    monkeypatch.setattr(bench, 'SIZES', {'small': 150})
+    output, baseline = tmp_path / 'results.json', tmp_path / 'baseline.json'
+
+    def run(*extra):
+        monkeypatch.setattr('sys.argv', ['run_benchmarks.py', '--sizes', 'small', '--repeat', '1',
+                                         '--filter', 'processor.segment_users', '--output', str(output),
+                                         '--baseline', str(baseline), *extra])
+        analytics_backend._backend = None
+        bench.main()
+        with open(output) as file:
+            return json.load(file)
+    return run, baseline
+
+
+def test_main_saves_a_baseline_and_fails_on_regressions(small_run, monkeypatch):
+    run, baseline = small_run
+    # These benchmarks take less than the default floor on a tiny dataset
+    monkeypatch.setattr(bench, 'compare', partial(compare, min_time=0, min_memory=0))
+    report = run('--save-baseline')
+    assert set(report['results']) == {'small/processor.segment_users', 'small/processor.segment_users[frame]'}
+    assert report['meta']['backend'] == 'duckdb' and report['meta']['seed'] == bench.SEED
+    assert json.loads(baseline.read_text()) == report
+
+    doctored = {key: result(0, 0) for key in report['results']}
+    baseline.write_text(json.dumps({'meta': report['meta'], 'results': doctored}))
+    with pytest.raises(SystemExit) as exited:
+        run()
+    assert exited.value.code == 1
@@ -0,0 +1,83 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from dashboard.utils.bulk_load import ACTIVITY_COLUMNS, _prepare, iter_batches, load_activity
+from dashboard.utils.partitions import list_partitions
+
+
+def test_iter_batches_splits_frames_csv_and_iterables(tmp_path, activity_frame):
+    sizes = [len(batch) for batch in iter_batches(activity_frame, batch_size=1000)]
+    assert sum(sizes) == len(activity_frame) and max(sizes) == 1000
+
+    path = tmp_path / 'activity.csv'
+    activity_frame.to_csv(path, index=False)
+    assert sum(len(batch) for batch in iter_batches(str(path), batch_size=700)) == len(activity_frame)
+
+    chunks = (activity_frame.iloc[i:i + 500] for i in range(0, len(activity_frame), 500))
+    assert all(len(batch) <= 200 for batch in iter_batches(chunks, batch_size=200))
+
+
+def test_default_batch_size_from_env(monkeypatch, activity_frame):
+    monkeypatch.setenv('BULK_LOAD_BATCH_SIZE', '2000')
+    assert [len(batch) for batch in iter_batches(activity_frame)][0] == 2000
+
+
+def test_prepare_orders_columns_and_truncates_timestamps(activity_frame):
+    frame = activity_frame.head(3)[list(reversed(ACTIVITY_COLUMNS))].assign(
+        date=pd.Timestamp('2026-03-01 17:45'), extra=1)
+    prepared = _prepare(frame)
+    assert list(prepared.columns) == ACTIVITY_COLUMNS
+    assert (prepared['date'] == pd.Timestamp('2026-03-01')).all()
+
+
+def count_rows(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*), MIN(date), MAX(date) FROM activity")
+        return cursor.fetchone()
+
+
+def test_append_reports_rows_and_date_range(pg_conn, activity_frame):
+    stats = load_activity(pg_conn, activity_frame, batch_size=500)
+    assert stats['rows'] == len(activity_frame)
+    assert stats['batches'] == -(-len(activity_frame) // 500)
+    assert (stats['min_date'], stats['max_date']) == (date(2026, 3, 1), activity_frame['date'].max().date())
+    assert count_rows(pg_conn) == (len(activity_frame), stats['min_date'], stats['max_date'])
+
+    load_activity(pg_conn, activity_frame.head(10))
+    assert count_rows(pg_conn)[0] == len(activity_frame) + 10
+
+
+@pytest.mark.parametrize('staging', [True, False])
+def test_replace_swaps_out_existing_rows(pg_conn, activity_frame, staging):
+    load_activity(pg_conn, activity_frame)
+    later = activity_frame[activity_frame['date'] >= '2026-03-20']
+    load_activity(pg_conn, later, replace=True, staging=staging)
+    assert count_rows(pg_conn) == (len(later), date(2026, 3, 20), later['date'].max().date())
+
+
+def test_failure_mid_stream_rolls_back(pg_conn, activity_frame):
+    load_activity(pg_conn, activity_frame.head(100))
+
+    def chunks():
+        yield activity_frame.iloc[100:200]
+        raise IOError("source went away")
+
+    with pytest.raises(IOError):
+        load_activity(pg_conn, chunks(), replace=True)
+    assert count_rows(pg_conn)[0] == 100
+
+
+def test_missing_monthly_partitions_are_created(pg_conn, activity_frame):
+    future = activity_frame.head(5).assign(date=pd.Timestamp('2031-07-15'))
+    load_activity(pg_conn, future)
+    with pg_conn.cursor() as cursor:
+        assert date(2031, 7, 1) in list_partitions(cursor)
+    assert count_rows(pg_conn)[0] == 5
+
+
+def test_commit_false_leaves_the_transaction_open(pg_conn, activity_frame):
+    load_activity(pg_conn, activity_frame.head(20), commit=False)
+    pg_conn.rollback()
+    assert count_rows(pg_conn)[0] == 0
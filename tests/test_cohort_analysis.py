@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import cohort_analysis
+from analysis.cohort_analysis import CohortEngine, period_start
+from dashboard.components.activity_frame import ActivityFrame, to_day_numbers
+from tests.test_cohort_retention_rollup import expected_cohorts
+
+ORDER = ['granularity', 'cohort_start', 'period_number']
+
+
+def sorted_table(table, by=ORDER):
+    return table.sort_values(by).reset_index(drop=True)
+
+
+def test_period_start_matches_date_trunc():
+    dates = pd.date_range('2023-12-25', '2026-03-10')
+    days = to_day_numbers(dates)
+    weeks = dates.to_period('W-SUN').start_time
+    months = dates.to_period('M').start_time
+    assert (period_start(days, 'day') == days).all()
+    assert (period_start(days, 'week') == to_day_numbers(weeks)).all()
+    assert (period_start(days, 'month') == to_day_numbers(months)).all()
+    with pytest.raises(ValueError):
+        period_start(days, 'year')
+
+
+def test_retention_matches_brute_force(activity_frame):
+    result = sorted_table(CohortEngine.retention(activity_frame, granularity=('day', 'week', 'month')))
+    expected = expected_cohorts(activity_frame)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+    sizes = result[result['period_number'] == 0].set_index(ORDER[:2])['users']
+    assert (result['cohort_size'] == sizes.loc[list(zip(result['granularity'], result['cohort_start']))].values).all()
+    assert (result['retention_rate'] == (result['users'] * 100.0 / result['cohort_size']).round(1)).all()
+
+
+@pytest.mark.parametrize('granularity', ['day', 'week', 'month'])
+def test_activity_frame_and_sorted_dedupe_give_the_same_table(activity_frame, monkeypatch, granularity):
+    expected = CohortEngine.retention(activity_frame, granularity, segment_col='device_type')
+    frame = ActivityFrame.from_dataframe(activity_frame)
+    pd.testing.assert_frame_equal(CohortEngine.retention(frame, granularity, segment_col='device_type'), expected)
+    monkeypatch.setattr(cohort_analysis, 'MAX_MATRIX_CELLS', 0)
+    pd.testing.assert_frame_equal(CohortEngine.retention(activity_frame, granularity, segment_col='device_type'),
+                                  expected)
+
+
+@pytest.mark.parametrize('segment_col', ['device_type', 'subscription_type'])
+def test_segments_follow_first_day_activity(activity_frame, segment_col):
+    result = CohortEngine.retention(activity_frame, 'week', segment_col=segment_col)
+
+    # Brute force: lowest segment value among each user's first-day rows
+    first = activity_frame['date'] == activity_frame.groupby('user_id')['date'].transform('min')
+    user_segment = activity_frame[first].groupby('user_id')[segment_col].min()
+    expected = []
+    for segment, users in user_segment.groupby(user_segment):
+        subset = activity_frame[activity_frame['user_id'].isin(users.index)]
+        weekly = expected_cohorts(subset).query("granularity == 'week'")
+        expected.append(weekly.assign(**{segment_col: segment}))
+    order = [segment_col, 'cohort_start', 'period_number']
+    expected = sorted_table(pd.concat(expected), order)
+    result = sorted_table(result, order)
+    for column in order + ['users']:
+        assert result[column].tolist() == expected[column].tolist(), column
+
+
+def test_max_periods_and_rows_without_users():
+    events = pd.DataFrame({
+        'user_id': ['a', 'a', 'a', None, 'b'],
+        'date': pd.to_datetime(['2026-03-02', '2026-03-03', '2026-03-06', '2026-03-01', '2026-03-03']),
+    })
+    result = CohortEngine.retention(events, 'day', max_periods=1)
+    assert result['cohort_start'].min() == pd.Timestamp('2026-03-02')
+    assert list(zip(result['period_number'], result['users'], result['retention_rate'])) == [
+        (0, 1, 100.0), (1, 1, 100.0), (0, 1, 100.0)]
+
+
+def test_empty_and_invalid_inputs_return_empty_tables():
+    empty = pd.DataFrame({'user_id': pd.Series([], dtype=object), 'date': pd.Series([], dtype='datetime64[ns]')})
+    result = CohortEngine.retention(empty, segment_col='course_id')
+    assert result.empty and list(result.columns) == ['granularity', 'course_id', 'cohort_start', 'period_number',
+                                                     'users', 'cohort_size', 'retention_rate']
+    assert CohortEngine.retention(empty, 'quarter').empty
+    assert CohortEngine.retention_matrix(empty).empty
+
+
+def test_retention_matrix(activity_frame):
+    matrix = CohortEngine.retention_matrix(activity_frame, 'week', value='users')
+    table = CohortEngine.retention(activity_frame, 'week')
+    assert matrix.shape == (table['cohort_start'].nunique(), table['period_number'].max() + 1)
+    assert np.nansum(matrix.values) == table['users'].sum()
+    assert (matrix[0] == table[table['period_number'] == 0].set_index('cohort_start')['users']).all()
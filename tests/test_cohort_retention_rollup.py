@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from dashboard.utils.rollups import refresh_rollups
+
+pytestmark = pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+
+
+def read_cohorts(conn):
+    frame = pd.read_sql("SELECT * FROM cohort_retention", conn)
+    frame['cohort_start'] = pd.to_datetime(frame['cohort_start'])
+    return frame.sort_values(['granularity', 'cohort_start', 'period_number']).reset_index(drop=True)
+
+
+def expected_cohorts(activity):
+    """Distinct users per cohort and period, by brute force"""
+    first = activity.groupby('user_id')['date'].transform('min')
+    frames = []
+    for granularity, freq in [('day', 'D'), ('week', 'W-SUN'), ('month', 'M')]:
+        if granularity == 'day':
+            cohort, period_start = first, activity['date']
+        else:
+            cohort = first.dt.to_period(freq).dt.start_time
+            period_start = activity['date'].dt.to_period(freq).dt.start_time
+        if granularity == 'month':
+            period = ((period_start.dt.year - cohort.dt.year) * 12 + period_start.dt.month - cohort.dt.month)
+        else:
+            period = (period_start - cohort).dt.days // (7 if granularity == 'week' else 1)
+        counts = (pd.DataFrame({'user_id': activity['user_id'], 'cohort_start': cohort, 'period_number': period})
+                  .drop_duplicates()
+                  .groupby(['cohort_start', 'period_number']).size().rename('users').reset_index())
+        frames.append(counts.assign(granularity=granularity))
+    expected = pd.concat(frames, ignore_index=True)[['granularity', 'cohort_start', 'period_number', 'users']]
+    return expected.sort_values(['granularity', 'cohort_start', 'period_number']).reset_index(drop=True)
+
+
+def test_full_refresh_matches_brute_force(pg_conn, activity_frame, insert_activity):
+    insert_activity(pg_conn, activity_frame)
+    refresh_rollups(pg_conn)
+    actual = read_cohorts(pg_conn)
+    expected = expected_cohorts(activity_frame)
+    for column in ['granularity', 'cohort_start', 'period_number', 'users']:
+        assert actual[column].tolist() == expected[column].tolist(), column
+
+
+@pytest.mark.parametrize('cutoff', ['2026-03-11', '2026-03-16', '2026-04-01'])  # mid-week, a Monday, a month start
+def test_incremental_refresh_matches_full_rebuild(pg_conn, activity_frame, insert_activity, cutoff):
+    cutoff = pd.Timestamp(cutoff)
+    insert_activity(pg_conn, activity_frame[activity_frame['date'] < cutoff])
+    refresh_rollups(pg_conn)
+    insert_activity(pg_conn, activity_frame[activity_frame['date'] >= cutoff])
+    refresh_rollups(pg_conn)
+    incremental = read_cohorts(pg_conn)
+
+    refresh_rollups(pg_conn, full=True)
+    pd.testing.assert_frame_equal(incremental, read_cohorts(pg_conn))
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import conversion_analysis
+from analysis.cohort_analysis import period_start
+from analysis.conversion_analysis import ConversionLatency, get_conversion_latency, resolve_milestone
+from dashboard.components.activity_frame import to_day_numbers
+from dashboard.components.funnel_engine import FunnelStep
+from dashboard.utils import analytics_backend
+from dashboard.utils.analytics_backend import DuckDBBackend
+from dashboard.utils.query_cache import QueryCache
+from tests.test_analytics_backend import write_snapshot
+
+
+def naive_durations(events, milestone, segment_col=None, granularity='week', as_of=None, weight_col=None):
+    """(group key, days to milestone or to as_of, converted) per user and group, one user at a time"""
+    step = resolve_milestone(milestone)
+    as_of_day = to_day_numbers(events['date']).max() if as_of is None else to_day_numbers(pd.Series([as_of]))[0]
+    rows = []
+    for _, user in events.groupby('user_id', sort=False):
+        user = user.assign(day=to_day_numbers(user['date']))
+        user = user.sort_values(['day'] + ([segment_col] if segment_col else []), kind='stable')
+        signup = user['day'].iloc[0]
+        count, reached = 0, None
+        for _, row in user.iterrows():
+            if row['day'] <= as_of_day and all(row[column] == value for column, value in step.predicate.items()):
+                count += row[weight_col] if weight_col else 1
+                if count >= step.min_count:
+                    reached = row['day']
+                    break
+        converted = reached is not None
+        duration = (reached if converted else as_of_day) - signup
+        if duration < 0:
+            continue
+        cohort = period_start([signup], granularity)[0]
+        groups = ['All'] + ([user[segment_col].iloc[0]] if segment_col else [])
+        rows.extend((cohort, group, duration, converted) for group in groups)
+    return pd.DataFrame(rows, columns=['cohort', 'segment', 'duration', 'converted'])
+
+
+def naive_km(durations, converted):
+    survival, curve = 1.0, []
+    for day in range(durations.max() + 1):
+        at_risk = (durations >= day).sum()
+        if not at_risk:
+            break
+        survival *= 1 - ((durations == day) & converted).sum() / at_risk
+        curve.append((day, at_risk, survival))
+    return curve
+
+
+@pytest.fixture
+def events(activity_frame):
+    # Premium users start out free for a few days, so there is something to wait for
+    events = activity_frame.copy()
+    first = events.groupby('user_id')['date'].transform('min')
+    events.loc[events['date'] < first + pd.Timedelta(days=5), 'subscription_type'] = 'free'
+    return events
+
+
+@pytest.mark.parametrize('milestone, segment_col', [('premium', None), ('premium', 'device_type'), (3, 'course_id')])
+def test_distribution_matches_per_user_loop(events, milestone, segment_col):
+    result = ConversionLatency.distribution(events, milestone, 'week', segment_col)
+    naive = naive_durations(events, milestone, segment_col)
+    assert len(result) == len(naive.groupby(['cohort', 'segment']))
+    for (cohort, segment), group in naive.groupby(['cohort', 'segment']):
+        row = result[(to_day_numbers(result['cohort_start']) == cohort) & (result['segment'] == segment)].iloc[0]
+        converted = group.loc[group['converted'], 'duration']
+        assert (row['users'], row['converted']) == (len(group), len(converted))
+        for q in (25, 50, 75, 90):
+            expected = np.percentile(converted, q) if len(converted) else np.nan
+            np.testing.assert_allclose(row[f'p{q}_days'], expected, err_msg=f"p{q}")
+        below_half = [day for day, _, survival in naive_km(group['duration'], group['converted']) if survival <= 0.5]
+        np.testing.assert_equal(row['km_median_days'], below_half[0] if below_half else np.nan)
+
+
+def test_survival_matches_kaplan_meier(events):
+    naive = naive_durations(events, 'premium', granularity='day', as_of='2026-04-15')
+    curve = naive_km(naive['duration'], naive['converted'])
+    result = ConversionLatency.survival(events, 'premium', granularity=None, as_of='2026-04-15')
+    assert result['day'].tolist() == [day for day, _, _ in curve]
+    assert result['at_risk'].tolist() == [at_risk for _, at_risk, _ in curve]
+    np.testing.assert_allclose(result['survival'], [round(s, 4) for _, _, s in curve])
+    np.testing.assert_allclose(result['converted_share'], 1 - result['survival'], atol=1e-4)
+    assert (result['converted'] + result['censored'] <= result['at_risk']).all()
+
+    capped = ConversionLatency.survival(events, 'premium', granularity=None, as_of='2026-04-15', max_days=3)
+    pd.testing.assert_frame_equal(capped, result[result['day'] <= 3])
+
+
+def test_as_of_censors_recent_users_and_weights_count_lessons():
+    events = pd.DataFrame({
+        'user_id': ['a', 'a', 'b', 'b', 'c'],
+        'date': pd.to_datetime(['2026-03-02', '2026-03-05', '2026-03-02', '2026-03-03', '2026-03-09']),
+        'lesson_completed': [True, True, True, False, True],
+        'events': [1, 2, 1, 1, 3],
+    })
+    result = ConversionLatency.distribution(events, 3, granularity=None, as_of='2026-03-06', weight_col='events')
+    row = result.iloc[0]
+    # c signs up after as_of; a reaches three lessons on day 3, b never does
+    assert (row['users'], row['converted'], row['p50_days'], row['km_median_days']) == (2, 1, 3.0, 3.0)
+    # Lessons after as_of don't count yet
+    assert ConversionLatency.distribution(events, 3, granularity=None, as_of='2026-03-04',
+                                          weight_col='events').iloc[0]['converted'] == 0
+    unweighted = ConversionLatency.distribution(events, 3, granularity=None)
+    assert unweighted.iloc[0]['converted'] == 0
+
+
+def test_bad_inputs():
+    with pytest.raises(ValueError):
+        resolve_milestone('lesson')
+    assert resolve_milestone(2).min_count == 2
+    assert ConversionLatency.distribution(pd.DataFrame()).empty
+    assert ConversionLatency.survival(pd.DataFrame(), granularity='fortnight').empty
+    with pytest.raises(ValueError):
+        get_conversion_latency(kind='histogram')
+    with pytest.raises(ValueError):
+        get_conversion_latency(milestone=FunnelStep('Any'))
+
+
+def test_cached_result_is_keyed_by_snapshot(tmp_path, events, monkeypatch):
+    pytest.importorskip('duckdb')
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', 'True')
+    cache = QueryCache(ttl=60)
+    monkeypatch.setattr(analytics_backend, 'get_query_cache', lambda: cache)
+    monkeypatch.setattr(conversion_analysis, 'get_query_cache', lambda: cache)
+    first = events[events['date'] < '2026-03-20']
+    path = write_snapshot(first, tmp_path)
+    backend = DuckDBBackend(path, check_interval=0)
+    monkeypatch.setattr(analytics_backend, '_backend', backend)
+
+    result = get_conversion_latency(segment_col=None)
+    assert result['users'].sum() == first['user_id'].nunique()
+    pd.testing.assert_frame_equal(get_conversion_latency(segment_col=None), result)
+    assert cache.stats()['hits'] == 1
+
+    write_snapshot(events, tmp_path)
+    assert get_conversion_latency(segment_col=None)['users'].sum() == events['user_id'].nunique()
+    assert backend.cache_key('SELECT 1') != analytics_backend.PostgresBackend().cache_key('SELECT 1')
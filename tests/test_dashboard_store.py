@@ -0,0 +1,140 @@
+import json
+
+import pandas as pd
+import plotly
+import pytest
+
+from dashboard import app as dashboard
+from dashboard.components import metric_store
+from dashboard.utils import analytics_backend, db_pool
+from dashboard.utils.rollups import refresh_rollups
+
+
+@pytest.fixture
+def fetchers(monkeypatch):
+    fetchers = {
+        'metrics': lambda: {'dau': 12, 'avg_session_time': 18.5},
+        'trends': lambda: pd.DataFrame({'date': pd.to_datetime(['2026-10-01', '2026-10-02']),
+                                        'daily_active_users': [10, 12]}),
+        'cohort': lambda: pd.DataFrame(),
+        'funnel': lambda: 1 / 0,
+        'segmentation': lambda: pd.DataFrame({'device_type': ['mobile'], 'users': [3]}),
+        'growth': lambda: pd.DataFrame(),
+    }
+    monkeypatch.setattr(dashboard, 'DASHBOARD_FETCHERS', fetchers)
+    return fetchers
+
+
+def test_failed_fetch_comes_back_empty_with_an_error(fetchers):
+    data, errors = dashboard.fetch_dashboard_data()
+    assert set(data) == set(fetchers)
+    assert data['funnel'].empty
+    assert 'division by zero' in errors['funnel']
+    assert data['metrics']['dau'] == 12
+
+
+def test_store_round_trips_through_json(fetchers):
+    data, errors = dashboard.fetch_dashboard_data()
+    payload = json.loads(json.dumps(dashboard.serialize_dashboard_data(data, errors),
+                                    cls=plotly.utils.PlotlyJSONEncoder))
+    assert dashboard.store_errors(payload) == errors
+    trends = dashboard.store_frame(payload, 'trends')
+    assert trends['daily_active_users'].tolist() == [10, 12]
+    assert dashboard.store_frame(payload, 'cohort').empty
+    assert payload['metrics'] == {'dau': 12, 'avg_session_time': 18.5}
+
+
+def test_store_helpers_accept_an_empty_store():
+    assert dashboard.store_frame(None, 'trends').empty
+    assert dashboard.store_errors(None) == {}
+
+
+def test_render_panel_falls_back_on_fetch_error_or_render_failure():
+    def builder(value):
+        return value * 2
+
+    assert dashboard.render_panel('trends', builder, 'fallback', {}, 2) == 4
+    assert dashboard.render_panel('trends', builder, 'fallback', {'trends': 'timeout'}, 2) == 'fallback'
+    assert dashboard.render_panel('trends', lambda: 1 / 0, 'fallback', {}) == 'fallback'
+
+
+def test_panel_builders_handle_empty_frames():
+    assert dashboard.create_cohort_figure(pd.DataFrame(), 'week').layout.title.text == "Weekly Cohort Retention Rates"
+    assert dashboard.create_funnel_figure(pd.DataFrame()).layout.title.text == "User Conversion Funnel"
+    assert dashboard.create_metric_cards({}) == []
+
+
+def render(store):
+    """Every data panel as the callbacks render it"""
+    return {
+        'metrics': dashboard.update_metric_cards(store),
+        'trends': dashboard.update_trends_chart(store, 'daily_active_users'),
+        'cohort': dashboard.update_cohort_heatmap(store, 'week'),
+        'funnel': dashboard.update_funnel_chart(store),
+        'segmentation': dashboard.update_segmentation_table(store),
+    }
+
+
+def unavailable(figure):
+    return [a.text for a in figure.layout.annotations] == ["Data temporarily unavailable"]
+
+
+def test_failed_fetch_degrades_only_its_panel(fetchers):
+    store, last_update = dashboard.update_dashboard(1, 0)
+    assert last_update.endswith("(unavailable: funnel)")
+    panels = render(store)
+    assert unavailable(panels['funnel'])
+    assert not unavailable(panels['trends']) and list(panels['trends'].data[0].y) == [10, 12]
+    assert panels['segmentation'] == [{'device_type': 'mobile', 'users': 3}]
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_failing_query_degrades_only_its_panel(test_db_url, pg_conn, activity_frame, insert_activity, monkeypatch):
+    monkeypatch.setenv('DB_URL', test_db_url)
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', 'False')
+    monkeypatch.setattr(analytics_backend, '_backend', analytics_backend.PostgresBackend())
+    monkeypatch.setattr(metric_store, '_store', None)
+    db_pool.close_pool()
+    recent = activity_frame.assign(date=activity_frame['date'] + (pd.Timestamp.now().normalize() - activity_frame['date'].max()))
+    insert_activity(pg_conn, recent)
+    refresh_rollups(pg_conn)
+    # Both ways of loading the funnel hit a missing relation
+    monkeypatch.setattr(dashboard, 'FUNNEL_PROGRESS_SQL', "SELECT * FROM missing_funnel_progress")
+    monkeypatch.setattr(dashboard, 'funnel_events_query', lambda columns: "SELECT * FROM missing_funnel_events")
+    try:
+        store, last_update = dashboard.update_dashboard(1, 0)
+    finally:
+        db_pool.close_pool()
+
+    assert set(dashboard.store_errors(store)) == {'funnel'} and 'missing_funnel' in store['errors']['funnel']
+    assert last_update.endswith("(unavailable: funnel)")
+    panels = render(store)
+    assert unavailable(panels['funnel'])
+    assert not any(unavailable(panels[name]) for name in ('trends', 'cohort'))
+    assert panels['trends'].data and panels['cohort'].data and panels['segmentation']
+    assert len(panels['metrics']) == 7
+
+
+def growth_rows(active_users, dod):
+    rows = [('All', 'All', 'All', 'active_users', active_users, dod), ('mobile', 'free', 'C101', 'active_users', 3.0, 50.0),
+            ('All', 'All', 'All', 'premium_rate', 25.0, None)]
+    return pd.DataFrame(rows, columns=['device_type', 'subscription_type', 'course_id', 'metric', 'value', 'dod']
+                        ).assign(wow=None, growth_28d=None)
+
+
+def card_text(card):
+    title, value, delta = card.children
+    return title.children, value.children, delta.children
+
+
+def test_dau_card_shows_the_day_its_delta_describes():
+    metrics = {'dau': 40, 'mau': 90, 'mau_change': -10.0}
+    cards = dashboard.create_metric_cards(metrics, growth_rows(24.0, 20.0))
+    title, value, delta = card_text(cards[0])
+    assert (title, value) == ("Daily Active Users", "24")
+    assert delta[0].children == "↗ 20.0%"
+    assert card_text(cards[-1])[1] == "90"
+    assert dashboard.kpi_values(growth_rows(24.0, 20.0)) == {'dau': 24.0}
+
+    # Without the metric store there is neither a delta nor a value for that day
+    assert card_text(dashboard.create_metric_cards(metrics)[0])[1:] == ("40", "No previous data")
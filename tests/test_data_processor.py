@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+from dashboard.components.data_processor import DataProcessor
+
+
+def sorted_rates(result, cohort_col='signup_date'):
+    return result.sort_values([cohort_col, 'date']).reset_index(drop=True)
+
+
+@pytest.fixture
+def activity(activity_frame):
+    # As the CSV exports have it: string dates and a signup column
+    activity = activity_frame.assign(signup_date=activity_frame.groupby('user_id')['date'].transform('min'))
+    return activity.assign(date=activity['date'].dt.strftime('%Y-%m-%d'),
+                           signup_date=activity['signup_date'].dt.strftime('%Y-%m-%d'))
+
+
+@pytest.fixture
+def export_dir(tmp_path, activity):
+    # Users spread over several files, in no particular order
+    shuffled = activity.sample(frac=1, random_state=3)
+    directory = tmp_path / 'export'
+    (directory / 'part').mkdir(parents=True)
+    for index, start in enumerate(range(0, len(shuffled), 1000)):
+        subdir = directory / 'part' if index % 2 else directory
+        shuffled.iloc[start:start + 1000].to_csv(subdir / f"activity_{index}.csv", index=False)
+    return directory
+
+
+@pytest.mark.parametrize('chunksize, buckets', [(97, 4), (10 ** 6, 1)])
+def test_chunked_matches_in_memory(export_dir, activity, chunksize, buckets):
+    expected = sorted_rates(DataProcessor.calculate_retention_rates(activity))
+    result = DataProcessor.calculate_retention_rates_chunked(str(export_dir), chunksize=chunksize, buckets=buckets)
+    pd.testing.assert_frame_equal(sorted_rates(result)[expected.columns], expected, check_dtype=False)
+
+
+def test_chunked_on_a_process_pool(export_dir, activity):
+    expected = sorted_rates(DataProcessor.calculate_retention_rates(activity))
+    result = DataProcessor.calculate_retention_rates_chunked([str(export_dir)], chunksize=250, buckets=3, workers=2)
+    pd.testing.assert_frame_equal(sorted_rates(result)[expected.columns], expected, check_dtype=False)
+
+
+def test_chunked_derives_cohorts_from_first_return(export_dir, activity):
+    expected = sorted_rates(DataProcessor.calculate_retention_rates(activity))
+    result = DataProcessor.calculate_retention_rates_chunked(str(export_dir), cohort_col=None, chunksize=300)
+    result = sorted_rates(result, 'cohort').rename(columns={'cohort': 'signup_date'})
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_chunked_parquet(tmp_path, activity):
+    pytest.importorskip('pyarrow')
+    activity.iloc[:1500].to_parquet(tmp_path / 'a.parquet')
+    activity.iloc[1500:].to_parquet(tmp_path / 'b.parquet')
+    expected = sorted_rates(DataProcessor.calculate_retention_rates(activity))
+    result = DataProcessor.calculate_retention_rates_chunked(str(tmp_path), chunksize=400, buckets=2)
+    pd.testing.assert_frame_equal(sorted_rates(result)[expected.columns], expected, check_dtype=False)
+
+
+def test_chunked_without_rows_or_files(tmp_path, activity):
+    path = tmp_path / 'empty.csv'
+    activity.iloc[:0].to_csv(path, index=False)
+    result = DataProcessor.calculate_retention_rates_chunked(str(path))
+    assert result.empty and list(result.columns) == ['signup_date', 'date', 'user_id', 'cohort_size',
+                                                     'retention_rate']
+    assert DataProcessor.calculate_retention_rates_chunked(str(tmp_path / 'missing.csv')).empty
@@ -0,0 +1,179 @@
+import threading
+import time
+
+import psycopg2
+import pytest
+
+from dashboard.utils import db_pool
+from dashboard.utils.db_pool import ConnectionPool, PoolTimeout
+from dashboard.utils.parallel import run_concurrently
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    created = []
+
+    def fake_connect(dsn, **kwargs):
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', fake_connect)
+    return created
+
+
+def test_invalid_sizes_are_rejected(connect):
+    with pytest.raises(ValueError):
+        ConnectionPool('dsn', min_size=3, max_size=2)
+    with pytest.raises(ValueError):
+        ConnectionPool('dsn', max_size=0)
+
+
+def test_min_size_connections_are_opened_upfront(connect):
+    pool = ConnectionPool('dsn', min_size=2, max_size=4)
+    assert len(connect) == 2
+    assert pool.stats()['idle'] == 2
+
+
+def test_connections_are_reused(connect):
+    pool = ConnectionPool('dsn', min_size=0, max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(connect) == 1
+    assert first.rollbacks == 2  # open transactions are reset on return
+
+
+def test_checkout_times_out_when_pool_is_exhausted(connect):
+    pool = ConnectionPool('dsn', min_size=0, max_size=1)
+    conn = pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+    pool.putconn(conn)
+    assert pool.getconn(timeout=0.05) is conn
+
+
+def test_waiting_checkout_gets_returned_connection(connect):
+    pool = ConnectionPool('dsn', min_size=0, max_size=1)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    waiter.join(5)
+    assert got == [conn]
+    assert pool.stats()['in_use'] == 1
+
+
+def test_in_use_never_exceeds_max_size(connect):
+    pool = ConnectionPool('dsn', min_size=0, max_size=3)
+    peak, lock = [0], threading.Lock()
+
+    def work():
+        for _ in range(20):
+            with pool.connection():
+                with lock:
+                    peak[0] = max(peak[0], pool.stats()['in_use'])
+                time.sleep(0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] <= 3
+    assert len(connect) <= 3
+    assert pool.stats()['in_use'] == 0
+
+
+def test_unhealthy_idle_connection_is_replaced(connect):
+    pool = ConnectionPool('dsn', min_size=1, max_size=2, health_check_interval=0)
+    stale = connect[0]
+    stale.broken = True
+    conn = pool.getconn()
+    assert conn is not stale
+    assert stale.closed
+    assert pool.stats()['health_check_failures'] == 1
+
+
+def test_broken_connection_is_discarded(connect):
+    pool = ConnectionPool('dsn', min_size=0, max_size=2)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("connection lost")
+    assert conn.closed
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['in_use'] == 0
+
+
+def test_closed_pool_rejects_checkouts(connect):
+    pool = ConnectionPool('dsn', min_size=2, max_size=2)
+    pool.close()
+    assert all(conn.closed for conn in connect)
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+
+@pytest.fixture
+def scratch_pool(test_db_url, monkeypatch):
+    monkeypatch.setenv('DB_URL', test_db_url)
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', 'False')
+    db_pool.close_pool()
+    yield
+    db_pool.close_pool()
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_queries_under_run_concurrently_get_the_remaining_time(scratch_pool):
+    read = "SELECT current_setting('statement_timeout') as timeout"
+    assert db_pool.read_sql(read)['timeout'][0] == '0'
+    results, errors = run_concurrently({'setting': lambda: db_pool.read_sql(read),
+                                        'slow': lambda: db_pool.read_sql("SELECT pg_sleep(5)")},
+                                       timeouts={'slow': 0.3}, default_timeout=10)
+    assert errors == {'slow': 'timeout'}
+    assert 9000 < int(results['setting']['timeout'][0].rstrip('ms')) <= 10000
+    # The abandoned query is cancelled by the server instead of running on
+    started = time.monotonic()
+    while db_pool.read_sql("SELECT COUNT(*) as n FROM pg_stat_activity WHERE query LIKE 'SELECT pg_sleep%%'")['n'][0]:
+        assert time.monotonic() - started < 2
+        time.sleep(0.05)
+    assert db_pool.read_sql(read)['timeout'][0] == '0'
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.components.funnel_engine import DEFAULT_FUNNEL, FunnelEngine, FunnelStep, funnel_signature
+
+STEPS = [
+    FunnelStep("Visited"),
+    FunnelStep("Completed Lesson", {'lesson_completed': True}),
+    FunnelStep("Completed 3+ Lessons", {'lesson_completed': True}, min_count=3),
+    FunnelStep("Premium within a week", {'subscription_type': 'premium'}, within_days=7),
+    FunnelStep("Long session", lambda events: events['time_spent'] >= 50),
+]
+
+
+def random_events(seed, users=40, rows=600):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_id': [f"u{u}" for u in rng.integers(0, users, rows)],
+        'date': pd.Timestamp('2026-05-01') + pd.to_timedelta(rng.integers(0, 30, rows), unit='D'),
+        'lesson_completed': rng.random(rows) < 0.3,
+        'subscription_type': rng.choice(['free', 'premium'], rows, p=[0.8, 0.2]),
+        'device_type': rng.choice(['mobile', 'desktop', 'tablet'], rows),
+        'time_spent': rng.integers(1, 60, rows),
+        'events': rng.integers(1, 4, rows),
+    })
+
+
+def naive_reach(events, steps, weight_col=None, segment_col=None):
+    """Per-user loop over the step definitions: {user: (segment, [day reached or None per step])}"""
+    qualifying = [step.mask(events) for step in steps]
+    result = {}
+    for user, rows in events.groupby('user_id'):
+        order = ['date', segment_col] if segment_col else ['date']
+        rows = rows.sort_values(order, kind='stable')
+        weights = rows[weight_col].tolist() if weight_col else [1] * len(rows)
+        reached, prev_day = [], None
+        for k, step in enumerate(steps):
+            running, day = 0, None
+            for position, index in enumerate(rows.index):
+                if not qualifying[k][events.index.get_loc(index)]:
+                    continue
+                running += weights[position]
+                event_day = rows.at[index, 'date']
+                if running >= step.min_count and (prev_day is None or event_day >= prev_day):
+                    day = event_day
+                    break
+            if day is not None and k > 0 and step.within_days is not None and (day - prev_day).days > step.within_days:
+                day = None
+            if day is None:
+                break
+            reached.append(day)
+            prev_day = day
+        reached += [None] * (len(steps) - len(reached))
+        result[user] = (rows[segment_col].iloc[0] if segment_col else None, reached)
+    return result
+
+
+def naive_funnel(events, steps, weight_col=None, segment_col=None):
+    reach = naive_reach(events, steps, weight_col, segment_col)
+    groups = [('All', list(reach.values()))]
+    if segment_col:
+        for segment in sorted({value[0] for value in reach.values()}):
+            groups.append((segment, [value for value in reach.values() if value[0] == segment]))
+    rows = []
+    for segment, members in groups:
+        for k in range(len(steps)):
+            got = [days for _, days in members if days[k] is not None]
+            from_start = [(days[k] - days[0]).days for days in got]
+            from_previous = [(days[k] - days[k - 1]).days if k else 0 for days in got]
+            rows.append({'segment': segment, 'step_index': k, 'users': len(got),
+                         'median_days_from_start': float(np.median(from_start)) if got else np.nan,
+                         'median_days_from_previous': float(np.median(from_previous)) if got else np.nan})
+    return pd.DataFrame(rows)
+
+
+COMPARED = ['segment', 'step_index', 'users', 'median_days_from_start', 'median_days_from_previous']
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_matches_naive_per_user_loop(seed):
+    events = random_events(seed)
+    result = FunnelEngine.compute(events, STEPS, segment_col='device_type')
+    pd.testing.assert_frame_equal(result[COMPARED], naive_funnel(events, STEPS, segment_col='device_type'),
+                                  check_dtype=False)
+
+
+def test_weights_count_towards_min_count():
+    events = random_events(4)
+    result = FunnelEngine.compute(events, STEPS, weight_col='events')
+    pd.testing.assert_frame_equal(result[COMPARED], naive_funnel(events, STEPS, weight_col='events'),
+                                  check_dtype=False)
+
+    # Pre-aggregating with a weight column gives the same funnel as the raw rows
+    raw = events.loc[events.index.repeat(events['events'])].drop(columns='events')
+    pd.testing.assert_frame_equal(result, FunnelEngine.compute(raw, STEPS))
+
+
+def test_conversion_rates():
+    result = FunnelEngine.compute(random_events(5), STEPS, segment_col='device_type')
+    for _, group in result.groupby('segment'):
+        users = group['users'].tolist()
+        assert group['conversion_from_start'].tolist() == [round(u * 100.0 / users[0], 1) for u in users]
+        assert group['conversion_from_previous'].tolist() == [100.0] + [
+            round(u * 100.0 / p, 1) if p else 0.0 for p, u in zip(users, users[1:])]
+    assert result['segment'].drop_duplicates().tolist() == ['All', 'desktop', 'mobile', 'tablet']
+
+
+def test_steps_before_the_previous_step_do_not_count():
+    # The lesson happens before the premium step, so "lesson after premium" is never reached
+    events = pd.DataFrame({'user_id': ['a', 'a'], 'date': pd.to_datetime(['2026-01-01', '2026-01-05']),
+                           'lesson_completed': [True, False], 'subscription_type': ['free', 'premium']})
+    steps = [FunnelStep("Premium", {'subscription_type': 'premium'}),
+             FunnelStep("Lesson", {'lesson_completed': True})]
+    assert FunnelEngine.compute(events, steps)['users'].tolist() == [1, 0]
+
+
+def test_reach_days_lists_dates_per_step():
+    events = random_events(6)
+    progress = FunnelEngine.reach_days(events, STEPS, segment_col='device_type').set_index('user_id')
+    for user, (segment, days) in naive_reach(events, STEPS, segment_col='device_type').items():
+        assert progress.at[user, 'segment'] == segment
+        assert progress.at[user, 'reached'] == [None if day is None else day.date() for day in days]
+
+
+def test_summarize_of_step_counts_matches_compute():
+    events = random_events(7)
+    result = FunnelEngine.compute(events, STEPS, segment_col='device_type')
+    pd.testing.assert_frame_equal(FunnelEngine.summarize(result[FunnelEngine.STEP_COUNT_COLUMNS], STEPS), result)
+
+
+def test_empty_events():
+    assert FunnelEngine.compute(pd.DataFrame(columns=['user_id', 'date'])).empty
+    assert FunnelEngine.reach_days(pd.DataFrame(columns=['user_id', 'date'])).empty
+
+
+def test_funnel_signature():
+    assert funnel_signature(DEFAULT_FUNNEL) == funnel_signature(list(DEFAULT_FUNNEL))
+    changed = DEFAULT_FUNNEL[:2] + [FunnelStep("Completed 3+ Lessons", {'lesson_completed': True}, min_count=4)]
+    assert funnel_signature(changed) != funnel_signature(DEFAULT_FUNNEL[:3])
+    assert funnel_signature(STEPS) is None  # callable predicate
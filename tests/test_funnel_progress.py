@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from dashboard.components.funnel_engine import DEFAULT_FUNNEL, FunnelEngine, FunnelStep, funnel_signature
+from dashboard.utils.funnel_progress import (FUNNEL_PROGRESS_SQL, FUNNEL_SEGMENT, funnel_columns,
+                                             funnel_events_query, refresh_funnel_progress)
+from dashboard.utils.rollups import refresh_rollups
+
+pytestmark = pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+
+
+def stored_funnel(conn, steps=DEFAULT_FUNNEL):
+    counts = pd.read_sql(FUNNEL_PROGRESS_SQL, conn, params={'funnel': funnel_signature(steps)})
+    return FunnelEngine.summarize(counts, steps)
+
+
+def test_funnel_columns():
+    assert funnel_columns(DEFAULT_FUNNEL, FUNNEL_SEGMENT) == ['device_type', 'lesson_completed', 'subscription_type']
+    assert funnel_columns([FunnelStep("Any")]) == []
+    assert 'time_spent' in funnel_columns([FunnelStep("Long", lambda events: events['time_spent'] > 30)])
+
+
+def test_full_refresh_matches_engine_on_activity(pg_conn, activity_frame, insert_activity):
+    insert_activity(pg_conn, activity_frame)
+    refresh_rollups(pg_conn)
+    expected = FunnelEngine.compute(activity_frame, DEFAULT_FUNNEL, segment_col=FUNNEL_SEGMENT)
+    pd.testing.assert_frame_equal(stored_funnel(pg_conn), expected)
+
+
+def test_incremental_refresh_with_late_events_matches_full_rebuild(pg_conn, activity_frame, insert_activity):
+    cutoff = pd.Timestamp('2026-03-20')
+    insert_activity(pg_conn, activity_frame[activity_frame['date'] < cutoff])
+    refresh_rollups(pg_conn)
+    insert_activity(pg_conn, activity_frame[activity_frame['date'] >= cutoff])
+    refresh_rollups(pg_conn)
+
+    # Late premium events for an early day: those users' whole history is recomputed
+    late_day = pd.Timestamp('2026-03-05')
+    late = activity_frame[activity_frame['date'] == late_day].assign(subscription_type='premium',
+                                                                      lesson_completed=True)
+    insert_activity(pg_conn, late)
+    refresh_rollups(pg_conn, from_date=late_day.date())
+
+    everything = pd.concat([activity_frame, late], ignore_index=True)
+    expected = FunnelEngine.compute(everything, DEFAULT_FUNNEL, segment_col=FUNNEL_SEGMENT)
+    pd.testing.assert_frame_equal(stored_funnel(pg_conn), expected)
+
+
+def test_changed_funnel_definition_recomputes_every_user(pg_conn, activity_frame, insert_activity):
+    insert_activity(pg_conn, activity_frame)
+    refresh_rollups(pg_conn)
+    steps = DEFAULT_FUNNEL[:2] + [FunnelStep("Completed 5+ Lessons", {'lesson_completed': True}, min_count=5)]
+    last_day = activity_frame['date'].max().date()
+    with pg_conn.cursor() as cursor:
+        refresh_funnel_progress(cursor, last_day, steps)
+        cursor.execute("SELECT COUNT(*) FROM user_funnel_progress WHERE funnel = %s", (funnel_signature(steps),))
+        assert cursor.fetchone()[0] == activity_frame['user_id'].nunique()
+    expected = FunnelEngine.compute(activity_frame, steps, segment_col=FUNNEL_SEGMENT)
+    pd.testing.assert_frame_equal(stored_funnel(pg_conn, steps), expected)
+
+
+def test_events_query_collapses_to_funnel_columns(pg_conn, activity_frame, insert_activity):
+    insert_activity(pg_conn, activity_frame)
+    columns = funnel_columns(DEFAULT_FUNNEL, FUNNEL_SEGMENT)
+    events = pd.read_sql(funnel_events_query(columns), pg_conn)
+    assert events['events'].sum() == len(activity_frame)
+    assert len(events) == len(activity_frame.drop_duplicates(['user_id', 'date'] + columns))
+    expected = FunnelEngine.compute(activity_frame, DEFAULT_FUNNEL, segment_col=FUNNEL_SEGMENT)
+    pd.testing.assert_frame_equal(
+        FunnelEngine.compute(events, DEFAULT_FUNNEL, weight_col='events', segment_col=FUNNEL_SEGMENT), expected)
@@ -0,0 +1,121 @@
+from collections import deque
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import scripts.generate_sample_data as generator
+from scripts.generate_sample_data import (generate_activity_shard, generate_realistic_edtech_data,
+                                          iter_activity_chunks, plan_shards, stream_to_file)
+
+END_DATE = date(2026, 6, 30)
+COLUMNS = ['date', 'user_id', 'course_id', 'lesson_completed', 'time_spent', 'device_type', 'subscription_type']
+
+
+@pytest.fixture(scope='module')
+def generated():
+    return generate_realistic_edtech_data(300, 60, seed=11, shard_size=100, end_date=END_DATE)
+
+
+def test_plan_shards_covers_every_user_once():
+    shards = plan_shards(250, seed=1, shard_size=100)
+    assert [(start, count) for start, count, _ in shards] == [(1, 100), (101, 100), (201, 50)]
+    assert plan_shards(250, seed=1, shard_size=100)[2][2].entropy == shards[2][2].entropy
+
+
+def test_output_shape_and_ranges(generated):
+    assert list(generated.columns) == COLUMNS
+    assert generated['date'].min() >= pd.Timestamp('2026-05-01')
+    assert generated['date'].max() <= pd.Timestamp(END_DATE)
+    assert generated['user_id'].str.fullmatch(r'U\d{4}').all()
+    assert generated['user_id'].nunique() <= 300
+    assert (generated['time_spent'] >= 5).all()
+    assert set(generated['device_type']) <= {'mobile', 'desktop', 'tablet'}
+    assert set(generated['subscription_type']) == {'free', 'premium'}
+
+
+def test_rows_are_ordered_by_user_then_date(generated):
+    order = generated.sort_values(['user_id', 'date'], kind='stable').index
+    assert (order == generated.index).all()
+
+
+def test_premium_users_stay_premium(generated):
+    premium = generated['subscription_type'] == 'premium'
+    first_premium = generated[premium].groupby('user_id')['date'].min()
+    later = generated.join(first_premium.rename('converted'), on='user_id')
+    assert not ((later['date'] >= later['converted']) & ~premium).any()
+
+
+def test_same_seed_same_data_whatever_the_job_count(generated):
+    parallel = generate_realistic_edtech_data(300, 60, seed=11, jobs=2, shard_size=100, end_date=END_DATE)
+    pd.testing.assert_frame_equal(parallel, generated)
+    other = generate_realistic_edtech_data(300, 60, seed=12, shard_size=100, end_date=END_DATE)
+    assert not other.equals(generated)
+
+
+def test_chunks_follow_shards(generated):
+    chunks = list(iter_activity_chunks(300, 60, seed=11, shard_size=100, end_date=END_DATE))
+    assert len(chunks) == 3
+    assert chunks[1]['user_id'].between('U0101', 'U0200').all()
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), generated)
+
+
+def test_shard_without_active_users_is_empty():
+    shard = generate_activity_shard(1, 0, 40, np.random.SeedSequence(1), END_DATE)
+    assert shard.empty and list(shard.columns) == COLUMNS
+
+
+def test_stream_to_csv_passes_chunks_through(tmp_path, generated):
+    path = str(tmp_path / 'activity.csv')
+    chunks = [generated.iloc[:500], generated.iloc[500:]]
+    assert [len(chunk) for chunk in stream_to_file(chunks, path)] == [500, len(generated) - 500]
+    written = pd.read_csv(path, parse_dates=['date'])
+    assert len(written) == len(generated)
+    assert written['user_id'].tolist() == generated['user_id'].tolist()
+
+
+def test_stream_to_parquet(tmp_path, generated):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'activity.parquet')
+    deque(stream_to_file([generated.iloc[:500], generated.iloc[500:]], path), maxlen=0)
+    written = pd.read_parquet(path)
+    assert len(written) == len(generated)
+    assert (written['time_spent'] == generated['time_spent']).all()
+
+
+def test_chunks_are_generated_lazily(monkeypatch):
+    calls = []
+    real = generator._generate_shard
+    monkeypatch.setattr(generator, '_generate_shard', lambda args: calls.append(args[0]) or real(args))
+
+    chunks = iter_activity_chunks(300, 60, seed=11, shard_size=100, end_date=END_DATE)
+    next(chunks)
+    assert calls == [1]
+
+
+def test_cli_stream_writes_the_same_file(tmp_path, monkeypatch):
+    paths = {}
+    for mode in ('frame', 'stream'):
+        paths[mode] = str(tmp_path / f"{mode}.csv")
+        argv = ['generate_sample_data.py', '--users', '150', '--days', '45', '--seed', '3', '--jobs', '1',
+                '--shard-size', '50', '--no-db', '--output', paths[mode]]
+        monkeypatch.setattr('sys.argv', argv + (['--stream'] if mode == 'stream' else []))
+        generator.main()
+    with open(paths['frame']) as frame, open(paths['stream']) as stream:
+        assert frame.read() == stream.read()
+
+
+def test_save_streamed_chunks_to_database(pg_conn, test_db_url, monkeypatch):
+    monkeypatch.setenv('DB_URL', test_db_url)
+    chunks = list(iter_activity_chunks(200, 45, seed=5, shard_size=50, end_date=END_DATE))
+    generator.save_to_database(iter(chunks))
+
+    with pg_conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*), COUNT(DISTINCT user_id) FROM activity")
+        rows, users = cursor.fetchone()
+        cursor.execute("SELECT SUM(sessions) FROM daily_activity_totals")
+        sessions = cursor.fetchone()[0]
+    combined = pd.concat(chunks, ignore_index=True)
+    assert rows == sessions == len(combined)
+    assert users == combined['user_id'].nunique()
@@ -0,0 +1,116 @@
+import ast
+import glob
+import os
+
+import pandas as pd
+
+from dashboard.utils.db_queries import dashboard_queries
+from dashboard.utils.rollups import refresh_rollups
+from scripts.index_advisor import ROOT, advise, explain, measure_change, propose_indexes
+
+DASHBOARD_DIR = os.path.join(ROOT, 'dashboard')
+
+PREMIUM_QUERY = "SELECT date, user_id FROM activity WHERE subscription_type = 'premium' ORDER BY date"
+# Trimmed EXPLAIN (VERBOSE, FORMAT JSON) output of PREMIUM_QUERY on a partitioned activity table
+PREMIUM_PLAN = {'Plan': {
+    'Node Type': 'Sort',
+    'Sort Key': ['activity.date'],
+    'Plans': [{
+        'Node Type': 'Seq Scan',
+        'Relation Name': 'activity_y2026m03',
+        'Output': ['activity.date', 'activity.user_id'],
+        'Filter': "((activity.subscription_type)::text = 'premium'::text)",
+    }],
+}}
+ACTIVITY_COLUMNS = {'activity': {'id', 'date', 'user_id', 'course_id', 'device_type', 'subscription_type'}}
+
+
+def read_sql_names(root=DASHBOARD_DIR):
+    """The name= of every read_sql call under dashboard/"""
+    names = set()
+    for path in glob.glob(os.path.join(root, '**', '*.py'), recursive=True):
+        with open(path) as file:
+            tree = ast.parse(file.read())
+        for node in ast.walk(tree):
+            func = getattr(node, 'func', None)
+            if not isinstance(node, ast.Call) or (getattr(func, 'id', None) or getattr(func, 'attr', None)) != 'read_sql':
+                continue
+            names.update(k.value.value for k in node.keywords
+                         if k.arg == 'name' and isinstance(k.value, ast.Constant))
+    return names
+
+
+def test_every_named_dashboard_query_is_registered():
+    names = [name for name, _, _ in dashboard_queries()]
+    assert len(names) == len(set(names))
+    found = read_sql_names()
+    assert {'funnel_progress', 'funnel_events', 'growth_totals', 'growth_segments', 'growth_retention',
+            'active_user_counts'} <= found
+    assert found <= set(names)
+    for name, sql, _ in dashboard_queries():
+        assert sql.split(None, 1)[0].upper() in ('SELECT', 'WITH'), name
+        assert not sql.endswith(';'), name
+
+
+def test_registered_queries_explain_with_their_sample_params(pg_conn, activity_frame, insert_activity):
+    recent = activity_frame.assign(date=activity_frame['date'] + (pd.Timestamp.now().normalize()
+                                                                  - activity_frame['date'].max()))
+    insert_activity(pg_conn, recent)
+    refresh_rollups(pg_conn)
+    with pg_conn.cursor() as cursor:
+        for name, sql, params in dashboard_queries():
+            result = explain(cursor, sql, repeat=1, params=params)
+            assert result['scans'], name
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            # Users sign up in the first 20 of 40 days, so no day-N retention is observed in the last 8
+            if name != 'growth_retention':
+                assert rows, name
+    pg_conn.rollback()
+
+
+def test_propose_covering_and_partial_indexes_on_the_parent_table():
+    candidates = propose_indexes(PREMIUM_PLAN, ACTIVITY_COLUMNS, {'activity_y2026m03': 'activity'})
+    assert candidates == {
+        'ON activity (subscription_type, date) INCLUDE (user_id)': 'activity',
+        "ON activity (date) INCLUDE (user_id) WHERE subscription_type = 'premium'": 'activity',
+    }
+
+
+def test_unfiltered_scan_is_indexed_on_its_group_keys():
+    plan = {'Plan': {'Node Type': 'Aggregate', 'Group Key': ['activity.course_id'], 'Plans': [
+        {'Node Type': 'Seq Scan', 'Relation Name': 'activity', 'Output': ['course_id', 'user_id']}]}}
+    assert propose_indexes(plan, ACTIVITY_COLUMNS, {}) == {'ON activity (course_id) INCLUDE (user_id)': 'activity'}
+
+
+def test_advise_measures_proposals_and_rolls_them_back(pg_conn, activity_frame, insert_activity):
+    insert_activity(pg_conn, activity_frame)
+    with pg_conn.cursor() as cursor:
+        result = explain(cursor, PREMIUM_QUERY, repeat=1)
+    pg_conn.rollback()
+    assert result['execution_ms'] >= 0
+    assert all(scan['relation'].startswith('activity_') for scan in result['scans'])
+
+    report = advise(pg_conn, [('premium', PREMIUM_QUERY, None)], repeat=1, min_gain=0)
+    assert set(report['baseline']) == {'premium'} and 'plan' not in report['baseline']['premium']
+    definitions = {p['definition'] for p in report['proposals']}
+    assert "CREATE INDEX ON activity (date) INCLUDE (user_id) WHERE subscription_type = 'premium'" in definitions
+    for proposal in report['proposals']:
+        assert proposal['proposed_for'] == ['premium'] and proposal['size_bytes'] > 0
+        assert set(proposal['effects']) == {'premium'}
+    assert any(info['index'] == 'idx_activity_user_date' for info in report['existing_indexes'])
+
+    with pg_conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM pg_class WHERE relname LIKE 'advisor_%%'")
+        assert cursor.fetchone()[0] == 0
+
+
+def test_measure_change_rolls_back_ddl(pg_conn):
+    seconds, size, tree, results = measure_change(
+        pg_conn, "CREATE INDEX advisor_test ON activity (course_id)", [('count', "SELECT COUNT(*) FROM activity", None)],
+        repeat=1, index_name='advisor_test')
+    assert size >= 0 and 'advisor_test' in tree and len(tree) > 1  # one child per partition
+    assert set(results) == {'count'}
+    with pg_conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('advisor_test')")
+        assert cursor.fetchone()[0] is None
@@ -0,0 +1,131 @@
+import json
+import threading
+from datetime import date
+
+import pytest
+
+from dashboard.utils import db_pool
+from dashboard.utils.ingest import BufferFull, IngestBuffer, MAX_ID_LENGTH, get_watermarks, parse_event, parse_ndjson
+
+EVENT = {'date': '2026-03-05', 'user_id': 'U0001', 'course_id': 'C101', 'lesson_completed': True,
+         'time_spent': 12, 'device_type': 'mobile', 'subscription_type': 'premium'}
+
+
+def test_parse_event_returns_row_in_column_order():
+    assert parse_event(EVENT) == (date(2026, 3, 5), 'U0001', 'C101', True, 12, 'mobile', 'premium')
+
+
+def test_parse_event_defaults_and_timestamps():
+    row = parse_event({'date': '2026-03-05T23:59:00Z', 'user_id': 'U1', 'course_id': 'C1', 'time_spent': 3.9})
+    assert row == (date(2026, 3, 5), 'U1', 'C1', False, 3, 'unknown', 'free')
+
+
+@pytest.mark.parametrize('change, message', [
+    ({'date': None}, None),
+    ({'date': '05/03/2026'}, None),
+    ({'time_spent': -1}, 'time_spent'),
+    ({'time_spent': True}, 'time_spent'),
+    ({'time_spent': '12'}, 'time_spent'),
+    ({'time_spent': 2 ** 31}, 'time_spent'),
+    ({'lesson_completed': 'yes'}, 'lesson_completed'),
+    ({'user_id': ''}, 'user_id'),
+    ({'user_id': 42}, 'user_id'),
+    ({'user_id': 'U' * (MAX_ID_LENGTH + 1)}, 'longer than'),
+    ({'device_type': 'd' * 21}, 'device_type'),
+    ({'course_id': None}, 'course_id'),
+])
+def test_parse_event_rejects_invalid_fields(change, message):
+    with pytest.raises(ValueError, match=message):
+        parse_event({**EVENT, **change})
+
+
+def test_parse_event_requires_an_object_with_a_date():
+    with pytest.raises(ValueError, match='JSON object'):
+        parse_event(['2026-03-05'])
+    with pytest.raises(ValueError, match='date is required'):
+        parse_event({k: v for k, v in EVENT.items() if k != 'date'})
+
+
+def test_parse_ndjson_reports_line_numbers():
+    body = '\n'.join([json.dumps(EVENT), '', '{not json', json.dumps({**EVENT, 'time_spent': -5}),
+                      json.dumps(EVENT)])
+    rows, errors = parse_ndjson(body)
+    assert len(rows) == 2
+    assert [error['line'] for error in errors] == [3, 4]
+    assert 'time_spent' in errors[1]['error']
+
+
+class RecordingBuffer(IngestBuffer):
+    """IngestBuffer whose batches are recorded instead of written"""
+
+    def __init__(self, **kwargs):
+        super().__init__(rollup_interval=3600, **kwargs)
+        self.batches = []
+        self.flushed = threading.Event()
+
+    def _flush(self, batch):
+        self.batches.append(batch)
+        with self._cond:
+            self._stats['flushed'] += len(batch)
+            self._flushing = 0
+        self.flushed.set()
+        return True
+
+
+def test_offer_is_all_or_nothing_when_full():
+    buffer = RecordingBuffer(flush_size=100, flush_interval=60, max_buffered=3)
+    row = parse_event(EVENT)
+    buffer.offer([row, row])
+    with pytest.raises(BufferFull) as raised:
+        buffer.offer([row, row])
+    assert raised.value.retry_after == 60
+    stats = buffer.stats()
+    assert (stats['accepted'], stats['throttled'], stats['buffered']) == (2, 2, 2)
+    buffer.close()
+    assert sum(len(batch) for batch in buffer.batches) == 2
+    with pytest.raises(RuntimeError):
+        buffer.offer([row])
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_interval():
+    buffer = RecordingBuffer(flush_size=2, flush_interval=60)
+    summary = buffer.ingest('\n'.join(json.dumps(EVENT) for _ in range(2)) + '\n{"date": "bad"}')
+    assert (summary['accepted'], summary['rejected']) == (2, 1)
+    assert buffer.flushed.wait(5)
+    assert len(buffer.batches[0]) == 2
+    buffer.close()
+
+
+@pytest.fixture
+def scratch_pool(test_db_url, pg_conn, monkeypatch):
+    """Point the process-wide pool at the scratch database"""
+    monkeypatch.setenv('DB_URL', test_db_url)
+    db_pool.close_pool()
+    yield db_pool.get_pool()
+    db_pool.close_pool()
+
+
+def test_flush_writes_rows_and_watermarks_then_rollups(scratch_pool, pg_conn):
+    buffer = IngestBuffer(flush_size=10, flush_interval=60, rollup_interval=3600)
+    rows = [parse_event({**EVENT, 'user_id': f"U{i}", 'date': f"2026-03-0{1 + i % 2}"}) for i in range(5)]
+    assert buffer._flush(rows)
+    assert get_watermarks()[0]['date'] == '2026-03-02'
+    assert [w['events_ingested'] for w in get_watermarks()] == [2, 3]
+    assert all(w['pending_rollup'] for w in get_watermarks())
+
+    assert buffer._refresh_rollups() == date(2026, 3, 1)
+    assert not any(w['pending_rollup'] for w in get_watermarks())
+    with pg_conn.cursor() as cursor:
+        cursor.execute("SELECT SUM(sessions), SUM(active_users) FROM daily_activity_totals")
+        assert cursor.fetchone() == (5, 5)
+    assert buffer._refresh_rollups() is None  # nothing pending
+
+
+def test_failed_flush_puts_the_batch_back(scratch_pool, pg_conn):
+    buffer = IngestBuffer(flush_size=10, flush_interval=0.01)
+    bad = parse_event(EVENT)[:1] + (None,) + parse_event(EVENT)[2:]  # NULL user_id violates NOT NULL
+    buffer._closed = True  # no retry sleep
+    assert not buffer._flush([bad])
+    stats = buffer.stats()
+    assert (stats['buffered'], stats['flush_errors']) == (1, 1)
+    assert get_watermarks() == []
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from dashboard.utils import instrumentation
+from dashboard.utils.instrumentation import (CALLBACK_DURATION, Counter, Gauge, Histogram, maybe_capture_plan,
+                                             query_label, record_query, register, render_metrics, timed_callback)
+
+
+def test_counter_renders_labels_and_escapes_values():
+    counter = Counter('test_events_total', 'Events', ['kind'])
+    counter.inc(kind='a')
+    counter.inc(2, kind='a')
+    counter.inc(kind='say "hi"\n')
+    assert counter.render() == [
+        '# HELP test_events_total Events',
+        '# TYPE test_events_total counter',
+        'test_events_total{kind="a"} 3',
+        'test_events_total{kind="say \\"hi\\"\\n"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'Latency', ['query'], buckets=(1.0, 0.1))
+    for value in (0.05, 0.5, 2.0):
+        histogram.observe(value, query='q')
+    lines = histogram.render()
+    assert 'test_seconds_bucket{query="q",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{query="q",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{query="q",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{query="q"} 2.55' in lines
+    assert 'test_seconds_count{query="q"} 3' in lines
+
+
+def test_gauge_reads_samples_at_render_time():
+    values = {('idle',): 1}
+    gauge = Gauge('test_pool', 'Pool', ['stat'], lambda: values)
+    values[('busy',)] = 4
+    assert gauge.render()[2:] == ['test_pool{stat="busy"} 4', 'test_pool{stat="idle"} 1']
+
+
+def test_gauge_collect_failure_renders_no_samples():
+    def broken():
+        raise RuntimeError("pool gone")
+    assert Gauge('test_broken', 'Broken', ['stat'], broken).render() == [
+        '# HELP test_broken Broken', '# TYPE test_broken gauge']
+
+
+def test_registered_metrics_are_rendered(monkeypatch):
+    monkeypatch.setattr(instrumentation, '_registry', list(instrumentation._registry))
+    register(Gauge('test_registered', 'Registered', [], lambda: {(): 7}))
+    text = render_metrics()
+    assert text.endswith('\n')
+    assert 'test_registered 7' in text.splitlines()
+    assert '# TYPE dashboard_query_duration_seconds histogram' in text
+
+
+def test_query_label():
+    assert query_label("SELECT 1", name='named') == 'named'
+    assert query_label("SELECT  *\nFROM activity") == query_label("SELECT * FROM activity")
+    assert query_label("SELECT 1").startswith('sql_') and len(query_label("SELECT 1")) == 14
+
+
+def test_record_query_updates_duration_cache_rows_and_bytes():
+    record_query('test_record', 0.2, 'miss', rows=5, result_bytes=100)
+    text = render_metrics()
+    assert 'dashboard_query_cache_total{query="test_record",result="miss"} 1' in text
+    assert 'dashboard_query_rows_total{query="test_record"} 5' in text
+    assert 'dashboard_query_result_bytes_total{query="test_record"} 100' in text
+    assert 'dashboard_query_duration_seconds_count{query="test_record",cache="miss"} 1' in text
+
+
+def test_timed_callback_records_failures_too():
+    @timed_callback('test_callback')
+    def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        failing()
+    assert 'dashboard_callback_duration_seconds_count{callback="test_callback"} 1' in CALLBACK_DURATION.render()
+    assert timed_callback()(test_query_label).__name__ == 'test_query_label'
+
+
+def wait_for_capture(label):
+    for thread in threading.enumerate():
+        if thread.name == f"explain-{label}":
+            thread.join(timeout=5)
+
+
+def test_slow_query_plan_is_captured(monkeypatch):
+    monkeypatch.setenv('SLOW_QUERY_MS', '100')
+    monkeypatch.setenv('SLOW_QUERY_EXPLAIN_RATE', '1')
+    monkeypatch.setattr(instrumentation, 'slow_query_plans', instrumentation.deque(maxlen=5))
+    calls = []
+
+    def run_explain(sql, params):
+        calls.append((sql, params))
+        return [('[{"Plan": {"Shared Hit Blocks": 3, "Shared Read Blocks": 1}, "Execution Time": 12.5}]',)]
+
+    maybe_capture_plan('test_fast', "SELECT 1", None, 0.05, run_explain)
+    maybe_capture_plan('test_slow', "SELECT 2", {'a': 1}, 0.5, run_explain)
+    wait_for_capture('test_slow')
+
+    assert calls == [("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT 2", {'a': 1})]
+    plan, = instrumentation.slow_query_plans
+    assert plan['query'] == 'test_slow'
+    assert plan['execution_ms'] == 12.5
+    assert (plan['shared_hit_blocks'], plan['shared_read_blocks']) == (3, 1)
+
+
+def test_slow_query_sampling_rate_zero_skips_explain(monkeypatch):
+    monkeypatch.setenv('SLOW_QUERY_MS', '0')
+    monkeypatch.setenv('SLOW_QUERY_EXPLAIN_RATE', '0')
+    maybe_capture_plan('test_unsampled', "SELECT 1", None, 10.0, lambda sql, params: pytest.fail("explained"))
+    wait_for_capture('test_unsampled')
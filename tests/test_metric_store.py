@@ -0,0 +1,138 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dashboard.components.metric_store import COMPONENTS, METRICS, MetricStore
+
+DAYS = pd.date_range('2026-03-01', periods=40)
+
+
+@pytest.fixture
+def components():
+    rng = np.random.default_rng(5)
+    rows = pd.MultiIndex.from_product([DAYS, ['mobile', 'desktop', 'tablet']], names=['date', 'segment']).to_frame(
+        index=False)
+    for name in COMPONENTS:
+        rows[name] = rng.integers(0, 50, len(rows)).astype(float)
+    rows['sessions'] += 1
+    # Some segments have no row on some days
+    return rows.sample(frac=0.85, random_state=1).reset_index(drop=True)
+
+
+def expected_growth(frame, as_of, horizons):
+    """Metric value and growth per segment, from window sums over a dense (segment, day) table"""
+    dense = frame.groupby(['segment', 'date'])[list(COMPONENTS)].sum()
+    dense = dense.reindex(pd.MultiIndex.from_product([dense.index.levels[0], DAYS]), fill_value=0)
+    first = frame['date'].min()
+
+    def rate(sums, metric, length):
+        numerator, denominator, scale = METRICS[metric]
+        total = sums[denominator] if denominator else length
+        return sums[numerator] * scale / total if total > 0 else np.nan
+
+    rows = []
+    for segment, days in dense.groupby(level=0):
+        days = days.droplevel(0)
+        for metric in METRICS:
+            row = {'segment': segment, 'metric': metric, 'value': rate(days.loc[as_of], metric, 1)}
+            for name, h in horizons.items():
+                current = days[(days.index > as_of - pd.Timedelta(days=h)) & (days.index <= as_of)].sum()
+                start = as_of - pd.Timedelta(days=2 * h)
+                previous = days[(days.index > start) & (days.index <= as_of - pd.Timedelta(days=h))].sum()
+                value, before = rate(current, metric, h), rate(previous, metric, h)
+                row[name] = round((value / before - 1) * 100, 2) if start >= first - pd.Timedelta(days=1) and \
+                    before > 0 else np.nan
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def sorted_growth(result):
+    return result.sort_values(['segment', 'metric']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('as_of', [None, DAYS[15], DAYS[5]])
+def test_growth_matches_window_sums(components, as_of):
+    store = MetricStore(horizons={'dod': 1, 'wow': 7, 'growth_14d': 14}).upsert(components)
+    result = sorted_growth(store.growth(as_of))
+    expected = sorted_growth(expected_growth(components, DAYS[-1] if as_of is None else as_of, store.horizons))
+    assert list(result.columns) == ['segment', 'metric', 'value', 'dod', 'wow', 'growth_14d']
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+    if as_of == DAYS[5]:
+        assert result['growth_14d'].isna().all() and result['dod'].notna().any()
+
+
+def test_incremental_loads_match_one_load(components):
+    expected = sorted_growth(MetricStore().upsert(components).growth())
+
+    store = MetricStore()
+    middle = components[(components['date'] >= DAYS[10]) & (components['date'] < DAYS[30])]
+    store.upsert(middle)
+    # Append a day at a time, re-reading the last few days each time
+    for day in DAYS[30:]:
+        store.upsert(components[(components['date'] > day - pd.Timedelta(days=3)) & (components['date'] <= day)])
+    # A backfill reaching before the first stored day replaces everything from there on
+    store.upsert(components[components['date'] < DAYS[10]])
+    assert store.growth().loc[lambda g: g['metric'] == 'sessions', 'value'].eq(0).all()
+    store.upsert(components)
+    assert store.num_days == len(DAYS) and store.last_day() == DAYS[-1]
+    pd.testing.assert_frame_equal(sorted_growth(store.growth()), expected)
+
+
+def test_rows_missing_from_a_reload_count_as_zero(components):
+    store = MetricStore().upsert(components)
+    reloaded = components[~((components['segment'] == 'tablet') & (components['date'] >= DAYS[-2]))]
+    store.upsert(reloaded[reloaded['date'] >= DAYS[-7]])
+    result = store.growth().set_index(['segment', 'metric'])
+    assert result.loc[('tablet', 'sessions'), 'value'] == 0
+    assert np.isnan(result.loc[('tablet', 'avg_session_time'), 'value'])
+    pd.testing.assert_frame_equal(sorted_growth(store.growth()), sorted_growth(MetricStore().upsert(reloaded).growth()))
+
+
+def test_multiple_segment_columns_and_missing_components():
+    frame = pd.DataFrame({'date': [DAYS[0], DAYS[1], DAYS[1]], 'device_type': ['mobile', 'mobile', 'desktop'],
+                          'course_id': [1, 1, 2], 'sessions': [4.0, 6.0, 2.0]})
+    result = MetricStore(segment_cols=('device_type', 'course_id')).upsert(frame).growth()
+    sessions = result[result['metric'] == 'sessions'].set_index(['device_type', 'course_id'])
+    assert sessions['value'].to_dict() == {('mobile', 1): 6.0, ('desktop', 2): 2.0}
+    assert sessions.loc[('mobile', 1), 'dod'] == 50.0
+    assert result.loc[result['metric'] == 'active_users', 'value'].eq(0).all()
+
+
+def test_empty_store_and_days_out_of_range(components):
+    store = MetricStore()
+    assert store.growth().empty and store.last_day() is None
+    assert store.upsert(components.iloc[:0]) is store and store.num_days == 0
+    store.upsert(components)
+    assert store.growth(DAYS[0] - pd.Timedelta(days=1)).empty
+    assert store.growth(DAYS[-1] + pd.Timedelta(days=1)).empty
+
+
+def test_clear_keeps_the_store_usable(components):
+    store = MetricStore().upsert(components)
+    lock = store._lock
+    store.clear()
+    assert store._lock is lock and len(store) == 0 and store.growth().empty
+
+    # Threads holding the store keep loading and reading it while it is cleared
+    errors = []
+
+    def load():
+        try:
+            for day in DAYS:
+                store.upsert(components[components['date'] == day])
+                store.growth()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    store.clear()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    store.clear()
+    store.upsert(components)
+    pd.testing.assert_frame_equal(sorted_growth(store.growth()), sorted_growth(MetricStore().upsert(components).growth()))
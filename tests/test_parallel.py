@@ -0,0 +1,72 @@
+import threading
+import time
+
+from dashboard.utils.parallel import run_concurrently, time_remaining
+
+
+def test_results_are_collected_by_name():
+    results, errors = run_concurrently({'a': lambda: 1, 'b': lambda: 'two'})
+    assert results == {'a': 1, 'b': 'two'}
+    assert errors == {}
+
+
+def test_tasks_run_in_parallel():
+    barrier = threading.Barrier(3, timeout=5)
+    tasks = {name: (lambda: barrier.wait() is not None) for name in 'abc'}
+    results, errors = run_concurrently(tasks, default_timeout=5)
+    assert errors == {}
+    assert set(results) == set('abc')
+
+
+def test_failures_and_timeouts_do_not_hide_other_results():
+    def fail():
+        raise RuntimeError("relation does not exist")
+
+    results, errors = run_concurrently(
+        {'ok': lambda: 42, 'fail': fail, 'slow': lambda: time.sleep(0.5)},
+        timeouts={'slow': 0.05}, default_timeout=5)
+    assert results == {'ok': 42}
+    assert errors == {'fail': 'relation does not exist', 'slow': 'timeout'}
+
+
+def test_timeouts_are_measured_from_submission_when_every_task_has_a_worker():
+    started = time.monotonic()
+    _, errors = run_concurrently({'a': lambda: time.sleep(0.3), 'b': lambda: time.sleep(0.3)},
+                                 default_timeout=0.1)
+    assert errors == {'a': 'timeout', 'b': 'timeout'}
+    assert time.monotonic() - started < 0.25
+
+
+def test_time_waiting_for_a_worker_does_not_count():
+    results, errors = run_concurrently({name: (lambda: time.sleep(0.2) or 'done') for name in 'abc'},
+                                       default_timeout=0.35, max_workers=1)
+    assert errors == {}
+    assert results == dict.fromkeys('abc', 'done')
+
+
+def test_calls_do_not_queue_behind_each_other():
+    # A slow refresh in another thread keeps its workers; this one still runs at once
+    release = threading.Event()
+    other = threading.Thread(target=run_concurrently,
+                             args=({f"slow_{i}": release.wait for i in range(8)},), kwargs={'default_timeout': 5})
+    other.start()
+    try:
+        results, errors = run_concurrently({'quick': lambda: 1}, default_timeout=0.2)
+        assert (results, errors) == ({'quick': 1}, {})
+    finally:
+        release.set()
+        other.join()
+
+
+def test_time_remaining_inside_a_task():
+    assert time_remaining() is None
+    results, _ = run_concurrently({'a': time_remaining, 'b': time_remaining}, timeouts={'a': 0.5}, default_timeout=5)
+    assert 0 < results['a'] <= 0.5 and 4 < results['b'] <= 5
+    assert run_concurrently({}) == ({}, {})
+
+
+def test_every_task_gets_a_worker_by_default(monkeypatch):
+    monkeypatch.delenv('DASH_QUERY_WORKERS', raising=False)
+    barrier = threading.Barrier(8, timeout=5)
+    results, errors = run_concurrently({str(i): barrier.wait for i in range(8)}, default_timeout=5)
+    assert errors == {} and len(results) == 8
@@ -0,0 +1,114 @@
+from datetime import date
+
+import pytest
+
+from dashboard.utils.partitions import (ARCHIVE_SCHEMA, DEFAULT_PARTITION, LEGACY_TABLE, add_months,
+                                        create_partition, ensure_partitions, is_partitioned, list_partitions,
+                                        maintain_partitions, migrate_legacy_table, month_start, partition_name,
+                                        set_aside_legacy_table)
+from tests.conftest import SCHEMA_PATH
+
+# activity as created before partitioning
+LEGACY_SCHEMA = """
+    CREATE TABLE activity (
+        id SERIAL PRIMARY KEY,
+        date DATE NOT NULL,
+        user_id VARCHAR(50) NOT NULL,
+        course_id VARCHAR(50) NOT NULL,
+        lesson_completed BOOLEAN NOT NULL DEFAULT FALSE,
+        time_spent INTEGER NOT NULL DEFAULT 0,
+        device_type VARCHAR(20) NOT NULL DEFAULT 'unknown',
+        subscription_type VARCHAR(20) NOT NULL DEFAULT 'free',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_activity_date_user ON activity(date, user_id);
+    CREATE INDEX idx_activity_user_date ON activity(user_id, date);
+"""
+
+
+def test_month_arithmetic():
+    assert month_start(date(2026, 3, 31)) == date(2026, 3, 1)
+    assert add_months(date(2026, 11, 15), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert add_months(date(2026, 5, 1), -17) == date(2024, 12, 1)
+    assert partition_name(date(2026, 3, 1)) == 'activity_y2026m03'
+
+
+@pytest.fixture
+def partitioned(pg_conn):
+    """Scratch activity with no monthly partitions and no archive schema, before and after the test"""
+    def clear():
+        with pg_conn.cursor() as cursor:
+            for name in list_partitions(cursor).values():
+                cursor.execute(f"DROP TABLE {name}")
+            cursor.execute(f"DROP SCHEMA IF EXISTS {ARCHIVE_SCHEMA} CASCADE")
+        pg_conn.commit()
+    clear()
+    yield pg_conn
+    pg_conn.rollback()
+    clear()
+
+
+def insert_days(cursor, *days):
+    for day in days:
+        cursor.execute("INSERT INTO activity (date, user_id, course_id) VALUES (%s, 'U1', 'C101')", (day,))
+
+
+def rows_in(cursor, table):
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def test_create_partition_moves_rows_out_of_default(partitioned):
+    with partitioned.cursor() as cursor:
+        assert is_partitioned(cursor)
+        insert_days(cursor, date(2040, 2, 1), date(2040, 2, 29), date(2040, 3, 1))
+        assert create_partition(cursor, date(2040, 2, 10)) == 'activity_y2040m02'
+        assert rows_in(cursor, 'activity_y2040m02') == 2
+        assert rows_in(cursor, DEFAULT_PARTITION) == 1
+        assert ensure_partitions(cursor, date(2040, 1, 20), date(2040, 3, 5)) == ['activity_y2040m01',
+                                                                                 'activity_y2040m03']
+        assert rows_in(cursor, DEFAULT_PARTITION) == 0
+        assert sorted(list_partitions(cursor)) == [date(2040, 1, 1), date(2040, 2, 1), date(2040, 3, 1)]
+
+
+@pytest.mark.parametrize('drop', [False, True])
+def test_maintain_creates_ahead_rehomes_strays_and_archives(partitioned, drop):
+    with partitioned.cursor() as cursor:
+        ensure_partitions(cursor, date(2039, 10, 1), date(2039, 12, 1))
+        insert_days(cursor, date(2039, 10, 5), date(2040, 8, 9))  # the second one lands in the default partition
+    partitioned.commit()
+
+    result = maintain_partitions(partitioned, months_ahead=1, retain_months=3, drop=drop, today=date(2040, 2, 14))
+    assert result['created'] == ['activity_y2040m02', 'activity_y2040m03', 'activity_y2040m08']
+    assert result['archived'] == ['activity_y2039m10']
+    with partitioned.cursor() as cursor:
+        assert rows_in(cursor, DEFAULT_PARTITION) == 0
+        assert rows_in(cursor, 'activity') == 1
+        assert date(2039, 11, 1) in list_partitions(cursor)  # inside the retention window
+        cursor.execute("SELECT to_regclass(%s)", (f"{ARCHIVE_SCHEMA}.activity_y2039m10",))
+        assert (cursor.fetchone()[0] is None) == drop
+
+
+def test_legacy_table_is_migrated_with_its_ids(pg_conn):
+    with pg_conn.cursor() as cursor, open(SCHEMA_PATH) as schema:
+        # Everything happens in one transaction that is rolled back, as setup_database would run it
+        cursor.execute("DROP TABLE activity CASCADE")
+        cursor.execute(LEGACY_SCHEMA)
+        insert_days(cursor, date(2041, 1, 31), date(2041, 3, 1), date(2041, 3, 2))
+        assert not is_partitioned(cursor)
+
+        assert set_aside_legacy_table(cursor)
+        cursor.execute(schema.read())
+        assert migrate_legacy_table(cursor) == 3
+
+        assert is_partitioned(cursor)
+        assert sorted(list_partitions(cursor)) == [date(2041, 1, 1), date(2041, 2, 1), date(2041, 3, 1)]
+        cursor.execute("SELECT id, date FROM activity ORDER BY id")
+        assert cursor.fetchall() == [(1, date(2041, 1, 31)), (2, date(2041, 3, 1)), (3, date(2041, 3, 2))]
+        cursor.execute("INSERT INTO activity (date, user_id, course_id) VALUES ('2041-03-03', 'U2', 'C1') RETURNING id")
+        assert cursor.fetchone()[0] == 4
+        cursor.execute("SELECT to_regclass(%s)", (LEGACY_TABLE,))
+        assert cursor.fetchone()[0] is None
+        assert not set_aside_legacy_table(cursor)  # already partitioned
+    pg_conn.rollback()
@@ -0,0 +1,218 @@
+import fcntl
+import os
+import pickle
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from dashboard.utils.query_cache import QueryCache, cache_key, is_private_dir
+
+needs_root = pytest.mark.skipif(not hasattr(os, 'geteuid') or os.geteuid() != 0,
+                                reason="changing file ownership needs root")
+
+
+class Loader:
+    def __init__(self, value='result', delay=0.0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return self.value
+
+
+def test_cache_key_ignores_whitespace_but_not_params():
+    assert cache_key("SELECT 1\n  FROM t") == cache_key("SELECT 1 FROM t")
+    assert cache_key("SELECT %(a)s", {'a': 1}) != cache_key("SELECT %(a)s", {'a': 2})
+
+
+@pytest.mark.parametrize('disk', [False, True])
+def test_hit_after_miss(tmp_path, disk):
+    cache = QueryCache(ttl=60, cache_dir=str(tmp_path / 'cache') if disk else None)
+    loader = Loader()
+    assert cache.get_or_load('k', loader) == 'result'
+    assert cache.get_or_load('k', loader) == 'result'
+    assert loader.calls == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = QueryCache(ttl=0.05)
+    loader = Loader()
+    cache.get_or_load('k', loader)
+    time.sleep(0.1)
+    cache.get_or_load('k', loader)
+    assert loader.calls == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(ttl=60, max_entries=2)
+    loaders = {key: Loader(key) for key in 'abc'}
+    cache.get_or_load('a', loaders['a'])
+    cache.get_or_load('b', loaders['b'])
+    cache.get_or_load('a', loaders['a'])  # 'b' is now the least recently used
+    cache.get_or_load('c', loaders['c'])
+    cache.get_or_load('a', loaders['a'])
+    cache.get_or_load('b', loaders['b'])
+    assert loaders['a'].calls == 1
+    assert loaders['b'].calls == 2
+    assert cache.stats()['evictions'] >= 1
+
+
+def test_concurrent_misses_load_once():
+    cache = QueryCache(ttl=60)
+    loader = Loader(delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('k', loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loader.calls == 1
+    assert results == ['result'] * 8
+
+
+def test_loader_error_reaches_every_waiter_and_is_not_cached():
+    cache = QueryCache(ttl=60)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def run():
+        try:
+            cache.get_or_load('k', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == ['boom'] * 4
+    assert len(calls) == 1
+    assert cache.get_or_load('k', Loader()) == 'result'
+
+
+def test_invalidate_reaches_other_processes_through_the_directory(tmp_path):
+    directory = str(tmp_path / 'cache')
+    first, second = QueryCache(ttl=60, cache_dir=directory), QueryCache(ttl=60, cache_dir=directory)
+    loader = Loader()
+    first.get_or_load('k', loader)
+    assert second.get_or_load('k', loader) == 'result'
+    assert loader.calls == 1
+    assert second.stats()['disk_hits'] == 1
+
+    time.sleep(0.01)  # generation stamps are file mtimes
+    second.invalidate()
+    first.get_or_load('k', loader)
+    assert loader.calls == 2
+
+
+def test_lock_files_go_with_their_entries(tmp_path):
+    directory = tmp_path / 'cache'
+    cache = QueryCache(ttl=60, max_entries=2, cache_dir=str(directory))
+    for key in 'abcdefgh':
+        cache.get_or_load(key, Loader())
+    assert len(list(directory.glob('*.pkl'))) == 2
+    assert {path.stem for path in directory.glob('*.lock')} == {path.stem for path in directory.glob('*.pkl')}
+
+    # A lock someone holds survives, even without an entry
+    with cache._file_lock('busy'):
+        cache.invalidate()
+        assert [path.name for path in directory.glob('*.lock')] == ['busy.lock']
+    cache.get_or_load('a', Loader())
+    assert sorted(path.name for path in directory.iterdir()) == ['GENERATION', 'a.lock', 'a.pkl']
+
+
+def test_waiter_relocks_a_lock_file_unlinked_under_it(tmp_path):
+    cache = QueryCache(ttl=60, cache_dir=str(tmp_path))
+    path = tmp_path / 'k.lock'
+    holder = open(path, 'w')
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    acquired, release = threading.Event(), threading.Event()
+
+    def wait_for_lock():
+        with cache._file_lock('k'):
+            acquired.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=wait_for_lock)
+    thread.start()
+    time.sleep(0.1)  # the waiter has opened the old file and blocks on it
+    os.remove(path)
+    holder.close()
+    assert acquired.wait(5)
+    # The waiter holds the file now at the path, so a newcomer has to wait
+    with open(path, 'w') as newcomer:
+        with pytest.raises(BlockingIOError):
+            fcntl.flock(newcomer, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    release.set()
+    thread.join()
+
+
+def test_cached_frames_are_not_mutated_by_callers():
+    cache = QueryCache(ttl=60)
+    frame = cache.get_or_load('k', lambda: pd.DataFrame({'a': [1, 2]}))
+    frame['b'] = 0
+    assert list(cache.get_or_load('k', Loader())) == ['a']
+
+
+def test_cache_directory_is_private(tmp_path):
+    directory = tmp_path / 'cache'
+    QueryCache(cache_dir=str(directory))
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+def test_loose_directory_of_our_own_is_tightened(tmp_path):
+    directory = tmp_path / 'cache'
+    directory.mkdir()
+    os.chmod(directory, 0o777)
+    cache = QueryCache(cache_dir=str(directory))
+    assert cache.cache_dir == str(directory)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+def test_symlinked_directory_disables_the_disk_tier(tmp_path):
+    target = tmp_path / 'elsewhere'
+    target.mkdir(mode=0o700)
+    link = tmp_path / 'cache'
+    link.symlink_to(target)
+    assert not is_private_dir(str(link))
+    assert QueryCache(cache_dir=str(link)).cache_dir is None
+
+
+@needs_root
+def test_directory_owned_by_another_user_disables_the_disk_tier(tmp_path):
+    directory = tmp_path / 'cache'
+    directory.mkdir(mode=0o700)
+    os.chown(directory, 65534, 65534)
+    cache = QueryCache(cache_dir=str(directory))
+    assert cache.cache_dir is None
+    loader = Loader()
+    cache.get_or_load('k', loader)
+    assert os.listdir(directory) == []
+
+
+@needs_root
+def test_entry_owned_by_another_user_is_not_unpickled(tmp_path):
+    directory = tmp_path / 'cache'
+    cache = QueryCache(ttl=60, cache_dir=str(directory))
+    path = directory / 'k.pkl'
+    with open(path, 'wb') as f:
+        pickle.dump((time.time() + 60, cache._generation(), 'planted'), f)
+    os.chown(path, 65534, 65534)
+    assert cache.get_or_load('k', Loader()) == 'result'
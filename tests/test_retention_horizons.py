@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from dashboard.components.data_processor import DataProcessor
+from dashboard.utils.rollups import refresh_rollups
+
+HORIZONS = (1, 7, 14, 30)
+
+
+def brute_force(activity, horizons=HORIZONS, as_of=None):
+    """Per-user loop over the retention definitions"""
+    as_of = activity['date'].max() if as_of is None else pd.Timestamp(as_of)
+    rows = []
+    for horizon in horizons:
+        eligible = classic = rolling = 0
+        for _, dates in activity.groupby('user_id')['date']:
+            day_n = set((dates - dates.min()).dt.days)
+            if dates.min() > as_of - pd.Timedelta(days=horizon):
+                continue
+            eligible += 1
+            classic += horizon in day_n
+            rolling += max(day_n) >= horizon
+        rows.append((horizon, eligible, classic, rolling))
+    return pd.DataFrame(rows, columns=['horizon', 'eligible_users', 'classic_retained', 'rolling_retained'])
+
+
+COUNTS = ['horizon', 'eligible_users', 'classic_retained', 'rolling_retained']
+
+
+def test_matches_per_user_definition(activity_frame):
+    result = DataProcessor.calculate_retention_horizons(activity_frame, horizons=HORIZONS)
+    pd.testing.assert_frame_equal(result[COUNTS], brute_force(activity_frame), check_dtype=False)
+    expected = (result['classic_retained'] * 100.0 / result['eligible_users']).round(1)
+    assert result['classic_retention'].tolist() == expected.tolist()
+
+
+def test_as_of_limits_eligible_users(activity_frame):
+    as_of = '2026-03-20'
+    result = DataProcessor.calculate_retention_horizons(activity_frame, horizons=(1, 7), as_of=as_of)
+    pd.testing.assert_frame_equal(result[COUNTS], brute_force(activity_frame, (1, 7), as_of), check_dtype=False)
+
+
+def test_horizons_are_deduplicated_and_sorted(activity_frame):
+    result = DataProcessor.calculate_retention_horizons(activity_frame, horizons=(7, 1, 7))
+    assert result['horizon'].tolist() == [1, 7]
+
+
+def test_unobservable_horizon_has_no_eligible_users():
+    activity = pd.DataFrame({'user_id': ['a', 'a', 'b'],
+                             'date': pd.to_datetime(['2026-01-01', '2026-01-02', '2026-01-02'])})
+    result = DataProcessor.calculate_retention_horizons(activity, horizons=(1, 30)).set_index('horizon')
+    assert result.loc[1, 'eligible_users'] == 1
+    assert result.loc[1, 'classic_retention'] == 100.0
+    assert result.loc[30, 'eligible_users'] == 0
+    assert pd.isna(result.loc[30, 'classic_retention'])
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_view_matches_activity_after_incremental_refresh(pg_conn, activity_frame, insert_activity):
+    cutoff = pd.Timestamp('2026-03-18')
+    insert_activity(pg_conn, activity_frame[activity_frame['date'] < cutoff])
+    refresh_rollups(pg_conn)
+    insert_activity(pg_conn, activity_frame[activity_frame['date'] >= cutoff])
+    refresh_rollups(pg_conn)
+
+    view = pd.read_sql("SELECT * FROM retention_horizons", pg_conn)
+    expected = DataProcessor.calculate_retention_horizons(activity_frame, horizons=HORIZONS)
+    pd.testing.assert_frame_equal(view[COUNTS], expected[COUNTS], check_dtype=False)
+    assert view['classic_retention'].astype(float).tolist() == expected['classic_retention'].tolist()
+    assert view['rolling_retention'].astype(float).tolist() == expected['rolling_retention'].tolist()
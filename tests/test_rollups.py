@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from dashboard.utils.rollups import get_watermark, refresh_rollups
+
+TABLES = {
+    'daily_activity_rollup': ['date', 'device_type', 'subscription_type', 'course_id'],
+    'daily_activity_totals': ['date'],
+    'user_segment_activity': ['user_id', 'device_type', 'subscription_type'],
+    'user_first_seen': ['user_id'],
+}
+
+
+def read_table(conn, table):
+    frame = pd.read_sql(f"SELECT * FROM {table}", conn)
+    return frame.sort_values(TABLES[table]).reset_index(drop=True)
+
+
+def expected_totals(activity):
+    grouped = activity.assign(premium_user=activity['user_id'].where(activity['subscription_type'] == 'premium'))
+    return (grouped.groupby('date')
+                   .agg(active_users=('user_id', 'nunique'), premium_users=('premium_user', 'nunique'),
+                        sessions=('user_id', 'size'), total_time_spent=('time_spent', 'sum'),
+                        lessons_completed=('lesson_completed', 'sum'))
+                   .reset_index())
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_full_refresh_matches_activity(pg_conn, activity_frame, insert_activity):
+    insert_activity(pg_conn, activity_frame)
+    assert refresh_rollups(pg_conn) == activity_frame['date'].min().date()
+
+    totals = read_table(pg_conn, 'daily_activity_totals')
+    expected = expected_totals(activity_frame)
+    assert pd.to_datetime(totals['date']).tolist() == expected['date'].tolist()
+    for column in ['active_users', 'premium_users', 'sessions', 'total_time_spent', 'lessons_completed']:
+        assert totals[column].tolist() == expected[column].tolist(), column
+
+    rollup = read_table(pg_conn, 'daily_activity_rollup')
+    expected = (activity_frame.groupby(TABLES['daily_activity_rollup'])
+                .agg(active_users=('user_id', 'nunique'), sessions=('user_id', 'size'))
+                .reset_index())
+    assert rollup['active_users'].tolist() == expected['active_users'].tolist()
+    assert rollup['sessions'].tolist() == expected['sessions'].tolist()
+
+    first_seen = read_table(pg_conn, 'user_first_seen')
+    expected = activity_frame.groupby('user_id')['date'].min()
+    assert pd.to_datetime(first_seen['first_date']).tolist() == expected.tolist()
+    assert get_watermark(pg_conn.cursor()) == activity_frame['date'].max().date()
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_incremental_refresh_matches_full_rebuild(pg_conn, activity_frame, insert_activity):
+    cutoff = pd.Timestamp('2026-03-25')
+    insert_activity(pg_conn, activity_frame[activity_frame['date'] < cutoff])
+    refresh_rollups(pg_conn)
+    watermark = get_watermark(pg_conn.cursor())
+
+    # The rest arrives later, including more rows for the (partial) watermark day
+    late = activity_frame[activity_frame['date'] >= cutoff]
+    insert_activity(pg_conn, late)
+    assert refresh_rollups(pg_conn) == watermark
+    incremental = {table: read_table(pg_conn, table) for table in TABLES}
+
+    refresh_rollups(pg_conn, full=True)
+    for table in TABLES:
+        pd.testing.assert_frame_equal(incremental[table], read_table(pg_conn, table), obj=table)
+
+
+def test_refresh_without_activity_does_nothing(pg_conn):
+    assert refresh_rollups(pg_conn) is None
+    assert get_watermark(pg_conn.cursor()) is None
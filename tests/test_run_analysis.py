@@ -0,0 +1,169 @@
+import os
+
+import pandas as pd
+import pytest
+
+from analysis import run_analysis
+from analysis.run_analysis import (ANALYSES, Analysis, ArtifactStore, analyses_by_name, content_hash,
+                                   course_performance, events_fingerprint, load_artifact, load_events, run,
+                                   topological_order)
+from dashboard.utils import analytics_backend, db_pool
+from dashboard.utils.analytics_backend import DuckDBBackend
+from tests.test_analytics_backend import write_snapshot
+
+pytestmark = pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+
+
+# Module-level so spawned workers can unpickle them
+def double(inputs):
+    return inputs['events'].assign(time_spent=inputs['events']['time_spent'] * 2)
+
+
+def course_count(inputs):
+    return inputs['events']['course_id'].nunique()
+
+
+def course_label(inputs):
+    return f"{inputs['courses']} courses"
+
+
+def broken_fingerprint(path=None):
+    raise ConnectionError("database is down")
+
+
+def small_dag(fingerprint=run_analysis.events_fingerprint):
+    return [
+        Analysis('events', load_events, fingerprint=fingerprint),
+        Analysis('doubled', double, deps=['events']),
+        Analysis('courses', course_count, deps=['events']),
+        Analysis('label', course_label, deps=['courses']),
+    ]
+
+
+def with_input(analyses, path):
+    return [Analysis(a.name, a.func, a.deps, {**a.params, 'path': str(path)}, a.version, a.fingerprint)
+            if not a.deps else a for a in analyses]
+
+
+@pytest.fixture
+def events_csv(tmp_path, activity_frame):
+    path = tmp_path / 'events.csv'
+    activity_frame.to_csv(path, index=False)
+    return path
+
+
+def test_topological_order():
+    registry = analyses_by_name(small_dag())
+    assert topological_order(registry) == ['events', 'doubled', 'courses', 'label']
+    assert topological_order(registry, only=['label']) == ['events', 'courses', 'label']
+    assert topological_order(analyses_by_name()).index('lifecycle') > topological_order(analyses_by_name()).index('users')
+    with pytest.raises(ValueError, match='Unknown'):
+        topological_order(registry, only=['nope'])
+    with pytest.raises(ValueError, match='cycle'):
+        topological_order({'a': Analysis('a', double, deps=['b']), 'b': Analysis('b', double, deps=['a'])})
+    with pytest.raises(ValueError, match='unknown'):
+        analyses_by_name([Analysis('a', double, deps=['missing'])])
+    with pytest.raises(ValueError, match='fingerprint'):
+        Analysis('source', load_events)
+
+
+def test_content_hash_depends_on_content_only(activity_frame):
+    assert content_hash(activity_frame) == content_hash(activity_frame.copy())
+    assert content_hash(activity_frame) != content_hash(activity_frame.assign(time_spent=0))
+    assert content_hash({'a': 1}) == content_hash({'a': 1})
+
+
+def test_second_run_is_served_from_the_store(tmp_path, events_csv):
+    analyses = with_input(small_dag(), events_csv)
+    store = str(tmp_path / 'store')
+    assert set(run(workers=2, artifact_dir=store, analyses=analyses).values()) == {'computed'}
+    assert set(run(workers=2, artifact_dir=store, analyses=analyses).values()) == {'cached'}
+    assert run(force=True, workers=1, artifact_dir=store, analyses=analyses)['courses'] == 'computed'
+
+    doubled = load_artifact('doubled', store)
+    assert (doubled['time_spent'] == load_events(str(events_csv))['time_spent'] * 2).all()
+    assert load_artifact('courses', store) == 3
+    assert load_artifact('unknown', store) is None
+
+
+def test_only_changed_content_is_recomputed(tmp_path, events_csv, activity_frame):
+    analyses = with_input(small_dag(), events_csv)
+    store = str(tmp_path / 'store')
+    run(workers=1, artifact_dir=store, analyses=analyses)
+
+    # Same content, new mtime: the source reloads but nothing downstream reruns
+    stat = os.stat(events_csv)
+    os.utime(events_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert run(workers=1, artifact_dir=store, analyses=analyses) == {
+        'events': 'computed', 'doubled': 'cached', 'courses': 'cached', 'label': 'cached'}
+
+    # New events rerun their direct dependents, but the course count comes out the same
+    activity_frame.assign(time_spent=activity_frame['time_spent'] + 1).to_csv(events_csv, index=False)
+    assert run(workers=1, artifact_dir=store, analyses=analyses) == {
+        'events': 'computed', 'doubled': 'computed', 'courses': 'computed', 'label': 'cached'}
+
+    assert ArtifactStore(store).collect_garbage() == 4  # two earlier events results, the first doubled and courses
+    assert load_artifact('label', store) == '3 courses'
+
+
+def test_fingerprint_error_fails_the_source_and_skips_dependents(tmp_path):
+    store = str(tmp_path / 'store')
+    status = run(workers=1, artifact_dir=store, analyses=small_dag(broken_fingerprint))
+    assert status == {'events': 'failed', 'doubled': 'skipped', 'courses': 'skipped', 'label': 'skipped'}
+    assert ArtifactStore(store).manifest() == {}
+
+
+def test_failing_analysis_is_reported(tmp_path, events_csv):
+    analyses = with_input(small_dag(), events_csv) + [Analysis('bad', course_count, deps=['courses']),
+                                                      Analysis('after_bad', course_label, deps=['bad'])]
+    status = run(workers=1, artifact_dir=str(tmp_path / 'store'), analyses=analyses)
+    assert (status['bad'], status['after_bad'], status['label']) == ('failed', 'skipped', 'computed')
+
+
+def test_registered_analyses_run_on_a_file(tmp_path, events_csv, activity_frame):
+    analyses = with_input(ANALYSES, events_csv)
+    store = str(tmp_path / 'store')
+    assert set(run(artifact_dir=store, analyses=analyses, workers=2).values()) == {'computed'}
+    courses = load_artifact('course_performance', store)
+    assert courses.set_index('course_id')['learners'].to_dict() == \
+        activity_frame.groupby('course_id')['user_id'].nunique().to_dict()
+    pd.testing.assert_frame_equal(courses, course_performance({'events': load_events(str(events_csv))}))
+    assert set(load_artifact('lifecycle', store)['stage']) <= {'new', 'active', 'at_risk', 'dormant'}
+
+
+@pytest.fixture
+def postgres_source(test_db_url, pg_conn, monkeypatch, activity_frame, insert_activity):
+    monkeypatch.setenv('DB_URL', test_db_url)
+    monkeypatch.setattr(analytics_backend, '_backend', analytics_backend.PostgresBackend())
+    db_pool.close_pool()
+    insert_activity(pg_conn, activity_frame)
+    yield pg_conn
+    db_pool.close_pool()
+
+
+def test_postgres_fingerprint_moves_on_updates(postgres_source, activity_frame):
+    before = events_fingerprint()
+    assert before['backend'] == 'PostgresBackend' and before['events'] == str(len(activity_frame))
+    assert events_fingerprint() == before
+    with postgres_source.cursor() as cursor:
+        # Counts, dates and sums all stay the same
+        cursor.execute("UPDATE activity SET device_type = 'tablet' WHERE id = 1")
+    postgres_source.commit()
+    after = events_fingerprint()
+    assert after['row_hash'] != before['row_hash']
+    assert {k: v for k, v in after.items() if k != 'row_hash'} == {k: v for k, v in before.items() if k != 'row_hash'}
+
+
+def test_duckdb_fingerprint_moves_on_updates(tmp_path, activity_frame, monkeypatch):
+    pytest.importorskip('duckdb')
+    monkeypatch.setenv('QUERY_CACHE_ENABLED', 'False')
+    backend = DuckDBBackend(write_snapshot(activity_frame, tmp_path), check_interval=0)
+    monkeypatch.setattr(analytics_backend, '_backend', backend)
+    before = events_fingerprint()
+    assert before['backend'] == 'DuckDBBackend' and before['events'] == str(len(activity_frame))
+
+    changed = activity_frame.copy()
+    changed.loc[0, 'subscription_type'] = 'premium' if changed.loc[0, 'subscription_type'] == 'free' else 'free'
+    write_snapshot(changed, tmp_path)
+    after = events_fingerprint()
+    assert after['row_hash'] != before['row_hash'] and after['events'] == before['events']